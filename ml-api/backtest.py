@@ -0,0 +1,364 @@
+"""
+Backtest Module for Policy Lab
+Evaluates compiled rules over windows of the precomputed feature table
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from feature_store import FeatureTable
+from rules import CompiledRule
+from utils.metrics import metrics
+
+# Windows are split into chunks of this many rows and evaluated in parallel
+CHUNK_ROWS = int(os.getenv("BACKTEST_CHUNK_ROWS", "262144"))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+
+# Maximum number of cached backtest results
+BACKTEST_CACHE_SIZE = int(os.getenv("BACKTEST_CACHE_SIZE", "512"))
+
+# Rows per time bucket: PaySim steps are hours
+GRANULARITY_STEPS = {'step': 1, 'day': 24}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Per-process pool (created lazily so pre-fork workers get their own)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(1, BACKTEST_WORKERS),
+                                           thread_name_prefix="backtest")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _chunk_ranges(start: int, stop: int, chunk_rows: Optional[int] = None) -> List[Tuple[int, int]]:
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    return [(a, min(a + chunk_rows, stop)) for a in range(start, stop, chunk_rows)] or [(start, stop)]
+
+
+def _popcount(packed: np.ndarray) -> int:
+    """Number of set bits in a packbits() array"""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(packed).sum())
+    return int(np.unpackbits(packed).sum())
+
+
+def _labels(table: FeatureTable, window: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    if table.label_column is None:
+        return None
+    return window[table.label_column] == 1
+
+
+def _stats_from_counts(matches: int, fraud_caught: int, total_fraud: int) -> Dict:
+    return {
+        "total_matches": matches,
+        "fraud_caught": fraud_caught,
+        "false_positives": matches - fraud_caught,
+        "precision": (fraud_caught / matches) if matches > 0 else 0.0,
+        "recall": (fraud_caught / total_fraud) if total_fraud > 0 else 0.0,
+    }
+
+
+def rule_stats(mask: np.ndarray, labels: Optional[np.ndarray], total_fraud: int) -> Dict:
+    """
+    Summarize a rule's match mask against ground truth
+
+    Args:
+        mask: Boolean match mask over the window
+        labels: Boolean fraud labels over the window (None if unavailable)
+        total_fraud: Number of fraud rows in the window
+
+    Returns:
+        Dict with total_matches, fraud_caught, false_positives, precision, recall
+    """
+    matches = int(np.count_nonzero(mask))
+    if labels is not None:
+        fraud_caught = int(np.count_nonzero(mask & labels))
+    else:
+        # If no ground truth, we can't calculate precision
+        fraud_caught = 0
+    return _stats_from_counts(matches, fraud_caught, total_fraud)
+
+
+@metrics.stage("backtest.rule_window").timed
+def backtest_rule_window(table: FeatureTable, rule: CompiledRule,
+                         start: int, stop: int,
+                         granularity: Optional[str] = None) -> Dict:
+    """
+    Backtest one rule over rows [start, stop) of the table
+
+    Large windows are split into chunks evaluated in parallel; each chunk
+    returns counts (and per-bucket counts when a granularity is requested)
+    that are summed at the end.
+
+    Args:
+        table: Precomputed feature table
+        rule: Compiled rule
+        start: First row (inclusive)
+        stop: Last row (exclusive)
+        granularity: None, 'step' or 'day' for a time series of results
+
+    Returns:
+        rule_stats() dict plus total_tested (and time_series if requested)
+    """
+    if granularity is not None and granularity not in GRANULARITY_STEPS:
+        raise ValueError(f"granularity must be one of {list(GRANULARITY_STEPS)}")
+    if granularity is not None and 'step' not in table.columns:
+        raise ValueError("Dataset has no 'step' column for a time series")
+
+    bucket_min = n_buckets = 0
+    if granularity is not None and stop > start:
+        steps = table.columns['step']
+        div = GRANULARITY_STEPS[granularity]
+        bucket_min = int(steps[start]) // div
+        n_buckets = int(steps[stop - 1]) // div - bucket_min + 1
+
+    def run_chunk(bounds: Tuple[int, int]) -> Dict:
+        a, b = bounds
+        window = table.window(a, b)
+        mask = rule.evaluate(window)
+        labels = _labels(table, window)
+        hits = mask & labels if labels is not None else None
+        part = {
+            "matches": int(np.count_nonzero(mask)),
+            "fraud_caught": int(np.count_nonzero(hits)) if hits is not None else 0,
+            "total_fraud": int(np.count_nonzero(labels)) if labels is not None else 0,
+        }
+        if n_buckets:
+            keys = window['step'] // GRANULARITY_STEPS[granularity] - bucket_min
+            part["bucket_total"] = np.bincount(keys, minlength=n_buckets)
+            part["bucket_matches"] = np.bincount(keys[mask], minlength=n_buckets)
+            part["bucket_fraud"] = (np.bincount(keys[hits], minlength=n_buckets)
+                                    if hits is not None else np.zeros(n_buckets, dtype=np.int64))
+        return part
+
+    chunks = _chunk_ranges(start, stop)
+    if len(chunks) == 1:
+        parts = [run_chunk(chunks[0])]
+    else:
+        parts = list(_get_executor().map(run_chunk, chunks))
+
+    stats = _stats_from_counts(
+        sum(p["matches"] for p in parts),
+        sum(p["fraud_caught"] for p in parts),
+        sum(p["total_fraud"] for p in parts),
+    )
+    stats["total_tested"] = stop - start
+
+    if granularity is not None:
+        series = []
+        if n_buckets:
+            totals = sum(p["bucket_total"] for p in parts)
+            matches = sum(p["bucket_matches"] for p in parts)
+            fraud = sum(p["bucket_fraud"] for p in parts)
+            for i in np.flatnonzero(totals):
+                series.append({
+                    granularity: int(bucket_min + i),
+                    "total": int(totals[i]),
+                    "matches": int(matches[i]),
+                    "fraud_caught": int(fraud[i]),
+                    "false_positives": int(matches[i] - fraud[i]),
+                })
+        stats["time_series"] = series
+    return stats
+
+
+def resolve_window(table: FeatureTable, limit: Optional[int] = None,
+                   start_step: Optional[int] = None, end_step: Optional[int] = None,
+                   full_history: bool = False) -> Tuple[int, int]:
+    """
+    Pick the row range to backtest
+
+    Args:
+        table: Precomputed feature table
+        limit: Number of most recent rows (used when no other option is given)
+        start_step: First step to include
+        end_step: Last step to include
+        full_history: Test every row
+
+    Returns:
+        (start, stop) row range
+    """
+    if full_history:
+        return 0, len(table)
+    if start_step is not None or end_step is not None:
+        return table.step_range(start_step, end_step)
+    return table.tail(limit if limit is not None else len(table))
+
+
+class BacktestCache:
+    """
+    Bounded LRU of backtest results.
+
+    Entries are keyed by (canonical rule, start, stop, granularity), so
+    reformatted rules share an entry. The whole cache is dropped as soon as
+    it is used with a different (dataset, feature engineer, model) version.
+    """
+
+    def __init__(self, max_entries: int = BACKTEST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._versions: Optional[Tuple] = None
+        self._lock = threading.Lock()
+
+    def _sync_versions(self, versions: Tuple) -> None:
+        if versions != self._versions:
+            if self._entries:
+                print(f"🔄 Dataset/model version changed, dropping {len(self._entries)} cached backtests")
+            self._entries.clear()
+            self._versions = versions
+
+    def get(self, versions: Tuple, rule_key: str, start: int, stop: int,
+            granularity: Optional[str] = None) -> Optional[Dict]:
+        """
+        Return a copy of the cached result, or None
+
+        Args:
+            versions: (dataset version, feature version, model version)
+            rule_key: Canonical rule text
+            start: First row (inclusive)
+            stop: Last row (exclusive)
+            granularity: Time series granularity of the result
+        """
+        key = (rule_key, start, stop, granularity)
+        with self._lock:
+            self._sync_versions(versions)
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, versions: Tuple, rule_key: str, start: int, stop: int,
+            result: Dict, granularity: Optional[str] = None, overwrite: bool = True) -> None:
+        """Store a result (unless one is cached and not overwrite), evicting the least recently used entries"""
+        if self.max_entries <= 0:
+            return
+        key = (rule_key, start, stop, granularity)
+        with self._lock:
+            self._sync_versions(versions)
+            if not overwrite and key in self._entries:
+                return
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+backtest_cache = BacktestCache()
+
+
+@metrics.stage("backtest.batch").timed
+def backtest_rule_batch(table: FeatureTable, rules: Sequence[CompiledRule],
+                        start: int, stop: int,
+                        deployed: Sequence[CompiledRule] = (),
+                        cache: Optional[BacktestCache] = None,
+                        cache_versions: Optional[Tuple] = None) -> Dict:
+    """
+    Backtest many rules in one pass over rows [start, stop)
+
+    Sub-predicates shared between rules (and the deployed set) are evaluated
+    once through a common memo. Besides per-rule stats this returns the
+    rule-by-rule overlap matrix and each rule's incremental catch over the
+    union of the deployed rules.
+
+    Args:
+        table: Precomputed feature table
+        rules: Candidate rules
+        start: First row (inclusive)
+        stop: Last row (exclusive)
+        deployed: Rules already in production
+        cache: If given, every sub-predicate evaluated over the full window
+            is stored so later single-rule backtests of it are instant
+            (marked from_batch: they were not audited as rules of their own)
+        cache_versions: Versions the cached results belong to
+
+    Returns:
+        Dict with results, overlap_matrix, deployed, total_tested,
+        total_fraud and shared_predicates
+    """
+    window = table.window(start, stop)
+    labels = _labels(table, window)
+    total_fraud = int(np.count_nonzero(labels)) if labels is not None else 0
+    memo: Dict[str, np.ndarray] = {}
+
+    masks = [rule.evaluate(window, memo=memo) for rule in rules]
+    distinct = {node.key for rule in rules for node in rule.nodes()}
+    total_nodes = sum(len(rule.nodes()) for rule in rules)
+
+    # Union of deployed rules, evaluated through the same memo
+    deployed_mask = np.zeros(stop - start, dtype=bool)
+    for rule in deployed:
+        deployed_mask |= rule.evaluate(window, memo=memo)
+    deployed_summary = None
+    if deployed:
+        deployed_summary = rule_stats(deployed_mask, labels, total_fraud)
+        deployed_summary["rules"] = [rule.canonical for rule in deployed]
+
+    results = []
+    not_deployed = ~deployed_mask
+    for rule, mask in zip(rules, masks):
+        stats = rule_stats(mask, labels, total_fraud)
+        incremental = mask & not_deployed
+        incremental_stats = rule_stats(incremental, labels, total_fraud)
+        stats["rule"] = rule.canonical
+        stats["incremental_fraud_caught"] = incremental_stats["fraud_caught"]
+        stats["incremental_false_positives"] = incremental_stats["false_positives"]
+        stats["incremental_recall"] = incremental_stats["recall"]
+        results.append(stats)
+
+    if cache is not None:
+        for key, mask in memo.items():
+            stats = rule_stats(mask, labels, total_fraud)
+            stats["total_tested"] = stop - start
+            stats["from_batch"] = True
+            # An entry /backtest stored for the same rule was already audited
+            cache.put(cache_versions, key, start, stop, stats, overwrite=False)
+
+    # Pairwise overlap on bit-packed masks (8x less memory traffic)
+    packed = [np.packbits(mask) for mask in masks]
+    k = len(packed)
+    overlap = [[0] * k for _ in range(k)]
+    for i in range(k):
+        overlap[i][i] = results[i]["total_matches"]
+        for j in range(i + 1, k):
+            overlap[i][j] = overlap[j][i] = _popcount(packed[i] & packed[j])
+
+    return {
+        "results": results,
+        "overlap_matrix": overlap,
+        "deployed": deployed_summary,
+        "total_tested": stop - start,
+        "total_fraud": total_fraud,
+        "shared_predicates": total_nodes - len(distinct),
+    }
@@ -0,0 +1,173 @@
+"""
+Benchmark harness
+Timing, peak memory sampling and baseline comparison shared by the
+benchmark cases
+"""
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# A case regresses when its p50 grows by more than this share of the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and by more than this many milliseconds (sub-millisecond cases are noisy)
+DEFAULT_MIN_DELTA_MS = 0.05
+# Peak RSS growth allowed before a case counts as a memory regression
+DEFAULT_RSS_TOLERANCE = 0.25
+DEFAULT_MIN_RSS_DELTA_MB = 32.0
+
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / 1e6 if hasattr(os, 'sysconf') else 0.0
+
+
+def rss_mb() -> float:
+    """Resident set size of this process (peak so far where the current value is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0.0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+class PeakRSS:
+    """Samples RSS in a background thread while a case runs"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, rss_mb())
+
+    def __enter__(self) -> "PeakRSS":
+        self.start_mb = self.peak_mb = rss_mb()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, rss_mb())
+
+
+def measure(fn: Callable[[int], object], calls: int, rows_per_call: int, warmup: int = 1) -> Dict:
+    """
+    Time repeated calls of a benchmark step
+
+    Args:
+        fn: Step to time, called with the call index
+        calls: Timed calls
+        rows_per_call: Rows (or events) one call processes, for the throughput
+        warmup: Untimed calls first (lazy initialization, caches)
+
+    Returns:
+        Dict with calls, rows_per_call, p50_ms, p99_ms, rows_per_second,
+        peak_rss_mb and rss_growth_mb
+    """
+    for i in range(warmup):
+        fn(i)
+    samples: List[float] = []
+    with PeakRSS() as memory:
+        for i in range(calls):
+            start = time.perf_counter()
+            fn(i)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples, rows_per_call, memory)
+
+
+def summarize(samples: List[float], rows_per_call: int, memory: PeakRSS) -> Dict:
+    """Figures of timed calls (seconds each) and the memory sampled meanwhile (see measure)"""
+    values = np.asarray(samples)
+    p50 = float(np.percentile(values, 50))
+    return {
+        "calls": len(samples),
+        "rows_per_call": rows_per_call,
+        "p50_ms": round(p50 * 1000, 4),
+        "p99_ms": round(float(np.percentile(values, 99)) * 1000, 4),
+        "rows_per_second": round(rows_per_call / p50, 1) if p50 > 0 else None,
+        "peak_rss_mb": round(memory.peak_mb, 1),
+        "rss_growth_mb": round(memory.peak_mb - memory.start_mb, 1),
+    }
+
+
+def environment() -> Dict:
+    """Machine and library versions a result was measured with"""
+    import pandas as pd
+    import xgboost as xgb
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "xgboost": xgb.__version__,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE,
+            min_delta_ms: float = DEFAULT_MIN_DELTA_MS, rss_tolerance: float = DEFAULT_RSS_TOLERANCE,
+            min_rss_delta_mb: float = DEFAULT_MIN_RSS_DELTA_MB) -> List[str]:
+    """
+    Cases of a run that regressed against a baseline run
+
+    Only cases present in both runs are compared, on p50 latency and on
+    peak RSS; both have to grow by more than the relative tolerance and the
+    absolute minimum to count.
+
+    Args:
+        results: Run as written by benchmarks.run ({"results": {size: {case: figures}}})
+        baseline: Baseline run in the same format
+
+    Returns:
+        Human-readable regressions (empty if none)
+    """
+    regressions = []
+    for size, cases in results.get("results", {}).items():
+        base_cases = baseline.get("results", {}).get(size, {})
+        for case, figures in cases.items():
+            base = base_cases.get(case)
+            if not base or "error" in figures or "error" in base:
+                continue
+            p50, base_p50 = figures["p50_ms"], base["p50_ms"]
+            if p50 > base_p50 * (1 + tolerance) and p50 - base_p50 > min_delta_ms:
+                regressions.append(f"{size} {case}: p50 {p50:.3f}ms vs baseline {base_p50:.3f}ms "
+                                   f"(+{(p50 / base_p50 - 1) * 100:.0f}%)")
+            rss, base_rss = figures["peak_rss_mb"], base["peak_rss_mb"]
+            if rss > base_rss * (1 + rss_tolerance) and rss - base_rss > min_rss_delta_mb:
+                regressions.append(f"{size} {case}: peak RSS {rss:.0f}MB vs baseline {base_rss:.0f}MB")
+    return regressions
+
+
+def load_json(path: str) -> Optional[Dict]:
+    """A results file, or None if it does not exist"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: Dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
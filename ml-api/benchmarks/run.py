@@ -0,0 +1,257 @@
+"""
+Benchmark suite of the feature engineering, inference and explanation paths
+Generates synthetic PaySim-shaped data, times the steps below at every size,
+writes throughput, p50/p99 latency and peak RSS per case to a JSON file and
+compares it with a baseline run:
+
+- fe.fit / fe.transform: FraudFeatureEngineer on all rows
+- predict.batch_<n>: FraudInference.predict on batches of n transactions
+- predict_and_explain: one transaction with SHAP, as /predict serves it without the LLM
+- explain_shap: FraudInference.explain_shap of one transaction
+- feature_table.build / backtest.rule_window / backtest.batch: Policy Lab backtests
+- simulation.serialize: events of the simulation stream
+
+The model is an XGBoost classifier trained on the synthetic data with fixed
+parameters (sized like the bundled model), so runs only differ by the code.
+
+Usage:
+    python -m benchmarks.run [--sizes 10k,1m,10m] [--baseline benchmarks/baseline.json]
+                             [--output benchmarks/results.json] [--update-baseline]
+
+Exits with status 1 when a case regressed past the tolerance or the
+single-transaction p99 is over the latency budget.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import xgboost as xgb
+
+from benchmarks.harness import (
+    DEFAULT_MIN_DELTA_MS, DEFAULT_TOLERANCE, PeakRSS, compare, environment, load_json, measure,
+    summarize, write_json
+)
+from benchmarks.synthetic import paysim_frame, parse_size
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+
+CASE_GROUPS = ('fe', 'predict', 'explain', 'backtest', 'simulation')
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+# Shaped like Models/fraud_pipeline_final.pkl (489 trees of depth 7)
+MODEL_PARAMS = dict(n_estimators=500, max_depth=7, learning_rate=0.05, random_state=0, tree_method='hist')
+# Rows the benchmark model is trained on (training is setup, not a case)
+MODEL_TRAIN_ROWS = 200_000
+# The README promises risk scoring in under 200ms
+LATENCY_BUDGET_MS = 200.0
+# Rows fitted / transformed at a time, like feature_store.build_feature_table
+TRANSFORM_CHUNK_ROWS = 250_000
+RULES = [
+    'amount > 200000 and type == "TRANSFER"',
+    'amount_over_oldBalanceOrig > 0.9 and dest_txn_count > 3',
+    'is_new_dest == 1 and amount > 50000',
+    'hour < 6 and amount > 10000',
+    'amt_ratio_to_user_mean > 3 or network_trust < 0.1',
+]
+
+
+def _repeats(rows: int, small: int) -> int:
+    """Timed calls of whole-dataset steps (one call is enough at a million rows)"""
+    return small if rows <= 100_000 else 1
+
+
+def _transform(fe, frame):
+    return [fe.transform(frame.iloc[start:start + TRANSFORM_CHUNK_ROWS])
+            for start in range(0, len(frame), TRANSFORM_CHUNK_ROWS)]
+
+
+def _simulation_events(frame, events: int) -> Dict:
+    """Serialize `events` rows through the simulation stream, timing each event"""
+    from simulation import SimulationManager
+
+    manager = SimulationManager()
+    manager.dataset = frame
+    manager.delay = 0
+    manager.is_running = True
+
+    async def drain():
+        stream = manager.stream_generator()
+        samples = []
+        with PeakRSS() as memory:
+            for _ in range(events):
+                start = time.perf_counter()
+                await stream.__anext__()
+                samples.append(time.perf_counter() - start)
+        await stream.aclose()
+        return summarize(samples, 1, memory)
+
+    return asyncio.run(drain())
+
+
+def run_size(rows: int, groups: Sequence[str], threads: int, batch_sizes: Sequence[int], seed: int) -> Dict:
+    """All cases of one dataset size"""
+    from feature_engineering import FraudFeatureEngineer
+    from inference import FraudInference
+
+    results: Dict[str, Dict] = {}
+    print(f"📦 Generating {rows:,} synthetic transactions...")
+    frame = paysim_frame(rows, seed=seed)
+    raw = frame.drop(columns=['isFraud'])
+
+    def case(name: str, fn) -> None:
+        print(f"⏱️ {name}...", flush=True)
+        try:
+            results[name] = fn()
+        except Exception as e:
+            print(f"⚠️ {name} failed: {str(e)}")
+            results[name] = {"error": str(e)}
+        figures = results[name]
+        if "error" not in figures:
+            print(f"   p50 {figures['p50_ms']:.3f}ms  p99 {figures['p99_ms']:.3f}ms  "
+                  f"{figures['rows_per_second']:,.0f} rows/s  peak RSS {figures['peak_rss_mb']:.0f}MB")
+        gc.collect()
+
+    fe = FraudFeatureEngineer(pagerank_limit=int(os.getenv("PAGERANK_LIMIT", "10000")) or None)
+    if 'fe' in groups:
+        case("fe.fit", lambda: measure(lambda i: fe.fit(raw), _repeats(rows, 3), rows, warmup=0))
+        case("fe.transform", lambda: measure(lambda i: _transform(fe, raw), _repeats(rows, 3), rows,
+                                             warmup=1 if rows <= 100_000 else 0))
+    else:
+        fe.fit(raw)
+
+    tmpdir = tempfile.mkdtemp(prefix="clovershield-bench-")
+    try:
+        engine = None
+        if {'predict', 'explain'} & set(groups):
+            train = frame.head(MODEL_TRAIN_ROWS)
+            X = fe.transform(train.drop(columns=['isFraud']))
+            model = xgb.XGBClassifier(**MODEL_PARAMS, n_jobs=threads).fit(X, train['isFraud'])
+            model_path = os.path.join(tmpdir, "model.pkl")
+            joblib.dump(model, model_path)
+            engine = FraudInference(model_path, feature_engineer=fe, shap_background=X.sample(100, random_state=0))
+            del X, train
+
+        if 'predict' in groups:
+            for size in batch_sizes:
+                size = min(size, rows)
+                calls = max(5, min(200, 20_000 // size))
+                starts = [(i * size) % (rows - size + 1) for i in range(calls + 1)]
+                case(f"predict.batch_{size}", lambda: measure(
+                    lambda i: engine.predict(raw.iloc[starts[i]:starts[i] + size]), calls, size))
+
+        if 'explain' in groups:
+            case("predict_and_explain", lambda: measure(
+                lambda i: engine.predict_and_explain(raw.iloc[[i % rows]], use_llm=False), 100, 1))
+            case("explain_shap", lambda: measure(lambda i: engine.explain_shap(raw.iloc[[i % rows]]), 100, 1))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if 'backtest' in groups:
+        from backtest import backtest_rule_batch, backtest_rule_window
+        from feature_store import build_feature_table
+        from rules import compile_rule
+
+        tables = []
+        case("feature_table.build", lambda: measure(
+            lambda i: tables.append(build_feature_table(frame, fe)), 1, rows, warmup=0))
+        table = tables[-1]
+        rules = [compile_rule(text) for text in RULES]
+        case("backtest.rule_window", lambda: measure(
+            lambda i: backtest_rule_window(table, rules[i % len(rules)], 0, rows), 10, rows))
+        case("backtest.batch", lambda: measure(
+            lambda i: backtest_rule_batch(table, rules, 0, rows), 5, rows))
+        del tables, table
+
+    if 'simulation' in groups:
+        case("simulation.serialize", lambda: _simulation_events(frame, min(rows, 5000)))
+
+    return results
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark feature engineering, inference and explanations")
+    parser.add_argument('--sizes', default="10k", help="Dataset sizes, e.g. 10k,1m,10m")
+    parser.add_argument('--cases', default=",".join(CASE_GROUPS), help=f"Case groups ({','.join(CASE_GROUPS)})")
+    parser.add_argument('--batch-sizes', default=",".join(map(str, BATCH_SIZES)),
+                        help="Batch sizes of the predict cases")
+    parser.add_argument('--threads', type=int, default=1, help="XGBoost threads of the benchmark model")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Where to write this run")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Run to compare against")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Merge this run into the baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative p50 / peak RSS growth over the baseline")
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="p50 growth below this is never a regression")
+    parser.add_argument('--latency-budget-ms', type=float, default=LATENCY_BUDGET_MS,
+                        help="p99 budget of predict_and_explain (0 = no check)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    groups = [g.strip() for g in args.cases.split(",") if g.strip()]
+    unknown = set(groups) - set(CASE_GROUPS)
+    if unknown:
+        print(f"❌ Unknown case groups: {sorted(unknown)}")
+        return 2
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b.strip()]
+
+    run = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "environment": environment(),
+        "settings": {"threads": args.threads, "seed": args.seed, "model": MODEL_PARAMS},
+        "results": {},
+    }
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        run["results"][size] = run_size(parse_size(size), groups, args.threads, batch_sizes, args.seed)
+    write_json(args.output, run)
+    print(f"💾 Results written to {args.output}")
+
+    failures: List[str] = []
+    for size, cases in run["results"].items():
+        p99 = cases.get("predict_and_explain", {}).get("p99_ms")
+        if args.latency_budget_ms > 0 and p99 is not None and p99 > args.latency_budget_ms:
+            failures.append(f"{size} predict_and_explain: p99 {p99:.1f}ms is over the "
+                            f"{args.latency_budget_ms:g}ms budget")
+
+    baseline = load_json(args.baseline)
+    if args.update_baseline:
+        merged = baseline or {"results": {}}
+        merged.update({k: v for k, v in run.items() if k != "results"})
+        for size, cases in run["results"].items():
+            merged["results"].setdefault(size, {}).update(cases)
+        write_json(args.baseline, merged)
+        print(f"📌 Baseline updated at {args.baseline}")
+    elif baseline is None:
+        print(f"⚠️ No baseline at {args.baseline}; run with --update-baseline to record one")
+    else:
+        if baseline.get("environment") != run["environment"]:
+            print("⚠️ Baseline was recorded on a different machine or library versions; "
+                  "compare with care")
+        failures.extend(compare(run, baseline, tolerance=args.tolerance, min_delta_ms=args.min_delta_ms))
+
+    if failures:
+        print("\n❌ Benchmark regressions:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
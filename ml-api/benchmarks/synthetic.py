@@ -0,0 +1,84 @@
+"""
+Synthetic PaySim-shaped transactions
+Same columns and rough distributions as dataset/test_dataset.csv (TRANSFER
+and CASH_OUT only, ~1% fraud, 743 hourly steps, heavy-tailed amounts,
+accounts that recur and receivers concentrated on few accounts), generated
+deterministically from a seed so benchmark runs are comparable without the
+dataset file. The tests build their transactions with it too.
+"""
+
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+STEPS = 743
+FRAUD_RATE = 0.0106
+# Distinct senders / receivers per row in the bundled sample
+ORIG_ACCOUNTS_PER_ROW = 0.32
+DEST_ACCOUNTS_PER_ROW = 0.2
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def parse_size(size: Union[str, int]) -> int:
+    """Row count of a size name ('10k', '1m', '10m') or number"""
+    text = str(size).strip().lower()
+    if text in SIZES:
+        return SIZES[text]
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def paysim_frame(rows: int, seed: int = 0, fraud_rate: float = FRAUD_RATE, steps: int = STEPS,
+                 types: Sequence[str] = ('TRANSFER', 'CASH_OUT')) -> pd.DataFrame:
+    """
+    Raw transactions shaped like the PaySim sample the API is fitted on
+
+    Args:
+        rows: Number of transactions
+        seed: Random seed (same seed and rows give the same frame)
+        fraud_rate: Share of fraudulent transactions
+        steps: Number of hourly steps the transactions span
+        types: Transaction types, drawn uniformly
+
+    Returns:
+        DataFrame with the dataset's columns, sorted by step
+    """
+    rng = np.random.default_rng(seed)
+    n_orig = max(int(rows * ORIG_ACCOUNTS_PER_ROW), 1)
+    n_dest = max(int(rows * DEST_ACCOUNTS_PER_ROW), 1)
+
+    step = np.sort(rng.integers(1, steps + 1, rows)).astype(np.int64)
+    is_fraud = (rng.random(rows) < fraud_rate).astype(np.int64)
+    amount = np.round(rng.lognormal(10.0, 1.5, rows), 2)
+    # Senders recur uniformly; receivers are skewed towards low ids (mule accounts)
+    orig = rng.integers(0, n_orig, rows)
+    dest = (n_dest * rng.random(rows) ** 3).astype(np.int64)
+
+    old_orig = np.round(np.where(rng.random(rows) < 0.3, 0.0, rng.lognormal(10.0, 1.6, rows)), 2)
+    new_orig = np.maximum(old_orig - amount, 0.0)
+    old_dest = np.round(np.where(rng.random(rows) < 0.35, 0.0, rng.lognormal(11.0, 1.7, rows)), 2)
+    new_dest = old_dest + amount
+
+    # PaySim fraud drains the sender and is often not credited on the receiver side
+    fraud = is_fraud == 1
+    old_orig[fraud] = amount[fraud]
+    new_orig[fraud] = 0.0
+    uncredited = fraud & (rng.random(rows) < 0.5)
+    new_dest[uncredited] = old_dest[uncredited]
+
+    return pd.DataFrame({
+        'step': step,
+        'type': np.asarray(types)[(rng.random(rows) * len(types)).astype(np.int64)],
+        'amount': amount,
+        'nameOrig': pd.Series(orig).map('C{}'.format).to_numpy(),
+        'oldBalanceOrig': old_orig,
+        'newBalanceOrig': np.round(new_orig, 2),
+        # Receivers and senders use separate id ranges, like PaySim's C / M accounts
+        'nameDest': pd.Series(dest + n_orig).map('C{}'.format).to_numpy(),
+        'oldBalanceDest': old_dest,
+        'newBalanceDest': np.round(new_dest, 2),
+        'isFraud': is_fraud,
+        'isFlaggedFraud': 0,
+    })
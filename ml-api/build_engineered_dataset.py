@@ -0,0 +1,247 @@
+"""
+Build test_dataset_engineered from the raw dataset
+Fits the feature engineer the same way the API does, transforms the dataset
+in vectorized chunks and streams them into Postgres with COPY, replacing the
+manually uploaded dataset_upload_engineered.csv
+
+Usage:
+    python build_engineered_dataset.py [--dataset dataset/test_dataset.csv.gz] [--force]
+"""
+
+import argparse
+import io
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Iterator, Optional, Sequence, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from feature_engineering import FraudFeatureEngineer, frame_fingerprint
+
+ENGINEERED_TABLE = 'test_dataset_engineered'
+LOADS_TABLE = 'engineered_dataset_loads'
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Columns of test_dataset_engineered (migration 013) in load order
+ID_COLUMNS = ['nameOrig', 'nameDest', 'isFraud']
+RAW_COLUMNS = ['step', 'amount', 'oldBalanceOrig', 'newBalanceOrig', 'oldBalanceDest', 'newBalanceDest']
+FEATURE_COLUMNS = ['hour', 'orig_txn_count', 'dest_txn_count', 'amt_ratio_to_user_mean', 'amount_log1p',
+                   'amount_over_oldBalanceOrig', 'amt_ratio_to_user_median', 'amt_log_ratio_to_user_median',
+                   'in_degree', 'out_degree', 'network_trust', 'is_new_origin', 'is_new_dest', 'type_encoded']
+TABLE_COLUMNS = ID_COLUMNS + RAW_COLUMNS + FEATURE_COLUMNS + ['fe_version']
+
+DEFAULT_DATASET_PATHS = [
+    "dataset/test_dataset.csv.gz",
+    "dataset/test_dataset.csv",
+    "../dataset/test_dataset.csv.gz",
+]
+
+
+def fit_feature_engineer(dataset: pd.DataFrame, pagerank_limit: Optional[int] = 10000) -> FraudFeatureEngineer:
+    """Fit the feature engineer on the full dataset (same settings as the API)"""
+    fe = FraudFeatureEngineer(pagerank_limit=pagerank_limit)
+    fe.fit(dataset)
+    return fe
+
+
+def engineered_chunk(fe: FraudFeatureEngineer, raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Transform one chunk of raw rows into the test_dataset_engineered layout
+
+    Args:
+        fe: Fitted feature engineer
+        raw: Raw transactions
+
+    Returns:
+        DataFrame with TABLE_COLUMNS, in that order
+    """
+    features = fe.transform(raw)
+    missing = [c for c in FEATURE_COLUMNS if c not in features.columns]
+    if missing:
+        raise ValueError(f"Feature engineer output lacks table columns: {missing}")
+    out = pd.DataFrame(index=raw.index)
+    for column in ID_COLUMNS:
+        out[column] = raw[column] if column in raw.columns else pd.NA
+    for column in RAW_COLUMNS + FEATURE_COLUMNS:
+        out[column] = features[column]
+    out['fe_version'] = fe.version
+    return out
+
+
+def engineered_csv_chunks(fe: FraudFeatureEngineer, dataset: pd.DataFrame,
+                          chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Tuple[int, io.StringIO]]:
+    """
+    Yield (row count, CSV buffer) per chunk, ready for COPY FROM STDIN
+
+    The next chunk is transformed on a background thread while the current
+    one is being sent, so the transform overlaps the network transfer.
+    """
+    slots: "queue.Queue" = queue.Queue(maxsize=2)
+    done = object()
+
+    def produce():
+        try:
+            for start in range(0, len(dataset), chunk_rows):
+                frame = engineered_chunk(fe, dataset.iloc[start:start + chunk_rows])
+                buffer = io.StringIO()
+                frame.to_csv(buffer, header=False, index=False)
+                buffer.seek(0)
+                slots.put((len(frame), buffer))
+            slots.put(done)
+        except Exception as e:
+            slots.put(e)
+
+    threading.Thread(target=produce, name="engineer-chunks", daemon=True).start()
+    while True:
+        item = slots.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def find_dataset(path: Optional[str] = None) -> str:
+    candidates = [path] if path else DEFAULT_DATASET_PATHS
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"Raw dataset not found. Tried: {candidates}")
+
+
+def load_engineered_dataset(db_url: str, dataset: pd.DataFrame, fe: FraudFeatureEngineer,
+                            dataset_version: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                            force: bool = False) -> int:
+    """
+    Replace the contents of test_dataset_engineered in one transaction
+
+    The new rows are copied in next to the previous load, which is deleted
+    at the end of the same transaction. Both only take a ROW EXCLUSIVE lock,
+    so readers are never blocked: until the commit they see the previous
+    load, then the complete new one. The load is recorded in
+    engineered_dataset_loads with the feature engineer and dataset
+    versions; a rerun for versions already loaded is a no-op.
+
+    Args:
+        db_url: Postgres connection string
+        dataset: Raw dataset the feature engineer was fitted on
+        fe: Fitted feature engineer
+        dataset_version: Fingerprint of the raw dataset
+        chunk_rows: Rows per transformed chunk
+        force: Reload even if these versions are already loaded
+
+    Returns:
+        Number of rows loaded (0 if skipped)
+    """
+    import psycopg2
+
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT rows_loaded FROM {LOADS_TABLE} WHERE fe_version = %s AND dataset_version = %s "
+                f"AND status = 'completed' ORDER BY finished_at DESC LIMIT 1",
+                (fe.version, dataset_version)
+            )
+            previous = cur.fetchone()
+            if previous and not force:
+                print(f"✅ {ENGINEERED_TABLE} already holds feature version {fe.version} "
+                      f"({previous[0]:,} rows); use --force to reload")
+                return 0
+
+            start_time = time.time()
+            cur.execute(
+                f"INSERT INTO {LOADS_TABLE} (fe_version, dataset_version, status) "
+                f"VALUES (%s, %s, 'running') RETURNING id",
+                (fe.version, dataset_version)
+            )
+            load_id = cur.fetchone()[0]
+        conn.commit()
+
+        column_sql = ", ".join(f'"{c}"' for c in TABLE_COLUMNS)
+        loaded = 0
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL synchronous_commit = off")
+                # One load at a time, so the rows of the previous load are the ones up to this id
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (ENGINEERED_TABLE,))
+                cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {ENGINEERED_TABLE}")
+                previous_max_id = cur.fetchone()[0]
+                for rows, buffer in engineered_csv_chunks(fe, dataset, chunk_rows):
+                    cur.copy_expert(
+                        f"COPY {ENGINEERED_TABLE} ({column_sql}) FROM STDIN WITH (FORMAT csv)", buffer
+                    )
+                    loaded += rows
+                    rate = loaded / max(time.time() - start_time, 1e-9)
+                    print(f"  ✅ Loaded {loaded:,}/{len(dataset):,} rows ({rate:,.0f} rows/s)...", end='\r')
+                # Not TRUNCATE: its ACCESS EXCLUSIVE lock would block readers until the commit
+                cur.execute(f"DELETE FROM {ENGINEERED_TABLE} WHERE id <= %s", (previous_max_id,))
+                elapsed = time.time() - start_time
+                cur.execute(
+                    f"UPDATE {LOADS_TABLE} SET status = 'completed', rows_loaded = %s, "
+                    f"seconds = %s, finished_at = NOW() WHERE id = %s",
+                    (loaded, round(elapsed, 2), load_id)
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"UPDATE {LOADS_TABLE} SET status = 'failed', error = %s, finished_at = NOW() WHERE id = %s",
+                    (str(e)[:1000], load_id)
+                )
+            conn.commit()
+            raise
+
+        print(f"\n✅ Loaded {loaded:,} rows into {ENGINEERED_TABLE} in {elapsed:.1f}s "
+              f"(feature version {fe.version})")
+        return loaded
+    finally:
+        conn.close()
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Rebuild {ENGINEERED_TABLE} from the raw dataset")
+    parser.add_argument('--dataset', help="Raw dataset CSV (.csv or .csv.gz)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per COPY chunk")
+    parser.add_argument('--pagerank-limit', type=int, default=int(os.getenv("PAGERANK_LIMIT", "10000")),
+                        help="PageRank node limit of the feature engineer (0 = no limit)")
+    parser.add_argument('--force', action='store_true', help="Reload even if this feature version is loaded")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+
+    db_url = os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
+    if not db_url:
+        print("❌ Error: SUPABASE_DB_URL or DATABASE_URL environment variable not set")
+        return 1
+
+    try:
+        path = find_dataset(args.dataset)
+        print(f"📦 Loading raw dataset from {path}...")
+        dataset = pd.read_csv(path)
+        if 'isFlaggedFraud' not in dataset.columns:
+            dataset['isFlaggedFraud'] = 0
+        dataset_version = frame_fingerprint(dataset)
+
+        print(f"🔧 Fitting feature engineer on {len(dataset):,} rows...")
+        fe = fit_feature_engineer(dataset, args.pagerank_limit or None)
+        print(f"✅ Feature engineer fitted (version {fe.version})")
+
+        load_engineered_dataset(db_url, dataset, fe, dataset_version,
+                                chunk_rows=args.chunk_rows, force=args.force)
+    except Exception as e:
+        print(f"\n❌ Error building {ENGINEERED_TABLE}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Cascade Scoring Module
+Two-stage scoring: the first K trees of a model screen every transaction,
+and only those scoring at or above a screening threshold go on to the full
+model (and SHAP / LLM explanation). K and the threshold are calibrated at
+training time on the labelled validation split so that the frauds the full
+model catches still reach it, checked on the untouched test split, and
+stored next to the model file.
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# Serve with the cascade when the model has a calibration file
+CASCADE_SCORING = os.getenv("CASCADE_SCORING", "false").lower() == "true"
+# Screening tree counts tried at calibration
+CASCADE_TREES = [int(k) for k in os.getenv("CASCADE_TREES", "4,8,16,32").split(",") if k.strip()]
+# Share of the validation frauds caught by the full model that the screen must pass on
+CASCADE_TARGET_RECALL = float(os.getenv("CASCADE_TARGET_RECALL", "1.0"))
+# Lowest probability a decision acts on (the serving MODEL_THRESHOLD): frauds the
+# full model scores below it are missed with or without the screen
+CASCADE_DECISION_THRESHOLD = float(os.getenv("MODEL_THRESHOLD", "0.0793"))
+# Fewer validation frauds than this leave the threshold too uncertain to calibrate
+CASCADE_MIN_FRAUD = int(os.getenv("CASCADE_MIN_FRAUD", "20"))
+
+
+def cascade_path(model_path: str) -> str:
+    """Calibration file stored next to a model file"""
+    return f"{os.path.splitext(model_path)[0]}_cascade.json"
+
+
+def screen_scores(model, X, trees: int) -> np.ndarray:
+    """Fraud probability from the first `trees` trees of a model"""
+    return model.predict_proba(X, iteration_range=(0, trees))[:, 1]
+
+
+def calibrate_cascade(model, X, y, tree_options=None, target_recall: float = CASCADE_TARGET_RECALL,
+                      decision_threshold: float = CASCADE_DECISION_THRESHOLD,
+                      min_fraud: int = CASCADE_MIN_FRAUD) -> Dict:
+    """
+    Pick the screening tree count and threshold on a labelled holdout
+
+    The frauds to keep are the holdout frauds the full model scores at or
+    above decision_threshold. For every candidate K the screening threshold
+    is the highest one that still passes target_recall of them, so the
+    cascade's recall matches the full model's. The K with the lowest
+    expected trees per transaction (K for everything, plus the full model
+    for the passed share) wins.
+
+    Args:
+        model: Fitted XGBClassifier
+        X: Engineered holdout features
+        y: Holdout labels
+        tree_options: Screening tree counts to try (default CASCADE_TREES)
+        target_recall: Share of the caught frauds that must pass the screen
+        decision_threshold: Lowest probability a decision acts on
+        min_fraud: Minimum caught holdout frauds to calibrate
+
+    Returns:
+        Dict with trees, threshold, pass_rate, screen_recall, recall, tree_cost_ratio
+        and screened_probability, or with 'skipped' giving the reason
+    """
+    y = np.asarray(y)
+    full = model.predict_proba(X)[:, 1]
+    frauds = (y == 1) & (full >= decision_threshold)
+    if frauds.sum() < min_fraud:
+        return {"skipped": f"full model catches {int(frauds.sum())} holdout frauds (need {min_fraud})"}
+    total = model.get_booster().num_boosted_rounds()
+    options = sorted(k for k in (tree_options or CASCADE_TREES) if 0 < k < total)
+    if not options:
+        return {"skipped": f"model has only {total} trees"}
+
+    best = None
+    for trees in options:
+        screen = screen_scores(model, X, trees)
+        threshold = float(np.quantile(screen[frauds], 1 - target_recall, method='lower'))
+        passed = screen >= threshold
+        pass_rate = float(passed.mean())
+        cost = (trees + pass_rate * total) / total
+        if best is None or cost < best[0]:
+            best = (cost, trees, threshold, passed, pass_rate)
+
+    cost, trees, threshold, passed, pass_rate = best
+    positives = max(int((y == 1).sum()), 1)
+    return {
+        "trees": trees,
+        "threshold": threshold,
+        "total_trees": total,
+        "pass_rate": round(pass_rate, 6),
+        "screen_recall": round(float(passed[frauds].mean()), 6),
+        # Holdout recall at decision_threshold: full model alone and through the cascade
+        "recall": {"full": round(float(frauds.sum() / positives), 6),
+                   "cascade": round(float((frauds & passed).sum() / positives), 6)},
+        "decision_threshold": decision_threshold,
+        "tree_cost_ratio": round(cost, 6),
+        # Reported for rows the screen stops (mean full-model score of those holdout rows)
+        "screened_probability": float(full[~passed].mean()) if (~passed).any() else 0.0,
+        "holdout_rows": int(len(y)),
+    }
+
+
+def evaluate_cascade(model, X, y, calibration: Dict) -> Dict:
+    """
+    Figures of a calibrated cascade on labelled rows it was not calibrated on
+
+    Returns:
+        Dict with pass_rate, screen_recall, recall (full model and cascade at
+        the calibration's decision threshold) and rows
+    """
+    y = np.asarray(y)
+    full = model.predict_proba(X)[:, 1]
+    frauds = (y == 1) & (full >= calibration['decision_threshold'])
+    passed = screen_scores(model, X, calibration['trees']) >= calibration['threshold']
+    positives = max(int((y == 1).sum()), 1)
+    return {
+        "pass_rate": round(float(passed.mean()), 6) if len(y) else None,
+        "screen_recall": round(float(passed[frauds].mean()), 6) if frauds.any() else None,
+        "recall": {"full": round(float(frauds.sum() / positives), 6),
+                   "cascade": round(float((frauds & passed).sum() / positives), 6)},
+        "rows": int(len(y)),
+    }
+
+
+def save_cascade(model_path: str, calibration: Dict) -> bool:
+    """Write a calibration next to its model file (skipped calibrations are not written)"""
+    if not calibration or 'threshold' not in calibration:
+        return False
+    with open(cascade_path(model_path), 'w') as f:
+        json.dump(calibration, f)
+    return True
+
+
+def load_cascade(model_path: str) -> Optional[Dict]:
+    """Calibration of a model file, or None if it has none"""
+    try:
+        with open(cascade_path(model_path)) as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return calibration if 'threshold' in calibration else None
@@ -0,0 +1,237 @@
+"""
+Deployed Rules Module
+Policy Lab rules promoted to production, evaluated next to the model on
+every scored transaction (hybrid detection)
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from feature_store import encode_types
+from rules import CompiledRule, RuleError, compile_rule
+
+DEPLOYED_RULES_PATH = os.getenv("DEPLOYED_RULES_PATH", "deployed_rules.json")
+# Seconds between checks of the rules file for changes
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "2"))
+
+# Rule actions, ordered by severity (same vocabulary as model decisions)
+DECISION_SEVERITY = {'pass': 0, 'warn': 1, 'block': 2}
+DECISION_RISK_LEVEL = {'pass': 'low', 'warn': 'medium', 'block': 'high'}
+RULE_ACTIONS = ['warn', 'block']
+
+
+def fuse_decision(model_decision: str, actions: Sequence[str]) -> Tuple[str, str]:
+    """
+    Combine the model decision with the actions of the rules that fired
+
+    The most severe of them wins.
+
+    Args:
+        model_decision: pass, warn or block from the model probability
+        actions: Actions of the fired rules
+
+    Returns:
+        (decision, risk_level)
+    """
+    decision = max([model_decision, *actions], key=DECISION_SEVERITY.__getitem__)
+    return decision, DECISION_RISK_LEVEL[decision]
+
+
+def rule_columns(features: pd.DataFrame, transactions: pd.DataFrame,
+                 needed: Optional[set] = None,
+                 probabilities: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Build the columns rules are evaluated on for freshly scored transactions
+
+    Args:
+        features: Output of the feature engineer's transform
+        transactions: Raw transactions the features came from
+        needed: Only extract these columns (all if None)
+        probabilities: Model scores, exposed as fraud_probability
+
+    Returns:
+        Mapping of column name to arrays (type as codes, like the feature table)
+    """
+    names = features.columns if needed is None else [c for c in features.columns if c in needed]
+    columns = {name: features[name].to_numpy() for name in names}
+    if 'type' in transactions.columns and (needed is None or 'type' in needed):
+        columns['type'] = encode_types(transactions['type'].tolist())
+    if 'isFlaggedFraud' in transactions.columns and (needed is None or 'isFlaggedFraud' in needed):
+        columns['isFlaggedFraud'] = transactions['isFlaggedFraud'].to_numpy()
+    if probabilities is not None:
+        columns['fraud_probability'] = np.asarray(probabilities)
+    return columns
+
+
+class RuleSet:
+    """A compiled, immutable set of deployed rules"""
+
+    def __init__(self, rules: List[Dict], version: int = 0, updated_at: Optional[str] = None):
+        """
+        Compile a rule set
+
+        Args:
+            rules: Rule definitions (name, rule_logic, action, enabled)
+            version: Version number of the rule set
+            updated_at: When the rule set was last changed
+
+        Raises:
+            RuleError: If a rule does not compile or has an unknown action
+        """
+        self.rules = [normalize_definition(rule) for rule in rules]
+        self.version = version
+        self.updated_at = updated_at
+        self.compiled: List[Tuple[Dict, CompiledRule]] = [
+            (rule, compile_rule(rule['rule_logic'])) for rule in self.rules if rule['enabled']
+        ]
+        self.columns = set().union(*(compiled.columns for _, compiled in self.compiled))
+        self._broken: set = set()
+
+    def __len__(self) -> int:
+        return len(self.compiled)
+
+    def evaluate(self, columns: Mapping[str, np.ndarray]) -> List[Tuple[Dict, np.ndarray]]:
+        """
+        Evaluate every enabled rule over the columns (shared sub-predicates once)
+
+        A rule referencing a column the current features do not have is
+        skipped (and reported once) rather than failing the prediction.
+
+        Args:
+            columns: Output of rule_columns()
+
+        Returns:
+            List of (rule definition, boolean mask) for rules that matched any row
+        """
+        memo: Dict[str, np.ndarray] = {}
+        fired = []
+        for rule, compiled in self.compiled:
+            try:
+                mask = compiled.evaluate(columns, memo=memo)
+            except RuleError as e:
+                if rule['name'] not in self._broken:
+                    self._broken.add(rule['name'])
+                    print(f"⚠️ Deployed rule '{rule['name']}' skipped: {e}")
+                continue
+            if mask.any():
+                fired.append((rule, mask))
+        return fired
+
+    def fired_per_row(self, columns: Mapping[str, np.ndarray], n_rows: int) -> List[List[Dict]]:
+        """Rules that fired for each of n_rows transactions"""
+        per_row: List[List[Dict]] = [[] for _ in range(n_rows)]
+        for rule, mask in self.evaluate(columns):
+            for i in np.flatnonzero(mask):
+                per_row[i].append(rule)
+        return per_row
+
+    def to_dict(self) -> Dict:
+        return {"version": self.version, "updated_at": self.updated_at, "rules": self.rules}
+
+
+def normalize_definition(rule: Dict) -> Dict:
+    """
+    Validate one rule definition and fill in defaults
+
+    Raises:
+        RuleError: If the rule logic or action is invalid
+    """
+    if not rule.get('rule_logic'):
+        raise RuleError("Deployed rule is missing 'rule_logic'")
+    action = rule.get('action', 'block')
+    if action not in RULE_ACTIONS:
+        raise RuleError(f"Unknown rule action '{action}' (expected one of {RULE_ACTIONS})")
+    compiled = compile_rule(rule['rule_logic'])
+    return {
+        "name": rule.get('name') or compiled.canonical,
+        "rule_logic": rule['rule_logic'],
+        "action": action,
+        "enabled": bool(rule.get('enabled', True)),
+    }
+
+
+class DeployedRuleStore:
+    """
+    Holds the deployed RuleSet, backed by a JSON file.
+
+    The file is re-checked at most every RULES_RELOAD_INTERVAL seconds and
+    recompiled when its modification time changes, so edits (from the API,
+    another worker process or by hand) apply without a restart.
+    """
+
+    def __init__(self, path: str = DEPLOYED_RULES_PATH,
+                 reload_interval: float = RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.rule_set = RuleSet([])
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def get(self) -> RuleSet:
+        """Return the current rule set, reloading it if the file changed"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self._reload_if_changed()
+        return self.rule_set
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            if mtime is None:
+                self.rule_set = RuleSet([])
+            else:
+                try:
+                    with open(self.path) as f:
+                        data = json.load(f)
+                    self.rule_set = RuleSet(data.get('rules', []), data.get('version', 0),
+                                            data.get('updated_at'))
+                    print(f"✅ Loaded {len(self.rule_set)} deployed rules (v{self.rule_set.version})")
+                except (OSError, ValueError) as e:
+                    # Keep serving the previous rule set
+                    print(f"⚠️ Failed to load deployed rules from {self.path}: {e}")
+            self._mtime = mtime
+
+    def save(self, rules: List[Dict]) -> RuleSet:
+        """
+        Replace the deployed rules (validated, written atomically)
+
+        Args:
+            rules: Rule definitions
+
+        Returns:
+            The new RuleSet
+
+        Raises:
+            RuleError: If any rule is invalid (nothing is written)
+        """
+        with self._lock:
+            self._reload_if_changed()
+            rule_set = RuleSet(rules, self.rule_set.version + 1, datetime.utcnow().isoformat() + "Z")
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(rule_set.to_dict(), f, indent=2)
+            os.replace(tmp_path, self.path)
+            self.rule_set = rule_set
+            self._mtime = os.path.getmtime(self.path)
+            return rule_set
+
+
+deployed_rules = DeployedRuleStore()
@@ -4,12 +4,19 @@
 
 PORT=${PORT:-7860}
 HOST=${HOST:-0.0.0.0}
+WORKERS=${WORKERS:-1}
 
 echo "🚀 Starting CloverShield ML API"
-echo "📋 Configuration: HOST=$HOST, PORT=$PORT"
+echo "📋 Configuration: HOST=$HOST, PORT=$PORT, WORKERS=$WORKERS"
 echo "⏳ Server will start, model will load on startup..."
 echo "💡 Note: First request may take longer if model is still loading"
 
+# Multi-process mode: the pre-fork master loads the model once and forks
+# copy-on-write workers that share the listening socket
+if [ "$WORKERS" -gt 1 ]; then
+    exec python serve.py
+fi
+
 # Start uvicorn with the PORT from environment
 # Use --log-level info for better visibility
 exec uvicorn main:app --host "$HOST" --port "$PORT" --workers 1 --log-level info
@@ -0,0 +1,249 @@
+"""
+External Memory Training Module
+Out-of-core data path for uploads larger than RAM: the CSV is read in
+chunks, the feature engineer is fitted incrementally and the transformed
+features are written as float32 shards that XGBoost reads through its
+data-iterator (external memory) interface
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# Rows per chunk read from the upload and per feature shard; bounds peak memory
+TRAINING_CHUNK_ROWS = int(os.getenv("TRAINING_CHUNK_ROWS", "500000"))
+# Uploads at least this large (MB) are trained out-of-core
+TRAINING_STREAMING_MIN_MB = float(os.getenv("TRAINING_STREAMING_MIN_MB", "1024"))
+# Scratch space for feature shards and XGBoost's external-memory cache
+TRAINING_WORK_DIR = os.getenv("TRAINING_WORK_DIR", "temp_uploads/work")
+
+RAW_RENAMES = {'oldbalanceOrg': 'oldBalanceOrig', 'newbalanceOrig': 'newBalanceOrig',
+               'oldbalanceDest': 'oldBalanceDest', 'newbalanceDest': 'newBalanceDest',
+               'is_fraud': 'isFraud', 'fraud': 'isFraud'}
+TRAIN, VALIDATION, TEST = 0, 1, 2
+SPLIT_NAMES = {TRAIN: 'train', VALIDATION: 'validation', TEST: 'test'}
+
+
+def prepare_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize an uploaded frame: canonical column names, and only the
+    TRANSFER / CASH_OUT rows the model is trained on
+    """
+    df = df.rename(columns={k: v for k, v in RAW_RENAMES.items() if k in df.columns})
+    if 'type' in df.columns:
+        df = df[df['type'].isin(['TRANSFER', 'CASH_OUT'])].reset_index(drop=True)
+    return df
+
+
+def use_streaming(file_path: str, params: Dict) -> bool:
+    """Train out-of-core if requested, or by default for large uploads"""
+    streaming = params.get('streaming')
+    if streaming is not None:
+        return bool(streaming)
+    return os.path.getsize(file_path) >= TRAINING_STREAMING_MIN_MB * 1024 * 1024
+
+
+def iter_chunks(file_path: str, chunk_rows: int = TRAINING_CHUNK_ROWS,
+                usecols=None) -> Iterator[pd.DataFrame]:
+    """Yield prepared chunks of the upload (pandas handles .gz transparently)"""
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows, usecols=usecols):
+        chunk = prepare_transactions(chunk)
+        if len(chunk):
+            yield chunk
+
+
+def _weighted_quantile(counts: pd.Series, q: float) -> float:
+    """Quantile of the values in counts.index weighted by counts (pandas 'linear' method)"""
+    counts = counts.sort_index()
+    cumulative = counts.cumsum().to_numpy()
+    position = q * (cumulative[-1] - 1)
+    lower, upper = int(np.floor(position)), int(np.ceil(position))
+    values = counts.index.to_numpy()
+    low = values[np.searchsorted(cumulative, lower, side='right')]
+    high = values[np.searchsorted(cumulative, upper, side='right')]
+    return float(low + (high - low) * (position - lower))
+
+
+@dataclass
+class SplitPlan:
+    """
+    How every row is assigned to train / validation / test without holding
+    the dataset. Like make_splits and temporal_holdout, the test and
+    validation sets are the latest steps (cutoff set), or a seeded random
+    draw per row when the latest steps hold too few frauds (cutoff None).
+    """
+    test_frac: float = 0.05
+    validation_frac: float = 0.0
+    test_cutoff: Optional[float] = None
+    validation_cutoff: Optional[float] = None
+    random_state: int = 42
+
+    def assign(self, chunk: pd.DataFrame, chunk_index: int) -> np.ndarray:
+        """Split code (TRAIN, VALIDATION or TEST) of every row of a chunk"""
+        rng = np.random.default_rng([self.random_state, chunk_index])
+        test_draw, validation_draw = rng.random(len(chunk)), rng.random(len(chunk))
+        codes = np.full(len(chunk), TRAIN, dtype=np.int8)
+        step = chunk['step'].to_numpy() if 'step' in chunk.columns else None
+
+        if self.test_cutoff is not None:
+            is_test = step > self.test_cutoff
+        else:
+            is_test = test_draw < self.test_frac
+        if self.validation_cutoff is not None:
+            is_validation = step > self.validation_cutoff
+        else:
+            is_validation = validation_draw < self.validation_frac
+        codes[is_validation] = VALIDATION
+        codes[is_test] = TEST
+        return codes
+
+
+def plan_splits(file_path: str, test_frac: float = 0.05, validation_frac: float = 0.0,
+                chunk_rows: int = TRAINING_CHUNK_ROWS, min_test_fraud: int = 100,
+                min_val_fraud: int = 20) -> Tuple[SplitPlan, Dict]:
+    """
+    Scan the step and label columns once and plan the splits
+
+    Returns:
+        (SplitPlan, summary with row count and latest step)
+    """
+    wanted = {'step', 'type', 'isFraud', *[k for k, v in RAW_RENAMES.items() if v == 'isFraud']}
+    steps = None
+    frauds = None
+    rows = 0
+    for chunk in iter_chunks(file_path, chunk_rows, usecols=lambda c: c in wanted):
+        if 'isFraud' not in chunk.columns:
+            raise ValueError("Training data has no isFraud column")
+        rows += len(chunk)
+        if 'step' not in chunk.columns:
+            continue
+        chunk_steps = chunk['step'].value_counts()
+        chunk_frauds = chunk.loc[chunk['isFraud'] == 1, 'step'].value_counts()
+        steps = chunk_steps if steps is None else steps.add(chunk_steps, fill_value=0)
+        frauds = chunk_frauds if frauds is None else frauds.add(chunk_frauds, fill_value=0)
+    if rows == 0:
+        raise ValueError("Training data has no TRANSFER / CASH_OUT rows")
+
+    plan = SplitPlan(test_frac=test_frac, validation_frac=validation_frac)
+    if steps is not None:
+        frauds = (frauds if frauds is not None else pd.Series(dtype='float64')).reindex(steps.index, fill_value=0)
+        cutoff = _weighted_quantile(steps, 1 - test_frac)
+        if frauds[frauds.index > cutoff].sum() >= min_test_fraud:
+            plan.test_cutoff = cutoff
+            if validation_frac > 0:
+                train_steps = steps[steps.index <= cutoff]
+                val_cutoff = _weighted_quantile(train_steps, 1 - validation_frac)
+                late = (frauds.index > val_cutoff) & (frauds.index <= cutoff)
+                if val_cutoff < cutoff and frauds[late].sum() >= min_val_fraud:
+                    plan.validation_cutoff = val_cutoff
+    max_step = int(steps.index.max()) if steps is not None else None
+    return plan, {"rows": rows, "max_step": max_step}
+
+
+def fit_feature_engineer_streaming(fe, file_path: str, plan: SplitPlan,
+                                   chunk_rows: int = TRAINING_CHUNK_ROWS, progress=None):
+    """Fit the feature engineer on the training rows only, one chunk at a time"""
+    for index, chunk in enumerate(iter_chunks(file_path, chunk_rows)):
+        codes = plan.assign(chunk, index)
+        fe.partial_fit(chunk[codes == TRAIN])
+        if progress is not None:
+            progress(index)
+    return fe.finalize_fit()
+
+
+@dataclass
+class ShardSet:
+    """float32 feature shards of one job, per split"""
+    directory: str
+    feature_names: List[str] = field(default_factory=list)
+    files: Dict[int, List[Tuple[str, str]]] = field(default_factory=lambda: {TRAIN: [], VALIDATION: [], TEST: []})
+    rows: Dict[int, int] = field(default_factory=lambda: {TRAIN: 0, VALIDATION: 0, TEST: 0})
+    frauds: Dict[int, int] = field(default_factory=lambda: {TRAIN: 0, VALIDATION: 0, TEST: 0})
+
+    def load(self, split: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Concatenate the shards of a (small) split into memory"""
+        parts = self.files[split]
+        if not parts:
+            return np.empty((0, len(self.feature_names)), dtype=np.float32), np.empty(0, dtype=np.float32)
+        X = np.concatenate([np.load(x) for x, _ in parts])
+        y = np.concatenate([np.load(y) for _, y in parts])
+        return X, y
+
+
+def write_feature_shards(fe, file_path: str, plan: SplitPlan, directory: str,
+                         chunk_rows: int = TRAINING_CHUNK_ROWS, progress=None) -> ShardSet:
+    """
+    Transform the upload chunk by chunk into float32 .npy shards
+
+    Args:
+        fe: Fitted feature engineer
+        file_path: Upload
+        plan: Split assignment
+        directory: Where to write the shards
+        chunk_rows: Rows per chunk
+        progress: Optional callback receiving the chunk index
+
+    Returns:
+        ShardSet describing the written shards
+    """
+    os.makedirs(directory, exist_ok=True)
+    shards = ShardSet(directory)
+    for index, chunk in enumerate(iter_chunks(file_path, chunk_rows)):
+        codes = plan.assign(chunk, index)
+        features = fe.transform(chunk)
+        if not shards.feature_names:
+            shards.feature_names = list(features.columns)
+        X = features[shards.feature_names].to_numpy(dtype=np.float32)
+        y = chunk['isFraud'].to_numpy(dtype=np.float32)
+        for split in (TRAIN, VALIDATION, TEST):
+            mask = codes == split
+            if not mask.any():
+                continue
+            prefix = os.path.join(directory, f"{SPLIT_NAMES[split]}_{index:05d}")
+            np.save(f"{prefix}_X.npy", X[mask])
+            np.save(f"{prefix}_y.npy", y[mask])
+            shards.files[split].append((f"{prefix}_X.npy", f"{prefix}_y.npy"))
+            shards.rows[split] += int(mask.sum())
+            shards.frauds[split] += int(y[mask].sum())
+        if progress is not None:
+            progress(index)
+    return shards
+
+
+class ShardIter(xgb.DataIter):
+    """Feeds one split's shards to XGBoost, one shard per batch"""
+
+    def __init__(self, shards: ShardSet, split: int = TRAIN):
+        self.shards = shards
+        self.parts = shards.files[split]
+        self._index = 0
+        super().__init__(cache_prefix=os.path.join(shards.directory, f"cache_{SPLIT_NAMES[split]}"))
+
+    def next(self, input_data) -> bool:
+        if self._index == len(self.parts):
+            return False
+        x_path, y_path = self.parts[self._index]
+        input_data(data=np.load(x_path, mmap_mode='r'), label=np.load(y_path),
+                   feature_names=self.shards.feature_names)
+        self._index += 1
+        return True
+
+    def reset(self) -> None:
+        self._index = 0
+
+
+def external_memory_matrix(shards: ShardSet, split: int = TRAIN, max_bin: int = 256):
+    """
+    Out-of-core training matrix over the shards of a split
+
+    Uses ExtMemQuantileDMatrix where available (XGBoost >= 3.0), otherwise
+    the older iterator-backed external-memory DMatrix.
+    """
+    iterator = ShardIter(shards, split)
+    if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+        return xgb.ExtMemQuantileDMatrix(iterator, max_bin=max_bin)
+    return xgb.DMatrix(iterator)
@@ -0,0 +1,167 @@
+"""
+Feature Cache Module
+Caches the split, transformed training matrices and the fitted feature
+engineer of a training job on disk, so later jobs on the same upload with
+the same split and feature settings go straight to model fitting
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from feature_engineering import FEATURE_SCHEMA_VERSION
+
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "temp_uploads/feature_cache")
+# Cached datasets kept (least recently used are removed first, 0 = cache off)
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "8"))
+
+SPLITS = ('train', 'val', 'test')
+
+
+@dataclass
+class FeatureSet:
+    """Transformed splits of one upload plus the feature engineer fitted on the train split"""
+    X_train: pd.DataFrame
+    y_train: pd.Series
+    X_test: pd.DataFrame
+    y_test: pd.Series
+    fe: object
+    steps_train: Optional[np.ndarray] = None
+    X_val: Optional[pd.DataFrame] = None
+    y_val: Optional[pd.Series] = None
+    data_cutoff_step: Optional[int] = None
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    """sha1 of a file's content, read in blocks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file_path: str, params: Dict) -> str:
+    """
+    Key of the transformed data for an upload and the job settings that shape it
+
+    Only the split and feature-engineer options are part of the key; model
+    hyperparameters are not, so changing them reuses the entry.
+    """
+    early_stopping = int(params.get('early_stopping_rounds', 50)) > 0
+    validation_split = float(params.get('validation_split', 0.1)) if early_stopping else 0.0
+    settings = {
+        'file': file_digest(file_path),
+        'test_split': float(params.get('test_split', 0.05)),
+        'validation_split': validation_split,
+        'pagerank_limit': params.get('pagerank_limit', 10000),
+        'advanced_features': bool(params.get('advanced_feature_engineering', False)),
+        'schema': FEATURE_SCHEMA_VERSION,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:20]
+
+
+class FeatureCache:
+    """
+    Directory of cached FeatureSets, one subdirectory per key
+
+    Matrices are stored as float32 .npy files (the precision XGBoost trains
+    on) and loaded memory-mapped. An entry is written under a temporary name
+    and renamed into place, so concurrent training processes never read a
+    partial entry.
+    """
+
+    def __init__(self, directory: str = FEATURE_CACHE_DIR, max_entries: int = FEATURE_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def load(self, key: str) -> Optional[FeatureSet]:
+        """Return the cached FeatureSet for a key, or None"""
+        if not self.enabled:
+            return None
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            columns = meta['feature_names']
+            arrays = {}
+            for split in meta['splits']:
+                arrays[split] = (
+                    pd.DataFrame(np.load(os.path.join(entry, f"X_{split}.npy"), mmap_mode='r'), columns=columns),
+                    pd.Series(np.load(os.path.join(entry, f"y_{split}.npy")), name='isFraud'),
+                )
+            steps_path = os.path.join(entry, 'steps_train.npy')
+            steps = np.load(steps_path) if os.path.exists(steps_path) else None
+            fe = joblib.load(os.path.join(entry, 'fe.pkl'))
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+        os.utime(os.path.join(entry, 'meta.json'))  # recently used
+        X_val, y_val = arrays.get('val', (None, None))
+        return FeatureSet(arrays['train'][0], arrays['train'][1], arrays['test'][0], arrays['test'][1],
+                          fe, steps, X_val, y_val, meta.get('data_cutoff_step'))
+
+    def save(self, key: str, features: FeatureSet) -> None:
+        """Store a FeatureSet under a key (no-op if the cache is off or the key exists)"""
+        if not self.enabled:
+            return
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+        tmp = f"{entry}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            splits: List[str] = []
+            for split in SPLITS:
+                X, y = getattr(features, f"X_{split}"), getattr(features, f"y_{split}")
+                if X is None:
+                    continue
+                np.save(os.path.join(tmp, f"X_{split}.npy"), X.to_numpy(dtype=np.float32))
+                np.save(os.path.join(tmp, f"y_{split}.npy"), np.asarray(y))
+                splits.append(split)
+            if features.steps_train is not None:
+                np.save(os.path.join(tmp, 'steps_train.npy'), np.asarray(features.steps_train))
+            joblib.dump(features.fe, os.path.join(tmp, 'fe.pkl'))
+            meta = {"feature_names": list(features.X_train.columns), "splits": splits,
+                    "rows": {split: len(getattr(features, f"X_{split}")) for split in splits},
+                    "fe_version": getattr(features.fe, 'version', None),
+                    "data_cutoff_step": features.data_cutoff_step,
+                    "created_at": datetime.utcnow().isoformat() + "Z"}
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored this key first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.prune()
+
+    def prune(self) -> None:
+        """Remove the least recently used entries beyond max_entries"""
+        try:
+            names = [n for n in os.listdir(self.directory) if '.tmp-' not in n]
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.directory, name, 'meta.json')), name))
+            except OSError:
+                continue
+        for _, name in sorted(entries, reverse=True)[self.max_entries:]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+# Process-wide cache (training worker processes)
+feature_cache = FeatureCache()
@@ -3,12 +3,34 @@ Feature Engineering Module for Fraud Detection
 Defines FraudFeatureEngineer class for model pipeline compatibility
 """
 
+import hashlib
 import pandas as pd
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
 from typing import Optional
 import networkx as nx
 
+# Bump when transform() output changes so cached feature tables are rebuilt
+FEATURE_SCHEMA_VERSION = 1
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Compute a stable content hash of a DataFrame (vectorized)
+
+    Args:
+        df: DataFrame to hash
+
+    Returns:
+        Hex digest identifying the frame's columns and values
+    """
+    digest = hashlib.sha1()
+    digest.update(",".join(map(str, df.columns)).encode())
+    digest.update(str(len(df)).encode())
+    if len(df) > 0:
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
 
 class FraudFeatureEngineer(BaseEstimator, TransformerMixin):
     """
@@ -17,21 +39,32 @@ class FraudFeatureEngineer(BaseEstimator, TransformerMixin):
     - Creates frequency, ratio, log and graph features
     """
     
-    def __init__(self, pagerank_limit=None, advanced_features=False):
+    def __init__(self, pagerank_limit=None, advanced_features=False,
+                 median_sample_per_user=64, global_median_sample=1_000_000):
         """
         Initialize the feature engineer
         
         Args:
             pagerank_limit: Optional limit on number of nodes for PageRank computation
             advanced_features: Whether to generate advanced features (balance errors, etc.)
+            median_sample_per_user: Amounts kept per user by partial_fit() for medians
+            global_median_sample: Amounts sampled by partial_fit() for the global median
         """
         self.pagerank_limit = pagerank_limit
         self.advanced_features = advanced_features
+        self.median_sample_per_user = median_sample_per_user
+        self.global_median_sample = global_median_sample
         self.stats = {}
         self.graph_meta = {}
         self.type_map = {'TRANSFER': 0, 'CASH_OUT': 1}
         self.global_mean = 0.0
         self.global_median = 0.0
+        self.fingerprint_ = None
+
+    @property
+    def version(self) -> Optional[str]:
+        """Identifier of the fitted state (None until fitted)"""
+        return getattr(self, 'fingerprint_', None)
     
     def fit(self, X, y=None):
         """
@@ -53,6 +86,7 @@ class FraudFeatureEngineer(BaseEstimator, TransformerMixin):
             X_sorted = X
 
         # Basic global stats (compute once, reuse)
+        self.fit_rows_ = len(X_sorted)
         self.global_mean = float(X_sorted['amount'].mean())
         self.global_median = float(X_sorted['amount'].median())
 
@@ -74,7 +108,19 @@ class FraudFeatureEngineer(BaseEstimator, TransformerMixin):
         # Weighted graph: count transactions per (origin,dest) - memory efficient
         # Use value_counts on tuples for edge weights (more memory efficient)
         edge_counts = X_sorted.groupby(['nameOrig', 'nameDest']).size()
-        
+        self._fit_graph(edge_counts)
+
+        # Identify the fitted state by options + the columns fit() reads
+        fit_cols = [c for c in ('step', 'amount', 'nameOrig', 'nameDest') if c in X.columns]
+        self.fingerprint_ = hashlib.sha1(
+            f"{FEATURE_SCHEMA_VERSION}|{self.pagerank_limit}|{self.advanced_features}|"
+            f"{frame_fingerprint(X[fit_cols])}".encode()
+        ).hexdigest()[:16]
+
+        return self
+    
+    def _fit_graph(self, edge_counts: pd.Series):
+        """Degree and PageRank features from (origin, dest) transaction counts"""
         # Build graph directly from edge counts (avoid intermediate DataFrame)
         G = nx.DiGraph()
         if len(edge_counts) > 0:
@@ -110,8 +156,154 @@ class FraudFeatureEngineer(BaseEstimator, TransformerMixin):
             print(f"⚠️ PageRank computation failed: {str(e)}, using empty pagerank")
             self.graph_meta['pagerank'] = {}
 
+    def partial_fit(self, X, y=None):
+        """
+        Accumulate fit statistics from one chunk of rows (out-of-core fit)
+
+        Call finalize_fit() after the last chunk. Memory grows with the number
+        of distinct accounts, not rows: per-user medians use the first
+        median_sample_per_user amounts of each user and the global median a
+        uniform sample of global_median_sample rows, so both are exact until
+        a user (or the dataset) exceeds those sizes.
+
+        Args:
+            X: Chunk of raw transaction data
+            y: Optional target variable (not used)
+
+        Returns:
+            self
+        """
+        state = getattr(self, '_partial', None)
+        if state is None:
+            state = self._partial = {
+                'rows': 0, 'amount_sum': 0.0,
+                'orig_counts': None, 'dest_counts': None, 'orig_sum_amt': None,
+                'last_step': None, 'edges': None, 'user_amounts': None, 'amount_sample': None,
+                'rng': np.random.default_rng(0),
+                'digest': hashlib.sha1(),
+            }
+        if len(X) == 0:
+            return self
+
+        state['rows'] += len(X)
+        state['amount_sum'] += float(X['amount'].sum())
+
+        def merge(key, chunk, combine):
+            state[key] = chunk if state[key] is None else combine(state[key], chunk)
+
+        add = lambda a, b: a.add(b, fill_value=0)
+        merge('orig_counts', X['nameOrig'].value_counts(), add)
+        merge('dest_counts', X['nameDest'].value_counts(), add)
+        merge('orig_sum_amt', X.groupby('nameOrig')['amount'].sum(), add)
+        merge('edges', X.groupby(['nameOrig', 'nameDest']).size(), add)
+        if 'step' in X.columns:
+            merge('last_step', X.groupby('nameOrig')['step'].max(),
+                  lambda a, b: pd.concat([a, b]).groupby(level=0).max())
+        first_amounts = lambda df: df.groupby('nameOrig', sort=False).head(self.median_sample_per_user)
+        merge('user_amounts', first_amounts(X[['nameOrig', 'amount']]),
+              lambda a, b: first_amounts(pd.concat([a, b], ignore_index=True)))
+
+        # Bottom-k random keys give a uniform sample across all chunks
+        keys = pd.Series(X['amount'].to_numpy(), index=state['rng'].random(len(X)))
+        merge('amount_sample', keys, lambda a, b: pd.concat([a, b]))
+        state['amount_sample'] = state['amount_sample'].sort_index().iloc[:self.global_median_sample]
+
+        fit_cols = [c for c in ('step', 'amount', 'nameOrig', 'nameDest') if c in X.columns]
+        state['digest'].update(frame_fingerprint(X[fit_cols]).encode())
         return self
-    
+
+    def finalize_fit(self):
+        """
+        Turn the statistics accumulated by partial_fit() into the fitted state
+
+        Returns:
+            self
+        """
+        state = getattr(self, '_partial', None)
+        if state is None or state['rows'] == 0:
+            raise ValueError("partial_fit() was not called with any rows")
+
+        self.fit_rows_ = state['rows']
+        self.global_mean = state['amount_sum'] / state['rows']
+        self.global_median = float(state['amount_sample'].median())
+
+        orig_counts = state['orig_counts'].astype('int64')
+        self.stats['orig_counts'] = orig_counts.to_dict()
+        self.stats['dest_counts'] = state['dest_counts'].astype('int64').to_dict()
+        self.stats['orig_mean_amt'] = (state['orig_sum_amt'] / orig_counts).to_dict()
+        amounts = state['user_amounts']
+        self.stats['orig_median_amt'] = amounts.groupby('nameOrig')['amount'].median().to_dict()
+        self.stats['orig_log_median_amt'] = np.log1p(amounts['amount']).groupby(amounts['nameOrig']).median().to_dict()
+        last_step = state['last_step']
+        self.stats['last_step'] = last_step.astype('int64').to_dict() if last_step is not None else {}
+
+        edges = state['edges'].astype('int64')
+        edges.index.names = ['nameOrig', 'nameDest']
+        self._fit_graph(edges)
+
+        self.fingerprint_ = hashlib.sha1(
+            f"{FEATURE_SCHEMA_VERSION}|{self.pagerank_limit}|{self.advanced_features}|"
+            f"stream:{state['digest'].hexdigest()}".encode()
+        ).hexdigest()[:16]
+        self._partial = None
+        return self
+
+    def update(self, X):
+        """
+        Refresh a fitted state with new rows (warm-start retraining)
+
+        Transaction counts, per-user means, last steps, weighted degrees and
+        the global mean become exactly what fit() on old + new rows gives.
+        Users first seen in X get medians of their new amounts; the medians
+        of known users, the global median and PageRank keep their fitted
+        values, since the graph and amount history are not retained.
+
+        Args:
+            X: New transactions (after the rows the state was fitted on)
+
+        Returns:
+            self
+        """
+        if self.version is None:
+            raise ValueError("update() needs a fitted feature engineer")
+        if len(X) == 0:
+            return self
+
+        rows = getattr(self, 'fit_rows_', None) or int(sum(self.stats['orig_counts'].values()))
+        self.global_mean = (self.global_mean * rows + float(X['amount'].sum())) / (rows + len(X))
+        self.fit_rows_ = rows + len(X)
+
+        old_counts = pd.Series(self.stats['orig_counts'], dtype='float64')
+        old_sums = pd.Series(self.stats['orig_mean_amt'], dtype='float64') * old_counts
+        counts = old_counts.add(X['nameOrig'].value_counts(), fill_value=0)
+        sums = old_sums.add(X.groupby('nameOrig')['amount'].sum(), fill_value=0)
+        self.stats['orig_mean_amt'] = (sums / counts).to_dict()
+        self.stats['orig_counts'] = counts.astype('int64').to_dict()
+        self.stats['dest_counts'] = pd.Series(self.stats['dest_counts'], dtype='float64').add(
+            X['nameDest'].value_counts(), fill_value=0).astype('int64').to_dict()
+
+        new_users = X[~X['nameOrig'].isin(old_counts.index)]
+        if len(new_users):
+            self.stats['orig_median_amt'].update(new_users.groupby('nameOrig')['amount'].median().to_dict())
+            self.stats['orig_log_median_amt'].update(
+                np.log1p(new_users['amount']).groupby(new_users['nameOrig']).median().to_dict())
+
+        if 'step' in X.columns:
+            last_step = pd.concat([pd.Series(self.stats['last_step'], dtype='int64'),
+                                   X.groupby('nameOrig')['step'].max()])
+            self.stats['last_step'] = last_step.groupby(level=0).max().astype('int64').to_dict()
+
+        edges = X.groupby(['nameOrig', 'nameDest']).size()
+        for key, level in (('out_degree', 0), ('in_degree', 1)):
+            self.graph_meta[key] = pd.Series(self.graph_meta.get(key, {}), dtype='float64').add(
+                edges.groupby(level=level).sum().astype('float64'), fill_value=0).to_dict()
+
+        fit_cols = [c for c in ('step', 'amount', 'nameOrig', 'nameDest') if c in X.columns]
+        self.fingerprint_ = hashlib.sha1(
+            f"{self.fingerprint_}|update:{frame_fingerprint(X[fit_cols])}".encode()
+        ).hexdigest()[:16]
+        return self
+
     def transform(self, X):
         """
         Transform input data by engineering features
@@ -0,0 +1,226 @@
+"""
+Feature Store Module for Policy Lab
+Keeps the engineered feature table of the in-memory dataset as typed columns
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Fixed vocabulary so type codes mean the same thing in every table and rule
+TRANSACTION_TYPES = ['CASH_IN', 'CASH_OUT', 'DEBIT', 'PAYMENT', 'TRANSFER']
+
+# Compact dtypes for known columns; other floats stay float64 so rule
+# comparisons give exactly the same answers as on the raw DataFrame
+COLUMN_DTYPES = {
+    'step': np.int32,
+    'hour': np.int16,
+    'orig_txn_count': np.int32,
+    'dest_txn_count': np.int32,
+    'is_new_origin': np.int8,
+    'is_new_dest': np.int8,
+    'type_encoded': np.int8,
+    'type': np.int8,
+    'isFraud': np.int8,
+    'isFlaggedFraud': np.int8,
+}
+
+LABEL_COLUMNS = ['isFraud', 'isFlaggedFraud']
+
+_TYPE_CODES = {name: code for code, name in enumerate(TRANSACTION_TYPES)}
+
+
+def encode_types(types) -> np.ndarray:
+    """
+    Encode transaction type strings as int8 codes into TRANSACTION_TYPES
+
+    Args:
+        types: Array-like of type strings
+
+    Returns:
+        int8 array of codes (-1 for unknown types)
+    """
+    if len(types) <= 64:
+        # Per-request path: a dict lookup beats building a Categorical
+        return np.array([_TYPE_CODES.get(t, -1) for t in types], dtype=np.int8)
+    return pd.Categorical(types, categories=TRANSACTION_TYPES).codes.astype(np.int8)
+
+
+class FeatureTable:
+    """
+    Column-oriented engineered feature table for one
+    (dataset version, feature engineer version) pair.
+
+    Rows are in dataset order (sorted by step), so windows are plain slices
+    and every column access is a zero-copy NumPy view.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], dataset_version: Optional[str],
+                 feature_version: Optional[str]):
+        """
+        Initialize the table
+
+        Args:
+            columns: Mapping of column name to equally long 1-D arrays
+            dataset_version: Fingerprint of the source dataset
+            feature_version: Version of the fitted feature engineer ("raw" if none)
+        """
+        self.columns = columns
+        self.dataset_version = dataset_version
+        self.feature_version = feature_version
+        self.n_rows = len(next(iter(columns.values()))) if columns else 0
+        self.label_column = next((c for c in LABEL_COLUMNS if c in columns), None)
+
+    @property
+    def key(self) -> Tuple[Optional[str], Optional[str]]:
+        return (self.dataset_version, self.feature_version)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.columns.values())
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def tail(self, limit: int) -> Tuple[int, int]:
+        """Return the (start, stop) row range of the last `limit` rows"""
+        limit = max(0, min(int(limit), self.n_rows))
+        return self.n_rows - limit, self.n_rows
+
+    def step_range(self, start_step: Optional[int] = None,
+                   end_step: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Return the (start, stop) row range covering steps [start_step, end_step]
+
+        Rows are sorted by step, so this is two binary searches.
+        """
+        if 'step' not in self.columns:
+            raise ValueError("Dataset has no 'step' column")
+        steps = self.columns['step']
+        start = 0 if start_step is None else int(np.searchsorted(steps, start_step, side='left'))
+        stop = self.n_rows if end_step is None else int(np.searchsorted(steps, end_step, side='right'))
+        return start, max(start, stop)
+
+    def attach_column(self, name: str, values: np.ndarray) -> None:
+        """Add (or replace) a derived per-row column such as model scores"""
+        if len(values) != self.n_rows:
+            raise ValueError(f"Column '{name}' has {len(values)} rows, table has {self.n_rows}")
+        self.columns[name] = values
+
+    def detach_column(self, name: str) -> None:
+        self.columns.pop(name, None)
+
+    def window(self, start: int = 0, stop: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Return zero-copy views of every column over rows [start, stop)"""
+        stop = self.n_rows if stop is None else stop
+        return {name: arr[start:stop] for name, arr in self.columns.items()}
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        Build a DataFrame over a window (type decoded back to its names)
+
+        Args:
+            start: First row (inclusive)
+            stop: Last row (exclusive), defaults to the end of the table
+
+        Returns:
+            DataFrame backed by views of the table's columns
+        """
+        data = self.window(start, stop)
+        if 'type' in data:
+            data['type'] = pd.Categorical.from_codes(data['type'], categories=TRANSACTION_TYPES)
+        return pd.DataFrame(data, copy=False)
+
+
+def build_feature_table(dataset: pd.DataFrame, feature_engineer=None,
+                        dataset_version: Optional[str] = None,
+                        chunk_rows: int = 250_000) -> FeatureTable:
+    """
+    Transform the whole dataset once into a typed column table
+
+    Args:
+        dataset: Raw transactions (sorted by step)
+        feature_engineer: Fitted FraudFeatureEngineer, or None for raw columns only
+        dataset_version: Fingerprint of the dataset
+        chunk_rows: Rows transformed at a time to bound peak memory
+
+    Returns:
+        FeatureTable covering every row of the dataset
+    """
+    n = len(dataset)
+    columns: Dict[str, np.ndarray] = {}
+
+    for start in range(0, max(n, 1), chunk_rows):
+        chunk = dataset.iloc[start:start + chunk_rows]
+        if feature_engineer is not None:
+            features = feature_engineer.transform(chunk)
+        else:
+            features = chunk.select_dtypes(include=[np.number])
+
+        for name in features.columns:
+            values = features[name].to_numpy()
+            if name not in columns:
+                dtype = COLUMN_DTYPES.get(name, np.float64 if values.dtype.kind == 'f' else values.dtype)
+                columns[name] = np.empty(n, dtype=dtype)
+            columns[name][start:start + len(chunk)] = values
+
+        # Transform drops type and labels; keep them as compact codes
+        if 'type' in chunk.columns:
+            columns.setdefault('type', np.empty(n, dtype=np.int8))
+            columns['type'][start:start + len(chunk)] = encode_types(chunk['type'])
+        for name in LABEL_COLUMNS:
+            if name in chunk.columns and name not in features.columns:
+                columns.setdefault(name, np.empty(n, dtype=np.int8))
+                columns[name][start:start + len(chunk)] = chunk[name].to_numpy()
+
+    feature_version = getattr(feature_engineer, 'version', None) if feature_engineer is not None else "raw"
+    return FeatureTable(columns, dataset_version, feature_version)
+
+
+class FeatureStore:
+    """
+    Holds the current FeatureTable and rebuilds it only when the dataset
+    or the fitted feature engineer changes.
+    """
+
+    def __init__(self):
+        self.table: Optional[FeatureTable] = None
+        self._lock = threading.Lock()
+
+    def get(self, dataset: pd.DataFrame, dataset_version: Optional[str],
+            feature_engineer=None) -> FeatureTable:
+        """
+        Return the table for this dataset / feature engineer, building it if needed
+
+        Args:
+            dataset: Raw transactions (sorted by step)
+            dataset_version: Fingerprint of the dataset
+            feature_engineer: Fitted FraudFeatureEngineer, or None for raw columns only
+
+        Returns:
+            FeatureTable for the current (dataset, feature engineer) pair
+        """
+        feature_version = getattr(feature_engineer, 'version', None) if feature_engineer is not None else "raw"
+        key = (dataset_version, feature_version)
+
+        table = self.table
+        if table is not None and table.key == key and dataset_version is not None:
+            return table
+
+        with self._lock:
+            table = self.table
+            if table is not None and table.key == key and dataset_version is not None:
+                return table
+            start_time = time.time()
+            print(f"⚙️ Building engineered feature table for {len(dataset):,} rows...")
+            table = build_feature_table(dataset, feature_engineer, dataset_version=dataset_version)
+            self.table = table
+            print(f"✅ Feature table ready ({len(table.columns)} columns, "
+                  f"{table.nbytes / (1024 * 1024):.1f} MB) in {time.time() - start_time:.1f}s")
+            return table
+
+
+feature_store = FeatureStore()
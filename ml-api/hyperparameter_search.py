@@ -0,0 +1,182 @@
+"""
+Hyperparameter Search Module
+Bounded random or successive-halving search over tree depth, learning rate
+and tree count for a training job. Trials are scored by validation aucpr on
+expanding-window temporal folds and run in parallel within the job's thread
+budget, all reading the same transformed feature matrix.
+"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import xgboost as xgb
+from scipy.stats import loguniform, randint
+from sklearn.metrics import average_precision_score
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+
+SEARCH_STRATEGIES = ('random', 'halving')
+# Candidates kept per successive-halving rung: the best 1 / HALVING_FACTOR
+HALVING_FACTOR = 3
+
+
+def search_space(max_estimators: int) -> Dict:
+    """Distributions sampled per trial; the job's n_estimators bounds the tree count"""
+    return {
+        'max_depth': randint(3, 11),
+        'learning_rate': loguniform(0.01, 0.3),
+        'n_estimators': randint(min(50, max_estimators), max_estimators + 1),
+    }
+
+
+def temporal_folds(steps: Optional[np.ndarray], y: np.ndarray, n_folds: int = 3,
+                   min_val_fraud: int = 5, random_state: int = 42) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], bool]:
+    """
+    Expanding-window folds over the training period
+
+    Like make_splits, boundaries are step quantiles: fold k trains on the
+    steps up to the k-th boundary and validates on the next slice. Falls back
+    to stratified folds without a time column, or when a slice holds fewer
+    than min_val_fraud frauds.
+
+    Returns:
+        ([(train_idx, val_idx), ...], whether the folds are temporal)
+    """
+    y = np.asarray(y)
+    if steps is not None:
+        steps = np.asarray(steps)
+        bounds = np.quantile(steps, np.arange(1, n_folds + 2) / (n_folds + 1))
+        folds = []
+        for k in range(n_folds):
+            train_idx = np.flatnonzero(steps <= bounds[k])
+            val_idx = np.flatnonzero((steps > bounds[k]) & (steps <= bounds[k + 1]))
+            if len(val_idx) == 0 or y[val_idx].sum() < min_val_fraud or y[train_idx].sum() == 0:
+                break
+            folds.append((train_idx, val_idx))
+        else:
+            return folds, True
+
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    return list(splitter.split(np.zeros(len(y)), y)), False
+
+
+def _fit_fold(X: np.ndarray, y: np.ndarray, train_idx: np.ndarray, val_idx: np.ndarray,
+              config: Dict, rounds: int, threads: int) -> Tuple[float, float]:
+    """Train one configuration on one fold; returns (validation aucpr, seconds)"""
+    start = time.time()
+    y_fit = y[train_idx]
+    spw = int(max(1, (y_fit == 0).sum() / max(1, (y_fit == 1).sum())))
+    clf = xgb.XGBClassifier(
+        objective='binary:logistic', tree_method='hist', random_state=42, n_jobs=threads,
+        n_estimators=rounds, max_depth=config['max_depth'], learning_rate=config['learning_rate'],
+        scale_pos_weight=spw,
+    )
+    clf.fit(X[train_idx], y_fit)
+    scores = clf.predict_proba(X[val_idx])[:, 1]
+    return float(average_precision_score(y[val_idx], scores)), time.time() - start
+
+
+def run_search(X, y, steps=None, strategy: str = 'random', n_trials: int = 12, n_folds: int = 3,
+               max_estimators: int = 300, threads: int = 1, progress=None, random_state: int = 42) -> Dict:
+    """
+    Search depth, learning rate and tree count
+
+    'random' scores every sampled configuration with its full tree count.
+    'halving' scores all of them with a fraction of their trees first and
+    gives the best 1 / HALVING_FACTOR of each rung more trees, up to their
+    full count in the last rung.
+
+    Args:
+        X: Transformed training features (converted to float32 once)
+        y: Labels
+        steps: Step of every row, for temporal folds (None = stratified)
+        strategy: 'random' or 'halving'
+        n_trials: Configurations sampled
+        n_folds: Cross-validation folds
+        max_estimators: Upper bound of the tree count
+        threads: Thread budget shared by the parallel trials
+        progress: Optional callback(done, total) after every fold fit
+        random_state: Seed of the sampler and the fallback folds
+
+    Returns:
+        Dict with best_params, best_aucpr and the metrics and timing of every trial
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}' (expected one of {SEARCH_STRATEGIES})")
+    search_start = time.time()
+    X = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+    y = np.asarray(y).astype(np.int32)
+    folds, temporal = temporal_folds(steps, y, n_folds, random_state=random_state)
+
+    candidates = [
+        {'max_depth': int(c['max_depth']), 'learning_rate': round(float(c['learning_rate']), 5),
+         'n_estimators': int(c['n_estimators'])}
+        for c in ParameterSampler(search_space(max_estimators), n_trials, random_state=random_state)
+    ]
+    rungs = 1
+    if strategy == 'halving':
+        while HALVING_FACTOR ** rungs <= len(candidates):
+            rungs += 1
+    total_fits = sum(len(folds) * math.ceil(len(candidates) / HALVING_FACTOR ** r) for r in range(rungs))
+    done = 0
+
+    trials = []
+    alive = list(range(len(candidates)))
+    for rung in range(rungs):
+        share = HALVING_FACTOR ** (rungs - 1 - rung)
+        rounds = {i: max(1, candidates[i]['n_estimators'] // share) for i in alive}
+        tasks = [(i, f) for i in alive for f in range(len(folds))]
+        workers = max(1, min(len(tasks), threads))
+        fit_threads = max(1, threads // workers)
+
+        results: Dict[int, Dict[int, Tuple[float, float]]] = {i: {} for i in alive}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search") as pool:
+            futures = {
+                pool.submit(_fit_fold, X, y, folds[f][0], folds[f][1], candidates[i], rounds[i], fit_threads): (i, f)
+                for i, f in tasks
+            }
+            try:
+                for future in as_completed(futures):
+                    i, f = futures[future]
+                    results[i][f] = future.result()
+                    done += 1
+                    if progress is not None:
+                        progress(done, total_fits)
+            except BaseException:
+                # Cancelled job or failed fit: do not start the remaining fits
+                for future in futures:
+                    future.cancel()
+                raise
+
+        scores = {}
+        for i in alive:
+            fold_aucpr = [results[i][f][0] for f in range(len(folds))]
+            scores[i] = float(np.mean(fold_aucpr))
+            trials.append({
+                'trial': i,
+                'rung': rung,
+                'params': candidates[i],
+                'rounds': rounds[i],
+                'aucpr': round(scores[i], 6),
+                'fold_aucpr': [round(s, 6) for s in fold_aucpr],
+                'seconds': round(sum(seconds for _, seconds in results[i].values()), 3),
+            })
+        alive = sorted(alive, key=lambda i: scores[i], reverse=True)
+        if rung < rungs - 1:
+            alive = alive[:max(1, math.ceil(len(alive) / HALVING_FACTOR))]
+
+    best = alive[0]
+    best_aucpr = next(t['aucpr'] for t in reversed(trials) if t['trial'] == best)
+    print(f"🔎 Search ({strategy}, {len(candidates)} trials, {len(folds)} "
+          f"{'temporal' if temporal else 'stratified'} folds): best {candidates[best]} aucpr={best_aucpr:.4f}")
+    return {
+        'strategy': strategy,
+        'folds': len(folds),
+        'temporal_folds': temporal,
+        'best_params': candidates[best],
+        'best_aucpr': best_aucpr,
+        'trials': trials,
+        'seconds': round(time.time() - search_start, 3),
+    }
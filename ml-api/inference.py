@@ -9,7 +9,7 @@ import numpy as np
 import pandas as pd
 import joblib
 import warnings
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # Suppress warnings
 warnings.filterwarnings('ignore', message='.*is_sparse.*', category=FutureWarning)
@@ -28,6 +28,10 @@ except ImportError:
         def transform(self, X):
             return X
 
+from cascade import CASCADE_SCORING, load_cascade, screen_scores
+from tree_compiler import TREE_EVALUATOR, TREE_COMPILED_MAX_ROWS, compile_model
+from utils.metrics import metrics
+
 # Optional imports
 try:
     import shap
@@ -47,6 +51,13 @@ try:
 except ImportError:
     XGBOOST_AVAILABLE = False
 
+# Stage timers of the inference path (see utils.metrics)
+TRANSFORM_STAGE = metrics.stage("inference.transform")
+SCORE_STAGE = metrics.stage("inference.score")
+SHAP_STAGE = metrics.stage("inference.shap")
+SHAP_BATCH_STAGE = metrics.stage("inference.shap_batch")
+LLM_STAGE = metrics.stage("inference.llm")
+
 # Load environment variables
 try:
     from dotenv import load_dotenv
@@ -55,6 +66,64 @@ except ImportError:
     pass
 
 
+def find_test_dataset(test_dataset_path: Optional[str] = None) -> str:
+    """
+    Locate the test dataset the feature engineer is fitted on
+
+    Args:
+        test_dataset_path: Preferred path (tried first, also relative to this directory)
+
+    Returns:
+        Path of the first candidate that exists
+    """
+    # Find test dataset path - use script directory as base
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    # Find test dataset path
+    test_paths = []
+    if test_dataset_path:
+        test_paths.append(test_dataset_path)
+        # Also try as absolute path if relative
+        if not os.path.isabs(test_dataset_path):
+            test_paths.append(os.path.join(script_dir, test_dataset_path))
+    
+    # Try common locations - prioritize dataset folder in ml-api
+    test_paths.extend([
+        # Compressed versions (preferred for size)
+        os.path.join(script_dir, "dataset", "test_dataset.csv.gz"),
+        "dataset/test_dataset.csv.gz",
+        "../dataset/test_dataset.csv.gz",
+        "/app/dataset/test_dataset.csv.gz",
+        # Uncompressed versions
+        os.path.join(script_dir, "dataset", "test_dataset.csv"),  # ml-api/dataset/test_dataset.csv
+        os.path.join(script_dir, "dataset", "test_dataset_woIDX.csv"),  # ml-api/dataset/test_dataset_woIDX.csv
+        "dataset/test_dataset.csv",  # Relative to current working directory
+        "dataset/test_dataset_woIDX.csv",
+        "../dataset/test_dataset.csv",  # Fallback
+        "../dataset/test_dataset_woIDX.csv",
+        "/app/dataset/test_dataset.csv",  # For Docker deployment
+        "/app/dataset/test_dataset_woIDX.csv",
+        # Legacy paths for backward compatibility
+        "assets/test_dataset.csv",
+        "../assets/test_dataset.csv",
+        "/app/assets/test_dataset.csv"
+    ])
+    
+    for path in test_paths:
+        if os.path.exists(path):
+            return path
+    
+    raise FileNotFoundError(
+        f"Test dataset not found. Tried: {test_paths}\n"
+        "Please ensure test dataset CSV is available for fitting feature engineer."
+    )
+
+
+def feature_state_path(model_path: str) -> str:
+    """Fitted feature engineer saved next to a model by training (model_<id>_features.pkl)"""
+    return f"{os.path.splitext(model_path)[0]}_features.pkl"
+
+
 class FraudInference:
     """
     Inference class for fraud detection pipeline with explainability
@@ -67,7 +136,9 @@ class FraudInference:
         test_dataset_path: Optional[str] = None,
         threshold: float = 0.0793, 
         groq_api_key: Optional[str] = None,
-        pagerank_limit: Optional[int] = None
+        pagerank_limit: Optional[int] = None,
+        feature_engineer=None,
+        shap_background: Optional[pd.DataFrame] = None
     ):
         """
         Initialize inference engine
@@ -78,6 +149,9 @@ class FraudInference:
             threshold: Decision threshold for fraud classification
             groq_api_key: Optional Groq API key for LLM explanations
             pagerank_limit: Optional limit on nodes for PageRank computation
+            feature_engineer: Already fitted feature engineer to use instead of
+                loading or fitting one (shared between engines by the model pool)
+            shap_background: SHAP background rows that go with feature_engineer
         """
         self.model_path = model_path
         self.test_dataset_path = test_dataset_path
@@ -88,10 +162,26 @@ class FraudInference:
         self.feature_engineer = None
         self.shap_background = None
         self.shap_explainer = None
+        self.cascade = None
+        self.compiled = None
         
-        # Load model and fit feature engineer
+        # Load model, then its saved feature engineer or fit one (unless a fitted one is shared)
         self.load_model()
-        self.fit_feature_engineer()
+        if CASCADE_SCORING:
+            self.cascade = load_cascade(self.model_path)
+            if self.cascade is not None:
+                print(f"✅ Cascade scoring: first {self.cascade['trees']} trees screen at "
+                      f"{self.cascade['threshold']:.4g}")
+        if feature_engineer is not None:
+            self.feature_engineer = feature_engineer
+            self.shap_background = shap_background
+            self.init_shap_explainer()
+        elif os.path.exists(feature_state_path(self.model_path)):
+            self.load_feature_engineer(feature_state_path(self.model_path))
+        else:
+            self.fit_feature_engineer()
+        if TREE_EVALUATOR == 'compiled':
+            self.init_tree_evaluator()
     
     def load_model(self):
         """Load the trained XGBoost model"""
@@ -127,52 +217,8 @@ class FraudInference:
             from feature_engineering import FraudFeatureEngineer
             self.feature_engineer = FraudFeatureEngineer(pagerank_limit=self.pagerank_limit)
             
-            # Find test dataset path - use script directory as base
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            # Find test dataset path
-            test_paths = []
-            if self.test_dataset_path:
-                test_paths.append(self.test_dataset_path)
-                # Also try as absolute path if relative
-                if not os.path.isabs(self.test_dataset_path):
-                    test_paths.append(os.path.join(script_dir, self.test_dataset_path))
-            
-            # Try common locations - prioritize dataset folder in ml-api
-            test_paths.extend([
-                # Compressed versions (preferred for size)
-                os.path.join(script_dir, "dataset", "test_dataset.csv.gz"),
-                "dataset/test_dataset.csv.gz",
-                "../dataset/test_dataset.csv.gz",
-                "/app/dataset/test_dataset.csv.gz",
-                # Uncompressed versions
-                os.path.join(script_dir, "dataset", "test_dataset.csv"),  # ml-api/dataset/test_dataset.csv
-                os.path.join(script_dir, "dataset", "test_dataset_woIDX.csv"),  # ml-api/dataset/test_dataset_woIDX.csv
-                "dataset/test_dataset.csv",  # Relative to current working directory
-                "dataset/test_dataset_woIDX.csv",
-                "../dataset/test_dataset.csv",  # Fallback
-                "../dataset/test_dataset_woIDX.csv",
-                "/app/dataset/test_dataset.csv",  # For Docker deployment
-                "/app/dataset/test_dataset_woIDX.csv",
-                # Legacy paths for backward compatibility
-                "assets/test_dataset.csv",
-                "../assets/test_dataset.csv",
-                "/app/assets/test_dataset.csv"
-            ])
-            
-            test_df = None
-            dataset_path = None
-            for path in test_paths:
-                if os.path.exists(path):
-                    dataset_path = path
-                    print(f"📊 Found test dataset at {path}")
-                    break
-            
-            if dataset_path is None:
-                raise FileNotFoundError(
-                    f"Test dataset not found. Tried: {test_paths}\n"
-                    "Please ensure test dataset CSV is available for fitting feature engineer."
-                )
+            dataset_path = find_test_dataset(self.test_dataset_path)
+            print(f"📊 Found test dataset at {dataset_path}")
             
             # Memory-efficient loading: sample dataset for fitting to reduce RAM usage
             # Read a sample of the dataset instead of the full file
@@ -235,33 +281,67 @@ class FraudInference:
             gc.collect()
             print("🧹 Cleared dataset from memory")
             
-            # Prepare SHAP background from a small sample (reload minimal data)
-            print("📊 Preparing SHAP background data (small sample)...")
-            shap_sample_size = min(100, max_rows_for_fitting)  # Reduced from 200 to 100
-            # Reload just a tiny sample for SHAP background
-            shap_df = pd.read_csv(dataset_path, nrows=shap_sample_size * 2)  # Get more to sample from
-            shap_sample = shap_df.sample(n=min(shap_sample_size, len(shap_df)), random_state=42)
-            # Ensure required columns
-            if 'isFlaggedFraud' not in shap_sample.columns:
-                shap_sample['isFlaggedFraud'] = 0
-            self.shap_background = self.feature_engineer.transform(shap_sample)
-            del shap_df, shap_sample
-            gc.collect()
-            print(f"✅ SHAP background prepared ({len(self.shap_background)} samples)")
-            
-            # Initialize SHAP explainer
-            if SHAP_AVAILABLE and XGBOOST_AVAILABLE and isinstance(self.model, xgb.XGBClassifier):
-                self.shap_explainer = shap.TreeExplainer(self.model)
-                print("✅ SHAP explainer initialized")
-            else:
-                if not SHAP_AVAILABLE:
-                    print("⚠️ SHAP explainer not initialized (SHAP library not available)")
-                else:
-                    print("⚠️ SHAP explainer not initialized (XGBoost not available or model type unknown)")
+            self.prepare_shap_background(dataset_path, min(100, max_rows_for_fitting))
                 
         except Exception as e:
             print(f"❌ Error fitting feature engineer: {str(e)}")
             raise
+
+    def load_feature_engineer(self, state_path: str):
+        """
+        Use the feature engineer saved with the model by training
+
+        It holds the account statistics of the model's own training data
+        (refreshed ones for warm-started models), so the model is served
+        with the features it was trained on instead of a refit on the test
+        dataset. The SHAP background still comes from the test dataset.
+        """
+        try:
+            self.feature_engineer = joblib.load(state_path)
+            print(f"✅ Feature engineer loaded from {state_path}")
+            self.prepare_shap_background(find_test_dataset(self.test_dataset_path), 100)
+        except Exception as e:
+            print(f"❌ Error loading feature engineer: {str(e)}")
+            raise
+
+    def prepare_shap_background(self, dataset_path: str, shap_sample_size: int):
+        """Transform a small test dataset sample as SHAP background, then build the explainer"""
+        print("📊 Preparing SHAP background data (small sample)...")
+        # Reload just a tiny sample for SHAP background
+        shap_df = pd.read_csv(dataset_path, nrows=shap_sample_size * 2)  # Get more to sample from
+        shap_sample = shap_df.sample(n=min(shap_sample_size, len(shap_df)), random_state=42)
+        # Ensure required columns
+        if 'isFlaggedFraud' not in shap_sample.columns:
+            shap_sample['isFlaggedFraud'] = 0
+        self.shap_background = self.feature_engineer.transform(shap_sample)
+        del shap_df, shap_sample
+        gc.collect()
+        print(f"✅ SHAP background prepared ({len(self.shap_background)} samples)")
+        
+        # Initialize SHAP explainer
+        self.init_shap_explainer()
+
+    def init_tree_evaluator(self):
+        """Compile the model's trees, verified against XGBoost on the SHAP background rows"""
+        if XGBOOST_AVAILABLE and isinstance(self.model, xgb.XGBClassifier) and self.shap_background is not None:
+            self.compiled = compile_model(self.model, self.shap_background)
+
+    def _evaluator(self, rows: int):
+        """Compiled trees for small batches when available, else the XGBoost model"""
+        if self.compiled is not None and rows <= TREE_COMPILED_MAX_ROWS:
+            return self.compiled
+        return self.model
+
+    def init_shap_explainer(self):
+        """Build the SHAP TreeExplainer of the loaded model"""
+        if SHAP_AVAILABLE and XGBOOST_AVAILABLE and isinstance(self.model, xgb.XGBClassifier):
+            self.shap_explainer = shap.TreeExplainer(self.model)
+            print("✅ SHAP explainer initialized")
+        else:
+            if not SHAP_AVAILABLE:
+                print("⚠️ SHAP explainer not initialized (SHAP library not available)")
+            else:
+                print("⚠️ SHAP explainer not initialized (XGBoost not available or model type unknown)")
     
     def predict(self, transaction_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -274,6 +354,26 @@ class FraudInference:
             probabilities: Array of fraud probabilities
             decisions: Array of binary decisions (0/1)
         """
+        probabilities, decisions, _ = self.predict_with_features(transaction_df)
+        return probabilities, decisions
+
+    def predict_with_features(self, transaction_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+        """
+        Predict fraud probability and keep the engineered features
+
+        Args:
+            transaction_df: DataFrame with raw transaction data
+
+        Returns:
+            probabilities: Array of fraud probabilities
+            decisions: Array of binary decisions (0/1)
+            X_transformed: Engineered features the model scored
+        """
+        probabilities, decisions, X_transformed, _ = self._predict(transaction_df)
+        return probabilities, decisions, X_transformed
+
+    def _predict(self, transaction_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame, Optional[np.ndarray]]:
+        """predict_with_features plus the cascade's passed mask (see score)"""
         if self.model is None:
             raise ValueError("Model not loaded. Call load_model() first.")
         
@@ -281,16 +381,41 @@ class FraudInference:
             raise ValueError("Feature engineer not fitted. Call fit_feature_engineer() first.")
         
         # Transform transaction using fitted feature engineer
-        X_transformed = self.feature_engineer.transform(transaction_df)
+        with TRANSFORM_STAGE.time():
+            X_transformed = self.feature_engineer.transform(transaction_df)
         
         # Get probabilities from XGBoost model
-        probabilities = self.model.predict_proba(X_transformed)[:, 1]
+        with SCORE_STAGE.time():
+            probabilities, passed = self.score(X_transformed)
         
         # Make decisions based on threshold
         decisions = (probabilities >= self.threshold).astype(int)
         
-        return probabilities, decisions
+        return probabilities, decisions, X_transformed, passed
     
+    def score(self, X_transformed: pd.DataFrame) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Fraud probabilities of engineered rows, through the cascade if it is on
+
+        Rows the screen stops get the calibrated screened_probability instead
+        of a full-model score.
+
+        Returns:
+            probabilities: Array of fraud probabilities
+            passed: Rows scored by the full model (None without a cascade)
+        """
+        evaluator = self._evaluator(len(X_transformed))
+        if self.cascade is None:
+            return evaluator.predict_proba(X_transformed)[:, 1], None
+        passed = screen_scores(evaluator, X_transformed, self.cascade['trees']) >= self.cascade['threshold']
+        if passed.all():
+            return evaluator.predict_proba(X_transformed)[:, 1], passed
+        probabilities = np.full(len(X_transformed), self.cascade['screened_probability'])
+        if passed.any():
+            rows = X_transformed[passed]
+            probabilities[passed] = self._evaluator(len(rows)).predict_proba(rows)[:, 1]
+        return probabilities, passed
+
     def explain_shap(self, transaction_df: pd.DataFrame, topk: int = 10) -> pd.DataFrame:
         """
         Generate SHAP explanations for a transaction
@@ -312,21 +437,23 @@ class FraudInference:
             raise ValueError("Feature engineer not fitted")
         
         # Transform transaction using fitted feature engineer
-        X_trans = self.feature_engineer.transform(transaction_df)
+        with TRANSFORM_STAGE.time():
+            X_trans = self.feature_engineer.transform(transaction_df)
         feature_names = X_trans.columns.tolist()
         
         # Compute SHAP values
         try:
-            if self.shap_explainer is not None:
-                shap_values = self._compute_shap_values(self.shap_explainer, X_trans)
-            elif XGBOOST_AVAILABLE and isinstance(self.model, xgb.XGBClassifier):
-                # Fallback: create explainer on the fly
-                explainer = shap.TreeExplainer(self.model)
-                shap_values = self._compute_shap_values(explainer, X_trans)
-            else:
-                explainer = shap.Explainer(self.model, X_trans.iloc[[0]], feature_names=feature_names)
-                shap_exp = explainer(X_trans)
-                shap_values = shap_exp.values[0] if shap_exp.values.ndim == 2 else shap_exp.values
+            with SHAP_STAGE.time():
+                if self.shap_explainer is not None:
+                    shap_values = self._compute_shap_values(self.shap_explainer, X_trans)
+                elif XGBOOST_AVAILABLE and isinstance(self.model, xgb.XGBClassifier):
+                    # Fallback: create explainer on the fly
+                    explainer = shap.TreeExplainer(self.model)
+                    shap_values = self._compute_shap_values(explainer, X_trans)
+                else:
+                    explainer = shap.Explainer(self.model, X_trans.iloc[[0]], feature_names=feature_names)
+                    shap_exp = explainer(X_trans)
+                    shap_values = shap_exp.values[0] if shap_exp.values.ndim == 2 else shap_exp.values
         except Exception as e:
             print(f"⚠️ SHAP computation failed: {str(e)}")
             shap_values = np.zeros(X_trans.shape[1])
@@ -348,6 +475,29 @@ class FraudInference:
         
         return feat_df.head(topk)
     
+    def explain_shap_batch(self, X_trans: pd.DataFrame, topk: int = 3) -> List[List[Tuple[str, float]]]:
+        """
+        Top SHAP contributions for many already-transformed rows in one call
+
+        Args:
+            X_trans: Engineered features (output of the feature engineer)
+            topk: Number of top features per row
+
+        Returns:
+            Per row, a list of (feature, shap value) sorted by absolute impact
+        """
+        if not SHAP_AVAILABLE:
+            raise ValueError("SHAP library not available")
+        with SHAP_BATCH_STAGE.time():
+            explainer = self.shap_explainer or shap.TreeExplainer(self.model)
+            shap_values = np.atleast_2d(self._compute_shap_values(explainer, X_trans))
+        feature_names = X_trans.columns.tolist()
+        order = np.argsort(-np.abs(shap_values), axis=1)[:, :topk]
+        return [
+            [(feature_names[j], float(shap_values[i, j])) for j in row]
+            for i, row in enumerate(order)
+        ]
+
     def _compute_shap_values(self, explainer, X_trans: pd.DataFrame) -> np.ndarray:
         """Helper method to compute SHAP values"""
         if isinstance(explainer, shap.TreeExplainer):
@@ -518,9 +668,22 @@ class FraudInference:
                 - decisions: Binary decisions
                 - shap_table: Feature contributions DataFrame
                 - llm_explanation: Optional LLM explanation text
+                - features: Engineered features the model scored
+                - screened_out: Whether the cascade screen stopped the transaction
+                  (no full-model score and no explanations then)
         """
         # Predict
-        probabilities, decisions = self.predict(transaction_df)
+        probabilities, decisions, X_transformed, passed = self._predict(transaction_df)
+        screened_out = passed is not None and not passed[0]
+        if screened_out:
+            return {
+                'probabilities': probabilities,
+                'decisions': decisions,
+                'shap_table': None,
+                'llm_explanation': None,
+                'features': X_transformed,
+                'screened_out': True
+            }
         
         # Prepare SHAP background if needed
         if shap_background is not None:
@@ -532,13 +695,16 @@ class FraudInference:
         # Generate LLM explanation if requested
         llm_explanation = None
         if use_llm and GROQ_AVAILABLE:
-            llm_explanation = self.explain_llm(probabilities[0], shap_table, transaction_df=transaction_df, topk=topk, language=language)
+            with LLM_STAGE.time():
+                llm_explanation = self.explain_llm(probabilities[0], shap_table, transaction_df=transaction_df, topk=topk, language=language)
         
         return {
             'probabilities': probabilities,
             'decisions': decisions,
             'shap_table': shap_table,
-            'llm_explanation': llm_explanation
+            'llm_explanation': llm_explanation,
+            'features': X_transformed,
+            'screened_out': False
         }
 
 
@@ -8,27 +8,40 @@ import sys
 import time
 import uuid
 import shutil
+import hashlib
+import asyncio
 import json
 from typing import Optional, Dict, List
 from datetime import datetime
 
 import pandas as pd
 import numpy as np
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field, validator
 import uvicorn
-from supabase import create_client, Client
 
 # Add current directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from inference import FraudInference, load_inference_engine
 from simulation import simulation_manager, SimulationConfig
-from training_service import train_model_async
+from feature_store import feature_store, FeatureTable, build_feature_table
+from rules import compile_rule, CompiledRule, RuleError
+from deployed_rules import deployed_rules, rule_columns, fuse_decision
+from score_store import score_store, SCORE_COLUMN
+from backtest import backtest_rule_window, backtest_rule_batch, resolve_window, backtest_cache
+from training_queue import training_queue
+from hyperparameter_search import SEARCH_STRATEGIES
+from model_benchmark import budget_violations, MODEL_BUDGET_POLICY
+from model_pool import model_pool, feature_state_key
+from shadow import shadow_scorer
 from utils.audit import AuditLogger
+from utils.db import create_database, DatabaseError
 from utils.prompts import SYSTEM_PROMPT
+from utils.metrics import metrics, Metric
 import warnings
 
 # Suppress warnings
@@ -80,6 +93,7 @@ class PredictRequest(BaseModel):
     """Request model for /predict endpoint"""
     transaction: TransactionInput
     options: Optional[PredictionOptions] = Field(default_factory=PredictionOptions)
+    model_id: Optional[str] = Field(default=None, description="Registry model to score with (default: the active model)")
 
 class SHAPExplanation(BaseModel):
     """SHAP explanation model"""
@@ -95,6 +109,8 @@ class PredictionResult(BaseModel):
     decision: str = Field(..., description="pass, warn, or block")
     risk_level: str = Field(..., description="low, medium, or high")
     confidence: float = Field(..., ge=0, le=1)
+    model_decision: Optional[str] = Field(default=None, description="Decision from the model probability alone")
+    rules_fired: List[str] = Field(default_factory=list, description="Deployed rules that matched")
 
 class PredictResponse(BaseModel):
     """Response model for /predict endpoint"""
@@ -105,17 +121,21 @@ class PredictResponse(BaseModel):
     processing_time_ms: int
     model_version: str
     timestamp: str
+    model_id: Optional[str] = None
+    screened_out: bool = Field(default=False, description="Stopped by the cascade screen (no full-model score or explanations)")
 
 class BatchPredictRequest(BaseModel):
     """Request model for batch prediction"""
     transactions: List[TransactionInput]
     options: Optional[PredictionOptions] = Field(default_factory=PredictionOptions)
+    model_id: Optional[str] = Field(default=None, description="Registry model to score with (default: the active model)")
 
 class BatchPredictResponse(BaseModel):
     """Response model for batch prediction"""
     results: List[Dict]
     processing_time_ms: int
     total_transactions: int
+    model_id: Optional[str] = None
 
 class TrainingConfig(BaseModel):
     """Configuration for model training"""
@@ -123,18 +143,54 @@ class TrainingConfig(BaseModel):
     n_estimators: int = Field(default=300, ge=10, le=2000)
     max_depth: int = Field(default=6, ge=1, le=20)
     learning_rate: float = Field(default=0.05, ge=0.001, le=1.0)
+    early_stopping_rounds: int = Field(default=50, ge=0, le=500, description="Stop after this many rounds without validation improvement (0 = off)")
+    validation_split: float = Field(default=0.1, ge=0.0, le=0.5, description="Latest fraction of the training period held out for early stopping")
+    search: Optional[str] = Field(default=None, description="Hyperparameter search: 'random' or 'halving' (successive halving)")
+    search_trials: int = Field(default=12, ge=1, le=100, description="Configurations sampled by the search")
+    search_folds: int = Field(default=3, ge=2, le=10, description="Temporal cross-validation folds per trial")
     pagerank_limit: int = Field(default=10000, ge=0)
+    feature_cache: bool = Field(default=True, description="Reuse the transformed features of an earlier job on the same upload and split / feature settings")
+    warm_start: bool = Field(default=False, description="Continue boosting the active (or parent_model_id) model on the rows after its data cutoff")
+    parent_model_id: Optional[str] = Field(default=None, description="Registry model to warm-start from (default: the active model)")
+    warm_start_min_gain: float = Field(default=0.0, ge=-1.0, le=1.0, description="Holdout aucpr gain over the parent required to mark a warm-started model ready")
+    streaming: Optional[bool] = Field(default=None, description="Train out-of-core from chunked feature shards (default: uploads of TRAINING_STREAMING_MIN_MB or more)")
     advanced_preprocessing: bool = Field(default=False, description="Apply advanced preprocessing (SMOTE)")
     advanced_feature_engineering: bool = Field(default=False, description="Generate advanced features (Balance errors, Interaction strength)")
     name: str = Field(default="Custom Model")
     version: str = Field(default="1.0")
 
+    @validator('search')
+    def validate_search(cls, v):
+        if v is not None and v not in SEARCH_STRATEGIES:
+            raise ValueError(f"Search must be one of {list(SEARCH_STRATEGIES)}")
+        return v
+
 class TrainingResponse(BaseModel):
     """Response for training initiation"""
     job_id: str
     status: str
     message: str
 
+class TrainingJob(BaseModel):
+    """State of a queued or running training job"""
+    job_id: str
+    status: str  # queued, running, completed, failed, cancelled
+    stage: Optional[str] = None
+    progress: float = 0.0
+    attempts: int = 0
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    stage_seconds: Optional[Dict[str, float]] = None
+
+    @classmethod
+    def from_job(cls, job: Dict) -> "TrainingJob":
+        return cls(job_id=job['id'], **{k: job[k] for k in (
+            'status', 'stage', 'progress', 'attempts', 'cancel_requested',
+            'error', 'created_at', 'started_at', 'finished_at', 'stage_seconds')})
+
 class ModelItem(BaseModel):
     """Model registry item"""
     id: str
@@ -175,14 +231,15 @@ cached_feature_engineer = None
 model_loading_lock = False
 MODEL_VERSION = "1.0.0"
 MODEL_THRESHOLD = float(os.getenv("MODEL_THRESHOLD", "0.0793"))
+# Score the whole simulation dataset in the background when the model or dataset changes
+RESCORE_ON_ACTIVATION = os.getenv("RESCORE_ON_ACTIVATION", "true").lower() == "true"
+RESCORE_TOPK = int(os.getenv("RESCORE_TOPK", "0"))
 
-# Supabase Client
-supabase_url: str = os.environ.get("SUPABASE_URL")
-supabase_key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Use Service Role Key for backend updates
-supabase: Client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
+# Database (async PostgREST client over Supabase, pooled and non-blocking)
+db = create_database()
 
 # Audit Logger
-audit_logger = AuditLogger(supabase) if supabase else None
+audit_logger = AuditLogger(db) if db else None
 
 # Risk thresholds (matching config.py)
 RISK_THRESHOLDS = {
@@ -191,10 +248,37 @@ RISK_THRESHOLDS = {
     "block": 0.70
 }
 
+# Stage timers of the request paths (engine stages are timed in inference.py)
+PREDICT_STAGE = metrics.stage("predict.total")
+TO_DATAFRAME_STAGE = metrics.stage("predict.to_dataframe")
+RULES_STAGE = metrics.stage("predict.deployed_rules")
+AUDIT_STAGE = metrics.stage("predict.audit_dispatch")
+BATCH_STAGE = metrics.stage("predict_batch.total")
+BATCH_TO_DATAFRAME_STAGE = metrics.stage("predict_batch.to_dataframe")
+BATCH_RULES_STAGE = metrics.stage("predict_batch.deployed_rules")
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+def engine_settings() -> Dict:
+    """Loader arguments shared by every inference engine of this process"""
+    pagerank_limit = os.getenv("PAGERANK_LIMIT", None)
+    
+    # Convert pagerank_limit to int if provided
+    if pagerank_limit:
+        try:
+            pagerank_limit = int(pagerank_limit)
+        except ValueError:
+            pagerank_limit = None
+    
+    return {
+        "test_dataset_path": os.getenv("TEST_DATASET_PATH", None),
+        "threshold": MODEL_THRESHOLD,
+        "groq_api_key": os.getenv("GROQ_API_KEY"),
+        "pagerank_limit": pagerank_limit or None,
+    }
+
 def load_model():
     """Load the ML model on startup"""
     global inference_engine, model_loading_lock
@@ -205,16 +289,7 @@ def load_model():
     model_loading_lock = True
     
     model_path = os.getenv("MODEL_PATH", "Models/fraud_pipeline_final.pkl")
-    test_dataset_path = os.getenv("TEST_DATASET_PATH", None)
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    pagerank_limit = os.getenv("PAGERANK_LIMIT", None)
-    
-    # Convert pagerank_limit to int if provided
-    if pagerank_limit:
-        try:
-            pagerank_limit = int(pagerank_limit)
-        except ValueError:
-            pagerank_limit = None
+    settings = engine_settings()
     
     # Try multiple paths for model
     possible_paths = [
@@ -251,13 +326,11 @@ def load_model():
             )
         
         # Try to load the model with test dataset for feature engineering
-        inference_engine = load_inference_engine(
-            model_path=actual_path,
-            test_dataset_path=test_dataset_path,
-            threshold=MODEL_THRESHOLD,
-            groq_api_key=groq_api_key,
-            pagerank_limit=pagerank_limit
-        )
+        # A model still in the pool (e.g. on rollback) is not read from disk again
+        inference_engine = model_pool.get(actual_path) or load_inference_engine(model_path=actual_path, **settings)
+        model_pool.add(inference_engine,
+                       feature_state_key(settings['test_dataset_path'], settings['pagerank_limit'],
+                                         actual_path), pin=True)
         print(f"✅ Model loaded successfully from {actual_path} ({file_size:.1f} MB)")
     except FileNotFoundError as e:
         error_msg = f"❌ Model file not found: {str(e)}"
@@ -296,6 +369,50 @@ def ensure_model_loaded():
             return False
     return False
 
+def resolve_model_file(model_path: str) -> str:
+    """Absolute path of a registry model file (falls back to Models/<file name>)"""
+    full_path = os.path.abspath(model_path) if os.path.isabs(model_path) else os.path.join(os.path.dirname(__file__), model_path)
+    
+    if not os.path.exists(full_path):
+        # Try relative to Models/ if not found
+        full_path = os.path.join(os.path.dirname(__file__), "Models", os.path.basename(model_path))
+    return full_path
+
+async def engine_for_model(model_id: Optional[str]) -> FraudInference:
+    """
+    Engine a request is scored with
+
+    Args:
+        model_id: Registry model (None = the active model)
+
+    Returns:
+        The active engine, or the model's engine from the pool (loaded on first use)
+    """
+    if model_id is None:
+        return inference_engine
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not available")
+    try:
+        model_data = await db.select_one("model_registry", {"id": model_id})
+    except DatabaseError as e:
+        raise HTTPException(status_code=503, detail=f"Failed to read model registry: {str(e)}")
+    if model_data is None:
+        raise HTTPException(status_code=404, detail="Model not found")
+    if model_data['status'] != 'ready' or not model_data.get('file_path'):
+        raise HTTPException(status_code=400, detail="Model is not in 'ready' state")
+
+    full_path = resolve_model_file(model_data['file_path'])
+    if not os.path.exists(full_path):
+        raise HTTPException(status_code=500, detail=f"Model file not found on disk: {full_path}")
+    try:
+        engine = await run_in_threadpool(model_pool.load, full_path, FraudInference, **engine_settings())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load model {model_id}: {str(e)}")
+    if os.getenv("PREFORK_MASTER_PID") and engine.model is not None:
+        # Same per-worker thread budget as the active model (serve.py)
+        engine.model.set_params(n_jobs=int(os.getenv("PREFORK_WORKER_THREADS", "1")))
+    return engine
+
 def calculate_decision(probability: float) -> tuple[str, str]:
     """Calculate decision and risk level from probability"""
     if probability >= RISK_THRESHOLDS['block']:
@@ -305,6 +422,37 @@ def calculate_decision(probability: float) -> tuple[str, str]:
     else:
         return 'pass', 'low'
 
+def apply_deployed_rules(probabilities, features: pd.DataFrame,
+                         transactions: pd.DataFrame) -> List[Dict]:
+    """
+    Fuse model decisions with the deployed Policy Lab rules
+
+    Args:
+        probabilities: Model fraud probabilities
+        features: Engineered features the model scored
+        transactions: Raw transactions
+
+    Returns:
+        One dict per transaction with decision, risk_level, model_decision
+        and rules_fired
+    """
+    rule_set = deployed_rules.get()
+    fired = rule_set.fired_per_row(rule_columns(features, transactions, rule_set.columns, probabilities),
+                                   len(transactions)) \
+        if len(rule_set) else [[] for _ in range(len(transactions))]
+
+    outcomes = []
+    for probability, rules in zip(probabilities, fired):
+        model_decision, _ = calculate_decision(float(probability))
+        decision, risk_level = fuse_decision(model_decision, [rule['action'] for rule in rules])
+        outcomes.append({
+            "decision": decision,
+            "risk_level": risk_level,
+            "model_decision": model_decision,
+            "rules_fired": [rule['name'] for rule in rules],
+        })
+    return outcomes
+
 def calculate_confidence(probability: float) -> float:
     """Calculate confidence level based on probability"""
     if probability < 0.1 or probability > 0.9:
@@ -332,61 +480,141 @@ def transaction_to_dataframe(transaction: TransactionInput) -> pd.DataFrame:
     }
     return pd.DataFrame([data])
 
-# ============================================================================
-# API ENDPOINTS
-# ============================================================================
+def ensure_simulation_dataset():
+    """Load the simulation dataset into memory if it is not loaded yet"""
+    if simulation_manager.dataset is not None:
+        return
+    print("📦 Loading simulation dataset...")
+    # Try to find the dataset
+    possible_paths = [
+        "dataset/test_dataset.csv.gz",
+        "dataset/test_dataset.csv",
+        "../dataset/test_dataset.csv.gz"
+    ]
 
-@app.on_event("startup")
-async def startup_event():
-    """Load model on startup"""
-    port = os.getenv("PORT", "7860")
-    print(f"🚀 Server starting on port {port}")
-    print("📦 Loading model...")
-    
-    try:
-        load_model()
-        if inference_engine is not None:
-            print("✅ Model loaded successfully - API is ready!")
-        else:
-            print("⚠️ Warning: Model loading completed but inference_engine is None")
+    path_to_use = "dataset/test_dataset.csv.gz" # Default
+    for p in possible_paths:
+        if os.path.exists(p):
+            path_to_use = p
+            break
+
+    simulation_manager.load_dataset(path_to_use)
+
+def ensure_feature_engineer():
+    """Fit and cache the feature engineer on the full simulation dataset"""
+    global cached_feature_engineer
+    if cached_feature_engineer is not None or simulation_manager.dataset is None:
+        return cached_feature_engineer
+    from feature_engineering import FraudFeatureEngineer
+    # We fit on the FULL dataset to get accurate history/graph stats
+    fe = FraudFeatureEngineer(pagerank_limit=10000) # Limit pagerank for speed
+    fe.fit(simulation_manager.dataset)
+    cached_feature_engineer = fe
+    return fe
+
+def get_feature_table() -> FeatureTable:
+    """Engineered feature table of the simulation dataset (built once per version)"""
+    if simulation_manager.dataset is None:
+        raise ValueError("Dataset not loaded")
+    return feature_store.get(
+        simulation_manager.dataset,
+        simulation_manager.dataset_version,
+        cached_feature_engineer
+    )
+
+def warm_up():
+    """
+    Load the model, simulation dataset, cached feature engineer and the
+    engineered feature table.
+
+    Safe to call more than once: anything already in memory is kept. The
+    pre-fork server (serve.py) calls this in the master process so that
+    workers inherit the loaded state copy-on-write and skip it at startup.
+    """
+    if inference_engine is None:
+        print("📦 Loading model...")
+        try:
+            load_model()
+            if inference_engine is not None:
+                print("✅ Model loaded successfully - API is ready!")
+            else:
+                print("⚠️ Warning: Model loading completed but inference_engine is None")
+                print("⚠️ API will attempt lazy loading on first request")
+        except Exception as e:
+            print(f"⚠️ Warning: Model not loaded on startup: {str(e)}")
             print("⚠️ API will attempt lazy loading on first request")
-    except Exception as e:
-        print(f"⚠️ Warning: Model not loaded on startup: {str(e)}")
-        print("⚠️ API will attempt lazy loading on first request")
-        print("⚠️ This is normal for serverless environments (e.g., Vercel)")
-        
+            print("⚠️ This is normal for serverless environments (e.g., Vercel)")
+
     # Load simulation dataset
     try:
-        print("📦 Loading simulation dataset...")
-        # Try to find the dataset
-        possible_paths = [
-            "dataset/test_dataset.csv.gz", 
-            "dataset/test_dataset.csv",
-            "../dataset/test_dataset.csv.gz"
-        ]
-        
-        path_to_use = "dataset/test_dataset.csv.gz" # Default
-        for p in possible_paths:
-            if os.path.exists(p):
-                path_to_use = p
-                break
-                
-        simulation_manager.load_dataset(path_to_use)
-        
-        # Pre-fit feature engineer to avoid timeout on first request
+        ensure_simulation_dataset()
+    except Exception as e:
+        print(f"⚠️ Failed to load simulation dataset: {str(e)}")
+        return
+    if simulation_manager.dataset is None:
+        return
+
+    # Pre-fit feature engineer to avoid timeout on first request
+    if cached_feature_engineer is None:
         try:
             print("⚙️ Pre-fitting feature engineer (background)...")
-            global cached_feature_engineer
-            from feature_engineering import FraudFeatureEngineer
-            fe = FraudFeatureEngineer(pagerank_limit=10000)
-            fe.fit(simulation_manager.dataset)
-            cached_feature_engineer = fe
+            ensure_feature_engineer()
             print("✅ Feature engineer pre-fitted and cached")
         except Exception as e:
             print(f"⚠️ Failed to pre-fit feature engineer: {str(e)}")
-            
+
+    # Precompute the engineered feature table used by Policy Lab backtests
+    try:
+        get_feature_table()
     except Exception as e:
-        print(f"⚠️ Failed to load simulation dataset: {str(e)}")
+        print(f"⚠️ Failed to build feature table: {str(e)}")
+
+# ============================================================================
+# API ENDPOINTS
+# ============================================================================
+
+def runs_background_services() -> bool:
+    """
+    Whether this process runs the training dispatcher and bulk rescoring
+
+    True in a single-process server. The pre-fork server runs them once, in
+    its services process, so that replacing workers never interrupts them.
+    """
+    return os.getenv("PREFORK_ROLE") != "worker"
+
+def start_background_services():
+    """Start the training dispatcher and materialize the current model's scores"""
+    # Training runs in separate processes fed by the local job queue
+    training_queue.start()
+
+    # Materialize scores for the whole dataset in the background (a no-op if
+    # this model's scores are already on disk, or another process is on it)
+    if RESCORE_ON_ACTIVATION:
+        try:
+            schedule_rescore()
+        except Exception as e:
+            print(f"⚠️ Could not start rescoring: {str(e)}")
+
+def stop_background_services():
+    """Stop the training dispatcher and its workers (their jobs are requeued)"""
+    training_queue.stop()
+
+@app.on_event("startup")
+async def startup_event():
+    """Load model on startup"""
+    port = os.getenv("PORT", "7860")
+    print(f"🚀 Server starting on port {port} (pid {os.getpid()})")
+    warm_up()
+    if runs_background_services():
+        start_background_services()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background services of this process and close pooled database connections"""
+    if runs_background_services():
+        stop_background_services()
+    if db:
+        await db.aclose()
 
 @app.get("/")
 async def root():
@@ -455,16 +683,18 @@ async def predict(request: PredictRequest):
     
     start_time = time.time()
     transaction_id = str(uuid.uuid4())
+    engine = await engine_for_model(request.model_id)
     
     try:
         # Convert transaction to DataFrame
-        transaction_df = transaction_to_dataframe(request.transaction)
+        with TO_DATAFRAME_STAGE.time():
+            transaction_df = transaction_to_dataframe(request.transaction)
         
         # Get options
         options = request.options or PredictionOptions()
         
         # Predict
-        result = inference_engine.predict_and_explain(
+        result = engine.predict_and_explain(
             transaction_df,
             shap_background=None,
             topk=options.topk,
@@ -473,14 +703,18 @@ async def predict(request: PredictRequest):
         )
         
         probability = float(result['probabilities'][0])
-        decision, risk_level = calculate_decision(probability)
+        with RULES_STAGE.time():
+            outcome = apply_deployed_rules(result['probabilities'], result['features'], transaction_df)[0]
+        if request.model_id is None:
+            shadow_scorer.offer(result['features'])
         confidence = calculate_confidence(probability)
         
         # Log prediction to Audit Log
         if audit_logger:
-            # Create features dictionary for audit log
-            audit_features = transaction_df.to_dict(orient='records')[0]
-            audit_logger.log_prediction(transaction_id, probability, audit_features)
+            with AUDIT_STAGE.time():
+                # Create features dictionary for audit log
+                audit_features = transaction_df.to_dict(orient='records')[0]
+                audit_logger.log_prediction(transaction_id, probability, audit_features)
         
         # Format SHAP explanations
         shap_explanations = None
@@ -505,21 +739,24 @@ async def predict(request: PredictRequest):
                 "language": options.language
             }
         
-        processing_time = int((time.time() - start_time) * 1000)
+        elapsed = time.time() - start_time
+        PREDICT_STAGE.observe(elapsed)
+        processing_time = int(elapsed * 1000)
         
         return PredictResponse(
             transaction_id=transaction_id,
             prediction=PredictionResult(
                 fraud_probability=probability,
-                decision=decision,
-                risk_level=risk_level,
-                confidence=confidence
+                confidence=confidence,
+                **outcome
             ),
             shap_explanations=shap_explanations,
             llm_explanation=llm_explanation,
             processing_time_ms=processing_time,
             model_version=MODEL_VERSION,
-            timestamp=datetime.utcnow().isoformat() + "Z"
+            timestamp=datetime.utcnow().isoformat() + "Z",
+            model_id=request.model_id,
+            screened_out=result.get('screened_out', False)
         )
         
     except ValueError as e:
@@ -528,31 +765,125 @@ async def predict(request: PredictRequest):
         print(f"❌ Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+# PostgREST returns at most this many rows per request; larger seeds are paged
+SEED_PAGE_SIZE = int(os.getenv("SEED_PAGE_SIZE", "1000"))
+SEED_SOURCE_COLUMNS = "step,type_encoded,amount,nameOrig,oldBalanceOrig,newBalanceOrig,nameDest,oldBalanceDest,newBalanceDest"
+
 class SeedQueueRequest(BaseModel):
     """Request model for seeding the queue"""
-    count: int = Field(default=10, le=50)
+    count: int = Field(default=10, ge=1, le=5000)
     offset: int = Field(default=0, ge=0)
     is_refill: bool = False
+    include_shap: bool = Field(default=False, description="Add the top SHAP drivers to each item's note")
+
+async def fetch_seed_candidates(offset: int, count: int) -> List[Dict]:
+    """Page through fraud rows of the engineered dataset, ordered by dest_txn_count"""
+    # Pages are fetched concurrently (bounded by the database client)
+    bounds = [(start, min(SEED_PAGE_SIZE, offset + count - start))
+              for start in range(offset, offset + count, SEED_PAGE_SIZE)]
+    pages = await asyncio.gather(*(
+        db.select('test_dataset_engineered', columns=SEED_SOURCE_COLUMNS,
+                  filters={'isFraud': 1}, order='dest_txn_count', desc=True,
+                  offset=start, limit=size)
+        for start, size in bounds
+    ))
+    rows: List[Dict] = []
+    for (_, size), page in zip(bounds, pages):
+        rows.extend(page or [])
+        if not page or len(page) < size:
+            break
+    return rows
+
+@metrics.stage("seed.build_items").timed
+def build_seed_items(source_data: List[Dict], include_shap: bool = False) -> tuple:
+    """
+    Score fetched candidates in one vectorized call and build history rows
+
+    Args:
+        source_data: Rows from test_dataset_engineered
+        include_shap: Add the top SHAP drivers to each note
+
+    Returns:
+        (items to insert, number of rows skipped as invalid)
+    """
+    source = pd.DataFrame(source_data)
+    tx_type = np.where(source['type_encoded'] == 1, 'CASH_OUT', 'TRANSFER')
+    transactions = pd.DataFrame({
+        'step': source['step'].fillna(1).astype(int),
+        'type': tx_type,
+        'amount': pd.to_numeric(source['amount'], errors='coerce'),
+        'nameOrig': source['nameOrig'],
+        'oldBalanceOrig': pd.to_numeric(source['oldBalanceOrig'], errors='coerce'),
+        'newBalanceOrig': pd.to_numeric(source['newBalanceOrig'], errors='coerce'),
+        'nameDest': source['nameDest'],
+        'oldBalanceDest': pd.to_numeric(source['oldBalanceDest'], errors='coerce'),
+        'newBalanceDest': pd.to_numeric(source['newBalanceDest'], errors='coerce'),
+        'isFlaggedFraud': 0
+    })
+
+    # Rows transaction_history would reject are dropped up front instead of
+    # failing the whole bulk insert
+    balances = ['oldBalanceOrig', 'newBalanceOrig', 'oldBalanceDest', 'newBalanceDest']
+    valid = (
+        transactions[['nameOrig', 'nameDest', 'amount'] + balances].notna().all(axis=1)
+        & (transactions['amount'] > 0)
+        & (transactions[balances] >= 0).all(axis=1)
+        & (transactions['nameOrig'] != transactions['nameDest'])
+    ).to_numpy()
+    skipped = int((~valid).sum())
+    transactions = transactions[valid].reset_index(drop=True)
+    if transactions.empty:
+        return [], skipped
+
+    probabilities, _, features = inference_engine.predict_with_features(transactions)
+    outcomes = apply_deployed_rules(probabilities, features, transactions)
+    drivers = inference_engine.explain_shap_batch(features, topk=3) if include_shap else None
+
+    # Stagger timestamps 2 minutes apart so the queue reads as a stream of recent events
+    n = len(transactions)
+    base_time = pd.Timestamp(datetime.utcnow())
+    timestamps = (base_time - pd.to_timedelta((n - np.arange(n)) * 2, unit='min')).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+    items = []
+    for i, row in enumerate(transactions.itertuples(index=False)):
+        prob = float(probabilities[i])
+        note = 'Top fraud ring candidate (High dest txn count)'
+        if drivers is not None:
+            note += "; top drivers: " + ", ".join(f"{name} ({value:+.2f})" for name, value in drivers[i])
+        items.append({
+            "sender_id": row.nameOrig,
+            "receiver_id": row.nameDest,
+            "amount": float(row.amount),
+            "transaction_type": row.type,
+            "old_balance_orig": float(row.oldBalanceOrig),
+            "new_balance_orig": float(row.newBalanceOrig),
+            "old_balance_dest": float(row.oldBalanceDest),
+            "new_balance_dest": float(row.newBalanceDest),
+            "step": int(row.step),
+            "transaction_timestamp": timestamps[i],
+            "fraud_probability": prob,
+            "fraud_decision": outcomes[i]['decision'],
+            "risk_level": outcomes[i]['risk_level'],
+            "model_confidence": calculate_confidence(prob),
+            "status": 'REVIEW',
+            "is_test_data": True,
+            "note": note
+        })
+    return items, skipped
 
 @app.post("/simulation/seed-queue")
 async def seed_queue(request: SeedQueueRequest):
     """
     Seed the investigation queue with high-risk transactions from the dataset.
-    Performs inference and saves to transaction_history.
+    Scores all fetched candidates in one call and bulk-inserts them into
+    transaction_history.
     """
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not connected")
 
     try:
-        # 1. Fetch fraud sources from Engineered Dataset
-        response = supabase.table('test_dataset_engineered') \
-            .select('*') \
-            .eq('isFraud', 1) \
-            .order('dest_txn_count', desc=True) \
-            .range(request.offset, request.offset + request.count - 1) \
-            .execute()
-        
-        source_data = response.data
+        # 1. Fetch fraud sources from Engineered Dataset (paged)
+        source_data = await fetch_seed_candidates(request.offset, request.count)
         if not source_data:
             return {"message": "No more records found", "count": 0}
 
@@ -561,79 +892,22 @@ async def seed_queue(request: SeedQueueRequest):
         if inference_engine is None:
              raise HTTPException(status_code=503, detail="Model failed to load")
 
-        valid_items = []
-        
-        # Current time as base
-        base_time = datetime.utcnow()
-        
-        for i, item in enumerate(source_data):
-            try:
-                # Prepare transaction for inference
-                tx_input = pd.DataFrame([{
-                    'step': item.get('step', 1),
-                    'type': 'CASH_OUT' if item.get('type_encoded') == 1 else 'TRANSFER',
-                    'amount': float(item['amount']),
-                    'nameOrig': item['nameOrig'],
-                    'oldBalanceOrig': float(item['oldBalanceOrig']),
-                    'newBalanceOrig': float(item['newBalanceOrig']),
-                    'nameDest': item['nameDest'],
-                    'oldBalanceDest': float(item['oldBalanceDest']),
-                    'newBalanceDest': float(item['newBalanceDest']),
-                    'isFlaggedFraud': 0
-                }])
-
-                # Run Inference
-                # We use the internal method to avoid overhead of full prediction pipeline if possible,
-                # but predict_and_explain is fine.
-                result = inference_engine.predict_and_explain(
-                    tx_input, 
-                    shap_background=None, 
-                    use_llm=False
-                )
-                
-                prob = float(result['probabilities'][0])
-                decision, risk = calculate_decision(prob)
-                conf = calculate_confidence(prob)
-                
-                # Stagger timestamps by 1-5 minutes to avoid "same millisecond" issue
-                # and make it look like a stream of recent events
-                time_offset = (len(source_data) - i) * 2  # Minutes ago
-                tx_timestamp = (base_time - pd.Timedelta(minutes=time_offset)).isoformat()
-
-                valid_items.append({
-                    "sender_id": item['nameOrig'],
-                    "receiver_id": item['nameDest'],
-                    "amount": item['amount'],
-                    "transaction_type": 'CASH_OUT' if item.get('type_encoded') == 1 else 'TRANSFER',
-                    "old_balance_orig": item['oldBalanceOrig'],
-                    "new_balance_orig": item['newBalanceOrig'],
-                    "old_balance_dest": item['oldBalanceDest'],
-                    "new_balance_dest": item['newBalanceDest'],
-                    "step": item.get('step'),
-                    "transaction_timestamp": tx_timestamp,
-                    "fraud_probability": prob,
-                    "fraud_decision": decision,
-                    "risk_level": risk,
-                    "model_confidence": conf,
-                    "status": 'REVIEW',
-                    "is_test_data": True,
-                    "note": 'Top fraud ring candidate (High dest txn count)'
-                })
-                
-            except Exception as e:
-                print(f"Skipping item {item.get('nameOrig')}: {str(e)}")
-                continue
+        # 2. One vectorized score over every candidate (SHAP only on request)
+        valid_items, skipped = await run_in_threadpool(build_seed_items, source_data, request.include_shap)
+
+        # 3. Save to History in bulk
+        for start in range(0, len(valid_items), SEED_PAGE_SIZE):
+            await db.insert('transaction_history', valid_items[start:start + SEED_PAGE_SIZE])
 
-        # 3. Save to History
-        if valid_items:
-            data, count = supabase.table('transaction_history').insert(valid_items).execute()
-            
         return {
             "message": "Queue seeded successfully", 
             "seeded_count": len(valid_items),
+            "skipped_count": skipped,
             "next_offset": request.offset + len(source_data)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Seed error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -655,33 +929,43 @@ async def predict_batch(request: BatchPredictRequest):
     
     start_time = time.time()
     options = request.options or PredictionOptions()
+    engine = await engine_for_model(request.model_id)
     
     results = []
     
     try:
-        for transaction in request.transactions:
-            transaction_df = transaction_to_dataframe(transaction)
+        if request.transactions:
+            with BATCH_TO_DATAFRAME_STAGE.time():
+                transactions_df = pd.concat(
+                    [transaction_to_dataframe(transaction) for transaction in request.transactions],
+                    ignore_index=True
+                )
             
-            # Predict (without SHAP for batch to speed up)
-            probabilities, decisions = inference_engine.predict(transaction_df)
-            probability = float(probabilities[0])
-            decision, risk_level = calculate_decision(probability)
+            # Predict all transactions in one call (without SHAP for batch to speed up)
+            probabilities, decisions, features = engine.predict_with_features(transactions_df)
+            with BATCH_RULES_STAGE.time():
+                outcomes = apply_deployed_rules(probabilities, features, transactions_df)
+            if request.model_id is None:
+                shadow_scorer.offer(features)
             
-            results.append({
-                "transaction_id": str(uuid.uuid4()),
-                "prediction": {
-                    "fraud_probability": probability,
-                    "decision": decision,
-                    "risk_level": risk_level
-                }
-            })
+            for probability, outcome in zip(probabilities, outcomes):
+                results.append({
+                    "transaction_id": str(uuid.uuid4()),
+                    "prediction": {
+                        "fraud_probability": float(probability),
+                        **outcome
+                    }
+                })
         
-        processing_time = int((time.time() - start_time) * 1000)
+        elapsed = time.time() - start_time
+        BATCH_STAGE.observe(elapsed)
+        processing_time = int(elapsed * 1000)
         
         return BatchPredictResponse(
             results=results,
             processing_time_ms=processing_time,
-            total_transactions=len(results)
+            total_transactions=len(results),
+            model_id=request.model_id
         )
         
     except Exception as e:
@@ -689,8 +973,18 @@ async def predict_batch(request: BatchPredictRequest):
 
 class BacktestRequest(BaseModel):
     """Request model for rule backtesting"""
-    rule_logic: str = Field(..., description="SQL-like filter string (e.g. 'amount > 50000 and type == \"TRANSFER\"')")
+    rule_logic: str = Field(..., description="Rule expression over feature columns (e.g. 'amount > 50000 and type == \"TRANSFER\"')")
     limit: int = Field(default=1000, description="Number of recent transactions to test")
+    start_step: Optional[int] = Field(default=None, ge=0, description="First step to test (overrides limit)")
+    end_step: Optional[int] = Field(default=None, ge=0, description="Last step to test (overrides limit)")
+    full_history: bool = Field(default=False, description="Test the whole dataset")
+    granularity: Optional[str] = Field(default=None, description="Return a time series per 'step' or 'day'")
+
+    @validator('granularity')
+    def validate_granularity(cls, v):
+        if v is not None and v not in ['step', 'day']:
+            raise ValueError("Granularity must be 'step' or 'day'")
+        return v
 
 class BacktestResponse(BaseModel):
     """Response model for backtest results"""
@@ -700,6 +994,56 @@ class BacktestResponse(BaseModel):
     precision: float
     total_tested: int
     execution_time_ms: int
+    recall: Optional[float] = None
+    time_series: Optional[List[Dict]] = None
+    cached: bool = False
+
+class RuleSpec(BaseModel):
+    """A named candidate rule"""
+    name: Optional[str] = None
+    rule_logic: str
+
+class BatchBacktestRequest(BaseModel):
+    """Request model for multi-rule backtesting"""
+    rules: List[RuleSpec] = Field(..., min_length=1, max_length=50)
+    deployed_rules: Optional[List[str]] = Field(default=None, description="Rules already in production for incremental lift (defaults to the deployed rule set)")
+    limit: int = Field(default=1000, description="Number of recent transactions to test")
+    start_step: Optional[int] = Field(default=None, ge=0, description="First step to test (overrides limit)")
+    end_step: Optional[int] = Field(default=None, ge=0, description="Last step to test (overrides limit)")
+    full_history: bool = Field(default=False, description="Test the whole dataset")
+
+class DeployedRule(BaseModel):
+    """A rule evaluated on every scored transaction"""
+    name: Optional[str] = None
+    rule_logic: str
+    action: str = Field(default="block", description="warn or block")
+    enabled: bool = True
+
+    @validator('action')
+    def validate_action(cls, v):
+        if v not in ['warn', 'block']:
+            raise ValueError("Action must be 'warn' or 'block'")
+        return v
+
+class DeployedRulesRequest(BaseModel):
+    """Request model for replacing the deployed rule set"""
+    rules: List[DeployedRule] = Field(..., max_length=200)
+
+class DeployedRulesResponse(BaseModel):
+    """The deployed rule set"""
+    version: int
+    updated_at: Optional[str] = None
+    rules: List[Dict]
+
+class BatchBacktestResponse(BaseModel):
+    """Response model for multi-rule backtest results"""
+    results: List[Dict]
+    overlap_matrix: List[List[int]]
+    deployed: Optional[Dict] = None
+    total_tested: int
+    total_fraud: int
+    shared_predicates: int
+    execution_time_ms: int
 
 class ChatMessage(BaseModel):
     role: str
@@ -841,143 +1185,293 @@ async def detect_internal_anomalies(request: LogAnomalyRequest):
 # BACKTEST ENDPOINTS
 # ============================================================================
 
-@app.post("/backtest", response_model=BacktestResponse)
-async def backtest_rule(request: BacktestRequest):
-    """
-    Backtest a fraud detection rule against historical data.
-    Uses in-memory dataset for high performance (no disk I/O).
-    """
-    start_time = time.time()
-    
+@metrics.stage("backtest.table").timed
+def _backtest_table() -> FeatureTable:
+    """Feature table for backtests, loading the dataset / feature engineer if needed"""
     # 1. Access the dataset from simulation manager (already loaded)
     # If not loaded, try to load it
     if simulation_manager.dataset is None:
         try:
             print("🔄 Loading dataset for backtest...")
-            # Try to find the dataset
-            possible_paths = [
-                "dataset/test_dataset.csv.gz", 
-                "dataset/test_dataset.csv",
-                "../dataset/test_dataset.csv.gz"
-            ]
-            path_to_use = None
-            for p in possible_paths:
-                if os.path.exists(p):
-                    path_to_use = p
-                    break
-            
-            if path_to_use:
-                simulation_manager.load_dataset(path_to_use)
-            else:
-                 raise HTTPException(status_code=503, detail="Dataset not found on server")
+            ensure_simulation_dataset()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to load dataset: {str(e)}")
 
     if simulation_manager.dataset is None:
         raise HTTPException(status_code=503, detail="Dataset not available")
 
+    # 2. Engineered features are precomputed once per (dataset, feature engineer)
     try:
-        # 2. Slice the dataframe (last N rows)
-        df = simulation_manager.dataset
-        limit = min(request.limit, len(df))
-        # Get the *last* N transactions (most recent)
-        test_slice = df.tail(limit).copy()
-        
-        # 3. Apply the rule logic
-        # Safety check: basic sanitation to prevent arbitrary code execution
-        allowed_chars = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_ ><=!&|().'\"-,")
-        clean_query = "".join(c for c in request.rule_logic if c in allowed_chars)
-        
-        # Check if we need feature engineering
-        complex_features = [
-            'orig_txn_count', 'dest_txn_count', 'in_degree', 'out_degree', 
-            'network_trust', 'hour', 'amt_ratio_to_user_median', 
-            'amount_over_oldBalanceOrig', 'amt_ratio_to_user_mean', 'amount_log1p',
-            'is_new_origin', 'is_new_dest'
-        ]
-        
-        needs_engineering = any(feat in clean_query for feat in complex_features)
-        
-        df_to_query = test_slice
-        
-        if needs_engineering:
+        if cached_feature_engineer is None:
+            print("⚙️ Fitting feature engineer for the first time...")
+            ensure_feature_engineer()
+    except Exception as e:
+        print(f"⚠️ Feature engineering failed: {e}, proceeding with raw data")
+
+    try:
+        table = get_feature_table()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build feature table: {str(e)}")
+
+    # 3. Model scores as the fraud_probability column, once materialized
+    attach_scores(table)
+    return table
+
+def _require_scores(table: FeatureTable, rules: List[CompiledRule]):
+    if any(SCORE_COLUMN in rule.columns for rule in rules) and SCORE_COLUMN not in table.columns:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Rule uses {SCORE_COLUMN} but the active model's scores are still being computed. "
+                   "Check /scores/status and retry."
+        )
+
+def current_model_version() -> Optional[str]:
+    """Identify the loaded model file (path and modification time)"""
+    path = getattr(inference_engine, 'model_path', None)
+    if not path:
+        return None
+    try:
+        return f"{path}@{int(os.path.getmtime(path))}"
+    except OSError:
+        return path
+
+def current_model_key() -> Optional[str]:
+    """Short stable id of the loaded model and its feature engineer (keys materialized score artifacts)"""
+    version = current_model_version()
+    if not version:
+        return None
+    feature_version = getattr(getattr(inference_engine, 'feature_engineer', None), 'version', None)
+    return hashlib.sha1(f"{version}|{feature_version}".encode()).hexdigest()[:16]
+
+def schedule_rescore(force: bool = False) -> bool:
+    """
+    Start the background job scoring the whole feature table with the current model
+
+    Rows are scored with the features the model is served with (its own
+    feature engineer), so materialized scores match /predict; they are
+    attached to the backtest table, whose rows they line up with.
+
+    Returns:
+        True if a job was started (False if scores exist or a job is running)
+    """
+    if inference_engine is None or simulation_manager.dataset is None:
+        return False
+    table = get_feature_table()
+    feature_engineer = inference_engine.feature_engineer
+    features = None
+    if feature_engineer is not None and getattr(feature_engineer, 'version', None) != table.feature_version:
+        dataset, dataset_version = simulation_manager.dataset, simulation_manager.dataset_version
+        features = lambda: build_feature_table(dataset, feature_engineer, dataset_version=dataset_version)
+    return score_store.start(inference_engine.model, table, current_model_key(),
+                             topk=RESCORE_TOPK, force=force, features=features)
+
+def attach_scores(table: FeatureTable) -> bool:
+    """
+    Expose the current model's materialized scores as the fraud_probability column
+
+    Returns:
+        True if scores are available
+    """
+    artifact = score_store.lookup(current_model_key(), table)
+    if artifact is None:
+        table.detach_column(SCORE_COLUMN)
+        if RESCORE_ON_ACTIVATION and runs_background_services() and not score_store.is_running():
             try:
-                # Use cached feature engineer if available
-                global cached_feature_engineer
-                
-                if cached_feature_engineer is None:
-                    print("⚙️ Fitting feature engineer for the first time...")
-                    from feature_engineering import FraudFeatureEngineer
-                    # We fit on the FULL dataset to get accurate history/graph stats
-                    # This ensures orig_txn_count reflects the full history, not just the slice
-                    fe = FraudFeatureEngineer(pagerank_limit=10000) # Limit pagerank for speed
-                    fe.fit(simulation_manager.dataset)
-                    cached_feature_engineer = fe
-                    print("✅ Feature engineer fitted and cached")
-                else:
-                    print("⚡ Using cached feature engineer")
-                
-                # Transform the slice to get the features
-                # Use the cached instance
-                df_eng = cached_feature_engineer.transform(test_slice)
-                
-                # FraudFeatureEngineer drops string columns like 'type', 'nameOrig'
-                # We need 'type' back for filtering if the rule uses it
-                if 'type' not in df_eng.columns and 'type' in test_slice.columns:
-                    # Align by index
-                    df_eng['type'] = test_slice['type']
-                
-                # Ensure ground truth columns are present for precision calc
-                for col in ['isFraud', 'isFlaggedFraud']:
-                    if col in test_slice.columns and col not in df_eng.columns:
-                        df_eng[col] = test_slice[col]
-                        
-                df_to_query = df_eng
-            except ImportError:
-                print("⚠️ Feature engineering module not found, proceeding with raw data")
+                schedule_rescore()
             except Exception as e:
-                print(f"⚠️ Feature engineering failed: {e}, proceeding with raw data")
-        
-        # Run the query
-        matches = df_to_query.query(clean_query)
-        
-        # Calculate metrics
-        matches_count = len(matches)
-        
-        # Check if 'isFraud' or 'isFlaggedFraud' exists for ground truth
-        fraud_col = 'isFraud' if 'isFraud' in matches.columns else ('isFlaggedFraud' if 'isFlaggedFraud' in matches.columns else None)
-        
-        if fraud_col:
-            fraud_caught = matches[fraud_col].sum()
-            false_positives = matches_count - fraud_caught
-            precision = (fraud_caught / matches_count) if matches_count > 0 else 0.0
-        else:
-            # If no ground truth, we can't calculate precision
-            fraud_caught = 0
-            false_positives = matches_count
-            precision = 0.0
+                print(f"⚠️ Could not start rescoring: {e}")
+        return False
+    if table.columns.get(SCORE_COLUMN) is not artifact.probabilities:
+        table.attach_column(SCORE_COLUMN, artifact.probabilities)
+    return True
 
-        execution_time = int((time.time() - start_time) * 1000)
-        
-        # Log backtest to Audit Log
-        if audit_logger:
-            # Determine pass/fail based on some criteria (e.g. precision > 0.5) or just log it
-            # For now, we consider it "passed" if it caught any fraud with > 0 precision
-            passed = fraud_caught > 0 and precision > 0.1 
-            audit_logger.log_backtest(clean_query, passed, precision)
-
-        return BacktestResponse(
-            total_matches=int(matches_count),
-            fraud_caught=int(fraud_caught),
-            false_positives=int(false_positives),
-            precision=float(precision),
-            total_tested=limit,
-            execution_time_ms=execution_time
-        )
+def _backtest_versions(table) -> tuple:
+    """Versions a cached backtest result is only valid for"""
+    return (table.dataset_version, table.feature_version, current_model_version())
+
+def _compile_or_400(rule_logic: str, label: str = "rule") -> CompiledRule:
+    try:
+        return compile_rule(rule_logic)
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule logic ({label}): {str(e)}")
+
+@app.post("/backtest", response_model=BacktestResponse)
+async def backtest_rule(request: BacktestRequest):
+    """
+    Backtest a fraud detection rule against historical data.
+    Uses in-memory dataset for high performance (no disk I/O).
+    """
+    start_time = time.time()
+    table = _backtest_table()
 
+    # 3. Parse and validate the rule (compiled form is cached by normalized text)
+    rule = _compile_or_400(request.rule_logic)
+    _require_scores(table, [rule])
+
+    try:
+        # 4. Evaluate over the last N rows (most recent), a step range or the
+        # full history - views, no copy, chunks in parallel off the event loop
+        start, stop = resolve_window(table, request.limit, request.start_step,
+                                     request.end_step, request.full_history)
+        versions = _backtest_versions(table)
+        stats = backtest_cache.get(versions, rule.canonical, start, stop, request.granularity)
+        cached = stats is not None
+        if not cached:
+            stats = await run_in_threadpool(
+                backtest_rule_window, table, rule, start, stop, request.granularity
+            )
+        # Sub-predicates cached by a batch backtest were not audited as rules of their own
+        audited = cached and not stats.pop('from_batch', False)
+        if not audited:
+            backtest_cache.put(versions, rule.canonical, start, stop, stats, request.granularity)
+    except (RuleError, ValueError) as e:
+        # Rule references a column this dataset does not have
+        raise HTTPException(status_code=400, detail=f"Invalid rule logic: {str(e)}")
     except Exception as e:
-        # Catch query syntax errors
+        raise HTTPException(status_code=500, detail=f"Backtest failed: {str(e)}")
+
+    execution_time = int((time.time() - start_time) * 1000)
+
+    # Log backtest to Audit Log (a result cached by this endpoint was already logged)
+    if audit_logger and not audited:
+        # For now, we consider it "passed" if it caught any fraud with > 0.1 precision
+        passed = stats['fraud_caught'] > 0 and stats['precision'] > 0.1
+        audit_logger.log_backtest(rule.canonical, passed, stats['precision'])
+
+    return BacktestResponse(
+        total_matches=stats['total_matches'],
+        fraud_caught=stats['fraud_caught'],
+        false_positives=stats['false_positives'],
+        precision=float(stats['precision']),
+        total_tested=stats['total_tested'],
+        execution_time_ms=execution_time,
+        recall=float(stats['recall']),
+        time_series=stats.get('time_series'),
+        cached=cached
+    )
+
+@app.post("/backtest/batch", response_model=BatchBacktestResponse)
+async def backtest_rules_batch(request: BatchBacktestRequest):
+    """
+    Backtest several candidate rules in a single pass over the data.
+
+    Returns per-rule precision/recall, the rule-by-rule overlap matrix and
+    each rule's incremental catch over the deployed rule set.
+    """
+    start_time = time.time()
+    table = _backtest_table()
+
+    rules = [_compile_or_400(spec.rule_logic, spec.name or f"rule {i + 1}")
+             for i, spec in enumerate(request.rules)]
+    if request.deployed_rules is None:
+        deployed = [compiled for _, compiled in deployed_rules.get().compiled]
+    else:
+        deployed = [_compile_or_400(text, f"deployed rule {i + 1}")
+                    for i, text in enumerate(request.deployed_rules)]
+    _require_scores(table, rules + deployed)
+
+    try:
+        start, stop = resolve_window(table, request.limit, request.start_step,
+                                     request.end_step, request.full_history)
+        batch = await run_in_threadpool(
+            backtest_rule_batch, table, rules, start, stop, deployed,
+            backtest_cache, _backtest_versions(table)
+        )
+    except (RuleError, ValueError) as e:
         raise HTTPException(status_code=400, detail=f"Invalid rule logic: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch backtest failed: {str(e)}")
+
+    for spec, result in zip(request.rules, batch['results']):
+        result['name'] = spec.name or result['rule']
+
+    if audit_logger:
+        audit_logger.log_batch_backtest(batch['results'])
+
+    return BatchBacktestResponse(
+        execution_time_ms=int((time.time() - start_time) * 1000),
+        **batch
+    )
+
+@app.get("/rules/deployed", response_model=DeployedRulesResponse)
+async def get_deployed_rules():
+    """
+    Get the rule set evaluated alongside the model in /predict.
+    """
+    return DeployedRulesResponse(**deployed_rules.get().to_dict())
+
+@app.put("/rules/deployed", response_model=DeployedRulesResponse)
+async def put_deployed_rules(request: DeployedRulesRequest):
+    """
+    Replace the deployed rule set.
+
+    Rules are validated and compiled first; the new set applies to every
+    worker within RULES_RELOAD_INTERVAL seconds without a restart.
+    """
+    definitions = [rule.dict() for rule in request.rules]
+    for i, rule in enumerate(request.rules):
+        _compile_or_400(rule.rule_logic, rule.name or f"rule {i + 1}")
+
+    try:
+        rule_set = deployed_rules.save(definitions)
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule set: {str(e)}")
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save rule set: {str(e)}")
+
+    if audit_logger:
+        audit_logger.log_rules_deployed(rule_set.version, rule_set.rules)
+
+    return DeployedRulesResponse(**rule_set.to_dict())
+
+@app.get("/scores/status")
+async def scores_status():
+    """
+    Status of the bulk rescoring job and of the materialized scores.
+    """
+    artifact = score_store.artifact
+    job = score_store.status
+    if not runs_background_services() and simulation_manager.dataset is not None:
+        # Under the pre-fork server the services process does the rescoring
+        owner = score_store.running_elsewhere(current_model_key(), get_feature_table())
+        if owner is not None:
+            job = {"state": "running", "model_key": current_model_key(), "pid": owner}
+    return {
+        "job": job,
+        "model_key": current_model_key(),
+        "scores": {
+            "model_key": artifact.model_key,
+            "dataset_version": artifact.dataset_version,
+            "feature_version": artifact.feature_version,
+            "rows": len(artifact.probabilities),
+            "topk": artifact.topk_index.shape[1] if artifact.topk_index is not None else 0,
+        } if artifact is not None else None
+    }
+
+@app.post("/scores/rescore")
+async def rescore(force: bool = False):
+    """
+    Score the whole simulation dataset with the active model in the background.
+    Under the pre-fork server the job runs in the services process, which
+    rolling reloads never replace.
+    """
+    if inference_engine is None and not ensure_model_loaded():
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if not runs_background_services():
+        from serve import request_rescore
+        try:
+            return await run_in_threadpool(request_rescore, current_model_key(), force)
+        except TimeoutError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=f"Failed to start rescoring: {str(e)}")
+    try:
+        ensure_simulation_dataset()
+        ensure_feature_engineer()
+        started = schedule_rescore(force=force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start rescoring: {str(e)}")
+    return {"started": started, "job": score_store.status}
 
 
 # ============================================================================
@@ -1074,13 +1568,13 @@ async def stream_simulation():
 
 @app.post("/train", response_model=TrainingResponse)
 async def train_model_endpoint(
-    background_tasks: BackgroundTasks,
     config: str = Form(...),
     file: UploadFile = File(...)
 ):
     """
-    Start a background training job.
-    Accepts a CSV file and a JSON string for configuration.
+    Queue a training job.
+    Accepts a CSV file and a JSON string for configuration. The job runs in a
+    separate worker process; follow it with GET /train/jobs/{job_id}.
     """
     try:
         config_dict = json.loads(config)
@@ -1091,6 +1585,8 @@ async def train_model_endpoint(
 
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
+    if training_config.warm_start and not db:
+        raise HTTPException(status_code=400, detail="Warm start needs the model registry (database not available)")
 
     job_id = str(uuid.uuid4())
     
@@ -1099,22 +1595,26 @@ async def train_model_endpoint(
     os.makedirs(temp_dir, exist_ok=True)
     file_path = os.path.join(temp_dir, f"{job_id}_{file.filename}")
     
-    try:
+    def save_upload():
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+
+    try:
+        # Large uploads must not block the event loop
+        await run_in_threadpool(save_upload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
     # Create initial record in Supabase
-    if supabase:
+    if db:
         try:
-            supabase.table("model_registry").insert({
+            await db.insert("model_registry", {
                 "id": job_id,
                 "name": training_config.name,
                 "version": training_config.version,
                 "status": "pending",
                 "is_active": False
-            }).execute()
+            })
         except Exception as e:
             # Clean up file if DB insert fails
             if os.path.exists(file_path):
@@ -1123,30 +1623,71 @@ async def train_model_endpoint(
     else:
         print("⚠️ Supabase not connected. Training will proceed but status won't be persisted.")
 
-    # Trigger background task
+    # Queue the job; a dispatcher starts it in a worker process
     params = training_config.dict()
-    background_tasks.add_task(train_model_async, job_id, file_path, params)
+    try:
+        # SQLite may wait behind the dispatcher's write lock: keep it off the event loop
+        await run_in_threadpool(training_queue.submit, job_id, file_path, params)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue training job: {str(e)}")
 
     return TrainingResponse(
         job_id=job_id,
         status="pending",
-        message="Training job started in background"
+        message="Training job queued"
     )
 
+@app.get("/train/jobs", response_model=List[TrainingJob])
+async def list_training_jobs(status: Optional[str] = None, limit: int = 50):
+    """List training jobs, most recent first"""
+    jobs = await run_in_threadpool(training_queue.list, status, max(1, min(limit, 500)))
+    return [TrainingJob.from_job(job) for job in jobs]
+
+@app.get("/train/jobs/{job_id}", response_model=TrainingJob)
+async def get_training_job(job_id: str):
+    """Status, stage and progress of a training job"""
+    job = await run_in_threadpool(training_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return TrainingJob.from_job(job)
+
+@app.post("/train/jobs/{job_id}/cancel", response_model=TrainingJob)
+async def cancel_training_job(job_id: str):
+    """
+    Cancel a training job.
+    A queued job is dropped; a running job stops at its next progress report
+    (or is terminated after TRAINING_CANCEL_GRACE seconds).
+    """
+    try:
+        job = await run_in_threadpool(training_queue.cancel, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # A running job updates the registry itself when it stops
+    if job['status'] == 'cancelled' and db:
+        try:
+            await db.update("model_registry", {"status": "failed", "metrics": {"error": "Cancelled"}},
+                            {"id": job_id})
+        except Exception as e:
+            print(f"⚠️ Failed to update registry for cancelled job {job_id}: {str(e)}")
+    return TrainingJob.from_job(job)
+
 @app.get("/models", response_model=List[ModelItem])
 async def list_models():
     """List all trained models from registry"""
-    if not supabase:
+    if not db:
         # Return mock data if no DB (or raise error)
         # For development ease, we can return checking a local dir, but let's stick to DB
         return []
         
     try:
-        response = supabase.table("model_registry").select("*").order("created_at", desc=True).execute()
+        rows = await db.select("model_registry", order="created_at", desc=True)
         
         # Convert created_at to string if needed or Pydantic handles it
         models = []
-        for item in response.data:
+        for item in rows:
             models.append(ModelItem(
                 id=item['id'],
                 name=item['name'],
@@ -1160,17 +1701,32 @@ async def list_models():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch models: {str(e)}")
 
+async def _restore_active_model(model_id: str, previous_id: Optional[str]):
+    """Point the registry back at the model that was active before a failed activation"""
+    try:
+        if previous_id and previous_id != model_id:
+            await db.update("model_registry", {"is_active": True}, {"id": previous_id})
+        else:
+            await db.update("model_registry", {"is_active": False}, {"id": model_id})
+    except Exception as e:
+        print(f"⚠️ Could not restore the active model in the registry: {str(e)}")
+
 @app.post("/models/{model_id}/activate")
-async def activate_model(model_id: str):
-    """Activate a specific model version"""
-    if not supabase:
+async def activate_model(model_id: str, force: bool = False):
+    """
+    Activate a specific model version.
+    Models over the serving budget (see model_benchmark) are activated with
+    warnings, or refused under MODEL_BUDGET_POLICY=refuse unless force is set.
+    """
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
 
     # 1. Get model details
     try:
-        response = supabase.table("model_registry").select("*").eq("id", model_id).single().execute()
-        model_data = response.data
-    except Exception:
+        model_data = await db.select_one("model_registry", {"id": model_id})
+    except DatabaseError as e:
+        raise HTTPException(status_code=503, detail=f"Failed to read model registry: {str(e)}")
+    if model_data is None:
         raise HTTPException(status_code=404, detail="Model not found")
 
     if model_data['status'] != 'ready':
@@ -1180,46 +1736,234 @@ async def activate_model(model_id: str):
     if not model_path:
         raise HTTPException(status_code=400, detail="Model file path missing")
 
-    # 2. Update DB (set active=True for this, False for others)
+    # Serving budget check on the benchmark recorded at training time
+    benchmark = (model_data.get('metrics') or {}).get('benchmark')
+    warnings_list = budget_violations(benchmark)
+    if warnings_list and MODEL_BUDGET_POLICY == 'refuse' and not force:
+        raise HTTPException(status_code=409, detail="Model exceeds the serving budget: " + "; ".join(warnings_list)
+                            + " (pass force=true to activate anyway)")
+    if not benchmark or 'error' in benchmark:
+        warnings_list.append("Model has no benchmark; its serving cost is unknown")
+    for warning in warnings_list:
+        print(f"⚠️ Activating {model_id}: {warning}")
+
+    full_path = resolve_model_file(model_path)
+
+    if not os.path.exists(full_path):
+         raise HTTPException(status_code=500, detail=f"Model file not found on disk: {full_path}")
+
+    # 2. Load the model before the registry names it (single process). The
+    # pre-fork master loads it itself and reports back; see step 4.
+    prefork = bool(os.getenv("PREFORK_MASTER_PID"))
+    if not prefork:
+        try:
+            # Instant if it is already in the pool, e.g. a rollback
+            new_engine = await run_in_threadpool(model_pool.load, full_path, FraudInference, **engine_settings())
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to load model into memory: {str(e)}")
+
+    # 3. Update DB (set active=True for this, False for others)
     # The trigger 'trigger_ensure_single_active_model' handles the "False for others" part!
     try:
-        supabase.table("model_registry").update({"is_active": True}).eq("id", model_id).execute()
+        previous = await db.select("model_registry", columns="id", filters={"is_active": True}, limit=1)
+        await db.update("model_registry", {"is_active": True}, {"id": model_id})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update database: {str(e)}")
 
-    # 3. Hot-swap in memory
-    # We need to set the environment variable or just reload logic
-    # Best way: Update global variable directly
-    full_path = os.path.abspath(model_path) if os.path.isabs(model_path) else os.path.join(os.path.dirname(__file__), model_path)
-    
-    if not os.path.exists(full_path):
-        # Try relative to Models/ if not found
-        full_path = os.path.join(os.path.dirname(__file__), "Models", os.path.basename(model_path))
+    # A shadow run compares against the active model, which is changing
+    if await run_in_threadpool(stop_shadow_run) is not None:
+        print("👥 Shadow scoring stopped by model activation")
 
-    if not os.path.exists(full_path):
-         raise HTTPException(status_code=500, detail=f"Model file not found on disk: {full_path}")
+    # 4. Hot-swap in memory
+    if prefork:
+        # Under the pre-fork server the master reloads once and rolls the workers
+        from serve import request_rolling_reload
+        try:
+            await run_in_threadpool(request_rolling_reload, full_path)
+        except Exception as e:
+            # The master keeps serving the previous model: so must the registry
+            await _restore_active_model(model_id, previous[0]['id'] if previous else None)
+            raise HTTPException(status_code=500, detail=f"Failed to reload workers with model {model_id}: {str(e)}")
+        os.environ["MODEL_PATH"] = full_path
+        return {"status": "success", "message": f"Model {model_id} activated, workers reloading",
+                "warnings": warnings_list}
 
+    global inference_engine
+    model_pool.pin(full_path)
+    inference_engine = new_engine
     # Set env var for future reloads
     os.environ["MODEL_PATH"] = full_path
-    
-    # Trigger reload
-    global inference_engine
+    print(f"✅ Hot-swapped to model {model_id} ({full_path})")
+
+    if RESCORE_ON_ACTIVATION:
+        try:
+            schedule_rescore()
+        except Exception as e:
+            print(f"⚠️ Could not start rescoring: {str(e)}")
+
+    return {"status": "success", "message": f"Model {model_id} activated", "warnings": warnings_list}
+
+
+@app.get("/models/pool")
+async def model_pool_status():
+    """Models loaded in this process for per-request routing and instant activation"""
+    return model_pool.stats()
+
+class ShadowRequest(BaseModel):
+    """Candidate model scored in the shadow of the active model"""
+    model_id: str
+    sample_rate: float = Field(default=1.0, gt=0, le=1, description="Fraction of /predict and /predict/batch requests shadowed")
+
+def start_shadow_run(candidate: FraudInference, sample_rate: float, model_id: Optional[str],
+                     run_id: Optional[str] = None):
+    """Start shadow scoring the active model's traffic with a candidate in this process"""
+    shadow_scorer.start(
+        inference_engine.model, candidate.model, sample_rate,
+        thresholds=(RISK_THRESHOLDS['warn'], RISK_THRESHOLDS['block']),
+        model_id=model_id,
+        feature_names=getattr(inference_engine.model, 'feature_names_in_', None),
+        run_id=run_id
+    )
+
+def stop_shadow_run() -> Optional[Dict]:
+    """
+    Stop shadow scoring here and, under the pre-fork server, in every worker
+
+    Blocks until the other workers have stopped, so call it off the event loop.
+
+    Returns:
+        Final counters (None if no shadow run was in progress)
+    """
+    status = shadow_scorer.stop()
+    if os.getenv("PREFORK_MASTER_PID"):
+        from serve import read_shadow_request, request_shadow
+        shadow_request = read_shadow_request()
+        if shadow_request.get('action') != 'start':
+            return status
+        request_shadow({"action": "stop", "run_id": shadow_request['run_id']})
+        return shadow_scorer.wait_stopped()
+    return status
+
+def apply_shadow_request(shadow_request: Dict):
+    """Start or stop this worker's part of a shadow run requested through the pre-fork master"""
+    running = shadow_scorer.config['run_id'] if shadow_scorer.enabled else None
+    if shadow_request.get('action') == 'start' and shadow_request['run_id'] != running:
+        if inference_engine is None and not ensure_model_loaded():
+            print("⚠️ Shadow scoring not started: model not loaded")
+            return
+        candidate = model_pool.load(shadow_request['model_path'], FraudInference, **engine_settings())
+        start_shadow_run(candidate, shadow_request['sample_rate'], shadow_request.get('model_id'),
+                         run_id=shadow_request['run_id'])
+    elif shadow_request.get('action') == 'stop' and running is not None:
+        shadow_scorer.stop()
+
+@app.post("/shadow")
+async def start_shadow(request: ShadowRequest):
+    """
+    Shadow-score live traffic with a candidate model.
+    The candidate scores the active model's engineered features in a
+    background thread; see GET /shadow for disagreement, score deltas and latency.
+    Under the pre-fork server every worker shadows its share of the traffic.
+    Activating a model ends the run.
+    """
+    if inference_engine is None and not ensure_model_loaded():
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    candidate = await engine_for_model(request.model_id)
+    if candidate is inference_engine:
+        raise HTTPException(status_code=400, detail="Model is already the active model")
     try:
-        # Load new model
-        new_engine = load_inference_engine(
-            model_path=full_path,
-            test_dataset_path=os.getenv("TEST_DATASET_PATH"),
-            threshold=float(os.getenv("MODEL_THRESHOLD", "0.0793")),
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            pagerank_limit=int(os.getenv("PAGERANK_LIMIT", "10000"))
-        )
-        inference_engine = new_engine
-        print(f"✅ Hot-swapped to model {model_id} ({full_path})")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to load model into memory: {str(e)}")
+        start_shadow_run(candidate, request.sample_rate, request.model_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if os.getenv("PREFORK_MASTER_PID"):
+        from serve import request_shadow
+        try:
+            request_shadow({"action": "start", "run_id": shadow_scorer.config['run_id'],
+                            "model_id": request.model_id, "model_path": candidate.model_path,
+                            "sample_rate": request.sample_rate})
+        except Exception as e:
+            shadow_scorer.stop()
+            raise HTTPException(status_code=500, detail=f"Failed to signal workers for shadow scoring: {str(e)}")
+    return await run_in_threadpool(shadow_scorer.shared_status)
+
+@app.get("/shadow")
+async def shadow_status():
+    """Counters of the current (or last) shadow run, summed over the serving processes"""
+    return await run_in_threadpool(shadow_scorer.shared_status)
+
+@app.delete("/shadow")
+async def stop_shadow():
+    """Stop shadow scoring in every serving process; returns the final counters"""
+    status = await run_in_threadpool(stop_shadow_run)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No shadow run in progress")
+    return status
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
 
-    return {"status": "success", "message": f"Model {model_id} activated"}
+def _cache_metrics(caches: Dict[str, tuple]) -> List[Metric]:
+    """Hit / miss counters of named caches given as (hits, misses)"""
+    return [
+        ("cache_hits_total", "counter", "Cache lookups answered from the cache",
+         [({"cache": name}, hits) for name, (hits, _) in caches.items()]),
+        ("cache_misses_total", "counter", "Cache lookups that had to compute or load",
+         [({"cache": name}, misses) for name, (_, misses) in caches.items()]),
+    ]
+
+def service_metrics() -> List[Metric]:
+    """Queue depths, cache hits and pool state of this process, read at scrape time"""
+    backtest = backtest_cache.stats()
+    rule_cache = compile_rule.cache_info()
+    pool = model_pool.stats()
+    shadow = shadow_scorer.status()
+    return [
+        ("model_loaded", "gauge", "Processes with the active model loaded",
+         [({}, int(inference_engine is not None))]),
+        ("audit_pending", "gauge", "Audit log writes dispatched and not finished",
+         [({}, audit_logger.pending if audit_logger else 0)]),
+        ("shadow_queue_depth", "gauge", "Batches waiting for the shadow worker",
+         [({}, shadow["queued"])]),
+        ("shadow_rows_total", "counter", "Rows scored by the shadow candidate", [({}, shadow["rows"])]),
+        ("shadow_dropped_total", "counter", "Shadow batches dropped because the queue was full",
+         [({}, shadow["dropped"])]),
+        ("rescore_running", "gauge", "Whether bulk rescoring is running", [({}, int(score_store.is_running()))]),
+        ("model_pool_models", "gauge", "Engines loaded in the model pool", [({}, len(pool["models"]))]),
+        ("model_pool_memory_mb", "gauge", "Estimated memory of the pooled engines", [({}, pool["memory_mb"])]),
+        ("model_pool_evictions_total", "counter", "Engines evicted from the model pool",
+         [({}, pool["evictions"])]),
+        *_cache_metrics({
+            "backtest": (backtest["hits"], backtest["misses"]),
+            "rule": (rule_cache.hits, rule_cache.misses),
+            "model_pool": (pool["hits"], pool["loads"]),
+        }),
+    ]
+
+def queue_metrics() -> List[Metric]:
+    """Training jobs by state, read from the queue database all processes share"""
+    return [
+        ("training_jobs", "gauge", "Training jobs by state",
+         [({"status": status}, count) for status, count in training_queue.counts().items()]),
+    ]
+
+metrics.add_collector(service_metrics)
+metrics.add_collector(queue_metrics, shared=True)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Stage latency histograms, queue depths and cache hit counters in the
+    Prometheus text format (summed over the pre-fork processes)
+    """
+    text = await run_in_threadpool(metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
 
+@app.get("/metrics/stages")
+async def stage_metrics():
+    """Count, errors and mean seconds of every timed stage"""
+    return await run_in_threadpool(metrics.stats)
 
 # ============================================================================
 # ERROR HANDLERS
@@ -0,0 +1,251 @@
+"""
+Model Benchmark Module
+Measures what a model costs to serve before it is activated: single-row
+latency (XGBoost and compiled trees), batch throughput, SHAP explanation
+cost and memory footprint, on a fixed replay set of transactions. Results
+are stored in the registry metrics and checked against the serving budget
+on activation.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tree_compiler import CompiledEnsemble
+
+try:
+    import shap
+    SHAP_AVAILABLE = True
+except ImportError:
+    SHAP_AVAILABLE = False
+
+# Replay set: the first BENCHMARK_ROWS TRANSFER / CASH_OUT rows of this file
+# (or of the first benchmarked upload when it is missing), frozen once into
+# BENCHMARK_REPLAY_SET so every model is measured on the same rows
+BENCHMARK_REPLAY_PATH = os.getenv("BENCHMARK_REPLAY_PATH", "dataset/test_dataset.csv")
+BENCHMARK_REPLAY_SET = os.getenv("BENCHMARK_REPLAY_SET", "Models/benchmark_replay.csv")
+BENCHMARK_ROWS = int(os.getenv("BENCHMARK_ROWS", "4096"))
+BENCHMARK_BATCH_SIZES = [int(b) for b in os.getenv("BENCHMARK_BATCH_SIZES", "1,32,256,4096").split(",") if b.strip()]
+# Timed calls for the single-row latency and explanation percentiles
+BENCHMARK_SINGLE_ROW_CALLS = int(os.getenv("BENCHMARK_SINGLE_ROW_CALLS", "300"))
+BENCHMARK_SHAP_CALLS = int(os.getenv("BENCHMARK_SHAP_CALLS", "30"))
+
+# Serving budget checked on activation (0 = no limit)
+MODEL_LATENCY_BUDGET_MS = float(os.getenv("MODEL_LATENCY_BUDGET_MS", "0"))
+MODEL_EXPLAIN_BUDGET_MS = float(os.getenv("MODEL_EXPLAIN_BUDGET_MS", "0"))
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# 'warn' activates over-budget models with warnings, 'refuse' rejects them
+# unless the activation is forced
+MODEL_BUDGET_POLICY = os.getenv("MODEL_BUDGET_POLICY", "warn")
+
+
+def replay_rows(fe, upload_path: Optional[str] = None, path: str = BENCHMARK_REPLAY_SET,
+                source: str = BENCHMARK_REPLAY_PATH, rows: int = BENCHMARK_ROWS) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Engineered features of the replay set
+
+    The replay set is frozen on first use: the first `rows` rows of `source`
+    (or of the upload, when `source` is missing) are written to `path`, and
+    every later model is benchmarked on those same transactions.
+
+    Args:
+        fe: Fitted feature engineer of the model
+        upload_path: Training upload, frozen when there is neither a replay set nor a source
+        path: Frozen replay CSV
+        source: CSV the replay set is taken from
+        rows: Rows to replay
+
+    Returns:
+        Engineered features (at most `rows` rows) and the replay set's path,
+        row count and content hash (stored with the benchmark)
+    """
+    from external_memory import iter_chunks
+
+    if not os.path.exists(path):
+        candidates = [c for c in (source, upload_path) if c and os.path.exists(c)]
+        if not candidates:
+            raise ValueError("No replay set available for benchmarking")
+        _freeze_replay_set(candidates[0], path, rows)
+    raw = next(iter_chunks(path, chunk_rows=rows * 4), None)
+    if raw is None:
+        raise ValueError(f"Replay set {path} has no usable rows")
+    raw = raw.head(rows).drop(columns=['isFraud'], errors='ignore')
+    digest = hashlib.sha1(pd.util.hash_pandas_object(raw, index=False).to_numpy().tobytes()).hexdigest()
+    return fe.transform(raw), {"path": path, "rows": len(raw), "sha1": digest[:16]}
+
+
+def _freeze_replay_set(source: str, path: str, rows: int) -> None:
+    """Copy the first rows of a CSV to the replay file (the first job to get there wins)"""
+    from external_memory import iter_chunks
+
+    raw = next(iter_chunks(source, chunk_rows=rows * 4), None)
+    if raw is None:
+        raise ValueError("No replay set available for benchmarking")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    raw.head(rows).to_csv(tmp, index=False)
+    try:
+        # link() fails if another job froze a replay set meanwhile; that one is kept
+        os.link(tmp, path)
+        print(f"📌 Froze benchmark replay set: {min(rows, len(raw))} rows of {source} -> {path}")
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000.0
+    return {"p50_ms": round(float(np.percentile(values, 50)), 4),
+            "p99_ms": round(float(np.percentile(values, 99)), 4)}
+
+
+def model_footprint(booster) -> Dict:
+    """Tree count, node count and serialized size of a booster"""
+    raw = booster.save_raw('json')
+    trees = json.loads(bytes(raw))['learner']['gradient_booster']['model']['trees']
+    return {
+        "trees": len(trees),
+        "nodes": int(sum(int(t['tree_param']['num_nodes']) for t in trees)),
+        "serialized_mb": round(len(booster.save_raw('ubj')) / 1e6, 3),
+    }
+
+
+def model_memory_mb(model, explainer=None) -> float:
+    """
+    Approximate serving memory of a model: booster plus SHAP tree arrays
+
+    The model pool accounts loaded engines the same way (engine_memory_mb),
+    so a model within MODEL_MEMORY_BUDGET_MB is measured against
+    MODEL_POOL_MAX_MB identically.
+
+    Args:
+        model: Fitted XGBClassifier (or None)
+        explainer: Its SHAP TreeExplainer, if one is built
+    """
+    size = 0
+    if model is not None and hasattr(model, 'get_booster'):
+        size += len(model.get_booster().save_raw('ubj'))
+    trees = getattr(explainer, 'model', None)
+    if trees is not None:
+        size += sum(v.nbytes for v in vars(trees).values() if isinstance(v, np.ndarray))
+    return round(size / 1e6, 3)
+
+
+def benchmark_model(model, X: pd.DataFrame, threads: Optional[int] = None,
+                    batch_sizes: Optional[List[int]] = None,
+                    single_row_calls: int = BENCHMARK_SINGLE_ROW_CALLS,
+                    shap_calls: int = BENCHMARK_SHAP_CALLS) -> Dict:
+    """
+    Benchmark a model the way it is served (predict_proba on engineered rows)
+
+    Args:
+        model: Fitted XGBClassifier
+        X: Engineered replay rows
+        threads: XGBoost threads while benchmarking (default: PREFORK_WORKER_THREADS,
+            the per-worker setting of the serving processes)
+        batch_sizes: Batch sizes for the throughput measurement
+        single_row_calls: Timed single-row predictions
+        shap_calls: Timed single-row SHAP explanations (0 = skip)
+
+    Returns:
+        Dict with latency (also of the compiled trees), throughput, explanation
+        and footprint figures
+    """
+    threads = threads or int(os.getenv("PREFORK_WORKER_THREADS", "1"))
+    batch_sizes = batch_sizes or BENCHMARK_BATCH_SIZES
+    previous_threads = model.get_params().get('n_jobs')
+    model.set_params(n_jobs=threads)
+    try:
+        n = len(X)
+        model.predict_proba(X.iloc[:1])  # warm-up
+
+        single = []
+        for i in range(single_row_calls):
+            row = X.iloc[[i % n]]
+            start = time.perf_counter()
+            model.predict_proba(row)
+            single.append(time.perf_counter() - start)
+
+        # Same single-row calls through the flattened trees (TREE_EVALUATOR=compiled)
+        try:
+            compiled = CompiledEnsemble.from_model(model)
+            compiled.predict_proba(X.iloc[:1])
+            compiled_single = []
+            for i in range(single_row_calls):
+                row = X.iloc[[i % n]]
+                start = time.perf_counter()
+                compiled.predict_proba(row)
+                compiled_single.append(time.perf_counter() - start)
+            compiled_result = {**_percentiles(compiled_single), "max_abs_diff": compiled.verify(model, X)}
+        except ValueError as e:
+            compiled_result = {"error": str(e)}
+
+        throughput = {}
+        for size in batch_sizes:
+            size = min(size, n)
+            batches = [X.iloc[s:s + size] for s in range(0, n - size + 1, size)][:max(1, single_row_calls)]
+            start = time.perf_counter()
+            for batch in batches:
+                model.predict_proba(batch)
+            elapsed = time.perf_counter() - start
+            throughput[str(size)] = int(size * len(batches) / elapsed) if elapsed > 0 else None
+
+        result = {
+            "replay_rows": n,
+            "threads": threads,
+            "single_row": _percentiles(single),
+            "compiled_single_row": compiled_result,
+            "throughput_rows_per_second": throughput,
+        }
+
+        # Served engines build an explainer whenever SHAP is installed, and
+        # its tree arrays count towards the memory footprint
+        explainer = None
+        if SHAP_AVAILABLE:
+            start = time.perf_counter()
+            explainer = shap.TreeExplainer(model)
+            init = time.perf_counter() - start
+        if explainer is not None and shap_calls > 0:
+            samples = []
+            for i in range(shap_calls):
+                row = X.iloc[[i % n]]
+                start = time.perf_counter()
+                explainer.shap_values(row)
+                samples.append(time.perf_counter() - start)
+            result["explain"] = {**_percentiles(samples), "explainer_init_ms": round(init * 1000, 2)}
+
+        result.update(model_footprint(model.get_booster()))
+        result["memory_mb"] = model_memory_mb(model, explainer)
+        return result
+    finally:
+        model.set_params(n_jobs=previous_threads)
+
+
+def budget_violations(benchmark: Optional[Dict]) -> List[str]:
+    """
+    Serving budget checks a benchmarked model fails
+
+    Returns:
+        Human-readable violations (empty if within budget)
+    """
+    if not benchmark:
+        return []
+    violations = []
+    p99 = benchmark.get('single_row', {}).get('p99_ms')
+    if MODEL_LATENCY_BUDGET_MS > 0 and p99 is not None and p99 > MODEL_LATENCY_BUDGET_MS:
+        violations.append(f"single-row p99 latency {p99:.2f}ms exceeds the {MODEL_LATENCY_BUDGET_MS:g}ms budget")
+    explain = benchmark.get('explain', {}).get('p99_ms')
+    if MODEL_EXPLAIN_BUDGET_MS > 0 and explain is not None and explain > MODEL_EXPLAIN_BUDGET_MS:
+        violations.append(f"explanation p99 {explain:.2f}ms exceeds the {MODEL_EXPLAIN_BUDGET_MS:g}ms budget")
+    # Benchmarks recorded before memory_mb only have the serialized size (model_mb)
+    size = benchmark.get('memory_mb', benchmark.get('model_mb'))
+    if MODEL_MEMORY_BUDGET_MB > 0 and size is not None and size > MODEL_MEMORY_BUDGET_MB:
+        violations.append(f"model memory {size:.1f}MB (booster and SHAP explainer) exceeds "
+                          f"the {MODEL_MEMORY_BUDGET_MB:g}MB budget")
+    return violations
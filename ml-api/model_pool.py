@@ -0,0 +1,238 @@
+"""
+Model Pool Module
+Keeps several loaded FraudInference engines in memory so requests can be
+scored by any registered model, and activation or rollback to a pooled model
+does not reload it from disk. Engines are evicted least recently used first
+when the pool exceeds its model count or memory budget. Engines whose feature
+engineer is fitted the same way share one fitted instance.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from feature_engineering import FEATURE_SCHEMA_VERSION
+from inference import FraudInference, feature_state_path, find_test_dataset
+from model_benchmark import model_memory_mb
+from utils.metrics import metrics
+
+# Loaded engines kept per process (the active model counts, and is never evicted)
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "3"))
+# Memory budget of the pooled models' trees and SHAP explainers (0 = no limit)
+MODEL_POOL_MAX_MB = float(os.getenv("MODEL_POOL_MAX_MB", "512"))
+
+LOAD_STAGE = metrics.stage("model_pool.load")
+
+
+def feature_state_key(test_dataset_path: Optional[str], pagerank_limit: Optional[int],
+                      model_path: Optional[str] = None) -> str:
+    """
+    Identify how an engine's feature engineer is fitted
+
+    Engines of models saved with their feature engineer load that one, so
+    the saved file identifies it. Other engines fit it on the first
+    MAX_FIT_ROWS rows of the test dataset, so the dataset file, the row
+    limit, the PageRank limit and the feature schema determine the fitted
+    state.
+    """
+    state_path = feature_state_path(model_path) if model_path else None
+    if state_path is not None and os.path.exists(state_path):
+        state_path = os.path.abspath(state_path)
+        return f"{state_path}@{int(os.path.getmtime(state_path))}"
+    try:
+        path = os.path.abspath(find_test_dataset(test_dataset_path))
+        dataset = f"{path}@{int(os.path.getmtime(path))}"
+    except (FileNotFoundError, OSError):
+        dataset = str(test_dataset_path)
+    return (f"{dataset}|{os.getenv('MAX_FIT_ROWS', '50000')}|{pagerank_limit}|"
+            f"{FEATURE_SCHEMA_VERSION}")
+
+
+def engine_memory_mb(engine: FraudInference) -> float:
+    """Approximate memory of an engine's own state: booster plus SHAP tree arrays"""
+    return model_memory_mb(engine.model, engine.shap_explainer)
+
+
+class PooledEngine:
+    """A loaded engine and its bookkeeping"""
+
+    def __init__(self, engine: FraudInference, state_key: Optional[str], memory_mb: float):
+        self.engine = engine
+        self.state_key = state_key
+        self.memory_mb = memory_mb
+        self.hits = 0
+
+
+class ModelPool:
+    """
+    LRU of loaded engines keyed by model file path
+
+    Pinned entries (the active model) are never evicted. Fitted feature
+    engineers and SHAP backgrounds are kept per feature_state_key and handed
+    to every engine loaded with the same key, as long as their feature
+    versions match; a state is dropped when its last engine is evicted.
+    """
+
+    def __init__(self, max_models: int = MODEL_POOL_SIZE, max_mb: float = MODEL_POOL_MAX_MB):
+        self.max_models = max(1, max_models)
+        self.max_mb = max_mb
+        self._engines: "OrderedDict[str, PooledEngine]" = OrderedDict()
+        self._feature_states: Dict[str, tuple] = {}
+        self._pinned: Optional[str] = None
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.evictions = 0
+        self.hits = 0
+        self.loads = 0
+
+    @staticmethod
+    def _key(model_path: str) -> str:
+        return os.path.abspath(model_path)
+
+    def get(self, model_path: str) -> Optional[FraudInference]:
+        """Pooled engine of a model file (marked most recently used), or None"""
+        key = self._key(model_path)
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is None:
+                return None
+            self._engines.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry.engine
+
+    def add(self, engine: FraudInference, state_key: Optional[str] = None, pin: bool = False) -> FraudInference:
+        """
+        Put an engine loaded elsewhere into the pool
+
+        Its feature engineer replaces the shared one of state_key, or is
+        replaced by it when both have the same version.
+
+        Args:
+            engine: Loaded engine
+            state_key: feature_state_key the engine was fitted with (None = not shared)
+            pin: Make this the active engine (never evicted)
+
+        Returns:
+            The engine
+        """
+        key = self._key(engine.model_path)
+        with self._lock:
+            current = self._engines.get(key)
+            if current is not None and current.engine is engine:
+                self._engines.move_to_end(key)
+                if pin:
+                    self._pinned = key
+                return engine
+            if state_key is not None:
+                shared = self._feature_states.get(state_key)
+                if shared is not None and getattr(shared[0], 'version', None) == getattr(engine.feature_engineer, 'version', None):
+                    engine.feature_engineer, engine.shap_background = shared
+                else:
+                    self._feature_states[state_key] = (engine.feature_engineer, engine.shap_background)
+            self._engines[key] = PooledEngine(engine, state_key, engine_memory_mb(engine))
+            self._engines.move_to_end(key)
+            if pin:
+                self._pinned = key
+            self._evict()
+        return engine
+
+    def load(self, model_path: str, loader: Callable[..., FraudInference], test_dataset_path: Optional[str] = None,
+             pagerank_limit: Optional[int] = None, **kwargs) -> FraudInference:
+        """
+        Pooled engine of a model file, loading it on a miss
+
+        Concurrent misses on the same file load it once.
+
+        Args:
+            model_path: Model file
+            loader: Engine factory with FraudInference's arguments
+            test_dataset_path: Dataset the feature engineer is fitted on (when the
+                model has no saved one) and the SHAP background is drawn from
+            pagerank_limit: PageRank node limit of the feature engineer
+            **kwargs: Further loader arguments (threshold, groq_api_key)
+
+        Returns:
+            The loaded engine
+        """
+        engine = self.get(model_path)
+        if engine is not None:
+            return engine
+        key = self._key(model_path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            engine = self.get(model_path)
+            if engine is not None:
+                return engine
+            state_key = feature_state_key(test_dataset_path, pagerank_limit, model_path)
+            with self._lock:
+                shared = self._feature_states.get(state_key)
+            with LOAD_STAGE.time():
+                if shared is not None:
+                    engine = loader(model_path, test_dataset_path=test_dataset_path, pagerank_limit=pagerank_limit,
+                                    feature_engineer=shared[0], shap_background=shared[1], **kwargs)
+                else:
+                    engine = loader(model_path, test_dataset_path=test_dataset_path, pagerank_limit=pagerank_limit,
+                                    **kwargs)
+            self.loads += 1
+            self.add(engine, state_key)
+            with self._lock:
+                self._load_locks.pop(key, None)
+            print(f"📦 Pooled model {model_path} ({len(self._engines)} loaded)")
+            return engine
+
+    def pin(self, model_path: str) -> None:
+        """Make a pooled model the active one"""
+        with self._lock:
+            key = self._key(model_path)
+            if key in self._engines:
+                self._pinned = key
+                self._engines.move_to_end(key)
+            self._evict()
+
+    def _memory_mb(self) -> float:
+        return sum(entry.memory_mb for entry in self._engines.values())
+
+    def _evict(self) -> None:
+        """Drop least recently used unpinned engines until within both limits (lock held)"""
+        newest = next(reversed(self._engines), None)
+        while len(self._engines) > self.max_models or (self.max_mb > 0 and self._memory_mb() > self.max_mb):
+            victim = next((k for k in self._engines if k not in (self._pinned, newest)), None)
+            if victim is None:
+                break
+            entry = self._engines.pop(victim)
+            self.evictions += 1
+            print(f"♻️ Evicted pooled model {victim}")
+            if entry.state_key is not None and not any(
+                    e.state_key == entry.state_key for e in self._engines.values()):
+                self._feature_states.pop(entry.state_key, None)
+
+    def stats(self) -> Dict:
+        """Loaded engines (least recently used first), memory and shared feature states"""
+        with self._lock:
+            models: List[Dict] = [
+                {
+                    "model_path": key,
+                    "active": key == self._pinned,
+                    "memory_mb": entry.memory_mb,
+                    "hits": entry.hits,
+                    "feature_version": getattr(entry.engine.feature_engineer, 'version', None),
+                }
+                for key, entry in self._engines.items()
+            ]
+            return {
+                "models": models,
+                "max_models": self.max_models,
+                "memory_mb": round(self._memory_mb(), 3),
+                "max_mb": self.max_mb,
+                "shared_feature_states": len(self._feature_states),
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+# Process-wide pool (each serving worker has its own)
+model_pool = ModelPool()
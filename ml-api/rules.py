@@ -0,0 +1,524 @@
+"""
+Rule Engine Module for Policy Lab
+Parses analyst rules into an AST and compiles them to vectorized NumPy masks
+"""
+
+import re
+import functools
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from feature_store import TRANSACTION_TYPES
+
+# Columns a rule may reference. Identifiers and ground-truth labels are
+# deliberately excluded.
+RULE_COLUMNS = frozenset([
+    # Raw transaction fields
+    'step', 'amount', 'oldBalanceOrig', 'newBalanceOrig',
+    'oldBalanceDest', 'newBalanceDest', 'isFlaggedFraud', 'type',
+    # Engineered features
+    'hour', 'orig_txn_count', 'dest_txn_count', 'amt_ratio_to_user_mean',
+    'amount_log1p', 'amount_over_oldBalanceOrig', 'amt_ratio_to_user_median',
+    'amt_log_ratio_to_user_median', 'in_degree', 'out_degree', 'network_trust',
+    'is_new_origin', 'is_new_dest', 'type_encoded',
+    # Advanced features
+    'balance_error_orig', 'balance_error_dest', 'interaction_strength',
+    'amount_to_dest_balance',
+    # Model output (materialized per row by the rescoring job)
+    'fraud_probability',
+])
+
+# Columns holding categorical codes; string literals are encoded against these
+CATEGORICAL_COLUMNS = {'type': TRANSACTION_TYPES}
+
+MAX_RULE_LENGTH = 2000
+# Deepest nesting of parentheses / 'not' a rule may use (the parser recurses per level)
+MAX_RULE_DEPTH = 64
+RULE_CACHE_SIZE = 1024
+
+# Below this fraction of rows still alive, later conjuncts/disjuncts are
+# evaluated only on the surviving rows instead of the full column
+SUBSET_FRACTION = 0.25
+
+_COMPARATORS = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+# Operator to use when the operands are swapped (literal on the left)
+_FLIPPED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<string>"[^"]*"|'[^']*')
+      | (?P<op>==|!=|<=|>=|&&|\|\||[<>=!&|~()\[\],-])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in', 'true', 'false'}
+
+
+class RuleError(ValueError):
+    """Raised for rules that do not parse or reference unknown columns"""
+
+
+# ============================================================================
+# AST
+# ============================================================================
+
+class _Context:
+    """Evaluation context: columns, row count and an optional shared memo"""
+
+    __slots__ = ('columns', 'n', 'memo', 'parent_memo', 'idx')
+
+    def __init__(self, columns: Mapping[str, np.ndarray], n: int,
+                 memo: Optional[Dict[str, np.ndarray]] = None,
+                 parent_memo: Optional[Dict[str, np.ndarray]] = None,
+                 idx: Optional[np.ndarray] = None):
+        self.columns = columns
+        self.n = n
+        self.memo = memo
+        self.parent_memo = parent_memo
+        self.idx = idx
+
+    def column(self, name: str) -> np.ndarray:
+        try:
+            values = self.columns[name]
+        except KeyError:
+            raise RuleError(f"Column '{name}' is not available in this dataset")
+        values = np.asarray(values)
+        return values if self.idx is None else values[self.idx]
+
+    def subset(self, idx: np.ndarray) -> "_Context":
+        """Context restricted to the given row positions (gathered lazily)"""
+        if self.idx is not None:
+            idx = self.idx[idx]
+        memo = self.memo if self.memo is not None else self.parent_memo
+        return _Context(self.columns, len(idx), parent_memo=memo, idx=idx)
+
+
+class Node:
+    """Base AST node. `key` is the canonical text used for caching and sharing."""
+
+    key: str = ''
+
+    def columns(self) -> set:
+        raise NotImplementedError
+
+    def evaluate(self, ctx: _Context) -> np.ndarray:
+        if ctx.memo is not None:
+            cached = ctx.memo.get(self.key)
+            if cached is None:
+                cached = self._evaluate(ctx)
+                ctx.memo[self.key] = cached
+            return cached
+        if ctx.parent_memo is not None:
+            cached = ctx.parent_memo.get(self.key)
+            if cached is not None:
+                return cached[ctx.idx]
+        return self._evaluate(ctx)
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        raise NotImplementedError
+
+    def walk(self) -> Iterable["Node"]:
+        yield self
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.key})"
+
+
+def _format_literal(value) -> str:
+    if isinstance(value, str):
+        return f'"{value}"'
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Compare(Node):
+    """column <op> literal, or column <op> column"""
+
+    def __init__(self, column: str, op: str, value, value_is_column: bool = False,
+                 display_value=None):
+        self.column = column
+        self.op = op
+        self.value = value
+        self.value_is_column = value_is_column
+        shown = value if value_is_column else _format_literal(
+            display_value if display_value is not None else value)
+        self.key = f"{column} {op} {shown}"
+
+    def columns(self) -> set:
+        return {self.column, self.value} if self.value_is_column else {self.column}
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        left = ctx.column(self.column)
+        right = ctx.column(self.value) if self.value_is_column else self.value
+        return _COMPARATORS[self.op](left, right)
+
+
+class In(Node):
+    """column in [literal, ...] (or not in)"""
+
+    def __init__(self, column: str, values: Tuple, negate: bool = False, display_values=None):
+        self.column = column
+        self.values = np.asarray(values)
+        self.negate = negate
+        shown = display_values if display_values is not None else values
+        items = ", ".join(_format_literal(v) for v in sorted(shown, key=str))
+        self.key = f"{column} {'not in' if negate else 'in'} [{items}]"
+
+    def columns(self) -> set:
+        return {self.column}
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        mask = np.isin(ctx.column(self.column), self.values)
+        return ~mask if self.negate else mask
+
+
+class Not(Node):
+    def __init__(self, child: Node):
+        self.child = child
+        self.key = f"not ({child.key})"
+
+    def columns(self) -> set:
+        return self.child.columns()
+
+    def walk(self):
+        yield self
+        yield from self.child.walk()
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        return ~self.child.evaluate(ctx)
+
+
+class _BoolOp(Node):
+    word = ''
+
+    def __init__(self, children: List[Node]):
+        # Flatten nested operators of the same kind and drop duplicates
+        flat: List[Node] = []
+        seen = set()
+        for child in children:
+            for grandchild in (child.children if isinstance(child, type(self)) else [child]):
+                if grandchild.key not in seen:
+                    seen.add(grandchild.key)
+                    flat.append(grandchild)
+        self.children = flat
+        # Commutative: canonical text sorts operands so reordered rules share a key
+        self.key = f" {self.word} ".join(f"({c.key})" for c in sorted(flat, key=lambda c: c.key))
+
+    def columns(self) -> set:
+        return set().union(*(c.columns() for c in self.children))
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class And(_BoolOp):
+    word = 'and'
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        mask = np.array(self.children[0].evaluate(ctx), dtype=bool, copy=True)
+        for child in self.children[1:]:
+            alive = np.count_nonzero(mask)
+            if alive == 0:
+                break
+            if alive < ctx.n * SUBSET_FRACTION:
+                idx = np.flatnonzero(mask)
+                mask[idx] = child.evaluate(ctx.subset(idx))
+            else:
+                mask &= child.evaluate(ctx)
+        return mask
+
+
+class Or(_BoolOp):
+    word = 'or'
+
+    def _evaluate(self, ctx: _Context) -> np.ndarray:
+        mask = np.array(self.children[0].evaluate(ctx), dtype=bool, copy=True)
+        for child in self.children[1:]:
+            remaining = ctx.n - np.count_nonzero(mask)
+            if remaining == 0:
+                break
+            if remaining < ctx.n * SUBSET_FRACTION:
+                idx = np.flatnonzero(~mask)
+                mask[idx] = child.evaluate(ctx.subset(idx))
+            else:
+                mask |= child.evaluate(ctx)
+        return mask
+
+
+def _bool_op(kind, children: List[Node]) -> Node:
+    """And / Or of children, or the only child left once duplicates are dropped"""
+    if len(children) == 1:
+        return children[0]
+    node = kind(children)
+    return node.children[0] if len(node.children) == 1 else node
+
+
+# ============================================================================
+# PARSER
+# ============================================================================
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise RuleError(f"Unexpected character {text[pos:].lstrip()[:1]!r} at position {pos}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive-descent parser for the rule language:
+
+        expr       := and_expr (('or' | '|' | '||') and_expr)*
+        and_expr   := not_expr (('and' | '&' | '&&') not_expr)*
+        not_expr   := ('not' | '~' | '!') not_expr | '(' expr ')' | comparison
+        comparison := operand CMP operand | column ['not'] 'in' list
+        operand    := column | number | string | true | false
+    """
+
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.depth = 0
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise RuleError("Rule is empty")
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise RuleError(f"Unexpected token '{self.tokens[self.pos][1]}'")
+        return node
+
+    def _peek(self) -> Tuple[Optional[str], Optional[str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _accept(self, *values) -> Optional[str]:
+        kind, value = self._peek()
+        if kind in ('op', 'keyword') and value in values:
+            self.pos += 1
+            return value
+        return None
+
+    def _expect(self, value: str):
+        if self._accept(value) is None:
+            found = self._peek()[1]
+            raise RuleError(f"Expected '{value}' but found {repr(found) if found else 'end of rule'}")
+
+    def _or(self) -> Node:
+        children = [self._and()]
+        while self._accept('or', '|', '||'):
+            children.append(self._and())
+        return _bool_op(Or, children)
+
+    def _and(self) -> Node:
+        children = [self._not()]
+        while self._accept('and', '&', '&&'):
+            children.append(self._not())
+        return _bool_op(And, children)
+
+    def _not(self) -> Node:
+        if self._accept('not', '~', '!'):
+            self._enter()
+            node = Not(self._not())
+        elif self._accept('('):
+            self._enter()
+            node = self._or()
+            self._expect(')')
+        else:
+            return self._comparison()
+        self.depth -= 1
+        return node
+
+    def _enter(self):
+        self.depth += 1
+        if self.depth > MAX_RULE_DEPTH:
+            raise RuleError(f"Rule is nested more than {MAX_RULE_DEPTH} levels deep")
+
+    def _operand(self):
+        """Returns ('column', name) or ('literal', value)"""
+        kind, value = self._peek()
+        if kind is None:
+            raise RuleError("Rule ended unexpectedly")
+        self.pos += 1
+        if kind == 'name':
+            if value not in RULE_COLUMNS:
+                raise RuleError(f"Unknown column '{value}'. Allowed: {', '.join(sorted(RULE_COLUMNS))}")
+            return 'column', value
+        if kind == 'number':
+            return 'literal', float(value)
+        if kind == 'string':
+            return 'literal', value[1:-1]
+        if kind == 'keyword' and value in ('true', 'false'):
+            return 'literal', 1.0 if value == 'true' else 0.0
+        if kind == 'op' and value == '-':
+            number_kind, number = self._peek()
+            if number_kind == 'number':
+                self.pos += 1
+                return 'literal', -float(number)
+        raise RuleError(f"Unexpected token '{value}'")
+
+    def _literal_list(self) -> List:
+        closing = ']' if self._accept('[') else (')' if self._accept('(') else None)
+        if closing is None:
+            raise RuleError("Expected a list after 'in'")
+        values = []
+        while True:
+            kind, value = self._operand()
+            if kind != 'literal':
+                raise RuleError("Lists may only contain literals")
+            values.append(value)
+            if not self._accept(','):
+                break
+        self._expect(closing)
+        return values
+
+    def _comparison(self) -> Node:
+        left_kind, left = self._operand()
+
+        if left_kind == 'column' and self._peek() in (('keyword', 'in'), ('keyword', 'not')):
+            negate = self._accept('not') is not None
+            self._expect('in')
+            values = self._literal_list()
+            return In(left, tuple(_encode_literal(left, v) for v in values),
+                      negate=negate, display_values=tuple(values))
+
+        op = self._accept(*_COMPARATORS, '=')
+        if op is None:
+            found = self._peek()[1]
+            raise RuleError(f"Expected a comparison after '{left}' but found "
+                            f"{repr(found) if found else 'end of rule'}")
+        op = '==' if op == '=' else op
+        right_kind, right = self._operand()
+
+        if left_kind == 'literal' and right_kind == 'literal':
+            raise RuleError("A comparison must reference at least one column")
+        if left_kind == 'literal':
+            # Normalize to column-on-the-left
+            left_kind, left, right_kind, right, op = right_kind, right, left_kind, left, _FLIPPED[op]
+
+        if right_kind == 'column':
+            if left in CATEGORICAL_COLUMNS or right in CATEGORICAL_COLUMNS:
+                if left != right or op not in ('==', '!='):
+                    raise RuleError(f"'{left} {op} {right}' compares a categorical column")
+            return Compare(left, op, right, value_is_column=True)
+
+        if left in CATEGORICAL_COLUMNS and op not in ('==', '!='):
+            raise RuleError(f"Column '{left}' only supports ==, != and in")
+        return Compare(left, op, _encode_literal(left, right), display_value=right)
+
+
+def _encode_literal(column: str, value):
+    """Map string literals of categorical columns to their codes"""
+    categories = CATEGORICAL_COLUMNS.get(column)
+    if categories is not None:
+        if not isinstance(value, str) or value not in categories:
+            raise RuleError(f"'{column}' must be one of {categories}")
+        return categories.index(value)
+    if isinstance(value, str):
+        raise RuleError(f"Column '{column}' is numeric; got string \"{value}\"")
+    return value
+
+
+# ============================================================================
+# COMPILED RULES
+# ============================================================================
+
+class CompiledRule:
+    """
+    A validated rule ready for vectorized evaluation.
+
+    The same instance serves backtests (whole column windows) and inline
+    scoring (length-1 columns). Categorical columns such as `type` must be
+    given as codes (see feature_store.encode_types).
+    """
+
+    def __init__(self, text: str, root: Node):
+        self.text = text
+        self.root = root
+        self.canonical = root.key
+        self.columns = frozenset(root.columns())
+
+    def evaluate(self, columns: Mapping[str, np.ndarray],
+                 memo: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Evaluate the rule over columns
+
+        Args:
+            columns: Mapping of column name to equally long arrays
+            memo: Optional dict shared across rules to reuse common sub-predicates
+
+        Returns:
+            Boolean mask of matching rows
+        """
+        ctx = _Context(columns, 0, memo=memo)
+        ctx.n = len(ctx.column(next(iter(self.columns))))
+        return np.asarray(self.root.evaluate(ctx), dtype=bool)
+
+    def nodes(self) -> List[Node]:
+        """Every distinct sub-predicate of the rule (including the rule itself)"""
+        unique = {}
+        for node in self.root.walk():
+            unique.setdefault(node.key, node)
+        return list(unique.values())
+
+    def __repr__(self) -> str:
+        return f"CompiledRule({self.canonical!r})"
+
+
+_compiled_by_canonical: Dict[str, CompiledRule] = {}
+
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def compile_rule(text: str) -> CompiledRule:
+    """
+    Parse, validate and compile a rule (cached by text and canonical form)
+
+    Args:
+        text: Rule source, e.g. 'amount > 50000 and type == "TRANSFER"'
+
+    Returns:
+        CompiledRule
+
+    Raises:
+        RuleError: If the rule is invalid
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise RuleError("Rule is empty")
+    if len(text) > MAX_RULE_LENGTH:
+        raise RuleError(f"Rule is longer than {MAX_RULE_LENGTH} characters")
+
+    root = _Parser(text).parse()
+    compiled = _compiled_by_canonical.get(root.key)
+    if compiled is None:
+        if len(_compiled_by_canonical) >= RULE_CACHE_SIZE:
+            _compiled_by_canonical.clear()
+        compiled = CompiledRule(text, root)
+        _compiled_by_canonical[root.key] = compiled
+    return compiled
+
+
+def normalize_rule(text: str) -> str:
+    """Canonical text of a rule (equal for trivially reformatted rules)"""
+    return compile_rule(text).canonical
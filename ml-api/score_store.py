@@ -0,0 +1,317 @@
+"""
+Score Store Module
+Materializes model scores for every row of the engineered feature table so
+that seed-queue, backtests and model-health views read them by row index
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from feature_store import FeatureTable
+from utils.metrics import metrics
+
+SCORES_DIR = os.getenv("SCORES_DIR", "Models/scores")
+RESCORE_CHUNK_ROWS = int(os.getenv("RESCORE_CHUNK_ROWS", "65536"))
+RESCORE_WORKERS = int(os.getenv("RESCORE_WORKERS", str(os.cpu_count() or 1)))
+
+SCORE_COLUMN = 'fraud_probability'
+
+
+class ScoreArtifact:
+    """Per-row model scores (and optional top-k contributions) for one table"""
+
+    def __init__(self, model_key: str, dataset_version: Optional[str], feature_version: Optional[str],
+                 probabilities: np.ndarray, feature_names: List[str],
+                 topk_index: Optional[np.ndarray] = None, topk_value: Optional[np.ndarray] = None):
+        self.model_key = model_key
+        self.dataset_version = dataset_version
+        self.feature_version = feature_version
+        self.probabilities = probabilities
+        self.feature_names = feature_names
+        self.topk_index = topk_index
+        self.topk_value = topk_value
+
+    @property
+    def key(self) -> Tuple[str, Optional[str], Optional[str]]:
+        return (self.model_key, self.dataset_version, self.feature_version)
+
+    def contributions(self, row: int) -> List[Dict]:
+        """Top-k feature contributions of one row (empty if not materialized)"""
+        if self.topk_index is None:
+            return []
+        return [
+            {"feature": self.feature_names[int(i)], "shap": float(v)}
+            for i, v in zip(self.topk_index[row], self.topk_value[row])
+        ]
+
+
+def _artifact_prefix(directory: str, key: Tuple) -> str:
+    model_key, dataset_version, feature_version = key
+    return os.path.join(directory, f"{model_key}_{dataset_version}_{feature_version}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _lock_owner(lock_path: str) -> Optional[int]:
+    """PID holding a rescoring lock file, if that process is alive"""
+    try:
+        with open(lock_path) as f:
+            owner = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+    return owner if owner and _pid_alive(owner) else None
+
+
+class ScoreStore:
+    """
+    Runs bulk rescoring jobs and serves their results.
+
+    Artifacts are .npy files keyed by (model, dataset version, feature
+    version) and loaded memory-mapped, so every worker process shares one
+    copy through the page cache. A lock file makes sure only one process
+    scores a given key at a time.
+    """
+
+    def __init__(self, directory: str = SCORES_DIR):
+        self.directory = directory
+        self.artifact: Optional[ScoreArtifact] = None
+        self.status: Dict = {"state": "idle"}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def lookup(self, model_key: Optional[str], table: FeatureTable) -> Optional[ScoreArtifact]:
+        """
+        Return the scores of a model over a table, loading them from disk if needed
+
+        Args:
+            model_key: Identifier of the model
+            table: Feature table the scores must line up with
+
+        Returns:
+            ScoreArtifact, or None if these scores were not materialized yet
+        """
+        if model_key is None:
+            return None
+        key = (model_key, table.dataset_version, table.feature_version)
+        artifact = self.artifact
+        if artifact is not None and artifact.key == key:
+            return artifact
+        artifact = self._load(key, len(table))
+        if artifact is not None:
+            self.artifact = artifact
+        return artifact
+
+    def _load(self, key: Tuple, n_rows: int) -> Optional[ScoreArtifact]:
+        prefix = _artifact_prefix(self.directory, key)
+        try:
+            with open(f"{prefix}.json") as f:
+                meta = json.load(f)
+            probabilities = np.load(f"{prefix}_proba.npy", mmap_mode='r')
+            topk_index = topk_value = None
+            if meta.get('topk'):
+                topk_index = np.load(f"{prefix}_topk_idx.npy", mmap_mode='r')
+                topk_value = np.load(f"{prefix}_topk_val.npy", mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if len(probabilities) != n_rows:
+            return None
+        return ScoreArtifact(*key, probabilities, meta['feature_names'], topk_index, topk_value)
+
+    def running_elsewhere(self, model_key: Optional[str], table: FeatureTable) -> Optional[int]:
+        """PID of another live process rescoring this model over this table, if any"""
+        if model_key is None or self.is_running():
+            return None
+        prefix = _artifact_prefix(self.directory, (model_key, table.dataset_version, table.feature_version))
+        return _lock_owner(f"{prefix}.lock")
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, model, table: FeatureTable, model_key: str,
+              topk: int = 0, force: bool = False,
+              features: Optional[Callable[[], FeatureTable]] = None) -> bool:
+        """
+        Start a background rescoring job unless the scores already exist
+
+        Args:
+            model: Fitted XGBoost model (XGBClassifier or Booster)
+            table: Feature table the scores line up with (and are keyed by)
+            model_key: Identifier of the model (and of the features it is served with)
+            topk: Also store the top-k SHAP contributions per row (0 = off)
+            force: Rescore even if an artifact exists
+            features: Builds the rows of `table` as the model is served them,
+                when that differs from `table` (called in the background job)
+
+        Returns:
+            True if a job was started
+        """
+        with self._lock:
+            if self.is_running():
+                return False
+            if not force and self.lookup(model_key, table) is not None:
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(model, table, model_key, topk, features),
+                name="rescore", daemon=True
+            )
+            self.status = {"state": "queued", "model_key": model_key, "rows": len(table)}
+            self._thread.start()
+            return True
+
+    def _run(self, model, table: FeatureTable, model_key: str, topk: int,
+             features: Optional[Callable[[], FeatureTable]] = None) -> None:
+        key = (model_key, table.dataset_version, table.feature_version)
+        prefix = _artifact_prefix(self.directory, key)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Another worker process may already be scoring this key
+        lock_path = f"{prefix}.lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            owner = _lock_owner(lock_path)
+            if owner:
+                self.status = {"state": "skipped", "model_key": model_key,
+                               "message": f"Rescoring in progress in process {owner}"}
+                return
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+
+        start_time = time.time()
+        self.status = {"state": "running", "model_key": model_key, "rows": len(table),
+                       "rows_done": 0, "started_at": datetime.utcnow().isoformat() + "Z"}
+        try:
+            scored = table
+            if features is not None:
+                scored = features()
+                if len(scored) != len(table):
+                    raise ValueError(f"Scoring features have {len(scored)} rows, the table has {len(table)}")
+            artifact = score_table(model, scored, model_key, topk, progress=self._progress)
+            # Keyed by the table the scores are attached to, not the one they were computed on
+            artifact.dataset_version, artifact.feature_version = table.dataset_version, table.feature_version
+            self._save(prefix, artifact, topk)
+            self.artifact = self._load(key, len(table)) or artifact
+            elapsed = time.time() - start_time
+            self.status = {"state": "completed", "model_key": model_key, "rows": len(table),
+                           "rows_done": len(table), "seconds": round(elapsed, 2),
+                           "rows_per_second": int(len(table) / elapsed) if elapsed > 0 else None}
+            print(f"✅ Rescored {len(table):,} rows with model {model_key} in {elapsed:.1f}s")
+        except Exception as e:
+            self.status = {"state": "failed", "model_key": model_key, "error": str(e)}
+            print(f"❌ Rescoring failed: {e}")
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def _progress(self, rows_done: int) -> None:
+        self.status["rows_done"] = rows_done
+
+    @staticmethod
+    def _save(prefix: str, artifact: ScoreArtifact, topk: int) -> None:
+        # Write to temp names and rename so readers never see partial files
+        files = {"_proba.npy": artifact.probabilities}
+        if artifact.topk_index is not None:
+            files["_topk_idx.npy"] = artifact.topk_index
+            files["_topk_val.npy"] = artifact.topk_value
+        for suffix, array in files.items():
+            tmp = f"{prefix}{suffix}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, f"{prefix}{suffix}")
+        meta = {"feature_names": artifact.feature_names, "topk": topk,
+                "rows": len(artifact.probabilities),
+                "created_at": datetime.utcnow().isoformat() + "Z"}
+        with open(f"{prefix}.json.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{prefix}.json.tmp", f"{prefix}.json")
+
+
+@metrics.stage("rescore.table").timed
+def score_table(model, table: FeatureTable, model_key: str, topk: int = 0,
+                chunk_rows: int = RESCORE_CHUNK_ROWS, workers: int = RESCORE_WORKERS,
+                progress=None) -> ScoreArtifact:
+    """
+    Score every row of a feature table in parallel vectorized chunks
+
+    Each chunk is a float32 matrix in the model's feature order, scored with
+    a single-threaded copy of the booster; chunks run on a thread pool
+    (XGBoost releases the GIL while predicting).
+
+    Args:
+        model: Fitted XGBoost model (XGBClassifier or Booster)
+        table: Feature table to score
+        model_key: Identifier of the model
+        topk: Also compute the top-k SHAP contributions per row (0 = off)
+        chunk_rows: Rows per chunk
+        workers: Number of chunks scored at once
+        progress: Optional callback receiving the number of rows done
+
+    Returns:
+        ScoreArtifact with float32 probabilities
+    """
+    import xgboost as xgb
+
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    feature_names = list(booster.feature_names or [])
+    missing = [name for name in feature_names if name not in table.columns]
+    if missing:
+        raise ValueError(f"Feature table lacks model features: {missing}")
+
+    # Private single-threaded copy: parallelism comes from the chunk pool and
+    # the serving model's thread settings stay untouched
+    booster = booster.copy()
+    booster.set_param({'nthread': 1})
+
+    n = len(table)
+    probabilities = np.empty(n, dtype=np.float32)
+    k = min(topk, len(feature_names))
+    topk_index = np.empty((n, k), dtype=np.int16) if k else None
+    topk_value = np.empty((n, k), dtype=np.float32) if k else None
+    done = [0]
+    done_lock = threading.Lock()
+
+    def run_chunk(bounds: Tuple[int, int]) -> None:
+        a, b = bounds
+        X = np.column_stack([table.columns[name][a:b] for name in feature_names]).astype(np.float32)
+        probabilities[a:b] = booster.inplace_predict(X, validate_features=False)
+        if k:
+            contribs = booster.predict(xgb.DMatrix(X, feature_names=feature_names),
+                                       pred_contribs=True)[:, :-1]
+            idx = np.argpartition(-np.abs(contribs), k - 1, axis=1)[:, :k]
+            values = np.take_along_axis(contribs, idx, axis=1)
+            order = np.argsort(-np.abs(values), axis=1)
+            topk_index[a:b] = np.take_along_axis(idx, order, axis=1)
+            topk_value[a:b] = np.take_along_axis(values, order, axis=1)
+        with done_lock:
+            done[0] += b - a
+            if progress is not None:
+                progress(done[0])
+
+    chunks = [(a, min(a + chunk_rows, n)) for a in range(0, n, chunk_rows)]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="rescore") as pool:
+        list(pool.map(run_chunk, chunks))
+
+    return ScoreArtifact(model_key, table.dataset_version, table.feature_version,
+                         probabilities, feature_names, topk_index, topk_value)
+
+
+score_store = ScoreStore()
@@ -0,0 +1,730 @@
+"""
+Pre-fork Multi-Process Server for CloverShield ML API
+Loads the model once in a master process and forks copy-on-write workers
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import errno
+import glob
+import select
+import signal
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+from typing import Dict, Optional
+
+import uvicorn
+
+# Add current directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shadow import shadow_scorer
+from utils.metrics import metrics
+
+# Seconds a model activation waits for the master to load the model
+RELOAD_TIMEOUT = float(os.getenv("PREFORK_RELOAD_TIMEOUT", "300"))
+# Seconds a worker waits for the services process to start a rescoring job
+RESCORE_REQUEST_TIMEOUT = 30.0
+
+
+def _control_file_path(master_pid: int) -> str:
+    """Path of the JSON file workers use to hand reload requests to the master"""
+    return os.getenv(
+        "PREFORK_CONTROL_FILE",
+        os.path.join(tempfile.gettempdir(), f"clovershield-prefork-{master_pid}.json")
+    )
+
+
+def _read_reload_request(master_pid: int) -> Dict:
+    """Last reload request ({} if there is no usable one)"""
+    try:
+        with open(_control_file_path(master_pid)) as f:
+            request = json.load(f)
+        if not isinstance(request, dict) or not request.get("model_path"):
+            raise ValueError("request has no model_path")
+        return request
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No usable reload request ({str(e)}), reloading current MODEL_PATH")
+        return {}
+
+
+def _result_file_path(master_pid: int, request_id: str) -> str:
+    """Path of the JSON file one reload or rescore request is answered in"""
+    return f"{_control_file_path(master_pid)}.{request_id}.result"
+
+
+def _write_json(path: str, payload: Dict):
+    """Write a JSON file atomically (readers never see it half written)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _share_metrics():
+    """Sum this process's metrics and shadow counters with the other processes of the server"""
+    directory = os.getenv("METRICS_DIR")
+    if directory:
+        metrics.share(directory)
+        shadow_scorer.share(directory)
+
+
+def _shadow_file_path(master_pid: int) -> str:
+    """Path of the JSON file holding the shadow run every worker should run"""
+    return f"{_control_file_path(master_pid)}.shadow"
+
+
+def read_shadow_request(master_pid: Optional[int] = None) -> Dict:
+    """Shadow run the workers were last asked to start or stop ({} if none)"""
+    master_pid = master_pid or int(os.environ["PREFORK_MASTER_PID"])
+    try:
+        with open(_shadow_file_path(master_pid)) as f:
+            request = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return request if isinstance(request, dict) else {}
+
+
+def request_shadow(request: Dict):
+    """
+    Ask every worker to start or stop shadow scoring.
+
+    Called from the worker handling /shadow. The request is kept in a
+    control file that the master announces to all workers with SIGUSR1;
+    workers forked later read it when they start, so the whole pool runs
+    the same shadow run.
+
+    Args:
+        request: {"action": "start", "run_id", "model_id", "model_path",
+            "sample_rate"} or {"action": "stop", "run_id"}
+    """
+    master_pid = int(os.environ["PREFORK_MASTER_PID"])
+    _write_json(_shadow_file_path(master_pid), request)
+    os.kill(master_pid, signal.SIGUSR1)
+
+
+def _rescore_file_path(master_pid: int) -> str:
+    """Path of the JSON file holding the last rescore request for the services process"""
+    return f"{_control_file_path(master_pid)}.rescore"
+
+
+def _wait_for_result(result_file: str, timeout: float) -> Optional[Dict]:
+    """Answer written to result_file (None if none came within timeout); the file is removed"""
+    deadline = time.time() + timeout
+    try:
+        while time.time() < deadline:
+            try:
+                with open(result_file) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                time.sleep(0.1)
+        return None
+    finally:
+        try:
+            os.remove(result_file)
+        except OSError:
+            pass
+
+
+def request_rescore(model_key: str, force: bool = False, timeout: float = RESCORE_REQUEST_TIMEOUT) -> Dict:
+    """
+    Ask the services process to rescore the dataset with the active model.
+
+    Called from a worker (POST /scores/rescore), so that rolling reloads,
+    which replace workers, never cut a rescoring job short. The master
+    forwards the request (SIGUSR2) to the services process, which answers
+    once the job is started. Blocks until then, so call it off the event loop.
+
+    Args:
+        model_key: current_model_key() of the requesting worker; the services
+            process refuses if it serves another model
+        force: Rescore even if scores for this model exist
+
+    Returns:
+        {"started": bool, "job": rescoring status of the services process}
+
+    Raises:
+        RuntimeError: The services process could not start the job
+        TimeoutError: No answer in time
+    """
+    master_pid = int(os.environ["PREFORK_MASTER_PID"])
+    request_id = uuid.uuid4().hex
+    _write_json(_rescore_file_path(master_pid),
+                {"model_key": model_key, "force": force, "request_id": request_id, "requested_by": os.getpid()})
+    os.kill(master_pid, signal.SIGUSR2)
+
+    result = _wait_for_result(_result_file_path(master_pid, request_id), timeout)
+    if result is None:
+        raise TimeoutError(f"Services process did not answer the rescore request within {timeout:.0f}s")
+    if not result.get("ok"):
+        raise RuntimeError(result.get("error") or "Rescoring failed to start")
+    return {"started": result["started"], "job": result["job"]}
+
+
+def request_rolling_reload(model_path: str, timeout: float = RELOAD_TIMEOUT):
+    """
+    Ask the pre-fork master to load a new model and roll the workers.
+
+    Called from a worker (e.g. by the model activation endpoint). The master
+    reads the model path from the control file when it receives SIGHUP and
+    answers once it has loaded the model (before replacing the workers).
+    Blocks until then, so call it off the event loop.
+
+    Args:
+        model_path: Absolute path of the model file to activate
+        timeout: Seconds to wait for the master's answer
+
+    Raises:
+        RuntimeError: The master could not load the model (it keeps serving the previous one)
+        TimeoutError: The master did not answer in time
+    """
+    master_pid = int(os.environ["PREFORK_MASTER_PID"])
+    request_id = uuid.uuid4().hex
+    result_file = _result_file_path(master_pid, request_id)
+    _write_json(_control_file_path(master_pid),
+                {"model_path": model_path, "request_id": request_id, "requested_by": os.getpid()})
+    os.kill(master_pid, signal.SIGHUP)
+
+    result = _wait_for_result(result_file, timeout)
+    if result is None:
+        raise TimeoutError(f"Master did not load {model_path} within {timeout:.0f}s")
+    if not result.get("ok"):
+        raise RuntimeError(result.get("error") or "Reload failed")
+
+
+class PreforkServer:
+    """
+    Master process supervising N uvicorn workers on one shared socket.
+
+    - The master binds the listening socket and loads the model, dataset and
+      feature engineer once (main.warm_up), then freezes the GC so the shared
+      heap is not dirtied by collections in the workers.
+    - Workers are forked and inherit everything copy-on-write; the kernel
+      load-balances accepted connections across them.
+    - Crashed workers are restarted (with backoff when they crash-loop).
+    - Background services (the training dispatcher and bulk rescoring) run
+      once, in a separate services process that reloads never replace, so
+      running training jobs are not interrupted by a reload.
+    - SIGHUP triggers a rolling reload: the master loads the new model and
+      reports the outcome to the requesting worker; if it loaded, it replaces
+      workers one at a time, waiting for each to become ready, and tells the
+      services process to load the model too. A model that fails to load
+      leaves MODEL_PATH and the workers as they were.
+    - SIGUSR1 (from a worker handling /shadow) is forwarded to every worker,
+      which then starts or stops shadow scoring as the shadow control file says.
+    - SIGUSR2 (from a worker handling /scores/rescore) is forwarded to the
+      services process, which starts the rescoring job and answers the worker.
+    - SIGTERM/SIGINT shut the workers and the services process down gracefully.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 7860,
+        workers: int = 2,
+        worker_threads: int = 1,
+        graceful_timeout: float = 30.0,
+        ready_timeout: float = 60.0,
+        log_level: str = "info"
+    ):
+        """
+        Initialize the pre-fork server
+
+        Args:
+            host: Interface to bind
+            port: Port to bind
+            workers: Number of worker processes to fork
+            worker_threads: XGBoost threads per worker (keep cores for other workers)
+            graceful_timeout: Seconds a retiring worker gets before SIGKILL
+            ready_timeout: Seconds to wait for a replacement worker during reload
+            log_level: Uvicorn log level for the workers
+        """
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.worker_threads = worker_threads
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.log_level = log_level
+        self.sock: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}  # pid -> spawn time
+        self.services_pid: Optional[int] = None
+        self.services_started_at = 0.0
+        self.retiring: Dict[int, float] = {}  # pid -> SIGKILL deadline
+        self.crash_count = 0
+        self.next_spawn_at = 0.0
+        self._stopping = False
+        self._reload_requested = False
+        self._shadow_requested = False
+        self._rescore_requested = False
+        self._own_metrics_dir: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Master lifecycle
+    # ------------------------------------------------------------------
+
+    def run(self):
+        """Bind, warm up, fork workers and supervise them until shutdown"""
+        self.sock = self._bind()
+        os.environ["PREFORK_MASTER_PID"] = str(os.getpid())
+        self._prepare_metrics_dir()
+        print(f"🧩 Pre-fork master {os.getpid()} listening on {self.host}:{self.port} "
+              f"with {self.num_workers} workers")
+
+        self._warm_up()
+
+        signal.signal(signal.SIGHUP, self._on_sighup)
+        # Installed before any fork, so a worker never sees SIGUSR1 before it has its own handler
+        signal.signal(signal.SIGUSR1, self._on_shadow)
+        signal.signal(signal.SIGUSR2, self._on_rescore)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+
+        try:
+            while not self._stopping:
+                if self._reload_requested:
+                    self._rolling_reload()
+                if self._shadow_requested:
+                    self._forward_shadow()
+                if self._rescore_requested:
+                    self._forward_rescore()
+                self._reap()
+                self._spawn_services_if_missing()
+                self._spawn_missing()
+                time.sleep(0.2)
+        finally:
+            self._shutdown()
+
+    def _bind(self) -> socket.socket:
+        """Create the shared listening socket"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(int(os.getenv("PREFORK_BACKLOG", "2048")))
+        sock.set_inheritable(True)
+        return sock
+
+    def _warm_up(self):
+        """Load shared state in the master before any fork"""
+        import main
+        main.warm_up()
+        # Move everything loaded so far out of the GC's reach so collections
+        # in the workers do not touch (and copy) the shared pages.
+        gc.collect()
+        gc.freeze()
+
+    def _prepare_metrics_dir(self):
+        """Empty directory the workers and the services process share their metrics through"""
+        directory = os.getenv("METRICS_DIR")
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # Left over from a previous master; Prometheus sees the restart as a counter reset
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(directory, name))
+        else:
+            directory = tempfile.mkdtemp(prefix=f"clovershield-metrics-{os.getpid()}-")
+            self._own_metrics_dir = directory
+        os.environ["METRICS_DIR"] = directory
+
+    def _on_sighup(self, signum, frame):
+        self._reload_requested = True
+
+    def _on_shadow(self, signum, frame):
+        self._shadow_requested = True
+
+    def _on_rescore(self, signum, frame):
+        self._rescore_requested = True
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _spawn_worker(self, wait_ready: bool = False) -> int:
+        """
+        Fork a worker serving on the shared socket
+
+        Args:
+            wait_ready: Block until the worker reports that uvicorn started
+
+        Returns:
+            PID of the new worker
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            exit_code = 0
+            try:
+                self._run_worker(write_fd)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} crashed: {str(e)}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        os.close(write_fd)
+        self.workers[pid] = time.time()
+        print(f"👷 Worker {pid} started")
+        try:
+            if wait_ready:
+                ready, _, _ = select.select([read_fd], [], [], self.ready_timeout)
+                if not ready or not os.read(read_fd, 1):
+                    print(f"⚠️ Worker {pid} did not report ready within {self.ready_timeout:.0f}s")
+        finally:
+            os.close(read_fd)
+        return pid
+
+    def _run_worker(self, ready_fd: int):
+        """Worker body: serve the app on the inherited socket"""
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        # Workers only serve requests; main skips the background services here
+        os.environ["PREFORK_ROLE"] = "worker"
+        self._watch_shadow()
+
+        import main
+        if main.inference_engine is not None and main.inference_engine.model is not None:
+            try:
+                main.inference_engine.model.set_params(n_jobs=self.worker_threads)
+            except Exception:
+                pass
+
+        config = uvicorn.Config(main.app, log_level=self.log_level, lifespan="on")
+        server = uvicorn.Server(config)
+
+        def _notify_ready():
+            while not server.started and not server.should_exit:
+                time.sleep(0.05)
+            try:
+                os.write(ready_fd, b"1" if server.started else b"")
+            except OSError:
+                pass  # the master did not wait for this worker
+            finally:
+                os.close(ready_fd)
+
+        threading.Thread(target=_notify_ready, daemon=True).start()
+        _share_metrics()
+        try:
+            server.run(sockets=[self.sock])
+        finally:
+            metrics.flush()
+            shadow_scorer.flush()
+
+    def _watch_shadow(self):
+        """Apply the shadow requests the master announces (SIGUSR1), starting with the current one"""
+        pending = threading.Event()
+        pending.set()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: pending.set())
+
+        def watch():
+            while True:
+                pending.wait()
+                pending.clear()
+                try:
+                    self._apply_shadow(read_shadow_request())
+                except Exception as e:
+                    print(f"⚠️ Worker {os.getpid()} could not apply the shadow request: {str(e)}")
+
+        threading.Thread(target=watch, name="shadow-control", daemon=True).start()
+
+    def _apply_shadow(self, request: Dict):
+        import main
+        main.apply_shadow_request(request)
+
+    def _forward_rescore(self):
+        """Hand the rescore request a worker wrote to the services process"""
+        self._rescore_requested = False
+        if self.services_pid is not None:
+            self._signal(self.services_pid, signal.SIGUSR2)
+        else:
+            print("⚠️ Rescore requested while the services process is down; the worker will time out")
+
+    def _forward_shadow(self):
+        """Tell every worker to re-read the shadow control file"""
+        self._shadow_requested = False
+        for pid in list(self.workers):
+            self._signal(pid, signal.SIGUSR1)
+
+    # ------------------------------------------------------------------
+    # Services process
+    # ------------------------------------------------------------------
+
+    def _spawn_services(self) -> int:
+        """Fork the process running the background services"""
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self._run_services()
+            except BaseException as e:
+                print(f"❌ Services process {os.getpid()} crashed: {str(e)}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.services_pid = pid
+        self.services_started_at = time.time()
+        print(f"🛠️ Services process {pid} started")
+        return pid
+
+    def _run_services(self):
+        """
+        Services body: run the background services until SIGTERM
+
+        SIGHUP (sent by the master after a rolling reload) makes it load the
+        newly activated model, without restarting the training dispatcher.
+        SIGUSR2 (forwarded from a worker) starts the requested rescoring job.
+        """
+        state = {"stop": False, "reload": False, "rescore": False}
+        signal.signal(signal.SIGTERM, lambda signum, frame: state.update(stop=True))
+        signal.signal(signal.SIGINT, lambda signum, frame: state.update(stop=True))
+        signal.signal(signal.SIGHUP, lambda signum, frame: state.update(reload=True))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: state.update(rescore=True))
+        os.environ["PREFORK_ROLE"] = "services"
+        _share_metrics()
+
+        self._start_services()
+        try:
+            while not state["stop"]:
+                if state["reload"]:
+                    state["reload"] = False
+                    request = _read_reload_request(int(os.environ["PREFORK_MASTER_PID"]))
+                    self._reload_services(request.get("model_path"))
+                if state["rescore"]:
+                    state["rescore"] = False
+                    self._answer_rescore()
+                time.sleep(0.2)
+        finally:
+            self._stop_services()
+            metrics.flush()
+
+    def _start_services(self):
+        import main
+        main.start_background_services()
+
+    def _reload_services(self, model_path: Optional[str]):
+        """Load the activated model in the services process (and rescore with it)"""
+        import main
+        if model_path:
+            os.environ["MODEL_PATH"] = model_path
+        try:
+            main.load_model()
+            if main.RESCORE_ON_ACTIVATION:
+                main.schedule_rescore()
+        except Exception as e:
+            print(f"❌ Services process could not load {os.getenv('MODEL_PATH')}: {str(e)}")
+
+    def _answer_rescore(self):
+        """Start the rescoring job a worker asked for and tell it the outcome"""
+        master_pid = int(os.environ["PREFORK_MASTER_PID"])
+        try:
+            with open(_rescore_file_path(master_pid)) as f:
+                request = json.load(f)
+            request_id = request["request_id"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ No usable rescore request ({str(e)})")
+            return
+        try:
+            answer = {"ok": True, **self._rescore(request.get("model_key"), bool(request.get("force")))}
+        except Exception as e:
+            print(f"❌ Services process could not start rescoring: {str(e)}")
+            answer = {"ok": False, "error": str(e)}
+        try:
+            _write_json(_result_file_path(master_pid, request_id), answer)
+        except OSError as e:
+            print(f"⚠️ Could not report the rescore result: {str(e)}")
+
+    def _rescore(self, model_key: Optional[str], force: bool) -> Dict:
+        """Start rescoring in the services process; returns {"started", "job"}"""
+        import main
+        current = main.current_model_key()
+        if model_key != current:
+            raise RuntimeError(f"Services process serves model {current}, not {model_key}; retry after the reload")
+        main.ensure_simulation_dataset()
+        main.ensure_feature_engineer()
+        return {"started": main.schedule_rescore(force=force), "job": main.score_store.status}
+
+    def _stop_services(self):
+        import main
+        main.stop_background_services()
+
+    def _spawn_services_if_missing(self):
+        if self.services_pid is None and not self._stopping and time.time() >= self.next_spawn_at:
+            self._spawn_services()
+
+    def _spawn_missing(self):
+        """Restart workers until the pool is back to full size"""
+        while len(self.workers) < self.num_workers and not self._stopping:
+            if time.time() < self.next_spawn_at:
+                return
+            self._spawn_worker()
+
+    def _reap(self):
+        """Collect exited workers and enforce retirement deadlines"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            if pid in self.retiring:
+                self.retiring.pop(pid)
+                print(f"👋 Worker {pid} retired")
+                continue
+
+            if pid == self.services_pid:
+                self.services_pid = None
+                started_at = self.services_started_at
+                if self._stopping:
+                    continue
+                print(f"💥 Services process {pid} exited unexpectedly "
+                      f"(code {os.waitstatus_to_exitcode(status)}), restarting")
+                self._back_off_if_crash_looping(started_at)
+                continue
+
+            started_at = self.workers.pop(pid, None)
+            if started_at is None or self._stopping:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            print(f"💥 Worker {pid} exited unexpectedly (code {code}), restarting")
+            self._back_off_if_crash_looping(started_at)
+
+        now = time.time()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                self._signal(pid, signal.SIGKILL)
+
+    def _back_off_if_crash_looping(self, started_at: float):
+        if time.time() - started_at < 5.0:
+            # Crash loop: back off exponentially, up to 30 seconds
+            self.crash_count += 1
+            self.next_spawn_at = time.time() + min(30.0, 0.5 * (2 ** self.crash_count))
+        else:
+            self.crash_count = 0
+
+    def _retire(self, pid: int):
+        """Gracefully stop a worker; it is killed if it outlives the timeout"""
+        self.workers.pop(pid, None)
+        self.retiring[pid] = time.time() + self.graceful_timeout
+        self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    # ------------------------------------------------------------------
+    # Rolling reload & shutdown
+    # ------------------------------------------------------------------
+
+    def _rolling_reload(self):
+        """Load the requested model in the master, then replace workers one by one"""
+        self._reload_requested = False
+        request = _read_reload_request(os.getpid())
+        model_path = request.get("model_path")
+        previous_path = os.environ.get("MODEL_PATH")
+        if model_path:
+            os.environ["MODEL_PATH"] = model_path
+
+        print(f"🔄 Rolling reload: loading {os.getenv('MODEL_PATH')} in master...")
+        gc.unfreeze()
+        try:
+            if model_path and not os.path.exists(model_path):
+                raise FileNotFoundError(f"Model file not found: {model_path}")
+            self._load_model()
+        except Exception as e:
+            print(f"❌ Reload failed, keeping current workers: {str(e)}")
+            if previous_path is None:
+                os.environ.pop("MODEL_PATH", None)
+            else:
+                os.environ["MODEL_PATH"] = previous_path
+            gc.freeze()
+            self._answer_reload(request, str(e))
+            return
+        gc.collect()
+        gc.freeze()
+        self._answer_reload(request)
+
+        for old_pid in list(self.workers):
+            if self._stopping:
+                return
+            self._spawn_worker(wait_ready=True)
+            self._retire(old_pid)
+        # The services process keeps running (and its training jobs with it)
+        if self.services_pid is not None:
+            self._signal(self.services_pid, signal.SIGHUP)
+        print("✅ Rolling reload complete")
+
+    def _answer_reload(self, request: Dict, error: Optional[str] = None):
+        """Tell the worker that requested a reload whether the master loaded the model"""
+        request_id = request.get("request_id")
+        if not request_id:
+            return
+        try:
+            _write_json(_result_file_path(os.getpid(), request_id), {"ok": error is None, "error": error})
+        except OSError as e:
+            print(f"⚠️ Could not report the reload result: {str(e)}")
+
+    def _load_model(self):
+        import main
+        main.load_model()
+
+    def _shutdown(self):
+        """Stop all workers and wait for them to exit"""
+        print("🛑 Shutting down workers...")
+        for pid in list(self.workers):
+            self._retire(pid)
+        if self.services_pid is not None:
+            # Training jobs stopped here are requeued for the next start
+            self._retire(self.services_pid)
+            self.services_pid = None
+        while self.retiring:
+            self._reap()
+            time.sleep(0.1)
+        if self.sock is not None:
+            self.sock.close()
+        control_file = _control_file_path(os.getpid())
+        # Answers nobody waited for (the worker timed out) are left behind too
+        for path in ([control_file, _shadow_file_path(os.getpid()), _rescore_file_path(os.getpid())]
+                     + glob.glob(f"{glob.escape(control_file)}.*.result")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if self._own_metrics_dir:
+            shutil.rmtree(self._own_metrics_dir, ignore_errors=True)
+
+
+def main():
+    port = int(os.getenv("PORT", 7860))
+    host = os.getenv("HOST", "0.0.0.0")
+    workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+
+    server = PreforkServer(
+        host=host,
+        port=port,
+        workers=workers,
+        worker_threads=int(os.getenv("PREFORK_WORKER_THREADS", "1")),
+        graceful_timeout=float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", "30")),
+        log_level=os.getenv("LOG_LEVEL", "info")
+    )
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
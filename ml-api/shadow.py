@@ -0,0 +1,371 @@
+"""
+Shadow Scoring Module
+Scores a sample of live traffic with a candidate model next to the active
+one. The request path only hands the engineered features to a bounded queue;
+a background thread scores them with both models and aggregates
+disagreement, score deltas and latency in fixed-size counters. Under the pre-fork server every worker runs the same
+shadow run and writes its counters to a shared directory, and the status
+sums them (see ShadowScorer.share).
+"""
+
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Pending shadow batches; requests arriving while it is full are not shadowed
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "256"))
+# XGBoost threads of the shadow worker (kept low so serving keeps its cores)
+SHADOW_THREADS = int(os.getenv("SHADOW_THREADS", "1"))
+# Seconds between snapshots of a process sharing its shadow counters
+SHADOW_FLUSH_INTERVAL = float(os.getenv("SHADOW_FLUSH_INTERVAL", "1"))
+
+DECISIONS = ('pass', 'warn', 'block')
+# Bucket edges of candidate minus active probability
+DELTA_EDGES = np.array([-0.5, -0.2, -0.1, -0.05, -0.01, 0.01, 0.05, 0.1, 0.2, 0.5])
+# Bucket edges of per-batch scoring latency (ms)
+LATENCY_EDGES_MS = np.array([0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250])
+# Queue wait that timed out: nothing to score, only a pending snapshot to write
+_IDLE = object()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _booster(model, threads: int):
+    """Private copy of a model's booster with its own thread setting"""
+    booster = model.get_booster().copy()
+    booster.set_param({'nthread': threads})
+    return booster
+
+
+class ShadowStats:
+    """Fixed-size aggregates of a shadow run"""
+
+    def __init__(self):
+        self.batches = 0
+        self.rows = 0
+        self.dropped = 0
+        self.errors = 0
+        # confusion[active decision, candidate decision]
+        self.confusion = np.zeros((len(DECISIONS), len(DECISIONS)), dtype=np.int64)
+        self.delta_sum = 0.0
+        self.delta_sq_sum = 0.0
+        self.delta_max_abs = 0.0
+        self.delta_hist = np.zeros(len(DELTA_EDGES) + 1, dtype=np.int64)
+        self.latency_hist = {name: np.zeros(len(LATENCY_EDGES_MS) + 1, dtype=np.int64)
+                             for name in ('active', 'candidate')}
+        self.latency_sum_ms = {'active': 0.0, 'candidate': 0.0}
+
+    def record(self, active: np.ndarray, candidate: np.ndarray, thresholds: Sequence[float],
+               active_ms: float, candidate_ms: float) -> None:
+        active_decision = np.digitize(active, thresholds)
+        candidate_decision = np.digitize(candidate, thresholds)
+        np.add.at(self.confusion, (active_decision, candidate_decision), 1)
+        delta = candidate - active
+        self.delta_sum += float(delta.sum())
+        self.delta_sq_sum += float(np.square(delta).sum())
+        self.delta_max_abs = max(self.delta_max_abs, float(np.abs(delta).max()))
+        self.delta_hist += np.bincount(np.digitize(delta, DELTA_EDGES), minlength=len(self.delta_hist))
+        for name, ms in (('active', active_ms), ('candidate', candidate_ms)):
+            self.latency_hist[name][np.digitize(ms, LATENCY_EDGES_MS)] += 1
+            self.latency_sum_ms[name] += ms
+        self.batches += 1
+        self.rows += len(delta)
+
+    def to_dict(self) -> Dict:
+        """JSON form of the counters (for the snapshots other processes read)"""
+        return {
+            "batches": self.batches, "rows": self.rows, "dropped": self.dropped, "errors": self.errors,
+            "confusion": self.confusion.tolist(),
+            "delta_sum": self.delta_sum, "delta_sq_sum": self.delta_sq_sum, "delta_max_abs": self.delta_max_abs,
+            "delta_hist": self.delta_hist.tolist(),
+            "latency_hist": {name: hist.tolist() for name, hist in self.latency_hist.items()},
+            "latency_sum_ms": dict(self.latency_sum_ms),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ShadowStats":
+        stats = cls()
+        stats.batches, stats.rows = data["batches"], data["rows"]
+        stats.dropped, stats.errors = data["dropped"], data["errors"]
+        stats.confusion = np.asarray(data["confusion"], dtype=np.int64)
+        stats.delta_sum, stats.delta_sq_sum = data["delta_sum"], data["delta_sq_sum"]
+        stats.delta_max_abs = data["delta_max_abs"]
+        stats.delta_hist = np.asarray(data["delta_hist"], dtype=np.int64)
+        stats.latency_hist = {name: np.asarray(hist, dtype=np.int64) for name, hist in data["latency_hist"].items()}
+        stats.latency_sum_ms = dict(data["latency_sum_ms"])
+        return stats
+
+    def add(self, other: "ShadowStats") -> "ShadowStats":
+        """Add another process's counters of the same run to these"""
+        self.batches += other.batches
+        self.rows += other.rows
+        self.dropped += other.dropped
+        self.errors += other.errors
+        self.confusion += other.confusion
+        self.delta_sum += other.delta_sum
+        self.delta_sq_sum += other.delta_sq_sum
+        self.delta_max_abs = max(self.delta_max_abs, other.delta_max_abs)
+        self.delta_hist += other.delta_hist
+        for name in self.latency_hist:
+            self.latency_hist[name] += other.latency_hist[name]
+            self.latency_sum_ms[name] += other.latency_sum_ms[name]
+        return self
+
+    def summary(self) -> Dict:
+        rows = max(self.rows, 1)
+        batches = max(self.batches, 1)
+        agreed = int(np.trace(self.confusion))
+        mean = self.delta_sum / rows
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "disagreement_rate": round(1 - agreed / rows, 6) if self.rows else None,
+            "decisions": {
+                f"{a}->{c}": int(self.confusion[i, j])
+                for i, a in enumerate(DECISIONS) for j, c in enumerate(DECISIONS)
+                if self.confusion[i, j]
+            },
+            "score_delta": {
+                "mean": round(mean, 6),
+                "std": round(float(np.sqrt(max(self.delta_sq_sum / rows - mean ** 2, 0.0))), 6),
+                "max_abs": round(self.delta_max_abs, 6),
+                "buckets": {"edges": DELTA_EDGES.tolist(), "counts": self.delta_hist.tolist()},
+            },
+            "latency_ms": {
+                name: {"mean": round(self.latency_sum_ms[name] / batches, 4),
+                       "buckets": {"edges": LATENCY_EDGES_MS.tolist(), "counts": hist.tolist()}}
+                for name, hist in self.latency_hist.items()
+            },
+        }
+
+
+class ShadowScorer:
+    """
+    Shadow run of one candidate model against the active model
+
+    offer() is the only call on the request path: a random draw and a
+    non-blocking queue put. Both models are timed in the worker on the same
+    rows with private booster copies, so the figures are comparable and the
+    served models' thread settings are untouched.
+    """
+
+    def __init__(self, queue_size: int = SHADOW_QUEUE_SIZE, threads: int = SHADOW_THREADS):
+        self.queue_size = queue_size
+        self.threads = threads
+        self.directory: Optional[str] = None
+        self.flush_interval = SHADOW_FLUSH_INTERVAL
+        self._queue: Optional[queue.Queue] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.config: Optional[Dict] = None
+        self.stats = ShadowStats()
+
+    @property
+    def enabled(self) -> bool:
+        return self._queue is not None
+
+    def start(self, active_model, candidate_model, sample_rate: float, thresholds: Sequence[float],
+              model_id: Optional[str] = None, feature_names: Optional[Sequence[str]] = None,
+              run_id: Optional[str] = None) -> None:
+        """
+        Start (or restart) shadowing with fresh counters
+
+        Args:
+            active_model: Served model (XGBClassifier)
+            candidate_model: Model to shadow (XGBClassifier)
+            sample_rate: Fraction of requests shadowed (0-1]
+            thresholds: Probability edges between pass / warn / block
+            model_id: Registry id of the candidate (reported only)
+            feature_names: Columns of the served feature matrix; the candidate must use the same
+            run_id: Identifies the run across processes (new one if not given)
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        expected = getattr(candidate_model, 'feature_names_in_', None)
+        if feature_names is not None and expected is not None and list(expected) != list(feature_names):
+            raise ValueError("Candidate model was trained on different features than the active model")
+        self.stop()
+        with self._lock:
+            self.stats = ShadowStats()
+            self.config = {"run_id": run_id or uuid.uuid4().hex, "model_id": model_id,
+                           "sample_rate": sample_rate, "started_at": datetime.utcnow().isoformat() + "Z"}
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            args = (self._queue, _booster(active_model, self.threads), _booster(candidate_model, self.threads),
+                    tuple(thresholds), self.stats)
+            self._worker = threading.Thread(target=self._run, args=args, name="shadow", daemon=True)
+            self._worker.start()
+        self.flush()
+        print(f"👥 Shadow scoring {model_id} on {sample_rate:.0%} of traffic")
+
+    def stop(self) -> Optional[Dict]:
+        """Stop shadowing; returns the final status of this process (None if it was not running)"""
+        with self._lock:
+            q, worker = self._queue, self._worker
+            self._queue = self._worker = None
+        if q is None:
+            return None
+        q.put(None)  # the worker drains what is queued, then exits
+        worker.join(timeout=5)
+        self.flush()
+        return self.status()
+
+    def offer(self, features: pd.DataFrame) -> bool:
+        """
+        Hand one scored request's features to the shadow worker (request path, never blocks)
+
+        The worker compares the candidate with the active booster's own
+        scores, not the served probabilities: with a cascade those hold the
+        constant screened_probability for the rows the screen stopped.
+
+        Returns:
+            True if the request was queued
+        """
+        q, config = self._queue, self.config
+        if q is None or random.random() >= config['sample_rate']:
+            return False
+        try:
+            q.put_nowait(features)
+            return True
+        except queue.Full:
+            self.stats.dropped += 1
+            return False
+
+    def _run(self, q: queue.Queue, active_booster, candidate_booster, thresholds: Sequence[float],
+             stats: ShadowStats) -> None:
+        """Worker loop of one run (its own boosters and counters, so a restart never mixes runs)"""
+        last_flush = time.monotonic()
+        dirty = False
+        while True:
+            try:
+                item = q.get(timeout=self.flush_interval if self.directory is not None else None)
+            except queue.Empty:
+                item = _IDLE
+            if item is None:
+                return
+            if item is not _IDLE:
+                features = item
+                try:
+                    start = time.perf_counter()
+                    active = np.asarray(active_booster.inplace_predict(features), dtype=np.float64)
+                    active_ms = (time.perf_counter() - start) * 1000
+                    start = time.perf_counter()
+                    candidate = np.asarray(candidate_booster.inplace_predict(features), dtype=np.float64)
+                    candidate_ms = (time.perf_counter() - start) * 1000
+                    stats.record(active, candidate, thresholds, active_ms, candidate_ms)
+                except Exception as e:
+                    stats.errors += 1
+                    print(f"⚠️ Shadow scoring failed: {str(e)}")
+                dirty = True
+            if dirty and time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                dirty = False
+                last_flush = time.monotonic()
+
+    def status(self) -> Dict:
+        """Counters of this process"""
+        return {
+            "enabled": self.enabled,
+            **(self.config or {}),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            **self.stats.summary(),
+        }
+
+    # ------------------------------------------------------------------
+    # Sharing between processes
+    # ------------------------------------------------------------------
+
+    def share(self, directory: str, flush_interval: float = SHADOW_FLUSH_INTERVAL) -> None:
+        """
+        Aggregate this process's shadow counters with the other processes using `directory`
+
+        The process writes a snapshot to <directory>/shadow-<pid>.json when a
+        run starts or stops and at most every flush_interval seconds while it
+        scores; shared_status() sums the snapshots of the current run.
+        Counters of exited processes are kept; only live processes count as
+        running or queued.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+
+    def flush(self) -> None:
+        """Write this process's snapshot (no-op unless sharing)"""
+        if self.directory is None:
+            return
+        snapshot = {"pid": os.getpid(), "enabled": self.enabled, "config": self.config,
+                    "queued": self._queue.qsize() if self._queue is not None else 0,
+                    "stats": self.stats.to_dict()}
+        path = os.path.join(self.directory, f"shadow-{os.getpid()}.json")
+        try:
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"⚠️ Could not write shadow snapshot: {str(e)}")
+
+    def _snapshots(self) -> List[Dict]:
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "shadow-*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def shared_status(self) -> Dict:
+        """Counters of the current (or last) run summed over the processes sharing it"""
+        if self.directory is None:
+            return self.status()
+        self.flush()
+        snapshots = [s for s in self._snapshots() if s.get("config")]
+        run_id = (self.config or {}).get("run_id")
+        if run_id is None and snapshots:
+            run_id = max(snapshots, key=lambda s: s["config"]["started_at"])["config"]["run_id"]
+        run = [s for s in snapshots if s["config"]["run_id"] == run_id]
+        if not run:
+            return self.status()
+        stats = ShadowStats()
+        for snapshot in run:
+            stats.add(ShadowStats.from_dict(snapshot["stats"]))
+        live = [s for s in run if _pid_alive(s["pid"])]
+        return {
+            "enabled": any(s["enabled"] for s in live),
+            **run[0]["config"],
+            "processes": sum(1 for s in live if s["enabled"]),
+            "queued": sum(s["queued"] for s in live),
+            **stats.summary(),
+        }
+
+    def wait_stopped(self, timeout: float = 5.0) -> Dict:
+        """Shared status once no live process runs the run any more (or after timeout)"""
+        deadline = time.time() + timeout
+        status = self.shared_status()
+        while status["enabled"] and time.time() < deadline:
+            time.sleep(0.05)
+            status = self.shared_status()
+        return status
+
+
+# Process-wide shadow run (each serving worker shadows its own traffic)
+shadow_scorer = ShadowScorer()
@@ -6,6 +6,11 @@ import time
 from typing import Optional, Generator, AsyncGenerator
 from pydantic import BaseModel
 
+from feature_engineering import frame_fingerprint
+from utils.metrics import metrics
+
+SERIALIZE_STAGE = metrics.stage("simulation.serialize")
+
 class SimulationConfig(BaseModel):
     speed: float = 1.0  # Multiplier, or seconds delay? Let's say speed multiplier (1x, 2x...)
     # But for simplicity, let's treat it as "transactions per second" or delay.
@@ -27,6 +32,7 @@ class SimulationManager:
         self.speed = 1.0  # Default 1x speed
         self.delay = 1.0  # Seconds between transactions
         self.dataset_path = None
+        self.dataset_version: Optional[str] = None
         
     def load_dataset(self, path: str):
         self.dataset_path = path
@@ -52,6 +58,8 @@ class SimulationManager:
             # Ensure it's sorted by step
             if 'step' in self.dataset.columns:
                 self.dataset = self.dataset.sort_values('step')
+            # Content hash so derived caches (feature table, backtests) can key on it
+            self.dataset_version = frame_fingerprint(self.dataset)[:16]
             print(f"Loaded {len(self.dataset)} transactions for simulation")
         else:
             print("Simulation dataset not found!")
@@ -104,23 +112,25 @@ class SimulationManager:
                 yield f"data: {json.dumps({'event': 'finished'})}\\n\\n"
                 break
 
-            # Get current transaction
-            row = self.dataset.iloc[self.current_index]
-            transaction = row.to_dict()
-            
-            # Convert numpy types to native python types for JSON serialization
-            for key, value in transaction.items():
-                if hasattr(value, 'item'):
-                    transaction[key] = value.item()
-            
-            # Create payload
-            payload = {
-                "transaction": transaction,
-                "index": self.current_index,
-                "total": len(self.dataset)
-            }
+            with SERIALIZE_STAGE.time():
+                # Get current transaction
+                row = self.dataset.iloc[self.current_index]
+                transaction = row.to_dict()
+                
+                # Convert numpy types to native python types for JSON serialization
+                for key, value in transaction.items():
+                    if hasattr(value, 'item'):
+                        transaction[key] = value.item()
+                
+                # Create payload
+                payload = {
+                    "transaction": transaction,
+                    "index": self.current_index,
+                    "total": len(self.dataset)
+                }
+                event = f"data: {json.dumps(payload)}\\n\\n"
             
-            yield f"data: {json.dumps(payload)}\\n\\n"
+            yield event
             
             self.current_index += 1
             
@@ -1,5 +1,6 @@
+import asyncio
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from utils.audit import AuditLogger
 
 class TestAuditLogger(unittest.TestCase):
@@ -26,6 +27,50 @@ class TestAuditLogger(unittest.TestCase):
         self.assertIn('0.85', payload['p_message'])
         self.assertEqual(payload['p_metadata']['fraud_score'], fraud_score)
 
+    def test_log_batch_backtest(self):
+        """Test that a multi-rule backtest is logged as one event."""
+        results = [
+            {"name": "big transfers", "rule": "amount > 50000", "fraud_caught": 4, "precision": 0.5},
+            {"name": None, "rule": "hour < 5", "fraud_caught": 0, "precision": 0.0},
+        ]
+
+        self.logger.log_batch_backtest(results)
+
+        self.mock_supabase.rpc.assert_called_once()
+        args, kwargs = self.mock_supabase.rpc.call_args
+        payload = args[1]
+        self.assertEqual(payload['p_action_type'], 'POLICY_BACKTEST')
+        policies = payload['p_metadata']['policies']
+        self.assertEqual([p['policy'] for p in policies], ["big transfers", "hour < 5"])
+        self.assertEqual([p['passed'] for p in policies], [True, False])
+
+    def test_log_rules_deployed(self):
+        """Test that a rule set deployment is logged with its version."""
+        rules = [{"name": "big transfers", "rule_logic": "amount > 50000", "action": "block", "enabled": True}]
+
+        self.logger.log_rules_deployed(3, rules)
+
+        args, kwargs = self.mock_supabase.rpc.call_args
+        payload = args[1]
+        self.assertEqual(payload['p_action_type'], 'POLICY_DEPLOYED')
+        self.assertEqual(payload['p_resource_id'], 'ruleset-v3')
+        self.assertEqual(payload['p_metadata']['rules'], rules)
+
+    def test_async_client_is_not_awaited_inline(self):
+        """With the async database the audit write runs as a background task."""
+        db = MagicMock()
+        db.rpc = AsyncMock(side_effect=Exception("Connection failed"))
+        logger = AuditLogger(db)
+
+        async def request_handler():
+            logger.log_prediction("tx_123", 0.5, {})
+            self.assertEqual(len(logger._pending), 1)
+            await asyncio.gather(*logger._pending)
+
+        asyncio.run(request_handler())
+        db.rpc.assert_awaited_once()
+        self.assertEqual(len(logger._pending), 0)
+
     def test_log_error_handling(self):
         """Test that logging errors are caught and do not crash the app."""
         self.mock_supabase.rpc.side_effect = Exception("Connection failed")
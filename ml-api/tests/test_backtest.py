@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+import backtest
+from feature_store import FeatureTable
+from rules import compile_rule
+
+
+def make_table(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    return FeatureTable({
+        'step': np.sort(rng.integers(1, 200, n)).astype(np.int32),
+        'amount': rng.lognormal(10, 1.5, n),
+        'hour': rng.integers(0, 24, n).astype(np.int16),
+        'isFraud': (rng.random(n) < 0.02).astype(np.int8),
+    }, dataset_version='test', feature_version='raw')
+
+
+class TestBacktestWindow(unittest.TestCase):
+    def setUp(self):
+        self.table = make_table()
+        self.rule = compile_rule('amount > 50000 and hour < 12')
+
+    def test_chunked_matches_single_pass(self):
+        """Parallel chunks sum to the same stats as one pass over the window."""
+        expected = backtest.backtest_rule_window(self.table, self.rule, 0, len(self.table))
+        with patch.object(backtest, 'CHUNK_ROWS', 1234):
+            actual = backtest.backtest_rule_window(self.table, self.rule, 0, len(self.table))
+        self.assertEqual(actual, expected)
+
+    def test_time_series_sums_to_totals(self):
+        start, stop = backtest.resolve_window(self.table, start_step=24, end_step=95)
+        stats = backtest.backtest_rule_window(self.table, self.rule, start, stop, granularity='day')
+        series = stats['time_series']
+        self.assertEqual([point['day'] for point in series], [1, 2, 3])
+        self.assertEqual(sum(point['total'] for point in series), stats['total_tested'])
+        self.assertEqual(sum(point['matches'] for point in series), stats['total_matches'])
+        self.assertEqual(sum(point['fraud_caught'] for point in series), stats['fraud_caught'])
+
+    def test_resolve_window(self):
+        n = len(self.table)
+        self.assertEqual(backtest.resolve_window(self.table, limit=100), (n - 100, n))
+        self.assertEqual(backtest.resolve_window(self.table, limit=100, full_history=True), (0, n))
+        start, stop = backtest.resolve_window(self.table, start_step=50, end_step=60)
+        steps = self.table.columns['step'][start:stop]
+        self.assertTrue(steps.min() >= 50 and steps.max() <= 60)
+
+    def test_rejects_unknown_granularity(self):
+        with self.assertRaises(ValueError):
+            backtest.backtest_rule_window(self.table, self.rule, 0, 10, granularity='week')
+
+
+class TestBacktestCache(unittest.TestCase):
+    def setUp(self):
+        self.table = make_table()
+        self.versions = (self.table.dataset_version, self.table.feature_version, 'model-a')
+
+    def test_lru_eviction_and_version_invalidation(self):
+        cache = backtest.BacktestCache(max_entries=2)
+        for i, rule in enumerate(['a', 'b', 'c']):
+            cache.put(self.versions, rule, 0, 10, {'total_matches': i})
+        self.assertIsNone(cache.get(self.versions, 'a', 0, 10))
+        self.assertEqual(cache.get(self.versions, 'c', 0, 10), {'total_matches': 2})
+        self.assertIsNone(cache.get(self.versions, 'c', 0, 11))
+
+        new_model = self.versions[:2] + ('model-b',)
+        self.assertIsNone(cache.get(new_model, 'c', 0, 10))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_batch_populates_sub_rules(self):
+        cache = backtest.BacktestCache()
+        rule = compile_rule('amount > 50000 and hour < 12')
+        n = len(self.table)
+        backtest.backtest_rule_batch(self.table, [rule], 0, n,
+                                     cache=cache, cache_versions=self.versions)
+        sub_rule = compile_rule('hour<12')
+        cached = cache.get(self.versions, sub_rule.canonical, 0, n)
+        self.assertTrue(cached.pop('from_batch'))
+        self.assertEqual(cached, backtest.backtest_rule_window(self.table, sub_rule, 0, n))
+
+
+class TestBacktestAudit(unittest.TestCase):
+    def setUp(self):
+        import main
+        self.main = main
+        self.audit_logger = Mock()
+        for name, value in (('_backtest_table', lambda: make_table()), ('audit_logger', self.audit_logger),
+                            ('backtest_cache', backtest.BacktestCache()),
+                            ('current_model_version', lambda: 'model-a')):
+            patcher = patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def single(self, rule_logic):
+        request = self.main.BacktestRequest(rule_logic=rule_logic, full_history=True)
+        return asyncio.run(self.main.backtest_rule(request))
+
+    def batch(self, *rule_logic):
+        request = self.main.BatchBacktestRequest(rules=[{'rule_logic': text} for text in rule_logic],
+                                                 deployed_rules=[], full_history=True)
+        return asyncio.run(self.main.backtest_rules_batch(request))
+
+    def test_rule_is_audited_once_across_batches(self):
+        first = self.single('hour < 12')
+        self.batch('amount > 50000 and hour < 12')
+        again = self.single('hour<12')
+        self.assertEqual(self.audit_logger.log_backtest.call_count, 1)
+        self.assertTrue(again.cached)
+        self.assertEqual(again.total_matches, first.total_matches)
+
+    def test_sub_predicate_cached_by_a_batch_is_audited_on_first_use(self):
+        self.batch('amount > 50000 and hour < 12')
+        self.single('hour < 12')
+        self.single('hour < 12')
+        self.assertEqual(self.audit_logger.log_backtest.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from benchmarks.harness import compare, measure
+from benchmarks.synthetic import paysim_frame, parse_size
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_paysim_frame_is_deterministic(self):
+        frame = paysim_frame(5000, seed=3)
+        self.assertTrue(frame.equals(paysim_frame(5000, seed=3)))
+        self.assertFalse(frame.equals(paysim_frame(5000, seed=4)))
+        self.assertEqual(list(frame.columns), [
+            'step', 'type', 'amount', 'nameOrig', 'oldBalanceOrig', 'newBalanceOrig',
+            'nameDest', 'oldBalanceDest', 'newBalanceDest', 'isFraud', 'isFlaggedFraud'])
+        self.assertTrue(frame['step'].is_monotonic_increasing)
+        self.assertEqual(set(frame['type']), {'TRANSFER', 'CASH_OUT'})
+        fraud = frame[frame['isFraud'] == 1]
+        self.assertGreater(len(fraud), 0)
+        self.assertTrue((fraud['newBalanceOrig'] == 0).all())
+        # Receivers recur far more than senders
+        self.assertLess(frame['nameDest'].nunique(), frame['nameOrig'].nunique())
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("10k"), 10_000)
+        self.assertEqual(parse_size("10M"), 10_000_000)
+        self.assertEqual(parse_size("2.5k"), 2_500)
+        self.assertEqual(parse_size(1234), 1234)
+
+    def test_measure_reports_figures(self):
+        calls = []
+        figures = measure(calls.append, calls=4, rows_per_call=10, warmup=2)
+        self.assertEqual(calls, [0, 1, 0, 1, 2, 3])
+        self.assertEqual((figures["calls"], figures["rows_per_call"]), (4, 10))
+        self.assertGreaterEqual(figures["p99_ms"], figures["p50_ms"])
+        self.assertGreater(figures["peak_rss_mb"], 0)
+
+    def test_compare_flags_only_real_regressions(self):
+        def run(**cases):
+            return {"results": {"10k": {name: {"p50_ms": p50, "peak_rss_mb": rss}
+                                         for name, (p50, rss) in cases.items()}}}
+
+        baseline = run(slow=(10.0, 300.0), tiny=(0.01, 300.0), fat=(5.0, 300.0), same=(1.0, 300.0))
+        current = run(slow=(20.0, 300.0), tiny=(0.03, 300.0), fat=(5.0, 500.0), same=(1.1, 310.0), new=(9.0, 900.0))
+        regressions = compare(current, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("10k slow: p50"))
+        self.assertTrue(regressions[1].startswith("10k fat: peak RSS"))
+        self.assertEqual(compare(baseline, baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import csv
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import paysim_frame
+from build_engineered_dataset import TABLE_COLUMNS, engineered_csv_chunks, fit_feature_engineer
+
+
+class TestBuildEngineeredDataset(unittest.TestCase):
+    def test_chunks_match_full_transform_in_table_layout(self):
+        dataset = paysim_frame(500, fraud_rate=0.5, steps=50)
+        fe = fit_feature_engineer(dataset)
+        chunks = list(engineered_csv_chunks(fe, dataset, chunk_rows=128))
+
+        self.assertEqual([n for n, _ in chunks], [128, 128, 128, 116])
+        rows = [row for _, buffer in chunks for row in csv.reader(buffer)]
+        self.assertEqual(len(rows), len(dataset))
+        self.assertTrue(all(len(row) == len(TABLE_COLUMNS) for row in rows))
+
+        loaded = pd.DataFrame(rows, columns=TABLE_COLUMNS)
+        self.assertTrue((loaded['fe_version'] == fe.version).all())
+        self.assertEqual(loaded['nameOrig'].tolist(), dataset['nameOrig'].tolist())
+        expected = fe.transform(dataset)
+        np.testing.assert_allclose(loaded['network_trust'].astype(float), expected['network_trust'])
+        np.testing.assert_array_equal(loaded['dest_txn_count'].astype(int), expected['dest_txn_count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from cascade import calibrate_cascade, evaluate_cascade, load_cascade, save_cascade, screen_scores
+from inference import FraudInference
+
+
+class TestCascade(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.random((6000, 5)), columns=[f"f{i}" for i in range(5)])
+        y = ((X['f0'] > 0.9) & (X['f1'] > 0.3)).astype(int)
+        self.model = xgb.XGBClassifier(n_estimators=60, max_depth=3).fit(X.iloc[:4000], y.iloc[:4000])
+        self.X, self.y = X.iloc[4000:].reset_index(drop=True), y.iloc[4000:].reset_index(drop=True)
+
+    def test_calibration_keeps_the_full_model_recall(self):
+        cal = calibrate_cascade(self.model, self.X, self.y, tree_options=[2, 4, 8], decision_threshold=0.5)
+        self.assertIn(cal['trees'], (2, 4, 8))
+        self.assertEqual(cal['screen_recall'], 1.0)
+        self.assertEqual(cal['recall']['cascade'], cal['recall']['full'])
+        self.assertLess(cal['pass_rate'], 0.5)
+        self.assertLess(cal['tree_cost_ratio'], 1.0)
+        caught = (self.y.to_numpy() == 1) & (self.model.predict_proba(self.X)[:, 1] >= 0.5)
+        screen = screen_scores(self.model, self.X, cal['trees'])
+        self.assertTrue((screen[caught] >= cal['threshold']).all())
+
+    def test_evaluation_on_other_rows(self):
+        cal = calibrate_cascade(self.model, self.X.iloc[:1000], self.y.iloc[:1000], tree_options=[4],
+                                decision_threshold=0.5)
+        X, y = self.X.iloc[1000:], self.y.iloc[1000:].to_numpy()
+        figures = evaluate_cascade(self.model, X, y, cal)
+        passed = screen_scores(self.model, X, 4) >= cal['threshold']
+        caught = (y == 1) & (self.model.predict_proba(X)[:, 1] >= 0.5)
+        self.assertEqual(figures['rows'], len(y))
+        self.assertAlmostEqual(figures['pass_rate'], passed.mean(), places=6)
+        self.assertAlmostEqual(figures['recall']['cascade'], (caught & passed).sum() / (y == 1).sum(), places=6)
+        self.assertLessEqual(figures['recall']['cascade'], figures['recall']['full'])
+
+    def test_skips_without_enough_frauds(self):
+        cal = calibrate_cascade(self.model, self.X, np.zeros(len(self.X)), tree_options=[4])
+        self.assertIn('skipped', cal)
+        self.assertIn('skipped', calibrate_cascade(self.model, self.X, self.y, tree_options=[100]))
+
+    def test_engine_scores_only_passed_rows_with_the_full_model(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        model_path = os.path.join(tmp, 'model.pkl')
+        cal = calibrate_cascade(self.model, self.X, self.y, tree_options=[4], decision_threshold=0.5)
+        self.assertTrue(save_cascade(model_path, cal))
+        self.assertFalse(save_cascade(model_path, {'skipped': 'no'}))
+        self.assertEqual(load_cascade(model_path), cal)
+
+        engine = FraudInference.__new__(FraudInference)
+        engine.model, engine.cascade, engine.compiled = self.model, load_cascade(model_path), None
+        probabilities, passed = engine.score(self.X)
+        full = self.model.predict_proba(self.X)[:, 1]
+        np.testing.assert_allclose(probabilities[passed], full[passed])
+        self.assertTrue((probabilities[~passed] == cal['screened_probability']).all())
+        self.assertTrue(passed[(self.y.to_numpy() == 1) & (full >= 0.5)].all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import unittest
+
+import httpx
+
+from utils.db import AsyncDatabase, DatabaseError
+
+
+class FakePostgREST:
+    """In-memory stand-in that answers like PostgREST and can inject failures"""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.failures:
+                failure = self.failures.pop(0)
+                if isinstance(failure, Exception):
+                    raise failure
+                return httpx.Response(failure, json={"message": "injected"})
+            if request.method == "GET":
+                return httpx.Response(200, json=[{"id": 1, "status": "ready"}])
+            return httpx.Response(201 if request.method == "POST" else 204)
+        finally:
+            self.in_flight -= 1
+
+
+def make_db(server, **kwargs):
+    kwargs.setdefault('backoff', 0.001)
+    return AsyncDatabase("http://postgrest.local", api_key="key",
+                         transport=httpx.MockTransport(server.handler), **kwargs)
+
+
+class TestAsyncDatabase(unittest.TestCase):
+    def test_select_builds_postgrest_query(self):
+        server = FakePostgREST()
+        rows = asyncio.run(make_db(server).select(
+            "model_registry", filters={"id": "abc", "is_active": True},
+            order="created_at", desc=True, offset=10, limit=5))
+        self.assertEqual(rows, [{"id": 1, "status": "ready"}])
+        params = server.requests[0].url.params
+        self.assertEqual(params["id"], "eq.abc")
+        self.assertEqual(params["is_active"], "eq.true")
+        self.assertEqual(params["order"], "created_at.desc")
+        self.assertEqual((params["offset"], params["limit"]), ("10", "5"))
+        self.assertEqual(server.requests[0].headers["apikey"], "key")
+
+    def test_reads_retry_transient_failures(self):
+        server = FakePostgREST(failures=[503, httpx.ReadTimeout("slow")])
+        rows = asyncio.run(make_db(server).select("model_registry"))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_writes_do_not_retry_when_request_may_have_landed(self):
+        server = FakePostgREST(failures=[httpx.ReadTimeout("slow")])
+        with self.assertRaises(DatabaseError):
+            asyncio.run(make_db(server).insert("transaction_history", [{"amount": 1}]))
+        self.assertEqual(len(server.requests), 1)
+
+        # A refused connection never reached the server, so it is safe to retry
+        server = FakePostgREST(failures=[httpx.ConnectError("refused")])
+        asyncio.run(make_db(server).rpc("log_activity", {"p_message": "x"}))
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(json.loads(server.requests[1].content), {"p_message": "x"})
+
+    def test_client_errors_are_not_retried(self):
+        server = FakePostgREST(failures=[400])
+        with self.assertRaises(DatabaseError) as ctx:
+            asyncio.run(make_db(server).update("model_registry", {"status": "x"}, {"id": 1}))
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_concurrency_is_bounded(self):
+        server = FakePostgREST()
+        db = make_db(server, max_concurrency=3)
+
+        async def run():
+            await asyncio.gather(*(db.select("model_registry") for _ in range(12)))
+
+        asyncio.run(run())
+        self.assertEqual(len(server.requests), 12)
+        self.assertLessEqual(server.max_in_flight, 3)
+
+    def test_run_sync_outside_event_loop(self):
+        server = FakePostgREST()
+        db = make_db(server)
+        self.assertEqual(db.run_sync(db.select("model_registry"))[0]["id"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from deployed_rules import DeployedRuleStore, RuleSet, fuse_decision, rule_columns
+from rules import RuleError
+
+
+class TestDeployedRules(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'deployed_rules.json')
+        self.store = DeployedRuleStore(self.path, reload_interval=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fuse_decision_takes_most_severe(self):
+        self.assertEqual(fuse_decision('pass', []), ('pass', 'low'))
+        self.assertEqual(fuse_decision('pass', ['warn']), ('warn', 'medium'))
+        self.assertEqual(fuse_decision('warn', ['block', 'warn']), ('block', 'high'))
+
+    def test_fired_per_row(self):
+        rule_set = RuleSet([
+            {'name': 'big transfer', 'rule_logic': 'amount > 1000 and type == "TRANSFER"'},
+            {'name': 'night', 'rule_logic': 'hour < 6', 'action': 'warn'},
+            {'name': 'off', 'rule_logic': 'amount > 0', 'enabled': False},
+        ])
+        features = pd.DataFrame({'amount': [5000.0, 5000.0, 10.0], 'hour': [12, 3, 3]})
+        raw = pd.DataFrame({'type': ['TRANSFER', 'CASH_OUT', 'TRANSFER']})
+        fired = rule_set.fired_per_row(rule_columns(features, raw, rule_set.columns), 3)
+        self.assertEqual([[r['name'] for r in rules] for rules in fired],
+                         [['big transfer'], ['night'], ['night']])
+
+    def test_missing_column_skips_rule(self):
+        rule_set = RuleSet([{'rule_logic': 'balance_error_orig > 0'}])
+        fired = rule_set.fired_per_row({'amount': pd.Series([1.0]).to_numpy()}, 1)
+        self.assertEqual(fired, [[]])
+
+    def test_save_and_hot_reload(self):
+        self.assertEqual(len(self.store.get()), 0)
+        saved = self.store.save([{'rule_logic': 'amount > 10'}])
+        self.assertEqual(saved.version, 1)
+
+        # An edit by another process is picked up on the next get()
+        other = DeployedRuleStore(self.path, reload_interval=0)
+        self.assertEqual(len(other.get()), 1)
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, 'w') as f:
+            json.dump({'version': 5, 'rules': []}, f)
+        os.utime(self.path, (mtime + 10, mtime + 10))
+        self.assertEqual(self.store.get().version, 5)
+
+    def test_invalid_rules_are_not_saved(self):
+        with self.assertRaises(RuleError):
+            self.store.save([{'rule_logic': 'isFraud == 1'}])
+        with self.assertRaises(RuleError):
+            self.store.save([{'rule_logic': 'amount > 1', 'action': 'approve'}])
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+import xgboost as xgb
+
+from benchmarks.synthetic import paysim_frame
+from external_memory import (
+    RAW_RENAMES, TEST, TRAIN, VALIDATION, external_memory_matrix, fit_feature_engineer_streaming,
+    plan_splits, write_feature_shards,
+)
+from feature_engineering import FraudFeatureEngineer
+
+
+class TestExternalMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, 'upload.csv')
+        # An upload with PaySim's own column names and the types the model does not use
+        upload = paysim_frame(4000, fraud_rate=0.1, steps=200, types=('TRANSFER', 'CASH_OUT', 'PAYMENT'))
+        upload = upload.rename(columns={v: k for k, v in RAW_RENAMES.items() if v != 'isFraud'})
+        upload.to_csv(self.path, index=False)
+
+    def test_partial_fit_matches_fit(self):
+        plan, summary = plan_splits(self.path, test_frac=0.0001, chunk_rows=500)
+        plan.test_cutoff, plan.test_frac = None, 0.0  # everything is training data
+        streamed = fit_feature_engineer_streaming(FraudFeatureEngineer(), self.path, plan, chunk_rows=500)
+
+        df = pd.read_csv(self.path)
+        df = df[df['type'].isin(['TRANSFER', 'CASH_OUT'])].rename(columns={
+            'oldbalanceOrg': 'oldBalanceOrig', 'newbalanceOrig': 'newBalanceOrig',
+            'oldbalanceDest': 'oldBalanceDest', 'newbalanceDest': 'newBalanceDest'}).reset_index(drop=True)
+        self.assertEqual(summary['rows'], len(df))
+        fitted = FraudFeatureEngineer().fit(df)
+        pd.testing.assert_frame_equal(streamed.transform(df), fitted.transform(df))
+
+    def test_plan_holds_out_latest_steps(self):
+        plan, _ = plan_splits(self.path, test_frac=0.1, validation_frac=0.1, chunk_rows=700,
+                              min_test_fraud=5, min_val_fraud=5)
+        self.assertIsNotNone(plan.test_cutoff)
+        self.assertIsNotNone(plan.validation_cutoff)
+        self.assertLess(plan.validation_cutoff, plan.test_cutoff)
+
+    def write_shards(self):
+        plan, summary = plan_splits(self.path, test_frac=0.1, validation_frac=0.1, chunk_rows=700,
+                                    min_test_fraud=5, min_val_fraud=5)
+        fe = fit_feature_engineer_streaming(FraudFeatureEngineer(), self.path, plan, chunk_rows=700)
+        return write_feature_shards(fe, self.path, plan, os.path.join(self.tmp, 'shards'), chunk_rows=700), summary
+
+    def test_shards_cover_every_row_once(self):
+        shards, summary = self.write_shards()
+        self.assertEqual(sum(shards.rows.values()), summary['rows'])
+        X_test, y_test = shards.load(TEST)
+        self.assertEqual(X_test.shape, (shards.rows[TEST], len(shards.feature_names)))
+        self.assertEqual(int(y_test.sum()), shards.frauds[TEST])
+
+        dtrain = external_memory_matrix(shards, TRAIN)
+        self.assertEqual(dtrain.num_row(), shards.rows[TRAIN])
+        self.assertGreater(shards.rows[VALIDATION], 0)
+        del dtrain
+
+    def test_iterator_matrix_without_extmem_quantile_dmatrix(self):
+        shards, _ = self.write_shards()
+        # XGBoost < 3.0 has no ExtMemQuantileDMatrix
+        extmem = xgb.ExtMemQuantileDMatrix
+        del xgb.ExtMemQuantileDMatrix
+        self.addCleanup(setattr, xgb, 'ExtMemQuantileDMatrix', extmem)
+
+        dtrain = external_memory_matrix(shards, TRAIN)
+        self.assertNotIsInstance(dtrain, extmem)
+        self.assertEqual(dtrain.num_row(), shards.rows[TRAIN])
+        self.assertEqual(dtrain.feature_names, shards.feature_names)
+        booster = xgb.train({'tree_method': 'hist', 'max_depth': 2}, dtrain, num_boost_round=3)
+        self.assertEqual(booster.num_boosted_rounds(), 3)
+        del dtrain, booster
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from feature_cache import FeatureCache, FeatureSet, cache_key
+
+
+def make_features(rows=50):
+    rng = np.random.default_rng(0)
+    frame = lambda n: pd.DataFrame(rng.random((n, 3)), columns=['amount', 'hour', 'in_degree'])
+    labels = lambda n: pd.Series(rng.integers(0, 2, n), name='isFraud')
+    return FeatureSet(X_train=frame(rows), y_train=labels(rows), X_test=frame(10), y_test=labels(10),
+                      fe={'fitted': True}, steps_train=np.arange(rows))
+
+
+class TestFeatureCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.upload = os.path.join(self.tmp, 'upload.csv')
+        with open(self.upload, 'w') as f:
+            f.write("step,amount\n1,10.0\n")
+
+    def test_key_ignores_model_hyperparameters(self):
+        base = cache_key(self.upload, {'n_estimators': 100, 'max_depth': 4})
+        self.assertEqual(base, cache_key(self.upload, {'n_estimators': 500, 'learning_rate': 0.2}))
+        self.assertNotEqual(base, cache_key(self.upload, {'test_split': 0.1}))
+        self.assertNotEqual(base, cache_key(self.upload, {'pagerank_limit': 0}))
+        with open(self.upload, 'a') as f:
+            f.write("2,20.0\n")
+        self.assertNotEqual(base, cache_key(self.upload, {}))
+
+    def test_roundtrip(self):
+        cache = FeatureCache(os.path.join(self.tmp, 'cache'), max_entries=2)
+        self.assertIsNone(cache.load('k1'))
+        features = make_features()
+        cache.save('k1', features)
+        loaded = cache.load('k1')
+        self.assertEqual(list(loaded.X_train.columns), list(features.X_train.columns))
+        np.testing.assert_allclose(loaded.X_train.to_numpy(), features.X_train.to_numpy(), rtol=1e-6)
+        np.testing.assert_array_equal(loaded.y_test.to_numpy(), features.y_test.to_numpy())
+        np.testing.assert_array_equal(loaded.steps_train, features.steps_train)
+        self.assertIsNone(loaded.X_val)
+        self.assertEqual(loaded.fe, {'fitted': True})
+
+    def test_prunes_least_recently_used(self):
+        cache = FeatureCache(os.path.join(self.tmp, 'cache'), max_entries=2)
+        for key in ('a', 'b'):
+            cache.save(key, make_features())
+            time.sleep(0.01)
+        cache.load('a')
+        time.sleep(0.01)
+        cache.save('c', make_features())
+        self.assertEqual(sorted(os.listdir(cache.directory)), ['a', 'c'])
+
+    def test_disabled_cache(self):
+        cache = FeatureCache(os.path.join(self.tmp, 'cache'), max_entries=0)
+        cache.save('k1', make_features())
+        self.assertIsNone(cache.load('k1'))
+        self.assertFalse(os.path.exists(cache.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from hyperparameter_search import run_search, temporal_folds
+
+
+class TestTemporalFolds(unittest.TestCase):
+    def test_expanding_windows_validate_on_later_steps(self):
+        rng = np.random.default_rng(0)
+        steps = rng.integers(0, 400, 2000)
+        y = (rng.random(2000) < 0.1).astype(int)
+        folds, temporal = temporal_folds(steps, y, n_folds=3)
+        self.assertTrue(temporal)
+        self.assertEqual(len(folds), 3)
+        for train_idx, val_idx in folds:
+            self.assertLess(steps[train_idx].max(), steps[val_idx].min())
+        self.assertLess(len(folds[0][0]), len(folds[2][0]))
+
+    def test_falls_back_to_stratified_folds_without_late_fraud(self):
+        steps = np.arange(1000)
+        y = (steps < 100).astype(int)
+        folds, temporal = temporal_folds(steps, y, n_folds=3)
+        self.assertFalse(temporal)
+        self.assertEqual(len(folds), 3)
+
+
+class TestRunSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.X = rng.random((1500, 4))
+        self.y = (self.X[:, 0] + 0.3 * rng.random(1500) > 1.0).astype(int)
+        self.steps = rng.integers(0, 100, 1500)
+
+    def test_halving_records_every_trial(self):
+        result = run_search(self.X, self.y, self.steps, strategy='halving', n_trials=9,
+                            max_estimators=30, threads=2)
+        self.assertEqual(len(result['trials']), 9 + 3 + 1)
+        final = [t for t in result['trials'] if t['rung'] == 2]
+        self.assertEqual(final[0]['params'], result['best_params'])
+        self.assertEqual(final[0]['rounds'], result['best_params']['n_estimators'])
+        self.assertLessEqual(result['best_params']['n_estimators'], 30)
+        self.assertTrue(all(len(t['fold_aucpr']) == result['folds'] for t in result['trials']))
+
+    def test_random_search_picks_best_trial(self):
+        result = run_search(self.X, self.y, self.steps, strategy='random', n_trials=4, max_estimators=20)
+        best = max(result['trials'], key=lambda t: t['aucpr'])
+        self.assertEqual(result['best_params'], best['params'])
+
+    def test_rejects_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            run_search(self.X, self.y, strategy='grid')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.metrics import MetricsRegistry, Stage, StageClock
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_buckets_and_errors(self):
+        stage = Stage("s", buckets=(0.001, 0.01))
+        for seconds in (0.0005, 0.001, 0.005, 2.0):
+            stage.observe(seconds)
+        with self.assertRaises(RuntimeError):
+            with stage.time():
+                raise RuntimeError("boom")
+        self.assertEqual(stage.counts[1:], [1, 1])
+        self.assertEqual((stage.count, stage.errors), (5, 1))
+
+        @stage.timed
+        def double(x):
+            return 2 * x
+        self.assertEqual(double(3), 6)
+        self.assertEqual(stage.count, 6)
+
+    def test_render_prometheus_text(self):
+        registry = MetricsRegistry(prefix="t")
+        registry.stage('a"b').observe(0.003)
+        registry.add_collector(lambda: [("queue_depth", "gauge", "Items queued", [({"queue": "x"}, 4)])])
+        registry.add_collector(lambda: 1 / 0)
+        lines = registry.render().splitlines()
+        self.assertIn('t_stage_duration_seconds_bucket{stage="a\\"b",le="0.0025"} 0', lines)
+        self.assertIn('t_stage_duration_seconds_bucket{stage="a\\"b",le="0.005"} 1', lines)
+        self.assertIn('t_stage_duration_seconds_bucket{stage="a\\"b",le="+Inf"} 1', lines)
+        self.assertIn('t_stage_duration_seconds_count{stage="a\\"b"} 1', lines)
+        self.assertIn('t_stage_errors_total{stage="a\\"b"} 0', lines)
+        self.assertIn('# TYPE t_queue_depth gauge', lines)
+        self.assertIn('t_queue_depth{queue="x"} 4', lines)
+
+    def test_stage_clock_accumulates_consecutive_stages(self):
+        clock = StageClock()
+        clock.mark("load")
+        time.sleep(0.01)
+        clock.mark("load")
+        clock.mark("train")
+        clock.mark(None)
+        self.assertEqual(set(clock.seconds), {"load", "train"})
+        self.assertGreaterEqual(clock.seconds["load"], 0.01)
+
+    def test_shared_registries_sum_across_processes(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        registry = MetricsRegistry(prefix="t")
+        hits = {"n": 5}
+        registry.add_collector(lambda: [("hits_total", "counter", "Hits", [({}, hits["n"])]),
+                                        ("depth", "gauge", "Depth", [({}, 2)])])
+        registry.add_collector(lambda: [("jobs", "gauge", "Jobs", [({}, 7)])], shared=True)
+        # Recorded before sharing (like the pre-fork master's warm-up): left out
+        registry.stage("s").observe(0.003)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                registry.share(tmpdir.name, flush_interval=0)
+                registry.stage("s").observe(0.003)
+                hits["n"] = 8
+                registry.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        registry.share(tmpdir.name, flush_interval=0)
+        registry.stage("s").observe(0.003)
+        hits["n"] = 6
+        lines = registry.render().splitlines()
+        self.assertIn('t_stage_duration_seconds_count{stage="s"} 2', lines)
+        # 3 hits in the exited process and 1 here
+        self.assertIn('t_hits_total 4', lines)
+        # Gauges of exited processes are dropped; shared ones are not summed
+        self.assertIn('t_depth 2', lines)
+        self.assertIn('t_jobs 7', lines)
+        self.assertEqual(registry.render().splitlines(), lines)
+        self.assertEqual(registry.stats()["s"]["count"], 2)
+        self.assertFalse(os.path.exists(os.path.join(tmpdir.name, f"{pid}.json")))
+
+    def test_timer_overhead_is_small(self):
+        stage = Stage("s")
+        n = 20000
+        start = time.perf_counter()
+        for _ in range(n):
+            with stage.time():
+                pass
+        # About 0.5us here; the bound leaves room for slow CI machines
+        self.assertLess((time.perf_counter() - start) / n, 5e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
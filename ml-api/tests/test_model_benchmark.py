@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+import model_benchmark
+from model_benchmark import benchmark_model, budget_violations, replay_rows
+
+
+class IdentityFeatures:
+    def transform(self, df):
+        return df
+
+
+def write_upload(path, seed):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'step': np.arange(50),
+        'type': rng.choice(['TRANSFER', 'CASH_OUT', 'PAYMENT'], 50),
+        'amount': rng.random(50).round(4),
+        'isFraud': 0,
+    }).to_csv(path, index=False)
+
+
+class TestModelBenchmark(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = pd.DataFrame(rng.random((512, 5)), columns=[f"f{i}" for i in range(5)])
+        y = (self.X['f0'] > 0.8).astype(int)
+        self.model = xgb.XGBClassifier(n_estimators=20, max_depth=3, n_jobs=4).fit(self.X, y)
+
+    def test_reports_latency_throughput_and_footprint(self):
+        result = benchmark_model(self.model, self.X, threads=1, batch_sizes=[1, 64, 1000],
+                                 single_row_calls=20, shap_calls=0)
+        self.assertLessEqual(result['single_row']['p50_ms'], result['single_row']['p99_ms'])
+        self.assertEqual(set(result['throughput_rows_per_second']), {'1', '64', '512'})
+        self.assertLess(result['compiled_single_row']['max_abs_diff'], 1e-6)
+        self.assertEqual(result['trees'], 20)
+        self.assertGreater(result['nodes'], 20)
+        self.assertGreater(result['serialized_mb'], 0)
+        self.assertGreaterEqual(result['memory_mb'], result['serialized_mb'])
+        self.assertEqual(self.model.get_params()['n_jobs'], 4)
+
+    def test_memory_matches_the_model_pool_accounting(self):
+        import shap
+        from model_pool import engine_memory_mb
+
+        result = benchmark_model(self.model, self.X, threads=1, batch_sizes=[1], single_row_calls=5, shap_calls=1)
+        engine = mock.Mock(model=self.model, shap_explainer=shap.TreeExplainer(self.model))
+        self.assertEqual(result['memory_mb'], engine_memory_mb(engine))
+        self.assertGreater(result['memory_mb'], result['serialized_mb'])
+
+    def test_replay_set_is_frozen_from_the_first_upload(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        first, second = os.path.join(tmpdir.name, "a.csv"), os.path.join(tmpdir.name, "b.csv")
+        write_upload(first, 0)
+        write_upload(second, 1)
+        path = os.path.join(tmpdir.name, "replay", "replay.csv")
+        missing = os.path.join(tmpdir.name, "missing.csv")
+
+        X, replay = replay_rows(IdentityFeatures(), first, path=path, source=missing, rows=10)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual((len(X), replay['rows']), (10, 10))
+        self.assertTrue(X['type'].isin(['TRANSFER', 'CASH_OUT']).all())
+        self.assertNotIn('isFraud', X.columns)
+
+        # Later jobs replay the frozen rows, whatever their upload or source
+        X_again, replay_again = replay_rows(IdentityFeatures(), second, path=path, source=second, rows=10)
+        self.assertEqual(replay_again, replay)
+        pd.testing.assert_frame_equal(X_again, X)
+        with self.assertRaises(ValueError):
+            replay_rows(IdentityFeatures(), None, path=missing, source=missing)
+
+    def test_budget_violations(self):
+        benchmark = {'single_row': {'p99_ms': 12.0}, 'explain': {'p99_ms': 3.0}, 'memory_mb': 40.0}
+        self.assertEqual(budget_violations(benchmark), [])
+        with mock.patch.object(model_benchmark, 'MODEL_LATENCY_BUDGET_MS', 10.0), \
+                mock.patch.object(model_benchmark, 'MODEL_MEMORY_BUDGET_MB', 50.0):
+            violations = budget_violations(benchmark)
+        self.assertEqual(len(violations), 1)
+        self.assertIn('p99 latency', violations[0])
+        with mock.patch.object(model_benchmark, 'MODEL_MEMORY_BUDGET_MB', 30.0):
+            self.assertIn('model memory', budget_violations(benchmark)[0])
+        self.assertEqual(budget_violations(None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+import xgboost as xgb
+
+from benchmarks.synthetic import paysim_frame
+from feature_engineering import FraudFeatureEngineer
+from inference import FraudInference, feature_state_path
+from model_pool import ModelPool
+
+
+class TestModelPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        df = paysim_frame(2000, fraud_rate=0.1, steps=100)
+        cls.dataset = os.path.join(cls.tmp, 'test_dataset.csv')
+        df.to_csv(cls.dataset, index=False)
+        X = FraudFeatureEngineer().fit(df).transform(df)
+        cls.paths = []
+        for i, depth in enumerate((2, 3, 4)):
+            path = os.path.join(cls.tmp, f"model_{i}.pkl")
+            joblib.dump(xgb.XGBClassifier(n_estimators=10, max_depth=depth).fit(X, df['isFraud']), path)
+            cls.paths.append(path)
+        # Trained on other rows and saved with its own feature engineer
+        own = df.tail(800).reset_index(drop=True)
+        cls.own_fe = FraudFeatureEngineer().fit(own)
+        cls.own_path = os.path.join(cls.tmp, "model_own.pkl")
+        joblib.dump(xgb.XGBClassifier(n_estimators=10, max_depth=3).fit(cls.own_fe.transform(own), own['isFraud']),
+                    cls.own_path)
+        joblib.dump(cls.own_fe, feature_state_path(cls.own_path))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def load(self, pool, path):
+        return pool.load(path, FraudInference, test_dataset_path=self.dataset)
+
+    def test_engines_share_fitted_feature_state(self):
+        pool = ModelPool(max_models=3, max_mb=0)
+        first, second = self.load(pool, self.paths[0]), self.load(pool, self.paths[1])
+        self.assertIsNot(first, second)
+        self.assertIs(first.feature_engineer, second.feature_engineer)
+        self.assertIs(self.load(pool, self.paths[0]), first)
+        self.assertEqual(pool.stats()['shared_feature_states'], 1)
+
+        tx = paysim_frame(5, seed=1).drop(columns=['isFraud'])
+        own = FraudInference(self.paths[1], test_dataset_path=self.dataset)
+        np.testing.assert_allclose(second.predict(tx)[0], own.predict(tx)[0])
+
+    def test_saved_feature_engineer_is_served_and_not_shared(self):
+        pool = ModelPool(max_models=3, max_mb=0)
+        default = self.load(pool, self.paths[0])
+        own = self.load(pool, self.own_path)
+        self.assertIsNot(own.feature_engineer, default.feature_engineer)
+        self.assertEqual(pool.stats()['shared_feature_states'], 2)
+
+        tx = paysim_frame(5, seed=1).drop(columns=['isFraud'])
+        expected = joblib.load(self.own_path).predict_proba(self.own_fe.transform(tx))[:, 1]
+        np.testing.assert_allclose(own.predict(tx)[0], expected, rtol=1e-6)
+        self.assertIsNotNone(own.shap_background)
+
+    def test_evicts_least_recently_used_but_not_the_active_model(self):
+        pool = ModelPool(max_models=2, max_mb=0)
+        pool.add(FraudInference(self.paths[0], test_dataset_path=self.dataset), pin=True)
+        self.load(pool, self.paths[1])
+        self.load(pool, self.paths[2])
+        loaded = {m['model_path']: m['active'] for m in pool.stats()['models']}
+        self.assertEqual(loaded, {self.paths[0]: True, self.paths[2]: False})
+        self.assertIsNone(pool.get(self.paths[1]))
+        self.assertEqual(pool.evictions, 1)
+
+    def test_memory_budget(self):
+        pool = ModelPool(max_models=3, max_mb=1e-6)
+        self.load(pool, self.paths[0])
+        self.load(pool, self.paths[1])
+        self.assertEqual([m['model_path'] for m in pool.stats()['models']], [self.paths[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
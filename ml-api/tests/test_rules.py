@@ -0,0 +1,112 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from feature_store import TRANSACTION_TYPES, encode_types
+from rules import compile_rule, normalize_rule, RuleError
+
+
+def make_frame(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'amount': rng.lognormal(10, 1.5, n),
+        'oldBalanceOrig': rng.lognormal(10, 2, n),
+        'orig_txn_count': rng.integers(0, 6, n),
+        'hour': rng.integers(0, 24, n),
+        'network_trust': np.where(rng.random(n) < 0.1, np.nan, rng.random(n) / 1000),
+        'type': rng.choice(['TRANSFER', 'CASH_OUT'], n),
+    })
+
+
+def as_columns(df):
+    columns = {name: df[name].to_numpy() for name in df.columns}
+    columns['type'] = encode_types(df['type'])
+    return columns
+
+
+class TestRuleEngine(unittest.TestCase):
+    def setUp(self):
+        self.df = make_frame()
+        self.columns = as_columns(self.df)
+
+    def assert_matches_query(self, rule_text, query_text=None):
+        expected = self.df.eval(query_text or rule_text).to_numpy()
+        actual = compile_rule(rule_text).evaluate(self.columns)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_matches_dataframe_query(self):
+        """Compiled rules agree with pandas on the same data."""
+        self.assert_matches_query('amount > 50000 and type == "TRANSFER"')
+        self.assert_matches_query('orig_txn_count >= 2 or hour < 5 and amount <= 1000')
+        self.assert_matches_query('not (hour < 5) and network_trust != 0.0005')
+        self.assert_matches_query('network_trust > 0.0001 or amount > oldBalanceOrig')
+        self.assert_matches_query('(amount > 1e5 or hour == 3) and (type != "CASH_OUT")')
+        self.assert_matches_query("type in ['CASH_OUT'] and orig_txn_count not in [0, 1]")
+
+    def test_short_circuit_on_selective_predicates(self):
+        """Evaluating later predicates on surviving rows gives the same mask."""
+        self.assert_matches_query('amount > 400000 and hour < 12 and orig_txn_count > 0')
+        self.assert_matches_query('amount < 900000 or hour < 12 or orig_txn_count > 0')
+
+    def test_literal_on_left_is_normalized(self):
+        self.assertEqual(normalize_rule('50000 < amount'), normalize_rule('amount > 50000'))
+        self.assert_matches_query('50000 < amount', 'amount > 50000')
+
+    def test_reformatted_rules_share_compiled_form(self):
+        a = compile_rule('amount > 50000 and type == "TRANSFER"')
+        b = compile_rule("(type=='TRANSFER')  AND amount>50000.0")
+        self.assertIs(a, b)
+
+    def test_rejects_unknown_columns_and_code(self):
+        for text in [
+            'isFraud == 1',
+            'nameOrig == "C123"',
+            '__import__("os").system("ls")',
+            'amount.sum() > 1',
+            'amount > 5; hour < 2',
+            'type > "TRANSFER"',
+            'type == "WIRE"',
+            'amount == "big"',
+            '5 > 3',
+            'amount >',
+            '',
+        ]:
+            with self.subTest(rule=text):
+                with self.assertRaises(RuleError):
+                    compile_rule(text)
+
+    def test_deep_nesting_is_a_rule_error(self):
+        for text in ['(' * 900 + 'amount > 5' + ')' * 900, 'not ' * 400 + 'amount > 5']:
+            with self.assertRaises(RuleError):
+                compile_rule(text)
+        self.assertEqual(compile_rule('(' * 10 + 'amount > 5' + ')' * 10).canonical, 'amount > 5')
+
+    def test_duplicate_operands_collapse(self):
+        self.assertEqual(compile_rule('amount > 5 and amount > 5').canonical, 'amount > 5')
+        self.assertEqual(normalize_rule('hour < 2 or (hour < 2 and hour < 2)'), 'hour < 2')
+        self.assertEqual(normalize_rule('not (amount > 5 or amount > 5)'), 'not (amount > 5)')
+
+    def test_shared_memo_reuses_sub_predicates(self):
+        memo = {}
+        first = compile_rule('amount > 50000 and hour < 5')
+        second = compile_rule('hour < 5 or orig_txn_count > 3')
+        first.evaluate(self.columns, memo=memo)
+        self.assertIn('hour < 5', memo)
+        np.testing.assert_array_equal(
+            second.evaluate(self.columns, memo=memo),
+            second.evaluate(self.columns)
+        )
+
+    def test_single_row_evaluation(self):
+        rule = compile_rule('amount > 50000 and type == "TRANSFER"')
+        row = {'amount': np.array([60000.0]), 'type': np.array([TRANSACTION_TYPES.index('TRANSFER')])}
+        self.assertTrue(rule.evaluate(row)[0])
+
+    def test_missing_column_raises_rule_error(self):
+        with self.assertRaises(RuleError):
+            compile_rule('balance_error_orig > 0').evaluate(self.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
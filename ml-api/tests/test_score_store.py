@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import xgboost as xgb
+
+from feature_store import FeatureTable
+from score_store import ScoreStore, score_table
+
+
+def make_table_and_model(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        'amount': rng.lognormal(10, 1.5, n),
+        'hour': rng.integers(0, 24, n).astype(np.int16),
+    }
+    labels = ((columns['amount'] > 60000) & (columns['hour'] < 8)).astype(np.int8)
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=3)
+    X = np.column_stack([columns['amount'], columns['hour']])
+    model.fit(X, labels)
+    model.get_booster().feature_names = ['amount', 'hour']
+    columns['isFraud'] = labels
+    return FeatureTable(columns, 'dataset', 'features'), model, X
+
+
+class TestScoreStore(unittest.TestCase):
+    def setUp(self):
+        self.table, self.model, self.X = make_table_and_model()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ScoreStore(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunked_scores_match_predict_proba(self):
+        artifact = score_table(self.model, self.table, 'm1', topk=1, chunk_rows=700, workers=3)
+        expected = self.model.predict_proba(self.X)[:, 1]
+        np.testing.assert_allclose(artifact.probabilities, expected, rtol=1e-6)
+        self.assertEqual(artifact.topk_index.shape, (len(self.table), 1))
+        self.assertIn(artifact.contributions(0)[0]['feature'], ['amount', 'hour'])
+
+    def test_job_materializes_and_reloads_from_disk(self):
+        self.assertIsNone(self.store.lookup('m1', self.table))
+        self.assertTrue(self.store.start(self.model, self.table, 'm1'))
+        self.store._thread.join(timeout=30)
+        self.assertEqual(self.store.status['state'], 'completed')
+
+        # A fresh store (another worker process) finds the artifact on disk
+        other = ScoreStore(self.tmpdir.name)
+        artifact = other.lookup('m1', self.table)
+        self.assertIsNotNone(artifact)
+        self.assertEqual(len(artifact.probabilities), len(self.table))
+        self.assertFalse(other.start(self.model, self.table, 'm1'))
+        self.assertIsNone(other.lookup('m2', self.table))
+
+    def test_stale_lock_from_dead_process_is_taken_over(self):
+        prefix = os.path.join(self.tmpdir.name, 'm1_dataset_features')
+        with open(f"{prefix}.lock", 'w') as f:
+            f.write('999999999')
+        self.store.start(self.model, self.table, 'm1')
+        self.store._thread.join(timeout=30)
+        self.assertEqual(self.store.status['state'], 'completed')
+        self.assertFalse(os.path.exists(f"{prefix}.lock"))
+
+    def test_job_scores_serving_features_keyed_by_table(self):
+        # The model is served with other features than the backtest table holds
+        served = FeatureTable({'amount': self.table.columns['amount'] * 2, 'hour': self.table.columns['hour']},
+                              'dataset', 'served')
+        self.assertTrue(self.store.start(self.model, self.table, 'm1', features=lambda: served))
+        self.store._thread.join(timeout=30)
+        self.assertEqual(self.store.status['state'], 'completed')
+
+        artifact = ScoreStore(self.tmpdir.name).lookup('m1', self.table)
+        self.assertEqual(artifact.key, ('m1', 'dataset', 'features'))
+        expected = score_table(self.model, served, 'm1').probabilities
+        np.testing.assert_array_equal(artifact.probabilities, expected)
+
+    def test_job_fails_on_misaligned_serving_features(self):
+        served = FeatureTable({'amount': self.table.columns['amount'][:10], 'hour': self.table.columns['hour'][:10]},
+                              'dataset', 'served')
+        self.store.start(self.model, self.table, 'm1', features=lambda: served)
+        self.store._thread.join(timeout=30)
+        self.assertEqual(self.store.status['state'], 'failed')
+        self.assertIsNone(self.store.lookup('m1', self.table))
+
+
+if __name__ == '__main__':
+    unittest.main()
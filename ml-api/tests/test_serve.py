@@ -0,0 +1,262 @@
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from serve import PreforkServer, request_rescore, request_rolling_reload, request_shadow
+from shadow import ShadowScorer, shadow_scorer
+from training_queue import TrainingQueue
+
+
+def slow_job(job_id, file_path, params, progress=None):
+    for i in range(60):
+        progress("training", i * 100 / 60)
+        time.sleep(0.05)
+
+
+class StubServer(PreforkServer):
+    """Pre-fork server with idle workers and a training queue as its only service"""
+
+    def __init__(self, queue_path, **kwargs):
+        super().__init__(**kwargs)
+        self.queue_path = queue_path
+
+    def _warm_up(self):
+        pass
+
+    def _load_model(self):
+        if "broken" in os.getenv("MODEL_PATH", ""):
+            raise ValueError("Invalid model file")
+
+    def _run_worker(self, ready_fd):
+        os.write(ready_fd, b"1")
+        os.close(ready_fd)
+        while True:
+            time.sleep(1)
+
+    def _start_services(self):
+        self.queue = TrainingQueue(self.queue_path, nice=0, poll_interval=0.05, target=slow_job)
+        self.queue.start()
+
+    def _reload_services(self, model_path):
+        pass
+
+    def _rescore(self, model_key, force):
+        if model_key != "current":
+            raise RuntimeError(f"Services process serves model current, not {model_key}")
+        return {"started": True, "job": {"state": "running", "model_key": model_key, "force": force,
+                                         "pid": os.getpid()}}
+
+    def _stop_services(self):
+        self.queue.stop()
+
+
+class ShadowStubServer(StubServer):
+    """Workers that each shadow one batch of their own traffic when asked to"""
+
+    def __init__(self, queue_path, shadow_dir, models, **kwargs):
+        super().__init__(queue_path, **kwargs)
+        self.shadow_dir = shadow_dir
+        self.X, self.active, self.candidate = models
+
+    def _run_worker(self, ready_fd):
+        shadow_scorer.share(self.shadow_dir, flush_interval=0.05)
+        self._watch_shadow()
+        try:
+            os.write(ready_fd, b"1")
+        except OSError:
+            pass  # the master did not wait for this worker
+        os.close(ready_fd)
+        while True:
+            time.sleep(1)
+
+    def _apply_shadow(self, request):
+        if request.get('action') == 'start' and (shadow_scorer.config or {}).get('run_id') != request['run_id']:
+            shadow_scorer.start(self.active, self.candidate, request['sample_rate'], thresholds=(0.3, 0.7),
+                                model_id=request['model_id'], run_id=request['run_id'])
+            shadow_scorer.offer(self.X)
+        elif request.get('action') == 'stop':
+            shadow_scorer.stop()
+
+
+class TestPreforkServer(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.queue_path = os.path.join(tmpdir.name, "jobs.db")
+        os.environ["PREFORK_MASTER_PID"] = str(os.getpid())
+        os.environ["PREFORK_CONTROL_FILE"] = os.path.join(tmpdir.name, "control.json")
+        self.addCleanup(os.environ.pop, "PREFORK_MASTER_PID", None)
+        self.addCleanup(os.environ.pop, "PREFORK_CONTROL_FILE", None)
+
+    def wait_for(self, condition, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            result = condition()
+            if result:
+                return result
+            time.sleep(0.05)
+        self.fail("condition not met in time")
+
+    def test_rolling_reload_keeps_running_training_job(self):
+        server = StubServer(self.queue_path, workers=2, ready_timeout=10, graceful_timeout=5)
+        self.addCleanup(server._shutdown)
+        server._spawn_services()
+        server._spawn_missing()
+        queue = TrainingQueue(self.queue_path)
+        queue.submit("job", "upload.csv", {})
+        running = self.wait_for(lambda: (lambda job: job if job['status'] == 'running' and job['progress'] > 0
+                                         else None)(queue.get("job")))
+
+        old_workers = set(server.workers)
+        services_pid = server.services_pid
+        server._rolling_reload()
+        self.assertTrue(old_workers.isdisjoint(server.workers))
+        self.assertEqual(len(server.workers), 2)
+        self.wait_for(lambda: (server._reap(), not server.retiring)[1])
+        self.assertEqual(server.services_pid, services_pid)
+
+        job = queue.get("job")
+        self.assertIn(job['status'], ('running', 'completed'))
+        if job['status'] == 'running':
+            self.assertEqual(job['pid'], running['pid'])
+        job = self.wait_for(lambda: (lambda job: job if job['status'] == 'completed' else None)(queue.get("job")))
+        self.assertEqual(job['attempts'], 1)
+
+    def request_reload(self, server, model_path):
+        """Request a reload from a thread (like a worker would) and run it in this 'master'"""
+        outcome = {}
+
+        def request():
+            try:
+                request_rolling_reload(model_path, timeout=10)
+                outcome['ok'] = True
+            except Exception as e:
+                outcome['error'] = e
+
+        previous_handler = signal.signal(signal.SIGHUP, server._on_sighup)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous_handler)
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.wait_for(lambda: server._reload_requested)
+        server._rolling_reload()
+        thread.join(timeout=10)
+        return outcome
+
+    def test_failed_reload_is_reported_and_keeps_model_path_and_workers(self):
+        tmpdir = os.path.dirname(self.queue_path)
+        models = {}
+        for name in ("good.pkl", "broken.pkl"):
+            models[name] = os.path.join(tmpdir, name)
+            open(models[name], "wb").close()
+        os.environ["MODEL_PATH"] = models["good.pkl"]
+        self.addCleanup(os.environ.pop, "MODEL_PATH", None)
+        server = StubServer(self.queue_path, workers=1, ready_timeout=10, graceful_timeout=5)
+        self.addCleanup(server._shutdown)
+        server._spawn_missing()
+        workers = set(server.workers)
+
+        outcome = self.request_reload(server, models["broken.pkl"])
+        self.assertIsInstance(outcome.get('error'), RuntimeError)
+        self.assertIn("Invalid model file", str(outcome['error']))
+        self.assertEqual(os.environ["MODEL_PATH"], models["good.pkl"])
+        self.assertEqual(set(server.workers), workers)
+
+        outcome = self.request_reload(server, os.path.join(tmpdir, "missing.pkl"))
+        self.assertIsInstance(outcome.get('error'), RuntimeError)
+        self.assertEqual(os.environ["MODEL_PATH"], models["good.pkl"])
+
+        outcome = self.request_reload(server, models["good.pkl"])
+        self.assertEqual(outcome, {'ok': True})
+        self.assertTrue(workers.isdisjoint(server.workers))
+        self.assertEqual(os.listdir(tmpdir).count("control.json"), 1)
+        self.assertFalse([name for name in os.listdir(tmpdir) if name.endswith(".result")])
+
+    def test_rescore_requests_run_in_the_services_process(self):
+        server = StubServer(self.queue_path, workers=1, ready_timeout=10, graceful_timeout=5)
+        self.addCleanup(server._shutdown)
+        previous_handler = signal.signal(signal.SIGUSR2, server._on_rescore)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous_handler)
+        server._spawn_services()
+        # The services process has its own handlers once its training queue exists
+        self.wait_for(lambda: os.path.exists(self.queue_path))
+
+        def rescore(model_key):
+            outcome = {}
+
+            def request():
+                try:
+                    outcome['result'] = request_rescore(model_key, force=True, timeout=10)
+                except Exception as e:
+                    outcome['error'] = e
+
+            thread = threading.Thread(target=request)
+            thread.start()
+            self.wait_for(lambda: server._rescore_requested)
+            server._forward_rescore()
+            thread.join(timeout=15)
+            return outcome
+
+        outcome = rescore("current")
+        self.assertEqual(outcome['result']['started'], True)
+        self.assertEqual(outcome['result']['job']['pid'], server.services_pid)
+        self.assertTrue(outcome['result']['job']['force'])
+
+        outcome = rescore("stale")
+        self.assertIsInstance(outcome.get('error'), RuntimeError)
+        self.assertIn("not stale", str(outcome['error']))
+        tmpdir = os.path.dirname(self.queue_path)
+        self.assertFalse([name for name in os.listdir(tmpdir) if name.endswith(".result")])
+
+    def test_shadow_requests_reach_every_worker_and_counters_are_summed(self):
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.random((100, 3)), columns=['f0', 'f1', 'f2'])
+        y = (X['f0'] > 0.7).astype(int)
+        active = xgb.XGBClassifier(n_estimators=5, max_depth=2, n_jobs=1).fit(X, y)
+        candidate = xgb.XGBClassifier(n_estimators=20, max_depth=3, n_jobs=1).fit(X, y)
+        shadow_dir = os.path.join(os.path.dirname(self.queue_path), "metrics")
+
+        server = ShadowStubServer(self.queue_path, shadow_dir, (X, active, candidate),
+                                  workers=3, ready_timeout=10, graceful_timeout=5)
+        self.addCleanup(server._shutdown)
+        previous_handler = signal.signal(signal.SIGUSR1, server._on_shadow)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous_handler)
+        server._spawn_missing()
+
+        run_id = uuid.uuid4().hex
+        request_shadow({"action": "start", "run_id": run_id, "model_id": "m2", "sample_rate": 1.0})
+        self.wait_for(lambda: server._shadow_requested)
+        server._forward_shadow()
+
+        # Another process (the one answering GET /shadow) sees the whole pool's counters
+        reader = ShadowScorer()
+        reader.share(shadow_dir)
+        status = self.wait_for(lambda: (lambda s: s if s['rows'] == 300 else None)(reader.shared_status()))
+        self.assertEqual((status['run_id'], status['model_id'], status['batches']), (run_id, 'm2', 3))
+        self.assertTrue(status['enabled'])
+        self.assertEqual(status['processes'], 3)
+
+        # A worker forked later joins the run
+        old_pid = next(iter(server.workers))
+        server._spawn_worker(wait_ready=True)
+        server._retire(old_pid)
+        self.wait_for(lambda: reader.shared_status()['rows'] == 400)
+        self.wait_for(lambda: (server._reap(), not server.retiring)[1])
+
+        request_shadow({"action": "stop", "run_id": run_id})
+        self.wait_for(lambda: server._shadow_requested)
+        server._forward_shadow()
+        status = reader.wait_stopped(timeout=10)
+        self.assertFalse(status['enabled'])
+        self.assertEqual((status['rows'], status['batches'], status['errors']), (400, 4, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from shadow import ShadowScorer
+
+
+class TestShadowScorer(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = pd.DataFrame(rng.random((300, 4)), columns=[f"f{i}" for i in range(4)])
+        y = (self.X['f0'] + 0.3 * self.X['f1'] > 0.9).astype(int)
+        self.active = xgb.XGBClassifier(n_estimators=10, max_depth=2).fit(self.X, y)
+        self.candidate = xgb.XGBClassifier(n_estimators=30, max_depth=4).fit(self.X, y)
+
+    def test_aggregates_disagreement_and_deltas(self):
+        scorer = ShadowScorer(queue_size=16, threads=1)
+        scorer.start(self.active, self.candidate, 1.0, thresholds=(0.3, 0.7), model_id='m2',
+                     feature_names=list(self.X.columns))
+        active_p = self.active.predict_proba(self.X)[:, 1]
+        for start in range(0, 300, 100):
+            self.assertTrue(scorer.offer(self.X.iloc[start:start + 100]))
+        status = scorer.stop()
+
+        candidate_p = self.candidate.predict_proba(self.X)[:, 1]
+        expected = np.mean(np.digitize(active_p, (0.3, 0.7)) != np.digitize(candidate_p, (0.3, 0.7)))
+        self.assertFalse(status['enabled'])
+        self.assertEqual((status['batches'], status['rows'], status['errors']), (3, 300, 0))
+        self.assertAlmostEqual(status['disagreement_rate'], expected, places=5)
+        self.assertAlmostEqual(status['score_delta']['mean'], float(np.mean(candidate_p - active_p)), places=5)
+        self.assertEqual(sum(status['score_delta']['buckets']['counts']), 300)
+        self.assertEqual(sum(status['latency_ms']['candidate']['buckets']['counts']), 3)
+
+    def test_offer_is_a_no_op_when_not_running(self):
+        scorer = ShadowScorer()
+        self.assertFalse(scorer.offer(self.X))
+        self.assertIsNone(scorer.stop())
+
+    def test_rejects_bad_configuration(self):
+        scorer = ShadowScorer()
+        with self.assertRaises(ValueError):
+            scorer.start(self.active, self.candidate, 0.0, thresholds=(0.3, 0.7))
+        with self.assertRaises(ValueError):
+            scorer.start(self.active, self.candidate, 1.0, thresholds=(0.3, 0.7), feature_names=['a', 'b'])
+        self.assertFalse(scorer.enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import time
+import unittest
+
+from training_queue import TrainingQueue
+from utils.metrics import metrics
+
+
+def quick_job(job_id, file_path, params, progress=None):
+    for i in range(5):
+        progress("training", 20 * i)
+
+
+def endless_job(job_id, file_path, params, progress=None):
+    while True:
+        progress("training", 50)
+        time.sleep(0.05)
+
+
+def crashing_job(job_id, file_path, params, progress=None):
+    os._exit(1)
+
+
+class TestTrainingQueue(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "jobs.db")
+
+    def make_queue(self, target, **kwargs):
+        queue = TrainingQueue(self.path, nice=0, poll_interval=0.05, target=target, **kwargs)
+        self.addCleanup(queue.stop)
+        return queue
+
+    def wait_for(self, queue, job_id, states, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            queue.tick()
+            job = queue.get(job_id)
+            if job['status'] in states:
+                return job
+            time.sleep(0.05)
+        self.fail(f"job stuck in {queue.get(job_id)}")
+
+    def test_claims_respect_concurrency_limit_across_queues(self):
+        first = TrainingQueue(self.path, max_concurrent=1)
+        second = TrainingQueue(self.path, max_concurrent=1)
+        first.submit("a", "a.csv", {})
+        first.submit("b", "b.csv", {"n_estimators": 10})
+
+        claimed = first._claim_next()
+        self.assertEqual(claimed['id'], "a")
+        self.assertIsNone(second._claim_next())
+        self.assertEqual(second.get("b")['params'], {"n_estimators": 10})
+
+        first.finish("a", "completed")
+        self.assertEqual(second._claim_next()['id'], "b")
+        self.assertEqual(first.get("a")['progress'], 100)
+
+    def test_cancel_queued_and_running(self):
+        queue = TrainingQueue(self.path, max_concurrent=2)
+        queue.submit("a", "a.csv", {})
+        queue.submit("b", "b.csv", {})
+        queue._claim_next()
+
+        self.assertEqual(queue.cancel("b")['status'], "cancelled")
+        self.assertFalse(queue.report("a", "training", 10))
+        self.assertTrue(queue.cancel("a")['cancel_requested'])
+        self.assertTrue(queue.report("a", "training", 20))
+        with self.assertRaises(ValueError):
+            queue.cancel("b")
+        with self.assertRaises(KeyError):
+            queue.cancel("missing")
+
+    def test_dead_worker_is_requeued_then_failed(self):
+        queue = TrainingQueue(self.path, max_attempts=2)
+        queue.submit("a", "a.csv", {})
+        dead_pid = 2 ** 22 + 1  # above the default pid_max
+        for expected in ("queued", "failed"):
+            queue._claim_next()
+            queue._set_pid("a", dead_pid)
+            queue.recover()
+            self.assertEqual(queue.get("a")['status'], expected)
+        self.assertIn("died", queue.get("a")['error'])
+
+    def test_worker_process_runs_job_to_completion(self):
+        queue = self.make_queue(quick_job)
+        queue.submit("a", "a.csv", {})
+        job = self.wait_for(queue, "a", ("completed", "failed"))
+        self.assertEqual(job['status'], "completed", job['error'])
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(set(job['stage_seconds']), {"training", "total"})
+
+        # The dispatcher adds the worker's stage timings to its own metrics when it reaps it
+        before = metrics.stage("training.total").count
+        deadline = time.time() + 10
+        while queue._processes and time.time() < deadline:
+            time.sleep(0.05)
+            queue.tick()
+        self.assertEqual(metrics.stage("training.total").count, before + 1)
+
+    def test_running_job_stops_when_cancelled(self):
+        queue = self.make_queue(endless_job, cancel_grace=30)
+        queue.submit("a", "a.csv", {})
+        self.wait_for(queue, "a", ("running",))
+        while queue.get("a")['stage'] != "training":
+            time.sleep(0.05)
+        queue.cancel("a")
+        job = self.wait_for(queue, "a", ("cancelled", "failed", "completed"))
+        self.assertEqual(job['status'], "cancelled")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import joblib
+
+import numpy as np
+import pandas as pd
+
+import training_service
+from benchmarks.synthetic import paysim_frame
+from feature_engineering import FraudFeatureEngineer
+from training_service import ModelRejected, temporal_holdout, training_thread_budget
+
+
+class TestTemporalHoldout(unittest.TestCase):
+    def test_holds_out_latest_steps(self):
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame({'step': rng.permutation(1000), 'amount': rng.random(1000)})
+        y = pd.Series((rng.random(1000) < 0.2).astype(int))
+        X_fit, X_val, y_fit, y_val = temporal_holdout(X, y, frac=0.1, min_val_fraud=5)
+        self.assertEqual(len(X_val), 100)
+        self.assertGreater(X_val['step'].min(), X_fit['step'].max())
+        self.assertEqual(len(y_fit) + len(y_val), 1000)
+
+    def test_falls_back_to_stratified_split_without_late_fraud(self):
+        X = pd.DataFrame({'step': np.arange(1000)})
+        y = pd.Series((np.arange(1000) < 100).astype(int))  # all fraud early on
+        _, X_val, _, y_val = temporal_holdout(X, y, frac=0.1, min_val_fraud=5)
+        self.assertEqual(len(X_val), 100)
+        self.assertEqual(int(y_val.sum()), 10)
+
+
+class TestThreadBudget(unittest.TestCase):
+    def test_explicit_budget(self):
+        with mock.patch.object(training_service, 'TRAINING_THREADS', '6'):
+            self.assertEqual(training_thread_budget(), 6)
+
+    def test_reserves_serving_threads_and_shares_between_jobs(self):
+        env = {"WORKERS": "4", "PREFORK_WORKER_THREADS": "2", "TRAINING_MAX_CONCURRENT": "2"}
+        with mock.patch.object(training_service, 'TRAINING_THREADS', None), \
+                mock.patch.dict(os.environ, env), mock.patch('os.cpu_count', return_value=32):
+            self.assertEqual(training_thread_budget(), 12)
+        with mock.patch.object(training_service, 'TRAINING_THREADS', None), \
+                mock.patch.dict(os.environ, env), mock.patch('os.cpu_count', return_value=4):
+            self.assertEqual(training_thread_budget(), 1)
+
+
+class TestBestIteration(unittest.TestCase):
+    def test_sliced_booster_keeps_params_and_predictions(self):
+        import xgboost as xgb
+
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.random((2000, 4)), columns=[f"f{i}" for i in range(4)])
+        y = (X['f0'] > 0.8).astype(int)
+        clf = xgb.XGBClassifier(n_estimators=50, max_depth=2, n_jobs=1, early_stopping_rounds=5, eval_metric='aucpr')
+        clf.fit(X.iloc[:1500], y.iloc[:1500], eval_set=[(X.iloc[1500:], y.iloc[1500:])], verbose=False)
+        trees = clf.best_iteration + 1
+        self.assertLess(trees, clf.get_booster().num_boosted_rounds())
+
+        clf.set_params(early_stopping_rounds=None)
+        best = training_service._classifier_from_booster(clf.get_booster()[:trees], **clf.get_params())
+        self.assertEqual(best.get_booster().num_boosted_rounds(), trees)
+        self.assertEqual((best.max_depth, best.n_jobs), (2, 1))
+        np.testing.assert_allclose(best.predict_proba(X)[:, 1],
+                                   clf.predict_proba(X, iteration_range=(0, trees))[:, 1])
+
+
+class TestCascadeCalibration(unittest.TestCase):
+    def test_calibrates_on_validation_and_reports_on_test(self):
+        import xgboost as xgb
+
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.random((6000, 4)), columns=[f"f{i}" for i in range(4)])
+        y = ((X['f0'] > 0.85) & (X['f1'] > 0.3)).astype(int)
+        clf = xgb.XGBClassifier(n_estimators=40, max_depth=3).fit(X.iloc[:3000], y.iloc[:3000])
+        X_val, y_val = X.iloc[3000:4500], y.iloc[3000:4500]
+        X_test, y_test = X.iloc[4500:], y.iloc[4500:]
+        cascade = training_service._calibrate_cascade(clf, X_val, y_val, X_test, y_test)
+        self.assertEqual(cascade['holdout_rows'], len(X_val))
+        self.assertEqual(cascade['test']['rows'], len(X_test))
+        self.assertIn('cascade', cascade['test']['recall'])
+        self.assertIn('skipped', training_service._calibrate_cascade(clf, None, None, X_test, y_test))
+
+
+class TestWarmStart(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.df = paysim_frame(3000, fraud_rate=0.08, steps=300)
+        self.cutoff = 200
+        self.upload = os.path.join(self.tmp, 'upload.csv')
+        self.df.to_csv(self.upload, index=False)
+
+    def test_update_matches_fit_on_all_rows(self):
+        old, new = self.df[self.df['step'] <= self.cutoff], self.df[self.df['step'] > self.cutoff]
+        full = FraudFeatureEngineer().fit(self.df)
+        updated = FraudFeatureEngineer().fit(old).update(new)
+        for key in ('orig_counts', 'dest_counts', 'last_step'):
+            self.assertEqual(updated.stats[key], full.stats[key])
+        means = pd.Series(updated.stats['orig_mean_amt'])
+        np.testing.assert_allclose(means[list(full.stats['orig_mean_amt'])], list(full.stats['orig_mean_amt'].values()))
+        for key in ('in_degree', 'out_degree'):
+            expected = {k: v for k, v in full.graph_meta[key].items() if v}
+            self.assertEqual({k: v for k, v in updated.graph_meta[key].items() if v}, expected)
+        self.assertAlmostEqual(updated.global_mean, full.global_mean)
+        self.assertNotEqual(updated.version, FraudFeatureEngineer().fit(old).version)
+
+    def train_parent(self):
+        import xgboost as xgb
+
+        old = self.df[self.df['step'] <= self.cutoff]
+        fe = FraudFeatureEngineer().fit(old)
+        clf = xgb.XGBClassifier(n_estimators=20, max_depth=3, n_jobs=1)
+        clf.fit(fe.transform(old.drop(columns='isFraud')), old['isFraud'])
+        path = os.path.join(self.tmp, 'model_parent.pkl')
+        joblib.dump(clf, path)
+        joblib.dump(fe, training_service.feature_state_path(path))
+        return {'id': 'parent', 'status': 'ready', 'file_path': path,
+                'metrics': {'data_cutoff_step': self.cutoff}}
+
+    def test_continues_parent_trees_on_new_rows(self):
+        parent = self.train_parent()
+        params = {'n_estimators': 10, 'early_stopping_rounds': 0, 'test_split': 0.2, 'warm_start_min_gain': -1.0}
+        clf, fe, metrics = training_service._train_warm_start(self.upload, params, parent, lambda *a: None)
+        self.assertEqual(clf.get_booster().num_boosted_rounds(), 30)
+        warm = metrics['warm_start']
+        self.assertEqual(warm['parent_trees'], 20)
+        self.assertEqual(warm['new_rows'], int((self.df['step'] > self.cutoff).sum()))
+        self.assertIsNotNone(warm['parent_holdout_aucpr'])
+        self.assertEqual(metrics['data_cutoff_step'], int(self.df['step'].max()))
+
+    def test_chained_warm_starts_keep_every_row_in_the_feature_state(self):
+        df = paysim_frame(4000, fraud_rate=0.08, steps=400)
+        self.df = df[df['step'] <= 300]
+        self.df.to_csv(self.upload, index=False)
+        parent = self.train_parent()
+        params = {'n_estimators': 5, 'early_stopping_rounds': 10, 'validation_split': 0.1,
+                  'test_split': 0.2, 'warm_start_min_gain': -1.0}
+        clf, fe, metrics = training_service._train_warm_start(self.upload, params, parent, lambda *a: None)
+        holdout = self.df[self.df['step'] > self.cutoff].tail(metrics['warm_start']['holdout_rows'])
+        self.assertTrue(set(holdout['nameOrig']) <= set(fe.stats['orig_counts']))
+
+        path = os.path.join(self.tmp, 'model_child.pkl')
+        joblib.dump(clf, path)
+        joblib.dump(fe, training_service.feature_state_path(path))
+        child = {'id': 'child', 'status': 'ready', 'file_path': path,
+                 'metrics': {'data_cutoff_step': metrics['data_cutoff_step']}}
+        df.to_csv(self.upload, index=False)
+        _, fe, _ = training_service._train_warm_start(self.upload, params, child, lambda *a: None)
+        full = FraudFeatureEngineer().fit(df)
+        for key in ('orig_counts', 'dest_counts', 'last_step'):
+            self.assertEqual(fe.stats[key], full.stats[key])
+
+    def test_rejects_model_that_does_not_beat_parent(self):
+        parent = self.train_parent()
+        params = {'n_estimators': 5, 'early_stopping_rounds': 0, 'test_split': 0.2, 'warm_start_min_gain': 1.0}
+        with self.assertRaises(ModelRejected) as ctx:
+            training_service._train_warm_start(self.upload, params, parent, lambda *a: None)
+        self.assertIn('warm_start', ctx.exception.metrics)
+
+    def test_fails_clearly_on_single_fraud_delta(self):
+        parent = self.train_parent()
+        df = self.df.copy()
+        new_fraud = df.index[(df['step'] > self.cutoff) & (df['isFraud'] == 1)]
+        df.loc[new_fraud[1:], 'isFraud'] = 0
+        df.to_csv(self.upload, index=False)
+        params = {'n_estimators': 5, 'early_stopping_rounds': 0, 'test_split': 0.2}
+        with self.assertRaisesRegex(ValueError, "Too few frauds in the delta"):
+            training_service._train_warm_start(self.upload, params, parent, lambda *a: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
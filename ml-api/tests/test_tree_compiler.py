@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from tree_compiler import CompiledEnsemble, compile_model
+
+
+class TestTreeCompiler(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = pd.DataFrame(rng.random((2000, 6)), columns=[f"f{i}" for i in range(6)])
+        self.X.iloc[::9, 2] = np.nan
+        y = ((self.X['f0'] > 0.7) | (self.X['f2'].isna() & (self.X['f1'] > 0.5))).astype(int)
+        self.model = xgb.XGBClassifier(n_estimators=40, max_depth=5).fit(self.X, y)
+        self.compiled = CompiledEnsemble.from_model(self.model)
+
+    def test_matches_booster_on_batches_and_single_rows(self):
+        expected = self.model.predict_proba(self.X)[:, 1]
+        batch = self.compiled.predict(self.X)
+        self.assertLess(np.abs(batch - expected).max(), 1e-6)
+        self.assertGreater(np.mean(batch == expected), 0.99)
+        for i in (0, 9, 1999):
+            single = self.compiled.predict_proba(self.X.iloc[[i]])
+            self.assertEqual(single.shape, (1, 2))
+            self.assertAlmostEqual(float(single[0, 1]), float(expected[i]), places=6)
+
+    def test_iteration_range_and_column_order(self):
+        expected = self.model.predict_proba(self.X, iteration_range=(0, 5))[:, 1]
+        got = self.compiled.predict_proba(self.X[self.X.columns[::-1]], iteration_range=(0, 5))[:, 1]
+        self.assertLess(np.abs(got - expected).max(), 1e-6)
+
+    def test_compile_model_verifies_and_rejects_unsupported_models(self):
+        self.assertIsNotNone(compile_model(self.model, self.X.head(200)))
+        regressor = xgb.XGBRegressor(n_estimators=5).fit(self.X, self.X['f0'])
+        self.assertIsNone(compile_model(regressor, self.X.head(10)))
+        with self.assertRaises(ValueError):
+            CompiledEnsemble.from_model(regressor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,477 @@
+"""
+Training Queue Module
+Durable local queue of training jobs, executed in separate worker processes
+so that model training never competes with request handling in the API
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from utils.metrics import StageClock, metrics
+
+TRAINING_QUEUE_PATH = os.getenv("TRAINING_QUEUE_PATH", "training_jobs.db")
+# Jobs training at the same time (across all dispatchers sharing the database)
+TRAINING_MAX_CONCURRENT = int(os.getenv("TRAINING_MAX_CONCURRENT", "1"))
+# Attempts per job before a crashing job is marked failed
+TRAINING_MAX_ATTEMPTS = int(os.getenv("TRAINING_MAX_ATTEMPTS", "2"))
+# Scheduling priority of training processes (higher = nicer to the API)
+TRAINING_NICE = int(os.getenv("TRAINING_NICE", "10"))
+TRAINING_POLL_INTERVAL = float(os.getenv("TRAINING_POLL_INTERVAL", "1"))
+# Seconds a cancelled job gets to stop by itself before it is terminated
+TRAINING_CANCEL_GRACE = float(os.getenv("TRAINING_CANCEL_GRACE", "10"))
+
+JOB_STATES = ['queued', 'running', 'completed', 'failed', 'cancelled']
+FINISHED_STATES = ['completed', 'failed', 'cancelled']
+
+# Minimum seconds between progress writes within the same stage
+_PROGRESS_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS training_jobs (
+    id TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,
+    cancel_requested_at TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    updated_at TEXT,
+    stage_seconds TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_training_jobs_status ON training_jobs(status, created_at);
+"""
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class TrainingQueue:
+    """
+    Training jobs stored in SQLite and run by spawned worker processes.
+
+    The process running the background services (the API process, or the
+    pre-fork server's services process, which reloads leave running) runs
+    a dispatcher thread. Dispatchers coordinate through the database, which
+    makes claiming a job atomic and enforces the concurrency limit across
+    processes. Jobs survive restarts: a job whose worker
+    process died is requeued (up to TRAINING_MAX_ATTEMPTS) by the next
+    dispatcher tick. Workers report their stage and percent back to the
+    database and stop at the next report once cancellation was requested.
+    """
+
+    def __init__(self, path: str = TRAINING_QUEUE_PATH,
+                 max_concurrent: int = TRAINING_MAX_CONCURRENT,
+                 max_attempts: int = TRAINING_MAX_ATTEMPTS,
+                 nice: int = TRAINING_NICE,
+                 poll_interval: float = TRAINING_POLL_INTERVAL,
+                 cancel_grace: float = TRAINING_CANCEL_GRACE,
+                 target=None):
+        """
+        Initialize the queue (the database is created on first use)
+
+        Args:
+            path: SQLite database file
+            max_concurrent: Jobs running at once
+            max_attempts: Attempts before a crashing job is marked failed
+            nice: Niceness added to training processes
+            poll_interval: Seconds between dispatcher ticks
+            cancel_grace: Seconds before a cancelled job is terminated
+            target: Picklable function run in the worker process as
+                target(job_id, file_path, params, progress=...);
+                defaults to training_service.train_model
+        """
+        self.path = path
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.nice = nice
+        self.poll_interval = poll_interval
+        self.cancel_grace = cancel_grace
+        self.target = target
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit connection; multi-statement changes use BEGIN IMMEDIATE
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(training_jobs)")}
+                if 'stage_seconds' not in columns:
+                    # Queue databases created before stage timings were recorded
+                    try:
+                        conn.execute("ALTER TABLE training_jobs ADD COLUMN stage_seconds TEXT")
+                    except sqlite3.OperationalError:
+                        pass  # added by another process meanwhile
+                self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['cancel_requested'] = job.pop('cancel_requested_at') is not None
+        job['stage_seconds'] = json.loads(job['stage_seconds']) if job.get('stage_seconds') else None
+        return job
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def submit(self, job_id: str, file_path: str, params: Dict) -> Dict:
+        """Queue a training job"""
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO training_jobs (id, file_path, params, status, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, file_path, json.dumps(params), now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recent jobs first, optionally filtered by status"""
+        query = "SELECT * FROM training_jobs"
+        args: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            args = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._connect() as conn:
+            rows = conn.execute(query, args + (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> Dict:
+        """
+        Cancel a job: queued jobs are dropped, running jobs are asked to stop
+
+        Raises:
+            KeyError: If the job does not exist
+            ValueError: If the job already finished
+        """
+        now = _now()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                raise KeyError(job_id)
+            if row['status'] in FINISHED_STATES:
+                conn.execute("ROLLBACK")
+                raise ValueError(f"Job already {row['status']}")
+            if row['status'] == 'queued':
+                conn.execute(
+                    "UPDATE training_jobs SET status = 'cancelled', stage = 'cancelled', "
+                    "cancel_requested_at = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                    (now, now, now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE training_jobs SET cancel_requested_at = COALESCE(cancel_requested_at, ?), "
+                    "updated_at = ? WHERE id = ?",
+                    (now, now, job_id)
+                )
+            conn.execute("COMMIT")
+        return self.get(job_id)
+
+    def report(self, job_id: str, stage: str, progress: float) -> bool:
+        """
+        Record the stage and percent of a running job (worker side)
+
+        Returns:
+            True if the job should stop (cancellation was requested)
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE training_jobs SET stage = ?, progress = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (stage, round(float(progress), 2), _now(), job_id)
+            )
+            row = conn.execute("SELECT cancel_requested_at FROM training_jobs WHERE id = ?",
+                               (job_id,)).fetchone()
+        return row is not None and row['cancel_requested_at'] is not None
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None,
+               stage_seconds: Optional[Dict[str, float]] = None) -> None:
+        """Mark a running job as finished (completed, failed or cancelled), with its seconds per stage"""
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE training_jobs SET status = ?, stage = ?, error = ?, pid = NULL, "
+                "progress = CASE WHEN ? = 'completed' THEN 100 ELSE progress END, "
+                "finished_at = ?, updated_at = ?, stage_seconds = COALESCE(?, stage_seconds) "
+                "WHERE id = ? AND status = 'running'",
+                (status, status, error, status, now, now,
+                 json.dumps(stage_seconds) if stage_seconds else None, job_id)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in every state"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM training_jobs GROUP BY status").fetchall()
+        return {**{state: 0 for state in JOB_STATES}, **{row[0]: row[1] for row in rows}}
+
+    def _claim_next(self) -> Optional[Dict]:
+        """Atomically move the oldest queued job to running, within the concurrency limit"""
+        now = _now()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            running = conn.execute(
+                "SELECT COUNT(*) FROM training_jobs WHERE status = 'running'").fetchone()[0]
+            row = None
+            if running < self.max_concurrent:
+                row = conn.execute(
+                    "SELECT * FROM training_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            # The dispatcher owns the job until the worker's pid is known
+            conn.execute(
+                "UPDATE training_jobs SET status = 'running', stage = 'starting', progress = 0, "
+                "attempts = attempts + 1, pid = ?, error = NULL, started_at = ?, updated_at = ? WHERE id = ?",
+                (os.getpid(), now, now, row['id'])
+            )
+            conn.execute("COMMIT")
+        return self.get(row['id'])
+
+    def _set_pid(self, job_id: str, pid: int) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE training_jobs SET pid = ? WHERE id = ? AND status = 'running'",
+                         (pid, job_id))
+
+    def _requeue(self, job_id: str, stage: str, count_attempt: bool = True) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE training_jobs SET status = 'queued', stage = ?, pid = NULL, progress = 0, "
+                "attempts = attempts - ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (stage, 0 if count_attempt else 1, _now(), job_id)
+            )
+
+    # ------------------------------------------------------------------
+    # Dispatcher
+    # ------------------------------------------------------------------
+
+    def recover(self) -> List[Dict]:
+        """
+        Handle running jobs whose worker process is gone
+
+        A job cancelled while its worker died is marked cancelled; otherwise
+        it is requeued, or marked failed after max_attempts.
+
+        Returns:
+            Jobs that ended (failed or cancelled) because of this
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM training_jobs WHERE status = 'running'").fetchall()
+        ended = []
+        for row in rows:
+            if row['id'] in self._processes or _pid_alive(row['pid']):
+                continue
+            if row['cancel_requested_at'] is not None:
+                self.finish(row['id'], 'cancelled', "Cancelled")
+            elif row['attempts'] < self.max_attempts:
+                print(f"⚠️ Training job {row['id']} lost its worker, requeueing "
+                      f"(attempt {row['attempts'] + 1}/{self.max_attempts})")
+                self._requeue(row['id'], 'requeued after worker crash')
+                continue
+            else:
+                self.finish(row['id'], 'failed', f"Worker process died ({row['attempts']} attempts)")
+            ended.append(self.get(row['id']))
+        return ended
+
+    def tick(self) -> None:
+        """One dispatcher pass: reap, enforce cancellations, recover, start jobs"""
+        for job_id, process in list(self._processes.items()):
+            if not process.is_alive():
+                process.join()
+                del self._processes[job_id]
+                self._observe_stages(job_id)
+
+        with self._connect() as conn:
+            cancelled = conn.execute(
+                "SELECT id, pid, cancel_requested_at FROM training_jobs "
+                "WHERE status = 'running' AND cancel_requested_at IS NOT NULL"
+            ).fetchall()
+        for row in cancelled:
+            requested = datetime.fromisoformat(row['cancel_requested_at'].rstrip('Z'))
+            waited = (datetime.utcnow() - requested).total_seconds()
+            if waited >= self.cancel_grace and _pid_alive(row['pid']) and row['pid'] != os.getpid():
+                # SIGTERM stops the worker at its next Python instruction;
+                # SIGKILL if it is stuck in native code for much longer
+                sig = signal.SIGKILL if waited >= 3 * self.cancel_grace else signal.SIGTERM
+                try:
+                    os.kill(row['pid'], sig)
+                except ProcessLookupError:
+                    pass
+
+        for job in self.recover():
+            _mark_registry_failed(job['id'], job['error'] or job['status'])
+
+        while not self._stop.is_set():
+            job = self._claim_next()
+            if job is None:
+                break
+            self._spawn(job)
+
+    def _observe_stages(self, job_id: str) -> None:
+        """Add a finished job's stage timings to this process's metrics (it ran in a worker process)"""
+        job = self.get(job_id)
+        if job is None or not job['stage_seconds']:
+            return
+        for stage, seconds in job['stage_seconds'].items():
+            metrics.observe(f"training.{stage}", seconds)
+
+    def _spawn(self, job: Dict) -> None:
+        # Spawned (not forked) so the worker does not inherit the API's
+        # threads, sockets and model memory
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(
+            target=run_job, args=(self.path, job['id'], self.nice, self.target),
+            name=f"train-{job['id'][:8]}", daemon=True
+        )
+        try:
+            process.start()
+        except Exception as e:
+            print(f"❌ Could not start training worker for job {job['id']}: {e}")
+            self.finish(job['id'], 'failed', f"Could not start worker: {e}")
+            _mark_registry_failed(job['id'], str(e))
+            return
+        self._processes[job['id']] = process
+        self._set_pid(job['id'], process.pid)
+        print(f"🏋️ Training job {job['id']} started in process {process.pid}")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"⚠️ Training dispatcher error: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Start the dispatcher thread of this process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="training-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the dispatcher and this process's workers
+
+        Interrupted jobs go back to the queue without using up an attempt.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for job_id, process in list(self._processes.items()):
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+                self._requeue(job_id, 'requeued after shutdown', count_attempt=False)
+            del self._processes[job_id]
+
+
+def _mark_registry_failed(job_id: str, error: str) -> None:
+    try:
+        from training_service import set_job_status
+        set_job_status(job_id, "failed", metrics={"error": error})
+    except Exception as e:
+        print(f"❌ Failed to update registry for job {job_id}: {e}")
+
+
+def run_job(path: str, job_id: str, nice: int = 0, target=None) -> None:
+    """Entry point of a training worker process"""
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+    queue = TrainingQueue(path, nice=nice)
+    job = queue.get(job_id)
+    if job is None:
+        return
+
+    from training_service import TrainingCancelled
+    if target is None:
+        from training_service import train_model as target
+
+    last = {"stage": None, "at": 0.0}
+    clock = StageClock()
+
+    def progress(stage: str, percent: float) -> None:
+        clock.mark(stage)
+        now = time.monotonic()
+        if stage == last["stage"] and now - last["at"] < _PROGRESS_INTERVAL:
+            return
+        last.update(stage=stage, at=now)
+        if queue.report(job_id, stage, percent):
+            raise TrainingCancelled()
+
+    def on_sigterm(signum, frame):
+        # Terminated after a cancel request, or by an API shutdown (the job
+        # is then requeued by the dispatcher, so record nothing here)
+        job = queue.get(job_id)
+        if job is not None and job['cancel_requested']:
+            raise TrainingCancelled()
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    start = time.perf_counter()
+    try:
+        target(job_id, job['file_path'], job['params'], progress=progress)
+    except TrainingCancelled:
+        queue.finish(job_id, 'cancelled', "Cancelled")
+        return
+    except Exception as e:
+        queue.finish(job_id, 'failed', str(e))
+        return
+    # Only completed jobs report stage timings, so a failure part-way does not skew them
+    clock.mark(None)
+    queue.finish(job_id, 'completed', stage_seconds={**clock.seconds, "total": time.perf_counter() - start})
+
+
+training_queue = TrainingQueue()
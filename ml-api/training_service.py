@@ -1,19 +1,20 @@
 import os
 import time
 import json
+import copy
+import shutil
 import joblib
 import pandas as pd
 import numpy as np
 import xgboost as xgb
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split, RandomizedSearchCV, cross_val_predict
-from sklearn.metrics import precision_recall_curve, classification_report, accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import precision_recall_curve, classification_report, accuracy_score, f1_score, precision_score, recall_score, average_precision_score
 try:
     from imblearn.over_sampling import SMOTE
 except ImportError:
     SMOTE = None
 
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
 # Import local modules
@@ -25,16 +26,45 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
     from feature_engineering import FraudFeatureEngineer
 
+from external_memory import (
+    TRAINING_CHUNK_ROWS, TRAINING_WORK_DIR, TRAIN, VALIDATION, TEST,
+    prepare_transactions, use_streaming, plan_splits, fit_feature_engineer_streaming,
+    write_feature_shards, external_memory_matrix,
+)
+from feature_cache import FeatureSet, cache_key, feature_cache
+from hyperparameter_search import run_search
+from model_benchmark import benchmark_model, replay_rows
+from cascade import calibrate_cascade, evaluate_cascade, save_cascade
+from inference import feature_state_path
+from utils.db import create_database
+
 load_dotenv()
 
-# Initialize Supabase client
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Use Service Role Key for backend updates
-supabase: Client = create_client(url, key) if url and key else None
+# Database client (async PostgREST over Supabase)
+db = create_database()
+
+# Threads per training job (unset = the cores not reserved for serving)
+TRAINING_THREADS = os.getenv("TRAINING_THREADS")
+
+
+def training_thread_budget() -> int:
+    """
+    Number of threads one training job may use
+
+    TRAINING_THREADS if set. Otherwise the cores left after reserving
+    WORKERS x PREFORK_WORKER_THREADS for serving, shared between the
+    TRAINING_MAX_CONCURRENT jobs that may run at once.
+    """
+    if TRAINING_THREADS:
+        return max(1, int(TRAINING_THREADS))
+    cores = os.cpu_count() or 1
+    serving = int(os.getenv("WORKERS", "1")) * int(os.getenv("PREFORK_WORKER_THREADS", "1"))
+    concurrent = max(1, int(os.getenv("TRAINING_MAX_CONCURRENT", "1")))
+    return max(1, (cores - serving) // concurrent)
 
-def update_job_status(job_id: str, status: str, metrics: dict = None, file_path: str = None):
+async def update_job_status(job_id: str, status: str, metrics: dict = None, file_path: str = None):
     """Update job status in Supabase"""
-    if not supabase:
+    if not db:
         print(f"⚠️ Supabase not configured. Job {job_id} status: {status}")
         return
 
@@ -45,7 +75,7 @@ def update_job_status(job_id: str, status: str, metrics: dict = None, file_path:
         data["file_path"] = file_path
     
     try:
-        supabase.table("model_registry").update(data).eq("id", job_id).execute()
+        await db.update("model_registry", data, {"id": job_id})
     except Exception as e:
         print(f"❌ Failed to update Supabase for job {job_id}: {str(e)}")
 
@@ -85,109 +115,642 @@ def make_splits(df, test_frac=0.05, time_col='step', min_test_fraud=100, random_
         y_test = test_df['isFraud']
         return X_train.reset_index(drop=True), X_test.reset_index(drop=True), y_train.reset_index(drop=True), y_test.reset_index(drop=True)
 
-async def train_model_async(job_id: str, file_path: str, params: dict):
+def temporal_holdout(X, y, frac=0.1, time_col='step', min_val_fraud=20, random_state=42):
     """
-    Background task to train model
+    Split the latest `frac` of the training period off for early stopping
+
+    Returns: X_fit, X_val, y_fit, y_val
     """
-    print(f"🚀 Starting training job {job_id} with params: {params}")
-    update_job_status(job_id, "training")
-    
+    n_val = int(len(X) * frac)
+    if time_col in X.columns and n_val > 0:
+        order = np.argsort(X[time_col].to_numpy(), kind='mergesort')
+        fit_idx, val_idx = order[:-n_val], order[-n_val:]
+        if y.iloc[val_idx].sum() >= min_val_fraud and y.iloc[fit_idx].sum() > 0:
+            return (X.iloc[fit_idx].reset_index(drop=True), X.iloc[val_idx].reset_index(drop=True),
+                    y.iloc[fit_idx].reset_index(drop=True), y.iloc[val_idx].reset_index(drop=True))
+
+    # Fallback to a stratified split if the latest slice has too few frauds
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=frac, stratify=y, random_state=random_state)
+    return X_fit.reset_index(drop=True), X_val.reset_index(drop=True), y_fit.reset_index(drop=True), y_val.reset_index(drop=True)
+
+class TrainingCancelled(Exception):
+    """Raised by a progress callback when the job was cancelled"""
+
+
+class _ProgressCallback(xgb.callback.TrainingCallback):
+    """Reports boosting progress (one call per tree) to the job's progress callback"""
+
+    def __init__(self, progress, n_estimators: int, start: float, end: float):
+        super().__init__()
+        self.progress = progress
+        self.n_estimators = max(1, n_estimators)
+        self.start = start
+        self.end = end
+
+    def after_iteration(self, model, epoch, evals_log):
+        done = (epoch + 1) / self.n_estimators
+        self.progress("training", self.start + (self.end - self.start) * done)
+        return False
+
+
+def set_job_status(job_id: str, status: str, metrics: dict = None, file_path: str = None):
+    """Update job status in Supabase from synchronous code (worker processes)"""
+    if not db:
+        print(f"⚠️ Supabase not configured. Job {job_id} status: {status}")
+        return
+    db.run_sync(update_job_status(job_id, status, metrics=metrics, file_path=file_path))
+
+
+def _classifier_from_booster(trained: xgb.Booster, **params) -> xgb.XGBClassifier:
+    """XGBClassifier (with the given sklearn parameters) holding a trained booster, e.g. a slice of one"""
+    clf = xgb.XGBClassifier(**params)
+    clf.load_model(bytearray(trained.save_raw('json')))
+    return clf
+
+
+def _calibrate_cascade(clf, X_val, y_val, X_test, y_test) -> dict:
+    """
+    Screening trees and threshold for cascade scoring (a failure is recorded, not raised)
+
+    Calibrated on the validation split; its recall is reported on the test
+    split under 'test', which the calibration never sees.
+    """
+    if X_val is None or len(X_val) == 0:
+        return {"skipped": "no validation split to calibrate on (early stopping is off)"}
     try:
-        # 1. Load Data
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Dataset not found at {file_path}")
-            
-        df = pd.read_csv(file_path)
-        
-        # Basic Preprocessing
-        if 'oldbalanceOrg' in df.columns:
-            df = df.rename(columns={'oldbalanceOrg':'oldBalanceOrig', 'newbalanceOrig':'newBalanceOrig', 
-                                    'oldbalanceDest':'oldBalanceDest', 'newbalanceDest':'newBalanceDest'})
-            
-        # Filter types if needed (Notebook filters to TRANSFER/CASH_OUT)
-        # We'll stick to what the notebook did for consistency
-        if 'type' in df.columns:
-            df = df[df['type'].isin(['TRANSFER', 'CASH_OUT'])].reset_index(drop=True)
-            
-        # 2. Split Data
-        test_frac = params.get('test_split', 0.05)
-        X_train, X_test, y_train, y_test = make_splits(df, test_frac=test_frac)
-        
+        calibration = calibrate_cascade(clf, X_val, y_val)
+        if 'threshold' in calibration:
+            calibration["test"] = evaluate_cascade(clf, X_test, y_test, calibration)
+        return calibration
+    except Exception as e:
+        print(f"⚠️ Cascade calibration failed: {str(e)}")
+        return {"skipped": str(e)}
+
+def _prepare_features(file_path: str, params: dict, report) -> FeatureSet:
+    """Load and split the upload, fit the feature engineer and transform every split"""
+    df = prepare_transactions(pd.read_csv(file_path))
+    data_cutoff_step = int(df['step'].max()) if 'step' in df.columns and len(df) else None
+
+    # 2. Split Data
+    report("splitting", 10)
+    test_frac = params.get('test_split', 0.05)
+    X_train, X_test, y_train, y_test = make_splits(df, test_frac=test_frac)
+    
+    # Latest slice of the training period drives early stopping
+    early_stopping_rounds = int(params.get('early_stopping_rounds', 50))
+    validation_split = float(params.get('validation_split', 0.1))
+    use_early_stopping = early_stopping_rounds > 0 and validation_split > 0
+    if use_early_stopping:
+        X_train, X_val, y_train, y_val = temporal_holdout(X_train, y_train, frac=validation_split)
+        print(f"📊 Data split: Train={len(X_train)}, Validation={len(X_val)}, Test={len(X_test)}")
+    else:
         print(f"📊 Data split: Train={len(X_train)}, Test={len(X_test)}")
-        
-        # 3. Feature Engineering
-        pagerank_limit = params.get('pagerank_limit', 10000)
-        advanced_features = params.get('advanced_feature_engineering', False)
-        fe = FraudFeatureEngineer(pagerank_limit=pagerank_limit, advanced_features=advanced_features)
-        
-        print("⚙️ Fitting feature engineer...")
-        fe.fit(X_train, y_train)
-        X_train_trans = fe.transform(X_train)
-        X_test_trans = fe.transform(X_test)
-        
-        # Apply Advanced Preprocessing (SMOTE) if requested
-        if params.get('advanced_preprocessing'):
-            if SMOTE:
-                print("⚖️ Applying SMOTE for class imbalance...")
-                try:
-                    smote = SMOTE(random_state=42)
-                    X_train_trans, y_train = smote.fit_resample(X_train_trans, y_train)
-                    print(f"   New training shape: {X_train_trans.shape}")
-                except Exception as e:
-                    print(f"⚠️ SMOTE failed: {str(e)}. Proceeding with original data.")
-            else:
-                print("⚠️ SMOTE requested but imbalanced-learn not installed. Proceeding without it.")
+    
+    # 3. Feature Engineering
+    report("feature_engineering", 15)
+    pagerank_limit = params.get('pagerank_limit', 10000)
+    advanced_features = params.get('advanced_feature_engineering', False)
+    fe = FraudFeatureEngineer(pagerank_limit=pagerank_limit, advanced_features=advanced_features)
+    
+    print("⚙️ Fitting feature engineer...")
+    fe.fit(X_train, y_train)
+    return FeatureSet(
+        X_train=fe.transform(X_train), y_train=y_train,
+        X_test=fe.transform(X_test), y_test=y_test, fe=fe,
+        steps_train=X_train['step'].to_numpy() if 'step' in X_train.columns else None,
+        X_val=fe.transform(X_val) if use_early_stopping else None,
+        y_val=y_val if use_early_stopping else None,
+        data_cutoff_step=data_cutoff_step,
+    )
+
+
+def _train_in_memory(file_path: str, params: dict, report, progress=None):
+    """
+    Train on the whole upload loaded into memory
+
+    Returns:
+        (fitted XGBClassifier, fitted feature engineer, metrics)
+    """
+    # 1-3. Load, split and engineer features (or reuse a cached result)
+    prepare_start = time.time()
+    key = None
+    features = None
+    if params.get('feature_cache', True) and feature_cache.enabled:
+        key = cache_key(file_path, params)
+        features = feature_cache.load(key)
+    cache_state = "off" if key is None else ("hit" if features is not None else "miss")
+    if features is None:
+        features = _prepare_features(file_path, params, report)
+        if key is not None:
+            feature_cache.save(key, features)
+    else:
+        print(f"♻️ Reusing cached features {key} (feature version {features.fe.version})")
+    prepare_seconds = time.time() - prepare_start
+
+    X_train_trans, y_train = features.X_train, features.y_train
+    X_val_trans, y_val = features.X_val, features.y_val
+    X_test_trans, y_test = features.X_test, features.y_test
+    early_stopping_rounds = int(params.get('early_stopping_rounds', 50))
+    use_early_stopping = X_val_trans is not None
+
+    # Optional search: every trial reuses the transformed training matrix
+    search = None
+    if params.get('search'):
+        report("searching", 20)
+        search = run_search(
+            X_train_trans, y_train, features.steps_train,
+            strategy=params['search'], n_trials=int(params.get('search_trials', 12)),
+            n_folds=int(params.get('search_folds', 3)),
+            max_estimators=int(params.get('n_estimators', 300)), threads=training_thread_budget(),
+            progress=lambda done, total: report("searching", 20 + 20 * done / total),
+        )
+        params = {**params, **search['best_params']}
+    
+    # Apply Advanced Preprocessing (SMOTE) if requested
+    if params.get('advanced_preprocessing'):
+        report("resampling", 40)
+        if SMOTE:
+            print("⚖️ Applying SMOTE for class imbalance...")
+            try:
+                smote = SMOTE(random_state=42)
+                X_train_trans, y_train = smote.fit_resample(X_train_trans, y_train)
+                print(f"   New training shape: {X_train_trans.shape}")
+            except Exception as e:
+                print(f"⚠️ SMOTE failed: {str(e)}. Proceeding with original data.")
+        else:
+            print("⚠️ SMOTE requested but imbalanced-learn not installed. Proceeding without it.")
+
+    # 4. Configure XGBoost
+    # Calculate scale_pos_weight
+    neg = (y_train == 0).sum()
+    pos = (y_train == 1).sum()
+    spw = int(max(1, neg / max(1, pos)))
+    
+    threads = training_thread_budget()
+    xgb_params = {
+        'objective': 'binary:logistic',
+        'tree_method': 'hist',
+        'random_state': 42,
+        'n_jobs': threads,
+        'n_estimators': int(params.get('n_estimators', 300)),
+        'max_depth': int(params.get('max_depth', 6)),
+        'learning_rate': float(params.get('learning_rate', 0.05)),
+        'scale_pos_weight': spw
+    }
+    if use_early_stopping:
+        xgb_params['early_stopping_rounds'] = early_stopping_rounds
+        xgb_params['eval_metric'] = 'aucpr'
+    
+    clf = xgb.XGBClassifier(**xgb_params)
+    if progress is not None:
+        clf.set_params(callbacks=[_ProgressCallback(progress, xgb_params['n_estimators'], 45, 90)])
+    
+    # 5. Train
+    report("training", 45)
+    print(f"🏋️ Training classifier ({threads} threads)...")
+    fit_start = time.time()
+    if use_early_stopping:
+        clf.fit(X_train_trans, y_train, eval_set=[(X_val_trans, y_val)], verbose=False)
+    else:
+        clf.fit(X_train_trans, y_train)
+    train_seconds = time.time() - fit_start
+    # Callbacks hold the job's progress reporter; do not pickle them
+    clf.set_params(callbacks=None)
+
+    trees_built = clf.get_booster().num_boosted_rounds()
+    trees_used = trees_built
+    best_validation_aucpr = None
+    if use_early_stopping:
+        trees_used = clf.best_iteration + 1
+        best_validation_aucpr = float(clf.best_score)
+        clf.set_params(early_stopping_rounds=None)
+        if trees_used < trees_built:
+            # Drop the trees past the best iteration so predict, SHAP and
+            # bulk scoring all see the same model
+            clf = _classifier_from_booster(clf.get_booster()[:trees_used], **clf.get_params())
+    print(f"   Trained {trees_built} trees in {train_seconds:.1f}s, keeping {trees_used}")
+    
+    # 6. Evaluate
+    report("evaluating", 90)
+    print("📝 Evaluating...")
+    y_pred = clf.predict(X_test_trans)
+    
+    metrics = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "precision": float(precision_score(y_test, y_pred)),
+        "recall": float(recall_score(y_test, y_pred)),
+        "f1": float(f1_score(y_test, y_pred)),
+        "n_estimators": xgb_params['n_estimators'],
+        "trees_used": trees_used,
+        "early_stopped": trees_built < xgb_params['n_estimators'],
+        "best_validation_aucpr": best_validation_aucpr,
+        "threads": threads,
+        "train_rows": int(len(X_train_trans)),
+        "train_seconds": round(train_seconds, 3),
+        "train_rows_per_second": int(len(X_train_trans) / train_seconds) if train_seconds > 0 else None,
+        "feature_cache": cache_state,
+        "prepare_seconds": round(prepare_seconds, 3),
+        "data_cutoff_step": features.data_cutoff_step,
+    }
+    if search is not None:
+        metrics["search"] = search
+    metrics["cascade"] = _calibrate_cascade(clf, X_val_trans, y_val, X_test_trans, y_test)
+    return clf, features.fe, metrics
+
+def _train_streaming(job_id: str, file_path: str, params: dict, report, progress=None):
+    """
+    Train out-of-core: the upload is read in chunks, the feature engineer is
+    fitted incrementally and XGBoost trains from float32 feature shards on
+    disk through its external-memory interface. Peak memory is bounded by
+    TRAINING_CHUNK_ROWS and the per-account feature state, not the upload.
+
+    Returns:
+        (fitted XGBClassifier, fitted feature engineer, metrics)
+    """
+    chunk_rows = int(params.get('chunk_rows') or TRAINING_CHUNK_ROWS)
+    test_frac = params.get('test_split', 0.05)
+    early_stopping_rounds = int(params.get('early_stopping_rounds', 50))
+    validation_split = float(params.get('validation_split', 0.1))
+    use_early_stopping = early_stopping_rounds > 0 and validation_split > 0
+    if params.get('advanced_preprocessing'):
+        print("⚠️ SMOTE is not supported for out-of-core training. Proceeding without it.")
+    if params.get('search'):
+        print("⚠️ Hyperparameter search is not supported for out-of-core training. Using the given parameters.")
+
+    # 2. Split Data (one pass over step / label)
+    report("splitting", 5)
+    plan, summary = plan_splits(file_path, test_frac=test_frac,
+                                validation_frac=validation_split if use_early_stopping else 0.0,
+                                chunk_rows=chunk_rows)
+    n_chunks = max(1, -(-summary['rows'] // chunk_rows))
+    print(f"📊 Streaming {summary['rows']} rows in {n_chunks} chunks of {chunk_rows}")
+
+    # 3. Feature Engineering (one pass to fit, one to write shards)
+    report("feature_engineering", 10)
+    fe = FraudFeatureEngineer(pagerank_limit=params.get('pagerank_limit', 10000),
+                              advanced_features=params.get('advanced_feature_engineering', False))
+    print("⚙️ Fitting feature engineer incrementally...")
+    fit_feature_engineer_streaming(fe, file_path, plan, chunk_rows,
+                                   progress=lambda i: report("feature_engineering", 10 + 15 * (i + 1) / n_chunks))
+
+    work_dir = os.path.join(TRAINING_WORK_DIR, str(job_id))
+    dtrain = None
+    try:
+        shards = write_feature_shards(fe, file_path, plan, work_dir, chunk_rows,
+                                      progress=lambda i: report("feature_engineering", 25 + 20 * (i + 1) / n_chunks))
+        if shards.rows[TRAIN] == 0 or shards.rows[TEST] == 0:
+            raise ValueError("Not enough rows to split into training and test sets")
+        print(f"📊 Data split: Train={shards.rows[TRAIN]}, Validation={shards.rows[VALIDATION]}, "
+              f"Test={shards.rows[TEST]}")
 
         # 4. Configure XGBoost
-        # Calculate scale_pos_weight
-        neg = (y_train == 0).sum()
-        pos = (y_train == 1).sum()
+        pos = shards.frauds[TRAIN]
+        neg = shards.rows[TRAIN] - pos
         spw = int(max(1, neg / max(1, pos)))
-        
-        xgb_params = {
+        threads = training_thread_budget()
+        n_estimators = int(params.get('n_estimators', 300))
+        booster_params = {
             'objective': 'binary:logistic',
             'tree_method': 'hist',
-            'random_state': 42,
-            'n_jobs': 1,
-            'n_estimators': int(params.get('n_estimators', 300)),
+            'seed': 42,
+            'nthread': threads,
             'max_depth': int(params.get('max_depth', 6)),
-            'learning_rate': float(params.get('learning_rate', 0.05)),
-            'scale_pos_weight': spw
+            'eta': float(params.get('learning_rate', 0.05)),
+            'scale_pos_weight': spw,
         }
-        
-        clf = xgb.XGBClassifier(**xgb_params)
-        
+        dtrain = external_memory_matrix(shards, TRAIN)
+        evals = []
+        X_val = y_val = None
+        if use_early_stopping and shards.rows[VALIDATION] > 0:
+            X_val, y_val = shards.load(VALIDATION)
+            evals = [(xgb.DMatrix(X_val, label=y_val, feature_names=shards.feature_names, nthread=threads),
+                      'validation')]
+            X_val = pd.DataFrame(X_val, columns=shards.feature_names)
+            booster_params['eval_metric'] = 'aucpr'
+        callbacks = [_ProgressCallback(progress, n_estimators, 45, 90)] if progress is not None else None
+
         # 5. Train
-        print("🏋️ Training classifier...")
-        clf.fit(X_train_trans, y_train)
-        
+        report("training", 45)
+        print(f"🏋️ Training classifier out-of-core ({threads} threads)...")
+        fit_start = time.time()
+        booster = xgb.train(booster_params, dtrain, num_boost_round=n_estimators, evals=evals,
+                            early_stopping_rounds=early_stopping_rounds if evals else None,
+                            callbacks=callbacks, verbose_eval=False)
+        train_seconds = time.time() - fit_start
+
+        trees_built = booster.num_boosted_rounds()
+        trees_used = trees_built
+        best_validation_aucpr = None
+        if evals:
+            trees_used = booster.best_iteration + 1
+            best_validation_aucpr = float(booster.best_score)
+            if trees_used < trees_built:
+                booster = booster[:trees_used]
+        print(f"   Trained {trees_built} trees in {train_seconds:.1f}s, keeping {trees_used}")
+
+        # Same estimator type as in-memory training, so inference is unchanged
+        clf = _classifier_from_booster(booster)
+
         # 6. Evaluate
+        report("evaluating", 90)
         print("📝 Evaluating...")
-        y_pred = clf.predict(X_test_trans)
-        
-        metrics = {
-            "accuracy": float(accuracy_score(y_test, y_pred)),
-            "precision": float(precision_score(y_test, y_pred)),
-            "recall": float(recall_score(y_test, y_pred)),
-            "f1": float(f1_score(y_test, y_pred))
-        }
+        X_test, y_test = shards.load(TEST)
+        X_test = pd.DataFrame(X_test, columns=shards.feature_names)
+        y_pred = clf.predict(X_test)
+        cascade = _calibrate_cascade(clf, X_val, y_val, X_test, y_test)
+    finally:
+        # Release XGBoost's page cache before its files are removed
+        dtrain = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "precision": float(precision_score(y_test, y_pred)),
+        "recall": float(recall_score(y_test, y_pred)),
+        "f1": float(f1_score(y_test, y_pred)),
+        "n_estimators": n_estimators,
+        "trees_used": trees_used,
+        "early_stopped": trees_built < n_estimators,
+        "best_validation_aucpr": best_validation_aucpr,
+        "threads": threads,
+        "train_rows": int(shards.rows[TRAIN]),
+        "train_seconds": round(train_seconds, 3),
+        "train_rows_per_second": int(shards.rows[TRAIN] / train_seconds) if train_seconds > 0 else None,
+        "streaming": True,
+        "chunk_rows": chunk_rows,
+        "data_cutoff_step": summary.get('max_step'),
+        "cascade": cascade,
+    }
+    return clf, fe, metrics
+
+class ModelRejected(Exception):
+    """Raised when a trained model does not pass its comparison against the parent"""
+
+    def __init__(self, message: str, metrics: dict):
+        super().__init__(message)
+        self.metrics = metrics
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Models")
+
+
+def model_file_path(registry_path: str) -> str:
+    """Absolute path of a registry file_path (stored relative to the ml-api directory)"""
+    if os.path.isabs(registry_path):
+        return registry_path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), registry_path)
+
+
+def resolve_parent_model(params: dict) -> dict:
+    """
+    Registry entry a warm-start job continues from
+
+    params['parent_model_id'] if given, else the active model.
+
+    Raises:
+        ValueError: If there is no usable parent
+    """
+    if not db:
+        raise ValueError("Warm start needs the model registry (Supabase not configured)")
+    parent_id = params.get('parent_model_id')
+    filters = {"id": parent_id} if parent_id else {"is_active": True}
+    parent = db.run_sync(db.select_one("model_registry", filters))
+    if parent is None:
+        raise ValueError(f"Parent model {parent_id} not found" if parent_id else "No active model to warm-start from")
+    if parent.get('status') != 'ready' or not parent.get('file_path'):
+        raise ValueError(f"Parent model {parent['id']} is not ready")
+    if (parent.get('metrics') or {}).get('data_cutoff_step') is None:
+        raise ValueError(f"Parent model {parent['id']} has no recorded data cutoff; train it once on the full history")
+    return parent
+
+
+def _train_warm_start(file_path: str, params: dict, parent: dict, report, progress=None):
+    """
+    Continue boosting the parent model on the transactions after its cutoff
+
+    The parent's feature state is refreshed with the new training rows
+    (FraudFeatureEngineer.update) and the parent's trees are extended via
+    xgb_model. The latest test_split of the new rows is a holdout shared by
+    parent and child; the child is rejected unless its aucpr there is at
+    least the parent's (plus warm_start_min_gain). The returned state is
+    refreshed with all new rows, validation and holdout included, since
+    the next warm start only reads rows after this one's cutoff.
+
+    Returns:
+        (fitted XGBClassifier, refreshed feature engineer, metrics)
+
+    Raises:
+        ModelRejected: If the child does not beat the parent on the holdout
+    """
+    parent_path = model_file_path(parent['file_path'])
+    state_path = feature_state_path(parent_path)
+    if not os.path.exists(state_path):
+        raise ValueError(f"Parent model {parent['id']} has no saved feature state")
+    parent_clf = joblib.load(parent_path)
+    parent_fe = joblib.load(state_path)
+    cutoff = int(parent['metrics']['data_cutoff_step'])
+
+    df = prepare_transactions(pd.read_csv(file_path))
+    if 'step' not in df.columns:
+        raise ValueError("Warm start needs a step column to find the new transactions")
+    delta = df[df['step'] > cutoff].reset_index(drop=True)
+    if delta.empty:
+        raise ValueError(f"No transactions after the parent's cutoff step {cutoff}")
+    # One fraud for the holdout and one to learn from; with fewer, the
+    # stratified fallback of make_splits cannot split the delta either
+    delta_fraud = int(delta['isFraud'].sum()) if 'isFraud' in delta.columns else 0
+    if delta_fraud < 2:
+        raise ValueError(f"Too few frauds in the delta: {len(delta)} transactions after step {cutoff} "
+                         f"hold {delta_fraud}, warm start needs at least 2")
+
+    # 2. Split the new rows: latest slice is the shared holdout
+    report("splitting", 10)
+    X_train, X_hold, y_train, y_hold = make_splits(delta, test_frac=params.get('test_split', 0.05),
+                                                   min_test_fraud=1)
+    early_stopping_rounds = int(params.get('early_stopping_rounds', 50))
+    validation_split = float(params.get('validation_split', 0.1))
+    use_early_stopping = early_stopping_rounds > 0 and validation_split > 0 and y_train.sum() >= 2
+    X_val = y_val = None
+    if use_early_stopping:
+        X_train, X_val, y_train, y_val = temporal_holdout(X_train, y_train, frac=validation_split, min_val_fraud=1)
+    print(f"📊 Warm start from {parent['id']} (cutoff step {cutoff}): {len(delta)} new rows, "
+          f"Train={len(X_train)}, Holdout={len(X_hold)}")
+
+    # 3. Refresh the feature state with the new training rows
+    report("feature_engineering", 15)
+    fe = copy.deepcopy(parent_fe).update(X_train)
+    X_train_trans = fe.transform(X_train)
+    parent_features = list(parent_clf.get_booster().feature_names or [])
+    if parent_features and list(X_train_trans.columns) != parent_features:
+        raise ValueError("Engineered features differ from the parent model's; train from scratch instead")
+
+    # 4. Continue boosting
+    neg = (y_train == 0).sum()
+    pos = (y_train == 1).sum()
+    threads = training_thread_budget()
+    parent_trees = parent_clf.get_booster().num_boosted_rounds()
+    xgb_params = {
+        'objective': 'binary:logistic',
+        'tree_method': 'hist',
+        'random_state': 42,
+        'n_jobs': threads,
+        'n_estimators': int(params.get('n_estimators', 300)),
+        'max_depth': int(params.get('max_depth', 6)),
+        'learning_rate': float(params.get('learning_rate', 0.05)),
+        'scale_pos_weight': int(max(1, neg / max(1, pos))),
+    }
+    if use_early_stopping:
+        xgb_params['early_stopping_rounds'] = early_stopping_rounds
+        xgb_params['eval_metric'] = 'aucpr'
+    clf = xgb.XGBClassifier(**xgb_params)
+    if progress is not None:
+        clf.set_params(callbacks=[_ProgressCallback(progress, xgb_params['n_estimators'], 45, 90)])
+
+    report("training", 45)
+    print(f"🏋️ Adding up to {xgb_params['n_estimators']} trees to {parent_trees} ({threads} threads)...")
+    fit_start = time.time()
+    fit_kwargs = {'xgb_model': parent_clf.get_booster()}
+    X_val_trans = None
+    if use_early_stopping:
+        X_val_trans = fe.transform(X_val)
+        fit_kwargs.update(eval_set=[(X_val_trans, y_val)], verbose=False)
+    clf.fit(X_train_trans, y_train, **fit_kwargs)
+    train_seconds = time.time() - fit_start
+    clf.set_params(callbacks=None)
+
+    trees_built = clf.get_booster().num_boosted_rounds()
+    trees_used = trees_built
+    best_validation_aucpr = None
+    if use_early_stopping:
+        trees_used = clf.best_iteration + 1
+        best_validation_aucpr = float(clf.best_score)
+        clf.set_params(early_stopping_rounds=None)
+        if trees_used < trees_built:
+            clf = _classifier_from_booster(clf.get_booster()[:trees_used], **clf.get_params())
+    print(f"   Added {trees_used - parent_trees} trees in {train_seconds:.1f}s")
+
+    # 6. Compare with the parent on the shared holdout
+    report("evaluating", 90)
+    X_hold_trans = fe.transform(X_hold)
+    child_scores = clf.predict_proba(X_hold_trans)[:, 1]
+    parent_scores = parent_clf.predict_proba(parent_fe.transform(X_hold))[:, 1]
+    y_pred = (child_scores >= 0.5).astype(int)
+    has_fraud = int(y_hold.sum()) > 0
+    holdout_aucpr = float(average_precision_score(y_hold, child_scores)) if has_fraud else None
+    parent_holdout_aucpr = float(average_precision_score(y_hold, parent_scores)) if has_fraud else None
+
+    metrics = {
+        "accuracy": float(accuracy_score(y_hold, y_pred)),
+        "precision": float(precision_score(y_hold, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_hold, y_pred, zero_division=0)),
+        "f1": float(f1_score(y_hold, y_pred, zero_division=0)),
+        "n_estimators": xgb_params['n_estimators'],
+        "trees_used": trees_used,
+        "early_stopped": trees_built - parent_trees < xgb_params['n_estimators'],
+        "best_validation_aucpr": best_validation_aucpr,
+        "threads": threads,
+        "train_rows": int(len(X_train_trans)),
+        "train_seconds": round(train_seconds, 3),
+        "train_rows_per_second": int(len(X_train_trans) / train_seconds) if train_seconds > 0 else None,
+        "data_cutoff_step": int(delta['step'].max()),
+        "warm_start": {
+            "parent_model_id": parent['id'],
+            "parent_cutoff_step": cutoff,
+            "parent_trees": parent_trees,
+            "new_trees": trees_used - parent_trees,
+            "new_rows": int(len(delta)),
+            "holdout_rows": int(len(X_hold)),
+            "holdout_aucpr": holdout_aucpr,
+            "parent_holdout_aucpr": parent_holdout_aucpr,
+        },
+        "cascade": _calibrate_cascade(clf, X_val_trans, y_val, X_hold_trans, y_hold),
+    }
+    if not has_fraud:
+        print("⚠️ Holdout has no fraud; skipping the comparison with the parent")
+    elif holdout_aucpr < parent_holdout_aucpr + float(params.get('warm_start_min_gain', 0.0)):
+        raise ModelRejected(
+            f"Warm-started model did not beat its parent on the holdout "
+            f"(aucpr {holdout_aucpr:.4f} vs {parent_holdout_aucpr:.4f})", metrics
+        )
+    # Served state: every row up to data_cutoff_step, or the next warm start
+    # would never count the validation and holdout rows
+    fe = copy.deepcopy(parent_fe).update(delta)
+    return clf, fe, metrics
+
+def train_model(job_id: str, file_path: str, params: dict, progress=None):
+    """
+    Train a model (runs in a training worker process, see training_queue)
+
+    Args:
+        job_id: Registry id of the job
+        file_path: Uploaded training CSV
+        params: TrainingConfig values
+        progress: Optional callback(stage, percent); it may raise
+            TrainingCancelled to stop the job
+
+    Raises:
+        TrainingCancelled: If the job was cancelled
+        Exception: Any training failure (the registry entry is marked failed first)
+    """
+    def report(stage: str, percent: float):
+        if progress is not None:
+            progress(stage, percent)
+
+    print(f"🚀 Starting training job {job_id} with params: {params}")
+    job_start = time.time()
+    set_job_status(job_id, "training")
+    
+    try:
+        # 1. Load, split, engineer features and train
+        report("loading", 0)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Dataset not found at {file_path}")
+
+        if params.get('warm_start'):
+            parent = resolve_parent_model(params)
+            clf, fe, metrics = _train_warm_start(file_path, params, parent, report, progress)
+        elif use_streaming(file_path, params):
+            clf, fe, metrics = _train_streaming(job_id, file_path, params, report, progress)
+        else:
+            clf, fe, metrics = _train_in_memory(file_path, params, report, progress)
+        # Serving cost on the replay set, checked against the budget on activation
+        report("benchmarking", 92)
+        try:
+            X_replay, replay = replay_rows(fe, file_path)
+            metrics["benchmark"] = {**benchmark_model(clf, X_replay), "replay": replay}
+        except Exception as e:
+            print(f"⚠️ Benchmark failed: {str(e)}")
+            metrics["benchmark"] = {"error": str(e)}
+        metrics["total_seconds"] = round(time.time() - job_start, 3)
         print(f"✅ Metrics: {metrics}")
         
         # 7. Save Model
+        report("saving", 95)
         # Ensure Models directory exists
-        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Models")
-        os.makedirs(models_dir, exist_ok=True)
+        os.makedirs(MODELS_DIR, exist_ok=True)
         
         model_filename = f"model_{job_id}.pkl"
-        model_save_path = os.path.join(models_dir, model_filename)
+        model_save_path = os.path.join(MODELS_DIR, model_filename)
         
-        # Save ONLY the classifier (as per notebook strategy)
+        # Save ONLY the classifier (as per notebook strategy); the fitted
+        # feature state goes next to it so later jobs can warm-start from it
         joblib.dump(clf, model_save_path)
+        joblib.dump(fe, feature_state_path(model_save_path))
+        save_cascade(model_save_path, metrics.get("cascade"))
         print(f"💾 Model saved to {model_save_path}")
         
         # 8. Update Registry
-        update_job_status(job_id, "ready", metrics=metrics, file_path=f"Models/{model_filename}")
+        set_job_status(job_id, "ready", metrics=metrics, file_path=f"Models/{model_filename}")
         
+    except ModelRejected as e:
+        print(f"❌ Training rejected: {str(e)}")
+        set_job_status(job_id, "failed", metrics={**e.metrics, "error": str(e)})
+        raise
+    except TrainingCancelled:
+        print(f"🛑 Training job {job_id} cancelled")
+        set_job_status(job_id, "failed", metrics={"error": "Cancelled"})
+        raise
     except Exception as e:
         print(f"❌ Training failed: {str(e)}")
-        update_job_status(job_id, "failed", metrics={"error": str(e)})
+        set_job_status(job_id, "failed", metrics={"error": str(e)})
+        raise
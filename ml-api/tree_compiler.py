@@ -0,0 +1,215 @@
+"""
+Tree Compiler Module
+Flattens a fitted XGBoost ensemble into contiguous NumPy arrays (split
+feature, threshold, children, default direction, leaf value) and evaluates
+it without going through the booster. For a single row every tree advances
+one level per step, so the cost is a handful of array operations per tree
+level instead of XGBoost's per-call overhead; batches advance all rows and
+trees together.
+"""
+
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+# 'xgboost' scores through the booster, 'compiled' through CompiledEnsemble
+# (models it cannot reproduce exactly keep the booster)
+TREE_EVALUATOR = os.getenv("TREE_EVALUATOR", "xgboost")
+TREE_EVALUATORS = ('xgboost', 'compiled')
+# Batches up to this many rows use the compiled trees; XGBoost's own
+# predictor is faster beyond that
+TREE_COMPILED_MAX_ROWS = int(os.getenv("TREE_COMPILED_MAX_ROWS", "32"))
+# Largest probability difference from the booster accepted at load time
+# (the float32 sigmoid can differ from XGBoost's expf in the last bit)
+TREE_COMPILED_TOLERANCE = float(os.getenv("TREE_COMPILED_TOLERANCE", "1e-6"))
+
+
+def _parse_base_score(value) -> float:
+    """base_score of the learner parameters ('5E-1' or '[5E-1]' depending on the version)"""
+    return float(str(value).strip('[]').split(',')[0])
+
+
+class CompiledEnsemble:
+    """
+    A binary:logistic gbtree ensemble as flat arrays
+
+    Nodes of all trees are concatenated; leaves point to themselves, so
+    every row can take max_depth steps without checking for leaves. A row
+    goes left when its value is below the threshold (compared in float32,
+    like XGBoost) or when it is missing and the node's default is left.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 default_left: np.ndarray, value: np.ndarray, roots: np.ndarray, depth: int,
+                 base_margin: float, feature_names: Optional[List[str]] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_margin = np.float32(base_margin)
+        self.feature_names = feature_names
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_model(cls, model, trees: Optional[int] = None) -> "CompiledEnsemble":
+        """
+        Compile an XGBClassifier (or Booster)
+
+        Args:
+            model: Fitted model
+            trees: Compile only the first `trees` trees (default: the trees
+                predict_proba uses, i.e. up to best_iteration if it is set)
+
+        Raises:
+            ValueError: If the model is not a single-output binary:logistic gbtree
+                without categorical splits
+        """
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        if trees is None:
+            best = getattr(model, 'best_iteration', None) if hasattr(model, 'get_booster') else None
+            trees = best + 1 if best is not None else None
+        learner = json.loads(bytes(booster.save_raw('json')))['learner']
+        if learner['objective']['name'] != 'binary:logistic':
+            raise ValueError(f"Unsupported objective {learner['objective']['name']}")
+        gbm = learner['gradient_booster']
+        if gbm['name'] != 'gbtree' or int(gbm['model']['gbtree_model_param']['num_parallel_tree']) != 1:
+            raise ValueError("Only gbtree models with one tree per iteration can be compiled")
+        tree_list = gbm['model']['trees'][:trees]
+
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        depth = 0
+        offset = 0
+        for tree in tree_list:
+            if any(tree.get('split_type', [])):
+                raise ValueError("Categorical splits cannot be compiled")
+            lc = np.asarray(tree['left_children'], dtype=np.int64)
+            rc = np.asarray(tree['right_children'], dtype=np.int64)
+            leaf = lc == -1
+            idx = np.arange(len(lc), dtype=np.int64)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            feature.append(np.where(leaf, 0, np.asarray(tree['split_indices'], dtype=np.int64)))
+            threshold.append(np.where(leaf, np.float32(0), conditions))
+            left.append(np.where(leaf, idx, lc) + offset)
+            right.append(np.where(leaf, idx, rc) + offset)
+            default_left.append(np.asarray(tree['default_left'], dtype=bool))
+            # A leaf's split condition holds its value (learning rate applied)
+            value.append(np.where(leaf, conditions, np.float32(0)))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(lc, rc))
+            offset += len(lc)
+
+        base_score = _parse_base_score(learner['learner_model_param']['base_score'])
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            default_left=np.concatenate(default_left),
+            value=np.concatenate(value).astype(np.float32),
+            roots=np.asarray(roots, dtype=np.intp),
+            depth=depth,
+            base_margin=float(np.log(base_score / (1 - base_score))),
+            feature_names=booster.feature_names,
+        )
+
+    def _matrix(self, X) -> np.ndarray:
+        """float32 feature matrix in the model's column order"""
+        if hasattr(X, 'columns'):
+            if self.feature_names is not None and list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy(dtype=np.float32)
+        return np.atleast_2d(np.asarray(X, dtype=np.float32))
+
+    def leaves(self, X, trees: Optional[int] = None) -> np.ndarray:
+        """Leaf node reached in every tree, shape (rows, trees)"""
+        X = self._matrix(X)
+        roots = self.roots if trees is None else self.roots[:trees]
+        if len(X) == 1:
+            # One row: advance all trees together on a 1-D state
+            row = X[0]
+            node = roots.copy()
+            for _ in range(self.depth):
+                x = row[self.feature[node]]
+                go_left = (x < self.threshold[node]) | (np.isnan(x) & self.default_left[node])
+                node = np.where(go_left, self.left[node], self.right[node])
+            return node[None, :]
+        node = np.broadcast_to(roots, (len(X), len(roots))).copy()
+        for _ in range(self.depth):
+            x = np.take_along_axis(X, self.feature[node], axis=1)
+            go_left = (x < self.threshold[node]) | (np.isnan(x) & self.default_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def margin(self, X, trees: Optional[int] = None) -> np.ndarray:
+        """Raw scores, accumulated in float32 from the base margin in tree order like the booster"""
+        values = self.value[self.leaves(X, trees)]
+        start = np.full((len(values), 1), self.base_margin, dtype=np.float32)
+        # cumsum adds sequentially (np.sum would add pairwise and round differently)
+        return np.cumsum(np.hstack([start, values]), axis=1, dtype=np.float32)[:, -1]
+
+    def predict(self, X, trees: Optional[int] = None) -> np.ndarray:
+        """Fraud probability of every row (float32 sigmoid, exp rounded from float64 like expf)"""
+        exp = np.exp(-self.margin(X, trees).astype(np.float64)).astype(np.float32)
+        return np.float32(1) / (exp + np.float32(1))
+
+    def predict_proba(self, X, iteration_range=None) -> np.ndarray:
+        """XGBClassifier.predict_proba equivalent (columns: legit, fraud)"""
+        trees = None
+        if iteration_range is not None:
+            if iteration_range[0] != 0:
+                raise ValueError("Only iteration ranges starting at 0 are supported")
+            trees = iteration_range[1]
+        p = self.predict(X, trees)
+        return np.column_stack([1 - p, p])
+
+    def verify(self, model, X, trees: Optional[int] = None) -> float:
+        """Largest absolute difference from the booster's probabilities on X"""
+        iteration_range = (0, trees) if trees is not None else None
+        expected = model.predict_proba(X, iteration_range=iteration_range)[:, 1] if iteration_range \
+            else model.predict_proba(X)[:, 1]
+        return float(np.max(np.abs(self.predict(X, trees) - expected))) if len(expected) else 0.0
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Edges on the longest root-to-leaf path"""
+    depth = np.zeros(len(left), dtype=np.int64)
+    # Children have higher ids than their parents in XGBoost's node order
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def compile_model(model, X_check, tolerance: float = TREE_COMPILED_TOLERANCE) -> Optional[CompiledEnsemble]:
+    """
+    Compile a model and check it against the booster
+
+    Args:
+        model: Fitted XGBClassifier
+        X_check: Engineered rows the two evaluators must agree on
+        tolerance: Largest allowed absolute probability difference
+
+    Returns:
+        The compiled ensemble, or None if it cannot be compiled or differs
+    """
+    try:
+        compiled = CompiledEnsemble.from_model(model)
+    except (ValueError, KeyError) as e:
+        print(f"⚠️ Model cannot be compiled, keeping XGBoost: {str(e)}")
+        return None
+    difference = compiled.verify(model, X_check)
+    if difference > tolerance:
+        print(f"⚠️ Compiled trees differ from XGBoost by {difference:.3g}, keeping XGBoost")
+        return None
+    print(f"✅ Compiled {compiled.n_trees} trees ({len(compiled.value)} nodes, depth {compiled.depth}), "
+          f"verified on {len(X_check)} rows")
+    return compiled
@@ -1,19 +1,61 @@
-from supabase import Client
+import asyncio
+import inspect
 import logging
 
+from utils.metrics import metrics
+
 # Configure logger for internal errors
 logger = logging.getLogger(__name__)
 
+# Duration of the log_activity RPC itself (off the request path when async)
+RPC_STAGE = metrics.stage("audit.rpc")
+
 class AuditLogger:
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client):
+        """
+        Args:
+            supabase_client: utils.db.AsyncDatabase (calls are dispatched as
+                background tasks) or a synchronous supabase Client
+        """
         self.supabase = supabase_client
+        self._pending = set()
+
+    def _log_activity(self, params: dict, what: str):
+        result = self.supabase.rpc("log_activity", params)
+        if not inspect.isawaitable(result):
+            with RPC_STAGE.time():
+                result.execute()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called outside the event loop (e.g. from a worker thread)
+            self.supabase.run_sync(self._await_logged(result, what))
+            return
+        # Fire-and-forget: the request being audited does not wait for the write
+        task = loop.create_task(self._await_logged(result, what))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    @staticmethod
+    async def _await_logged(awaitable, what: str):
+        try:
+            with RPC_STAGE.time():
+                await awaitable
+        except Exception as e:
+            logger.error(f"Failed to log {what} audit: {str(e)}")
+
+    @property
+    def pending(self) -> int:
+        """Audit writes dispatched but not finished yet"""
+        return len(self._pending)
 
     def log_prediction(self, transaction_id: str, fraud_score: float, features: dict):
         """
         Logs an ML prediction event to the audit_logs table via RPC.
         """
         try:
-            self.supabase.rpc("log_activity", {
+            self._log_activity({
                 "p_action_type": "ML_PREDICTION",
                 "p_message": f"ML Model prediction: {fraud_score:.4f}",
                 "p_resource_type": "transaction",
@@ -22,7 +64,7 @@ class AuditLogger:
                     "fraud_score": fraud_score,
                     "features_snapshot": features
                 }
-            }).execute()
+            }, "prediction")
         except Exception as e:
             # We catch all exceptions to ensuring logging failures don't block the main inference
             logger.error(f"Failed to log prediction audit: {str(e)}")
@@ -33,7 +75,7 @@ class AuditLogger:
         """
         try:
             status = "PASSED" if passed else "FAILED"
-            self.supabase.rpc("log_activity", {
+            self._log_activity({
                 "p_action_type": "POLICY_BACKTEST",
                 "p_message": f"Policy '{policy_name}' backtest {status}",
                 "p_resource_type": "policy",
@@ -42,6 +84,48 @@ class AuditLogger:
                     "passed": passed,
                     "impact_score": impact_score
                 }
-            }).execute()
+            }, "backtest")
         except Exception as e:
             logger.error(f"Failed to log backtest audit: {str(e)}")
+
+    def log_batch_backtest(self, results: list):
+        """
+        Logs a multi-rule policy backtest as a single audit event.
+        """
+        try:
+            self._log_activity({
+                "p_action_type": "POLICY_BACKTEST",
+                "p_message": f"Batch backtest of {len(results)} policies",
+                "p_resource_type": "policy",
+                "p_resource_id": "batch",
+                "p_metadata": {
+                    "policies": [
+                        {
+                            "policy": r.get("name") or r.get("rule"),
+                            "passed": r["fraud_caught"] > 0 and r["precision"] > 0.1,
+                            "impact_score": r["precision"]
+                        }
+                        for r in results
+                    ]
+                }
+            }, "batch backtest")
+        except Exception as e:
+            logger.error(f"Failed to log batch backtest audit: {str(e)}")
+
+    def log_rules_deployed(self, version: int, rules: list):
+        """
+        Logs a change of the deployed (live) policy rule set.
+        """
+        try:
+            self._log_activity({
+                "p_action_type": "POLICY_DEPLOYED",
+                "p_message": f"Deployed rule set v{version} ({len(rules)} rules)",
+                "p_resource_type": "policy",
+                "p_resource_id": f"ruleset-v{version}",
+                "p_metadata": {
+                    "version": version,
+                    "rules": rules
+                }
+            }, "rule deployment")
+        except Exception as e:
+            logger.error(f"Failed to log rule deployment audit: {str(e)}")
@@ -0,0 +1,235 @@
+"""
+Async database access for the API
+Talks to Supabase (or any PostgREST-compatible server) over pooled HTTP
+connections without blocking the event loop
+"""
+
+import asyncio
+import logging
+import os
+import random
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying; only the first set guarantees nothing was written
+NOT_PROCESSED_STATUSES = {429, 503}
+RETRY_STATUSES = NOT_PROCESSED_STATUSES | {502, 504}
+# Transport errors raised before the request reached the server
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class DatabaseError(Exception):
+    """Raised when a database call fails (after retries)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncDatabase:
+    """
+    Minimal async PostgREST client shared by the whole API.
+
+    One pooled httpx.AsyncClient per event loop, a semaphore bounding the
+    number of in-flight calls, per-call timeouts and retries with
+    exponential backoff. Reads and filtered updates are retried on any
+    transient failure; inserts and RPCs only when the request provably
+    never reached the server, so a retry cannot write twice.
+    """
+
+    def __init__(self, rest_url: str, api_key: Optional[str] = None,
+                 max_connections: int = 20, max_concurrency: int = 10,
+                 timeout: float = 5.0, retries: int = 3, backoff: float = 0.2,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Initialize the client (connections are opened lazily)
+
+        Args:
+            rest_url: PostgREST base URL (e.g. https://xyz.supabase.co/rest/v1)
+            api_key: Supabase key sent as apikey and bearer token
+            max_connections: Size of the HTTP connection pool
+            max_concurrency: Maximum concurrent calls
+            timeout: Seconds per attempt
+            retries: Extra attempts after the first one
+            backoff: Base delay in seconds, doubled on every retry
+            transport: Custom httpx transport (used by tests)
+        """
+        self.rest_url = rest_url.rstrip('/')
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = transport
+        # Clients and semaphores are bound to the loop that created them
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["apikey"] = self.api_key
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _loop_state(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            client = httpx.AsyncClient(
+                base_url=self.rest_url,
+                headers=self._headers(),
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+            state = self._states[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+        return state
+
+    async def aclose(self) -> None:
+        """Close the connection pool of the current event loop"""
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+
+    def run_sync(self, awaitable) -> Any:
+        """
+        Run a call from synchronous code that has no event loop (worker
+        threads, training processes), closing its connections afterwards
+        """
+        async def runner():
+            try:
+                return await awaitable
+            finally:
+                await self.aclose()
+        return asyncio.run(runner())
+
+    async def _request(self, method: str, path: str, idempotent: bool,
+                       params: Optional[Dict[str, str]] = None, json: Any = None,
+                       headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        client, semaphore = self._loop_state()
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await client.request(method, path, params=params, json=json, headers=headers)
+                if response.status_code < 400:
+                    return response
+                retry_statuses = RETRY_STATUSES if idempotent else NOT_PROCESSED_STATUSES
+                if response.status_code not in retry_statuses or attempt >= self.retries:
+                    raise DatabaseError(
+                        f"{method} {path} failed ({response.status_code}): {response.text[:500]}",
+                        status_code=response.status_code
+                    )
+            except httpx.HTTPError as e:
+                retryable = idempotent or isinstance(e, _NOT_SENT_ERRORS)
+                if not retryable or attempt >= self.retries:
+                    raise DatabaseError(f"{method} {path} failed: {type(e).__name__}: {e}") from e
+            delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            attempt += 1
+            logger.warning(f"Retrying {method} {path} in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _filters(filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        return {column: f"eq.{_format_value(value)}" for column, value in (filters or {}).items()}
+
+    async def select(self, table: str, columns: str = "*", filters: Optional[Dict[str, Any]] = None,
+                     order: Optional[str] = None, desc: bool = False,
+                     offset: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Select rows
+
+        Args:
+            table: Table name
+            columns: Comma separated column list
+            filters: Equality filters {column: value}
+            order: Column to order by
+            desc: Descending order
+            offset: Rows to skip
+            limit: Maximum rows to return
+
+        Returns:
+            List of row dicts
+        """
+        params = {"select": columns, **self._filters(filters)}
+        if order:
+            params["order"] = f"{order}.{'desc' if desc else 'asc'}"
+        if offset:
+            params["offset"] = str(offset)
+        if limit is not None:
+            params["limit"] = str(limit)
+        response = await self._request("GET", f"/{table}", idempotent=True, params=params)
+        return response.json()
+
+    async def select_one(self, table: str, filters: Dict[str, Any], columns: str = "*") -> Optional[Dict]:
+        """Select a single row by equality filters (None if there is no match)"""
+        rows = await self.select(table, columns=columns, filters=filters, limit=2)
+        if len(rows) > 1:
+            raise DatabaseError(f"Expected one row from {table}, got several")
+        return rows[0] if rows else None
+
+    async def insert(self, table: str, rows: Union[Sequence[Dict], Dict], returning: bool = False) -> List[Dict]:
+        """
+        Insert one row or a list of rows in a single request
+
+        Returns:
+            Inserted rows if returning is set, else an empty list
+        """
+        headers = {"Prefer": "return=representation" if returning else "return=minimal"}
+        response = await self._request("POST", f"/{table}", idempotent=False, json=rows, headers=headers)
+        return response.json() if returning else []
+
+    async def update(self, table: str, values: Dict, filters: Dict[str, Any]) -> None:
+        """Update the rows matching equality filters"""
+        if not filters:
+            raise ValueError("Refusing to update without filters")
+        await self._request("PATCH", f"/{table}", idempotent=True, params=self._filters(filters),
+                            json=values, headers={"Prefer": "return=minimal"})
+
+    async def rpc(self, function: str, params: Optional[Dict] = None) -> Any:
+        """Call a Postgres function exposed by PostgREST"""
+        response = await self._request("POST", f"/rpc/{function}", idempotent=False, json=params or {})
+        return response.json() if response.content else None
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def create_database() -> Optional[AsyncDatabase]:
+    """
+    Build the shared database client from the environment
+
+    POSTGREST_URL points at a plain PostgREST server (e.g. a local stand-in);
+    otherwise SUPABASE_URL + /rest/v1 is used.
+
+    Returns:
+        AsyncDatabase, or None if no database is configured
+    """
+    rest_url = os.getenv("POSTGREST_URL")
+    supabase_url = os.getenv("SUPABASE_URL")
+    api_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Service Role Key for backend updates
+    if not rest_url:
+        if not (supabase_url and api_key):
+            return None
+        rest_url = f"{supabase_url.rstrip('/')}/rest/v1"
+    return AsyncDatabase(
+        rest_url,
+        api_key=api_key,
+        max_connections=int(os.getenv("DB_MAX_CONNECTIONS", "20")),
+        max_concurrency=int(os.getenv("DB_MAX_CONCURRENCY", "10")),
+        timeout=float(os.getenv("DB_TIMEOUT", "5")),
+        retries=int(os.getenv("DB_RETRIES", "3")),
+        backoff=float(os.getenv("DB_RETRY_BACKOFF", "0.2")),
+    )
@@ -0,0 +1,375 @@
+"""
+Process metrics for the API
+Stage timers feeding fixed-bucket latency histograms, plus collectors read
+at scrape time (queue depths, cache hits), rendered in the Prometheus text
+exposition format. Under the pre-fork server every process writes snapshots
+to a shared directory and a scrape sums them (see MetricsRegistry.share)
+"""
+
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the stage latency buckets: 50us single-row
+# scoring up to multi-minute training stages
+STAGE_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0,
+)
+
+PREFIX = "clovershield"
+# Seconds between snapshots of a process sharing its metrics
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Snapshot of the processes that exited, folded together
+_EXITED_SNAPSHOT = "exited.json"
+
+# (name, type, help, [(labels, value), ...]) as returned by collectors
+Metric = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Stage:
+    """
+    Latency histogram and error count of one named stage
+
+    observe() is a bisect over the bucket bounds and two increments under
+    an uncontended lock, so timing a stage costs well under a microsecond.
+    """
+
+    __slots__ = ('name', 'buckets', 'counts', 'sum', 'errors', '_lock')
+
+    def __init__(self, name: str, buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, failed: bool = False) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            if failed:
+                self.errors += 1
+
+    def time(self) -> "_Timer":
+        """Context manager timing one run of the stage (a raised exception counts as an error)"""
+        return _Timer(self)
+
+    def timed(self, fn: Callable) -> Callable:
+        """Decorator timing every call of fn as this stage"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(self):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.errors = 0
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: Stage):
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stage.observe(time.perf_counter() - self.start, exc_type is not None)
+
+
+class StageClock:
+    """
+    Durations of consecutive stages, for work that reports "now in stage X"
+    (training progress) rather than wrapping each stage in a timer
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._since = 0.0
+
+    def mark(self, stage: Optional[str]) -> None:
+        """Enter `stage` (None ends the current one); re-entering the current stage is a no-op"""
+        if stage == self._stage:
+            return
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.seconds[self._stage] = self.seconds.get(self._stage, 0.0) + now - self._since
+        self._stage, self._since = stage, now
+
+
+class MetricsRegistry:
+    """Stages and collectors of one process (or of all processes sharing a directory)"""
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self.directory: Optional[str] = None
+        self._stages: Dict[str, Stage] = {}
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+        self._shared_collectors: List[Callable[[], Iterable[Metric]]] = []
+        # Collector counter values at share() time, left out of the snapshots
+        self._offsets: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> Stage:
+        """The stage called `name` (created on first use; keep the result, lookups are not free)"""
+        stage = self._stages.get(name)
+        if stage is None:
+            with self._lock:
+                stage = self._stages.setdefault(name, Stage(name))
+        return stage
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration measured elsewhere (e.g. in a training process)"""
+        self.stage(name).observe(seconds)
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]], shared: bool = False) -> None:
+        """
+        Register a function returning Metric tuples, called on every scrape
+
+        Args:
+            collector: The function
+            shared: Its values are the same in every process (e.g. read from
+                a shared database), so they are reported once, not summed
+        """
+        (self._shared_collectors if shared else self._collectors).append(collector)
+
+    # ------------------------------------------------------------------
+    # Sharing between processes
+    # ------------------------------------------------------------------
+
+    def share(self, directory: str, flush_interval: float = METRICS_FLUSH_INTERVAL) -> None:
+        """
+        Aggregate this process's metrics with the other processes using `directory`
+
+        The process writes a snapshot of its stages and collectors to
+        <directory>/<pid>.json every flush_interval seconds and on every
+        render(); render() and stats() then sum the snapshots of all
+        processes, so any process answers a scrape with the same totals.
+        Counters and histograms of exited processes are kept, so totals never
+        go down; gauges only count live processes. Whatever was recorded
+        before the call (e.g. inherited from the pre-fork master) is left out.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for stage in list(self._stages.values()):
+            stage.reset()
+        self._offsets = {}
+        for name, kind, _, samples in self._collect(self._collectors):
+            if kind == 'counter':
+                for labels, value in samples:
+                    self._offsets[_sample_key(name, labels)] = value
+        self.directory = directory
+        if flush_interval > 0:
+            threading.Thread(target=self._flush_loop, args=(flush_interval,),
+                             name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this process's snapshot (no-op unless sharing)"""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics snapshot: {str(e)}")
+
+    def _snapshot(self) -> Dict:
+        stages = {}
+        for name, stage in list(self._stages.items()):
+            with stage._lock:
+                stages[name] = {"buckets": stage.buckets, "counts": list(stage.counts),
+                                "sum": stage.sum, "errors": stage.errors}
+        collected = []
+        for name, kind, help_text, samples in self._collect(self._collectors):
+            if kind == 'counter':
+                samples = [(labels, value - self._offsets.get(_sample_key(name, labels), 0))
+                           for labels, value in samples]
+            collected.append((name, kind, help_text, samples))
+        return {"stages": stages, "metrics": collected}
+
+    def _merged(self) -> Tuple[Dict[str, Dict], List[Metric]]:
+        """Stage histograms and collector metrics of this process, or summed over all sharing it"""
+        if self.directory is None:
+            snapshot = self._snapshot()
+            return snapshot["stages"], snapshot["metrics"]
+        self.flush()
+        import fcntl
+
+        with open(os.path.join(self.directory, ".lock"), 'w') as lock:
+            # Exclusive: folding exited processes must not race another scrape
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited_path = os.path.join(self.directory, _EXITED_SNAPSHOT)
+            exited = _read_snapshot(exited_path) or {"stages": {}, "metrics": []}
+            live = []
+            folded = []
+            for path in glob.glob(os.path.join(self.directory, "[0-9]*.json")):
+                snapshot = _read_snapshot(path)
+                if snapshot is None:
+                    continue
+                if _pid_alive(int(os.path.basename(path).split('.')[0])):
+                    live.append(snapshot)
+                else:
+                    # Counters of an exited process keep counting; its gauges do not
+                    snapshot["metrics"] = [m for m in snapshot["metrics"] if m[1] == 'counter']
+                    exited = _sum_snapshots([exited, snapshot])
+                    folded.append(path)
+            if folded:
+                with open(f"{exited_path}.tmp", 'w') as f:
+                    json.dump(exited, f)
+                os.replace(f"{exited_path}.tmp", exited_path)
+                for path in folded:
+                    os.remove(path)
+        total = _sum_snapshots([exited] + live)
+        return total["stages"], total["metrics"]
+
+    @staticmethod
+    def _collect(collectors: List[Callable[[], Iterable[Metric]]]) -> List[Metric]:
+        collected = []
+        for collector in collectors:
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {str(e)}")
+        return collected
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        """Stage counts, errors and mean seconds (JSON form of the histograms)"""
+        result = {}
+        stages, _ = self._merged()
+        for name, stage in sorted(stages.items()):
+            count = sum(stage["counts"])
+            result[name] = {"count": count, "errors": stage["errors"],
+                            "mean_seconds": round(stage["sum"] / count, 6) if count else None}
+        return result
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        stages, collected = self._merged()
+        lines: List[str] = []
+        histogram = f"{self.prefix}_stage_duration_seconds"
+        lines.append(f"# HELP {histogram} Duration of instrumented processing stages")
+        lines.append(f"# TYPE {histogram} histogram")
+        errors: List[Tuple[str, int]] = []
+        for name, stage in sorted(stages.items()):
+            label = _escape(name)
+            cumulative = 0
+            for bound, count in zip(tuple(stage["buckets"]) + (float('inf'),), stage["counts"]):
+                cumulative += count
+                lines.append(f'{histogram}_bucket{{stage="{label}",le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'{histogram}_sum{{stage="{label}"}} {_number(stage["sum"])}')
+            lines.append(f'{histogram}_count{{stage="{label}"}} {cumulative}')
+            errors.append((label, stage["errors"]))
+
+        counter = f"{self.prefix}_stage_errors_total"
+        lines.append(f"# HELP {counter} Runs of a stage that raised")
+        lines.append(f"# TYPE {counter} counter")
+        lines.extend(f'{counter}{{stage="{label}"}} {failed}' for label, failed in errors)
+
+        for name, kind, help_text, samples in collected + self._collect(self._shared_collectors):
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{full_name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _sample_key(name: str, labels: Dict[str, str]) -> tuple:
+    return (name,) + tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _read_snapshot(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _sum_snapshots(snapshots: List[Dict]) -> Dict:
+    """Add up stage histograms and collector samples of several snapshots"""
+    stages: Dict[str, Dict] = {}
+    metrics_by_name: Dict[str, list] = {}
+    for snapshot in snapshots:
+        for name, stage in snapshot["stages"].items():
+            total = stages.get(name)
+            if total is None:
+                stages[name] = {"buckets": list(stage["buckets"]), "counts": list(stage["counts"]),
+                                "sum": stage["sum"], "errors": stage["errors"]}
+            elif list(total["buckets"]) == list(stage["buckets"]):
+                total["counts"] = [a + b for a, b in zip(total["counts"], stage["counts"])]
+                total["sum"] += stage["sum"]
+                total["errors"] += stage["errors"]
+        for name, kind, help_text, samples in snapshot["metrics"]:
+            entry = metrics_by_name.setdefault(name, [name, kind, help_text, {}])
+            for labels, value in samples:
+                key = _sample_key(name, labels)
+                previous = entry[3].get(key, (labels, 0))
+                entry[3][key] = (labels, previous[1] + value)
+    return {
+        "stages": stages,
+        "metrics": [(name, kind, help_text, list(samples.values()))
+                    for name, kind, help_text, samples in metrics_by_name.values()],
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Process-wide registry (each serving worker exposes its own)
+metrics = MetricsRegistry()
@@ -0,0 +1,22 @@
+-- CloverShield Supabase Migration
+-- Checkpoints for the bulk dataset loader (scripts/import_test_dataset.py)
+-- Each loaded chunk is recorded in the same transaction as its COPY, so an
+-- interrupted import resumes after the last committed chunk
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source_key VARCHAR(32) NOT NULL,
+    target_table VARCHAR(63) NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_key, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_checkpoints_table ON import_checkpoints(target_table);
+
+-- Only the loader (service connection) uses this table
+ALTER TABLE import_checkpoints ENABLE ROW LEVEL SECURITY;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- CloverShield Supabase Migration
+-- Version the engineered dataset built by ml-api/build_engineered_dataset.py
+-- Every row records the feature engineer version that produced it, and every
+-- load is logged so a refresh after a refit can be traced and skipped when
+-- nothing changed
+
+BEGIN;
+
+ALTER TABLE test_dataset_engineered
+    ADD COLUMN IF NOT EXISTS fe_version VARCHAR(32);
+
+CREATE INDEX IF NOT EXISTS idx_eng_fe_version ON test_dataset_engineered(fe_version);
+
+CREATE TABLE IF NOT EXISTS engineered_dataset_loads (
+    id SERIAL PRIMARY KEY,
+    fe_version VARCHAR(32) NOT NULL,
+    dataset_version VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'completed', 'failed')),
+    rows_loaded INTEGER,
+    seconds DOUBLE PRECISION,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_engineered_loads_versions
+    ON engineered_dataset_loads(fe_version, dataset_version);
+
+ALTER TABLE engineered_dataset_loads ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Public read access" ON engineered_dataset_loads FOR SELECT USING (true);
+CREATE POLICY "Service role full access" ON engineered_dataset_loads FOR ALL USING (auth.role() = 'service_role');
+
+COMMIT;
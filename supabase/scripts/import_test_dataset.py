@@ -1,181 +1,351 @@
 """
 Import test_dataset.csv into Supabase test_dataset table
 Run this script after creating the test_dataset table via migration
+
+Rows are streamed from the CSV (plain or .gz) in chunks and loaded with
+COPY FROM STDIN, optionally over several parallel connections. Every chunk
+is committed together with a row in import_checkpoints, so an interrupted
+import can be re-run and continues after the last committed chunk.
+
+Usage:
+    python import_test_dataset.py [--csv PATH] [--workers 4] [--truncate]
 """
 
+import argparse
+import csv
+import gzip
+import hashlib
+import io
 import os
+import queue
 import sys
-import csv
-import psycopg2
-from psycopg2.extras import execute_batch
-from dotenv import load_dotenv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# Columns that may be loaded, in table order (quoted camelCase as in migration 012)
+TABLE_COLUMNS = ['step', 'type', 'amount', 'nameOrig', 'oldBalanceOrig', 'newBalanceOrig',
+                 'nameDest', 'oldBalanceDest', 'newBalanceDest', 'isFraud', 'isFlaggedFraud']
+REQUIRED_COLUMNS = ['step', 'type', 'amount', 'nameOrig', 'oldBalanceOrig',
+                    'newBalanceOrig', 'nameDest', 'oldBalanceDest', 'newBalanceDest', 'isFlaggedFraud']
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def open_text(path: Path):
+    """Open a CSV file for reading, transparently decompressing .gz"""
+    if path.suffix == '.gz':
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
 
-# Load environment variables
-load_dotenv()
-
-# Get Supabase connection details from environment
-SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
-CSV_FILE_PATH = os.getenv('TEST_DATASET_CSV_PATH', 'assets/test_dataset.csv')
-
-if not SUPABASE_DB_URL:
-    print("❌ Error: SUPABASE_DB_URL or DATABASE_URL environment variable not set")
-    print("Please set it to your Supabase database connection string")
-    print("Format: postgresql://postgres:[password]@[host]:[port]/postgres")
-    sys.exit(1)
-
-# Resolve CSV file path
-script_dir = Path(__file__).parent.parent.parent
-csv_path = script_dir / CSV_FILE_PATH
-
-if not csv_path.exists():
-    print(f"❌ Error: CSV file not found at {csv_path}")
-    print(f"Please ensure the file exists or set TEST_DATASET_CSV_PATH environment variable")
-    sys.exit(1)
-
-def import_csv_to_supabase():
-    """Import CSV data into Supabase test_dataset table"""
-    
-    print(f"📂 Reading CSV file: {csv_path}")
-    
-    # Read CSV file
-    # CSV columns must match exactly: step,type,amount,nameOrig,oldBalanceOrig,newBalanceOrig,nameDest,oldBalanceDest,newBalanceDest,isFlaggedFraud
-    rows = []
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        # Validate CSV headers match expected columns
-        expected_columns = ['step', 'type', 'amount', 'nameOrig', 'oldBalanceOrig', 
-                          'newBalanceOrig', 'nameDest', 'oldBalanceDest', 'newBalanceDest', 'isFlaggedFraud']
-        actual_columns = reader.fieldnames
-        
-        # Filter out empty column names (some CSV files have leading commas)
-        actual_columns = [col for col in actual_columns if col.strip()] if actual_columns else []
-        
-        # Check if all expected columns are present
-        missing_columns = set(expected_columns) - set(actual_columns)
-        if missing_columns:
-            print(f"❌ Error: CSV is missing required columns: {missing_columns}")
-            print(f"   Expected: {expected_columns}")
-            print(f"   Found: {actual_columns}")
-            sys.exit(1)
-        
+
+def source_key(path: Path, table: str, chunk_rows: int) -> str:
+    """
+    Identify an import so its checkpoints are only reused for the same
+    file, target table and chunking
+    """
+    stat = path.stat()
+    raw = f"{path.resolve()}|{stat.st_size}|{int(stat.st_mtime)}|{table}|{chunk_rows}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def read_header(reader) -> Tuple[List[int], List[str]]:
+    """
+    Validate the CSV header and pick the columns to load
+
+    Returns:
+        (positions in the CSV, column names) of every loadable column
+    """
+    header = next(reader)
+    positions = {name.strip(): i for i, name in enumerate(header) if name.strip()}
+    missing = [c for c in REQUIRED_COLUMNS if c not in positions]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {missing}\n"
+                         f"   Expected: {REQUIRED_COLUMNS}\n   Found: {list(positions)}")
+    columns = [c for c in TABLE_COLUMNS if c in positions]
+    return [positions[c] for c in columns], columns
+
+
+def iter_chunks(path: Path, chunk_rows: int) -> Iterator[Tuple[int, List[str], List[List[str]]]]:
+    """
+    Stream the CSV as (chunk index, columns, rows) without loading it whole
+
+    Rows only contain the loadable columns, in table order.
+    """
+    with open_text(path) as f:
+        reader = csv.reader(f)
+        positions, columns = read_header(reader)
+        chunk: List[List[str]] = []
+        index = 0
         for row in reader:
-            # Column names must match CSV exactly: nameOrig, oldBalanceOrig, newBalanceOrig, nameDest, oldBalanceDest, newBalanceDest, isFlaggedFraud
-            rows.append({
-                'step': int(row['step']),
-                'type': row['type'],
-                'amount': float(row['amount']),
-                'nameOrig': row['nameOrig'],
-                'oldBalanceOrig': float(row['oldBalanceOrig']),
-                'newBalanceOrig': float(row['newBalanceOrig']),
-                'nameDest': row['nameDest'],
-                'oldBalanceDest': float(row['oldBalanceDest']),
-                'newBalanceDest': float(row['newBalanceDest']),
-                'isFlaggedFraud': int(row['isFlaggedFraud'])
-            })
-    
-    print(f"✅ Read {len(rows)} rows from CSV")
-    
-    # Connect to Supabase
-    print("🔌 Connecting to Supabase...")
-    try:
-        conn = psycopg2.connect(SUPABASE_DB_URL)
-        cur = conn.cursor()
-        print("✅ Connected to Supabase")
-    except Exception as e:
-        print(f"❌ Error connecting to Supabase: {e}")
-        sys.exit(1)
-    
-    # Check if table exists
-    cur.execute("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = 'test_dataset'
-        );
-    """)
-    
-    if not cur.fetchone()[0]:
-        print("❌ Error: test_dataset table does not exist")
-        print("Please run the migration 005_test_dataset.sql first")
-        conn.close()
-        sys.exit(1)
-    
-    # Check if data already exists
-    cur.execute("SELECT COUNT(*) FROM test_dataset")
-    existing_count = cur.fetchone()[0]
-    
-    if existing_count > 0:
-        response = input(f"⚠️  Table already contains {existing_count} rows. Clear and reimport? (y/N): ")
-        if response.lower() == 'y':
-            print("🗑️  Clearing existing data...")
-            cur.execute("TRUNCATE TABLE test_dataset RESTART IDENTITY CASCADE")
+            if not row:
+                continue
+            chunk.append([row[i] for i in positions])
+            if len(chunk) >= chunk_rows:
+                yield index, columns, chunk
+                index += 1
+                chunk = []
+        if chunk:
+            yield index, columns, chunk
+
+
+def rows_to_copy_buffer(rows: Sequence[Sequence[str]]) -> io.StringIO:
+    """Serialize rows as CSV for COPY FROM STDIN"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+class Loader:
+    """Loads chunks over a pool of connections (one per worker thread)"""
+
+    def __init__(self, db_url: str, table: str, key: str, workers: int):
+        self.db_url = db_url
+        self.table = table
+        self.key = key
+        self.workers = workers
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        import psycopg2
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = psycopg2.connect(self.db_url)
+            with conn.cursor() as cur:
+                # Each chunk is its own transaction; losing the last commits
+                # on a crash is harmless because the checkpoint goes with them
+                cur.execute("SET synchronous_commit = off")
             conn.commit()
-            print("✅ Cleared existing data")
-        else:
-            print("❌ Import cancelled")
-            conn.close()
-            sys.exit(0)
-    
-    # Insert data in batches
-    print(f"📤 Inserting {len(rows)} rows into test_dataset table...")
-    
-    # SQL column names must match CSV exactly: nameOrig, oldBalanceOrig, newBalanceOrig, nameDest, oldBalanceDest, newBalanceDest, isFlaggedFraud
-    insert_query = """
-        INSERT INTO test_dataset (
-            step, type, amount, nameOrig, oldBalanceOrig, newBalanceOrig,
-            nameDest, oldBalanceDest, newBalanceDest, isFlaggedFraud
-        ) VALUES (
-            %(step)s, %(type)s, %(amount)s, %(nameOrig)s, %(oldBalanceOrig)s, %(newBalanceOrig)s,
-            %(nameDest)s, %(oldBalanceDest)s, %(newBalanceDest)s, %(isFlaggedFraud)s
-        )
-    """
-    
-    batch_size = 1000
-    total_inserted = 0
-    
-    try:
-        for i in range(0, len(rows), batch_size):
-            batch = rows[i:i + batch_size]
-            execute_batch(cur, insert_query, batch, page_size=batch_size)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def load_chunk(self, index: int, columns: List[str], rows: List[List[str]]) -> int:
+        """COPY one chunk and record it in import_checkpoints in the same transaction"""
+        conn = self.connection()
+        column_sql = ", ".join(f'"{c}"' for c in columns)
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(
+                    f'COPY {self.table} ({column_sql}) FROM STDIN WITH (FORMAT csv)',
+                    rows_to_copy_buffer(rows)
+                )
+                cur.execute(
+                    "INSERT INTO import_checkpoints (source_key, target_table, chunk_index, row_count) "
+                    "VALUES (%s, %s, %s, %s)",
+                    (self.key, self.table, index, len(rows))
+                )
             conn.commit()
-            total_inserted += len(batch)
-            print(f"  ✅ Inserted {total_inserted}/{len(rows)} rows...", end='\r')
-        
-        print(f"\n✅ Successfully imported {total_inserted} rows into test_dataset table")
-        
-        # Verify import
-        cur.execute("SELECT COUNT(*) FROM test_dataset")
-        count = cur.fetchone()[0]
-        print(f"✅ Verification: Table now contains {count} rows")
-        
-        # Show sample statistics
+        except Exception:
+            conn.rollback()
+            raise
+        return len(rows)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+
+def completed_chunks(conn, key: str) -> set:
+    with conn.cursor() as cur:
+        cur.execute("SELECT chunk_index FROM import_checkpoints WHERE source_key = %s", (key,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def table_exists(conn, table: str) -> bool:
+    with conn.cursor() as cur:
         cur.execute("""
-            SELECT 
-                COUNT(DISTINCT nameOrig) as unique_senders,
-                COUNT(DISTINCT nameDest) as unique_receivers,
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables
+                WHERE table_schema = 'public'
+                AND table_name = %s
+            );
+        """, (table,))
+        return cur.fetchone()[0]
+
+
+def print_statistics(conn, table: str):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT
+                COUNT(DISTINCT "nameOrig") as unique_senders,
+                COUNT(DISTINCT "nameDest") as unique_receivers,
                 COUNT(*) as total_transactions,
-                SUM(CASE WHEN isFlaggedFraud = 1 THEN 1 ELSE 0 END) as fraud_count
-            FROM test_dataset
+                SUM(CASE WHEN "isFlaggedFraud" = 1 THEN 1 ELSE 0 END) as fraud_count
+            FROM {table}
         """)
-        
         stats = cur.fetchone()
-        print(f"\n📊 Dataset Statistics:")
-        print(f"   Unique Senders: {stats[0]}")
-        print(f"   Unique Receivers: {stats[1]}")
-        print(f"   Total Transactions: {stats[2]}")
-        print(f"   Fraud Cases: {stats[3]}")
-        
-    except Exception as e:
-        conn.rollback()
-        print(f"\n❌ Error inserting data: {e}")
-        sys.exit(1)
+    print(f"\n📊 Dataset Statistics:")
+    print(f"   Unique Senders: {stats[0]}")
+    print(f"   Unique Receivers: {stats[1]}")
+    print(f"   Total Transactions: {stats[2]}")
+    print(f"   Fraud Cases: {stats[3]}")
+
+
+def import_csv(db_url: str, csv_path: Path, table: str = 'test_dataset', workers: int = 1,
+               chunk_rows: int = DEFAULT_CHUNK_ROWS, truncate: bool = False,
+               assume_yes: bool = False, statistics: bool = True) -> int:
+    """
+    Stream a CSV into a table with COPY, resuming a previous partial import
+
+    Args:
+        db_url: Postgres connection string
+        csv_path: CSV file (.csv or .csv.gz)
+        table: Target table
+        workers: Parallel connections
+        chunk_rows: Rows per COPY / checkpoint
+        truncate: Empty the table (and its checkpoints) before loading
+        assume_yes: Do not prompt before clearing a non-empty table
+        statistics: Print dataset statistics at the end
+
+    Returns:
+        Number of rows loaded by this run
+    """
+    import psycopg2
+
+    print("🔌 Connecting to Supabase...")
+    conn = psycopg2.connect(db_url)
+    print("✅ Connected to Supabase")
+
+    loader = None
+    try:
+        if not table_exists(conn, table):
+            raise RuntimeError(f"{table} table does not exist. Please run the migrations first")
+        if not table_exists(conn, 'import_checkpoints'):
+            raise RuntimeError("import_checkpoints table does not exist. "
+                               "Please run the migration 027_import_checkpoints.sql first")
+
+        key = source_key(csv_path, table, chunk_rows)
+        done = set() if truncate else completed_chunks(conn, key)
+
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+            has_rows = cur.fetchone()[0]
+
+        if has_rows and not done and not truncate:
+            answer = 'y' if assume_yes else input(
+                f"⚠️  Table {table} already contains rows and there is no checkpoint for this file. "
+                f"Clear and reimport? (y/N): ")
+            if answer.lower() != 'y':
+                print("❌ Import cancelled")
+                return 0
+            truncate = True
+
+        if truncate:
+            print("🗑️  Clearing existing data...")
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE")
+                cur.execute("DELETE FROM import_checkpoints WHERE target_table = %s", (table,))
+            conn.commit()
+            print("✅ Cleared existing data")
+        elif done:
+            print(f"↩️  Resuming: {len(done)} chunks already loaded")
+
+        print(f"📤 Streaming {csv_path} into {table} "
+              f"({workers} connection{'s' if workers > 1 else ''}, {chunk_rows:,} rows per chunk)...")
+        loader = Loader(db_url, table, key, workers)
+        start_time = time.time()
+        loaded = skipped = 0
+
+        # Bounded hand-off so the reader never gets far ahead of the loaders
+        slots = threading.Semaphore(workers * 2)
+        errors: "queue.Queue[BaseException]" = queue.Queue()
+        # Callbacks run in the loader threads
+        loaded_lock = threading.Lock()
+
+        def on_done(future):
+            nonlocal loaded
+            slots.release()
+            if future.exception() is not None:
+                errors.put(future.exception())
+                return
+            with loaded_lock:
+                loaded += future.result()
+                total = loaded
+            rate = total / max(time.time() - start_time, 1e-9)
+            print(f"  ✅ Loaded {total:,} rows ({rate:,.0f} rows/s)...", end='\r')
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for index, columns, rows in iter_chunks(csv_path, chunk_rows):
+                if not errors.empty():
+                    break
+                if index in done:
+                    skipped += len(rows)
+                    continue
+                slots.acquire()
+                pool.submit(loader.load_chunk, index, columns, rows).add_done_callback(on_done)
+
+        if not errors.empty():
+            raise errors.get()
+
+        elapsed = time.time() - start_time
+        print(f"\n✅ Loaded {loaded:,} rows in {elapsed:.1f}s"
+              + (f" (skipped {skipped:,} rows from earlier runs)" if skipped else ""))
+
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            print(f"✅ Verification: Table now contains {cur.fetchone()[0]} rows")
+        if statistics:
+            print_statistics(conn, table)
+        return loaded
     finally:
-        cur.close()
+        if loader is not None:
+            loader.close()
         conn.close()
         print("🔌 Disconnected from Supabase")
 
-if __name__ == '__main__':
-    import_csv_to_supabase()
 
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk-load the test dataset CSV into Supabase with COPY")
+    parser.add_argument('--csv', default=os.getenv('TEST_DATASET_CSV_PATH', 'assets/test_dataset.csv'),
+                        help="CSV or .csv.gz file (relative paths are resolved from the repository root)")
+    parser.add_argument('--table', default='test_dataset', help="Target table")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('IMPORT_WORKERS', '4')),
+                        help="Parallel connections")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows per COPY and checkpoint")
+    parser.add_argument('--truncate', action='store_true', help="Clear the table and start over")
+    parser.add_argument('--yes', action='store_true', help="Do not prompt before clearing a non-empty table")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+
+    db_url = os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
+    if not db_url:
+        print("❌ Error: SUPABASE_DB_URL or DATABASE_URL environment variable not set")
+        print("Please set it to your Supabase database connection string")
+        print("Format: postgresql://postgres:[password]@[host]:[port]/postgres")
+        return 1
+
+    csv_path = Path(args.csv)
+    if not csv_path.is_absolute():
+        csv_path = Path(__file__).parent.parent.parent / csv_path
+    if not csv_path.exists():
+        print(f"❌ Error: CSV file not found at {csv_path}")
+        print(f"Please ensure the file exists or set TEST_DATASET_CSV_PATH environment variable")
+        return 1
+
+    try:
+        import_csv(db_url, csv_path, table=args.table, workers=max(1, args.workers),
+                   chunk_rows=args.chunk_rows, truncate=args.truncate, assume_yes=args.yes)
+    except Exception as e:
+        print(f"\n❌ Error importing data: {e}")
+        print("   Re-run the same command to resume from the last committed chunk")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())